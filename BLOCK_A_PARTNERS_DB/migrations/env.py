@@ -8,12 +8,13 @@ import os
 # Добавляем путь к проекту
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
-# Импортируем наши модели
-from models.base import Base
-from models.partner_models import Partner, VerificationLog
-
-# Это объект метаданных для Alembic
-target_metadata = Base.metadata
+# Импортируем наши модели (нужны только для autogenerate)
+try:
+    from models.base import Base
+    from models.partner_models import Partner, VerificationLog
+    target_metadata = Base.metadata
+except ImportError:
+    target_metadata = None
 
 # Получаем конфигурацию из alembic.ini
 config = context.config
@@ -35,8 +36,28 @@ def run_migrations_offline() -> None:
     with context.begin_transaction():
         context.run_migrations()
 
+def do_run_migrations(connection) -> None:
+    context.configure(
+        connection=connection,
+        target_metadata=target_metadata,
+        compare_type=True,
+        compare_server_default=True,
+    )
+
+    with context.begin_transaction():
+        context.run_migrations()
+
 def run_migrations_online() -> None:
-    """Запуск миграций в online режиме."""
+    """Запуск миграций в online режиме.
+
+    Соединение можно передать через config.attributes['connection']
+    (тесты, программный вызов command.upgrade).
+    """
+    connection = config.attributes.get('connection')
+    if connection is not None:
+        do_run_migrations(connection)
+        return
+
     connectable = engine_from_config(
         config.get_section(config.config_ini_section, {}),
         prefix="sqlalchemy.",
@@ -44,15 +65,7 @@ def run_migrations_online() -> None:
     )
 
     with connectable.connect() as connection:
-        context.configure(
-            connection=connection,
-            target_metadata=target_metadata,
-            compare_type=True,
-            compare_server_default=True,
-        )
-
-        with context.begin_transaction():
-            context.run_migrations()
+        do_run_migrations(connection)
 
 if context.is_offline_mode():
     run_migrations_offline()
@@ -0,0 +1,90 @@
+"""payments and subscriptions tables
+
+Revision ID: 001a_payments
+Revises: 001_initial
+Create Date: 2024-06-01 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '001a_payments'
+down_revision = '001_initial'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+
+    # Платежи и подписки ссылаются на строковый partners.partner_id
+    # (app.models.Partner); в 001_initial его роль играл partner_code
+    if 'partner_id' not in {column['name'] for column in inspector.get_columns('partners')}:
+        op.add_column('partners', sa.Column('partner_id', sa.String(length=50), nullable=True))
+        op.execute('UPDATE partners SET partner_id = partner_code')
+        op.create_index('ux_partners_partner_id', 'partners', ['partner_id'], unique=True)
+
+    # Таблицы могли быть созданы через db.create_all() до появления миграции
+    tables = inspector.get_table_names()
+    if 'payments' not in tables:
+        op.create_table('payments',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('payment_number', sa.String(length=50), nullable=False),
+            sa.Column('partner_id', sa.String(length=50), nullable=False),
+            sa.Column('amount', sa.Float(), nullable=False),
+            sa.Column('currency', sa.String(length=3), nullable=True),
+            sa.Column('status', sa.String(length=20), nullable=True),
+            sa.Column('payment_type', sa.String(length=30), nullable=True),
+            sa.Column('tariff_plan', sa.String(length=30), nullable=True),
+            sa.Column('description', sa.Text(), nullable=True),
+            sa.Column('invoice_data', sa.JSON(), nullable=True),
+            sa.Column('invoice_file', sa.String(length=255), nullable=True),
+            sa.Column('payment_system', sa.String(length=30), nullable=True),
+            sa.Column('payment_system_id', sa.String(length=100), nullable=True),
+            sa.Column('payment_url', sa.String(length=500), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=False),
+            sa.Column('updated_at', sa.DateTime(), nullable=True),
+            sa.Column('paid_at', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['partner_id'], ['partners.partner_id'], name='payments_partner_id_fkey'),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('payment_number', name='payments_payment_number_key')
+        )
+
+    if 'subscriptions' not in tables:
+        op.create_table('subscriptions',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('subscription_code', sa.String(length=40), nullable=True),
+            sa.Column('partner_id', sa.String(length=50), nullable=False),
+            sa.Column('tariff_plan', sa.String(length=30), nullable=False),
+            sa.Column('status', sa.String(length=20), nullable=True),
+            sa.Column('price', sa.Float(), nullable=False),
+            sa.Column('period', sa.String(length=20), nullable=True),
+            sa.Column('leads_included', sa.Integer(), nullable=True),
+            sa.Column('starts_at', sa.DateTime(), nullable=False),
+            sa.Column('expires_at', sa.DateTime(), nullable=False),
+            sa.Column('auto_renewal', sa.Boolean(), nullable=True),
+            # Без внешнего ключа: после 003 первичный ключ payments - (id, created_at)
+            sa.Column('last_payment_id', sa.Integer(), nullable=True),
+            sa.Column('renewal_payment_id', sa.String(length=64), nullable=True),
+            sa.Column('last_renewal_payment_id', sa.String(length=64), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('updated_at', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['partner_id'], ['partners.partner_id'], name='subscriptions_partner_id_fkey'),
+            sa.PrimaryKeyConstraint('id')
+        )
+    else:
+        columns = {column['name'] for column in inspector.get_columns('subscriptions')}
+        for name, length in (('subscription_code', 40), ('renewal_payment_id', 64), ('last_renewal_payment_id', 64)):
+            if name not in columns:
+                op.add_column('subscriptions', sa.Column(name, sa.String(length=length), nullable=True))
+    if 'ux_subscriptions_subscription_code' not in {index['name'] for index in sa.inspect(op.get_bind()).get_indexes('subscriptions')}:
+        op.create_index('ux_subscriptions_subscription_code', 'subscriptions', ['subscription_code'], unique=True)
+
+
+def downgrade():
+    op.drop_table('subscriptions')
+    op.drop_table('payments')
+    if 'ux_partners_partner_id' in {index['name'] for index in sa.inspect(op.get_bind()).get_indexes('partners')}:
+        op.drop_index('ux_partners_partner_id', table_name='partners')
+        op.drop_column('partners', 'partner_id')
@@ -0,0 +1,52 @@
+"""query indexes for payments and subscriptions
+
+Revision ID: 002_payment_indexes
+Revises: 001a_payments
+Create Date: 2024-06-03 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '002_payment_indexes'
+down_revision = '001a_payments'
+branch_labels = None
+depends_on = None
+
+OPEN_STATUSES = "status IN ('pending', 'processing')"
+
+
+def upgrade():
+    postgresql = op.get_bind().dialect.name == 'postgresql'
+
+    # В PostgreSQL индексы строятся CONCURRENTLY (без блокировки записи), вне транзакции
+    with op.get_context().autocommit_block():
+        # История платежей партнера, новые первыми
+        op.create_index('ix_payments_partner_created', 'payments',
+                        ['partner_id', sa.text('created_at DESC')],
+                        if_not_exists=True, postgresql_concurrently=postgresql)
+        # Сверка статусов: только незавершенные платежи в порядке id
+        op.create_index('ix_payments_open', 'payments', ['id'],
+                        postgresql_where=sa.text(OPEN_STATUSES),
+                        sqlite_where=sa.text(OPEN_STATUSES),
+                        if_not_exists=True, postgresql_concurrently=postgresql)
+        # Топ партнеров за период (покрывающий: сумма и статус из индекса)
+        op.create_index('ix_payments_paid_at_partner', 'payments', ['paid_at', 'partner_id'],
+                        postgresql_include=['amount', 'status'],
+                        if_not_exists=True, postgresql_concurrently=postgresql)
+
+        # Активная подписка партнера
+        op.create_index('ix_subscriptions_partner_status', 'subscriptions', ['partner_id', 'status'],
+                        if_not_exists=True, postgresql_concurrently=postgresql)
+        # Истекающие подписки
+        op.create_index('ix_subscriptions_status_expires', 'subscriptions', ['status', 'expires_at'],
+                        if_not_exists=True, postgresql_concurrently=postgresql)
+
+
+def downgrade():
+    op.drop_index('ix_subscriptions_status_expires', table_name='subscriptions')
+    op.drop_index('ix_subscriptions_partner_status', table_name='subscriptions')
+    op.drop_index('ix_payments_paid_at_partner', table_name='payments')
+    op.drop_index('ix_payments_open', table_name='payments')
+    op.drop_index('ix_payments_partner_created', table_name='payments')
@@ -0,0 +1,139 @@
+"""monthly range partitions for payments
+
+Revision ID: 003_payment_partitions
+Revises: 002_payment_indexes
+Create Date: 2024-06-17 10:00:00.000000
+
+"""
+from datetime import date
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '003_payment_partitions'
+down_revision = '002_payment_indexes'
+branch_labels = None
+depends_on = None
+
+# Партиции вперед от текущего месяца (дальше - services.payment_partitions ensure)
+AHEAD_MONTHS = 3
+
+OPEN_STATUSES = "status IN ('pending', 'processing')"
+
+# Уникальный ключ секционированной таблицы обязан включать created_at, поэтому
+# номера платежей резервируются в обычной таблице payment_numbers. Номер
+# остается занятым и после удаления или архивации платежа; перенос строки
+# между партициями (тот же id) повторно номер не занимает
+RESERVE_NUMBER = """
+CREATE FUNCTION reserve_payment_number() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO payment_numbers (payment_number, payment_id)
+    VALUES (NEW.payment_number, NEW.id)
+    ON CONFLICT (payment_number) DO NOTHING;
+    IF NOT FOUND AND NOT EXISTS (
+        SELECT 1 FROM payment_numbers
+        WHERE payment_number = NEW.payment_number AND payment_id = NEW.id
+    ) THEN
+        RAISE EXCEPTION 'duplicate payment_number %', NEW.payment_number
+            USING ERRCODE = 'unique_violation', CONSTRAINT = 'payment_numbers_pkey';
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql
+"""
+
+
+def _add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _create_indexes():
+    # Индексы на секционированной таблице создаются на каждой партиции
+    op.create_index('ix_payments_number', 'payments', ['payment_number'])
+    op.create_index('ix_payments_partner_created', 'payments',
+                    ['partner_id', sa.text('created_at DESC')])
+    op.create_index('ix_payments_open', 'payments', ['id'],
+                    postgresql_where=sa.text(OPEN_STATUSES))
+    op.create_index('ix_payments_paid_at_partner', 'payments', ['paid_at', 'partner_id'],
+                    postgresql_include=['amount', 'status', 'created_at'])
+
+
+def upgrade():
+    # SQLite (тесты) - обычная таблица
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    # Таблица переписывается целиком в одной транзакции: запись в payments
+    # блокируется на время копирования
+    op.execute('ALTER TABLE payments RENAME TO payments_unpartitioned')
+    op.execute('ALTER SEQUENCE payments_id_seq OWNED BY NONE')
+    # Внешний ключ на секционированную таблицу требует ключа секционирования
+    op.execute('ALTER TABLE subscriptions DROP CONSTRAINT IF EXISTS subscriptions_last_payment_id_fkey')
+    op.execute('UPDATE payments_unpartitioned SET created_at = COALESCE(paid_at, updated_at, now()) '
+               'WHERE created_at IS NULL')
+
+    op.execute('CREATE TABLE payments (LIKE payments_unpartitioned INCLUDING DEFAULTS) '
+               'PARTITION BY RANGE (created_at)')
+    op.execute('ALTER TABLE payments ALTER COLUMN created_at SET NOT NULL')
+
+    # Партиции от первого месяца истории до AHEAD_MONTHS вперед
+    first = op.get_bind().execute(sa.text('SELECT min(created_at) FROM payments_unpartitioned')).scalar()
+    current = date.today().replace(day=1)
+    month = date(first.year, first.month, 1) if first else current
+    while month <= _add_months(current, AHEAD_MONTHS):
+        following = _add_months(month, 1)
+        op.execute(f'CREATE TABLE payments_y{month.year}m{month.month:02d} PARTITION OF payments '
+                   f"FOR VALUES FROM ('{month.isoformat()}') TO ('{following.isoformat()}')")
+        month = following
+    op.execute('CREATE TABLE payments_default PARTITION OF payments DEFAULT')
+
+    op.execute('INSERT INTO payments SELECT * FROM payments_unpartitioned')
+
+    op.execute('CREATE TABLE payment_numbers (payment_number varchar(50) PRIMARY KEY, '
+               'payment_id integer NOT NULL)')
+    op.execute('INSERT INTO payment_numbers SELECT payment_number, id FROM payments_unpartitioned')
+    op.execute(RESERVE_NUMBER)
+    op.execute('CREATE TRIGGER payments_reserve_number AFTER INSERT OR UPDATE OF payment_number '
+               'ON payments FOR EACH ROW EXECUTE FUNCTION reserve_payment_number()')
+
+    op.execute('DROP TABLE payments_unpartitioned')
+    op.execute('ALTER SEQUENCE payments_id_seq OWNED BY payments.id')
+
+    # Ключи - после удаления старой таблицы (имена индексов заняты ею)
+    op.execute('ALTER TABLE payments ADD PRIMARY KEY (id, created_at)')
+    op.execute('ALTER TABLE payments ADD CONSTRAINT payments_partner_id_fkey '
+               'FOREIGN KEY (partner_id) REFERENCES partners (partner_id)')
+    _create_indexes()
+    op.execute('ANALYZE payments')
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    # Возвращаются только подключенные партиции; архивные (схема archive) не трогаются
+    op.execute('DROP TRIGGER payments_reserve_number ON payments')
+    op.execute('DROP FUNCTION reserve_payment_number()')
+    op.execute('DROP TABLE payment_numbers')
+    op.execute('ALTER TABLE payments RENAME TO payments_partitioned')
+    op.execute('ALTER SEQUENCE payments_id_seq OWNED BY NONE')
+
+    op.execute('CREATE TABLE payments (LIKE payments_partitioned INCLUDING DEFAULTS)')
+    op.execute('INSERT INTO payments SELECT * FROM payments_partitioned')
+    op.execute('DROP TABLE payments_partitioned')
+    op.execute('ALTER SEQUENCE payments_id_seq OWNED BY payments.id')
+
+    # Ключи и индексы - после удаления секционированной таблицы
+    op.execute('ALTER TABLE payments ADD PRIMARY KEY (id)')
+    op.execute('ALTER TABLE payments ADD CONSTRAINT payments_payment_number_key UNIQUE (payment_number)')
+    op.execute('ALTER TABLE payments ADD CONSTRAINT payments_partner_id_fkey '
+               'FOREIGN KEY (partner_id) REFERENCES partners (partner_id)')
+
+    op.create_index('ix_payments_partner_created', 'payments',
+                    ['partner_id', sa.text('created_at DESC')])
+    op.create_index('ix_payments_open', 'payments', ['id'],
+                    postgresql_where=sa.text(OPEN_STATUSES))
+    op.create_index('ix_payments_paid_at_partner', 'payments', ['paid_at', 'partner_id'],
+                    postgresql_include=['amount', 'status'])
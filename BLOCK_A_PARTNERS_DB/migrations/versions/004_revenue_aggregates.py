@@ -0,0 +1,118 @@
+"""revenue aggregates and analytics snapshots
+
+Revision ID: 004_revenue_aggregates
+Revises: 003_payment_partitions
+Create Date: 2024-07-01 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '004_revenue_aggregates'
+down_revision = '003_payment_partitions'
+branch_labels = None
+depends_on = None
+
+# Вклад подписки в MRR (revenue_aggregates.monthly_amount)
+MONTHLY_PRICE = ("price / CASE period WHEN 'quarterly' THEN 3 WHEN 'yearly' THEN 12 ELSE 1 END")
+
+
+def upgrade():
+    # Агрегаты обновляются по событиям (services.revenue_aggregates)
+    op.create_table('revenue_daily_partner',
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('partner_id', sa.String(length=50), nullable=False),
+        sa.Column('revenue', sa.Float(), server_default='0', nullable=False),
+        sa.Column('payment_count', sa.Integer(), server_default='0', nullable=False),
+        sa.PrimaryKeyConstraint('day', 'partner_id')
+    )
+    op.create_index('ix_revenue_daily_partner_partner', 'revenue_daily_partner', ['partner_id', 'day'])
+
+    op.create_table('revenue_daily_tariff',
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('tariff_plan', sa.String(length=30), nullable=False),
+        sa.Column('revenue', sa.Float(), server_default='0', nullable=False),
+        sa.Column('payment_count', sa.Integer(), server_default='0', nullable=False),
+        sa.PrimaryKeyConstraint('day', 'tariff_plan')
+    )
+
+    op.create_table('subscription_transitions_daily',
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('tariff_plan', sa.String(length=30), nullable=False),
+        sa.Column('from_status', sa.String(length=20), nullable=False),
+        sa.Column('to_status', sa.String(length=20), nullable=False),
+        sa.Column('transition_count', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('mrr_delta', sa.Float(), server_default='0', nullable=False),
+        sa.PrimaryKeyConstraint('day', 'tariff_plan', 'from_status', 'to_status')
+    )
+
+    # Снимки пересчета когорт (services.cohort_engine)
+    op.create_table('partner_ltv_snapshot',
+        sa.Column('partner_id', sa.String(length=50), nullable=False),
+        sa.Column('cohort', sa.Date(), nullable=False),
+        sa.Column('total_spent', sa.Float(), server_default='0', nullable=False),
+        sa.Column('payment_count', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('active_months', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('first_payment', sa.DateTime(), nullable=True),
+        sa.Column('last_payment', sa.DateTime(), nullable=True),
+        sa.Column('computed_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('partner_id')
+    )
+
+    op.create_table('cohort_revenue_snapshot',
+        sa.Column('cohort', sa.Date(), nullable=False),
+        sa.Column('month_offset', sa.Integer(), nullable=False),
+        sa.Column('cohort_size', sa.Integer(), nullable=False),
+        sa.Column('active_partners', sa.Integer(), nullable=False),
+        sa.Column('revenue', sa.Float(), nullable=False),
+        sa.PrimaryKeyConstraint('cohort', 'month_offset')
+    )
+
+    op.create_table('churn_monthly_snapshot',
+        sa.Column('period', sa.Date(), nullable=False),
+        sa.Column('active_at_start', sa.Integer(), nullable=False),
+        sa.Column('started', sa.Integer(), nullable=False),
+        sa.Column('churned', sa.Integer(), nullable=False),
+        sa.Column('churn_rate', sa.Float(), nullable=False),
+        sa.Column('computed_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('period')
+    )
+
+    # Первичное заполнение агрегатов - как RevenueAggregates.rebuild()
+    completed = "status = 'completed' AND paid_at IS NOT NULL"
+    op.execute(
+        'INSERT INTO revenue_daily_partner (day, partner_id, revenue, payment_count) '
+        'SELECT date(paid_at), partner_id, sum(amount), count(*) FROM payments '
+        f'WHERE {completed} GROUP BY date(paid_at), partner_id'
+    )
+    op.execute(
+        'INSERT INTO revenue_daily_tariff (day, tariff_plan, revenue, payment_count) '
+        "SELECT date(paid_at), COALESCE(tariff_plan, 'unknown'), sum(amount), count(*) FROM payments "
+        f"WHERE {completed} GROUP BY date(paid_at), COALESCE(tariff_plan, 'unknown')"
+    )
+    # Из текущего состояния подписок восстанавливаются создание и последний переход
+    op.execute(
+        'INSERT INTO subscription_transitions_daily '
+        '(day, tariff_plan, from_status, to_status, transition_count, mrr_delta) '
+        "SELECT date(starts_at), COALESCE(tariff_plan, 'unknown'), 'new', 'active', "
+        f'count(*), sum({MONTHLY_PRICE}) FROM subscriptions '
+        "GROUP BY date(starts_at), COALESCE(tariff_plan, 'unknown')"
+    )
+    op.execute(
+        'INSERT INTO subscription_transitions_daily '
+        '(day, tariff_plan, from_status, to_status, transition_count, mrr_delta) '
+        "SELECT date(COALESCE(updated_at, starts_at)), COALESCE(tariff_plan, 'unknown'), 'active', status, "
+        f"count(*), -sum({MONTHLY_PRICE}) FROM subscriptions WHERE status != 'active' "
+        "GROUP BY date(COALESCE(updated_at, starts_at)), COALESCE(tariff_plan, 'unknown'), status"
+    )
+
+
+def downgrade():
+    op.drop_table('churn_monthly_snapshot')
+    op.drop_table('cohort_revenue_snapshot')
+    op.drop_table('partner_ltv_snapshot')
+    op.drop_table('subscription_transitions_daily')
+    op.drop_table('revenue_daily_tariff')
+    op.drop_index('ix_revenue_daily_partner_partner', table_name='revenue_daily_partner')
+    op.drop_table('revenue_daily_partner')
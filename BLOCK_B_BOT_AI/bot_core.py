@@ -3,6 +3,8 @@ cat > BLOCK_B_BOT_AI/bot_core.py << 'EOF'
 import time
 from enum import Enum
 
+from BLOCK_B_BOT_AI.utils.intent_router import BOT_USER_TYPE_ROUTER
+
 class UserType(Enum):
     UNKNOWN = "unknown"
     CUSTOMER = "customer"
@@ -33,17 +35,12 @@ class BotCore:
         return response
     
     def _detect_user_type(self, message):
-        message = message.lower()
-        
-        customer_words = ['хочу', 'найти', 'ремонт', 'построить', 'ищу', 'нужен']
-        partner_words = ['партнер', 'компания', 'зарегистрироваться', 'исполнитель']
-        
-        customer_score = sum(1 for word in customer_words if word in message)
-        partner_score = sum(1 for word in partner_words if word in message)
+        # Таблица ключевых слов бота, один проход по сообщению
+        label = BOT_USER_TYPE_ROUTER.classify(message)['label']
         
-        if customer_score > partner_score:
+        if label == 'customer':
             return UserType.CUSTOMER
-        elif partner_score > customer_score:
+        elif label == 'partner':
             return UserType.PARTNER
         else:
             return UserType.UNKNOWN
@@ -0,0 +1,189 @@
+"""
+МАРШРУТИЗАТОР НАМЕРЕНИЙ ПО КЛЮЧЕВЫМ СЛОВАМ
+Классификатор и таблицы ключевых слов бота (Блок B) и вебхуков
+(Блок C). Импортируется как BLOCK_B_BOT_AI.utils.intent_router.
+
+Замер пропускной способности:
+    python -m BLOCK_B_BOT_AI.utils.intent_router --count 100000
+"""
+
+import argparse
+import json
+import random
+import re
+import time
+from typing import Dict, Any, List, Optional, Tuple
+
+# Ключевые слова типов пользователей - у каждого блока своя таблица:
+# бот (Блок B) выбирает тип по большему счету, вебхуки (Блок C) уточняют
+# тип, если найдены слова обоих типов. Слово засчитывается, если с него
+# начинается слово сообщения (окончания не важны: "партнер" - "партнером").
+BOT_USER_TYPE_KEYWORDS = {
+    'partner': ['партнер', 'компания', 'зарегистрироваться', 'исполнитель', 'стать партнером'],
+    'customer': ['хочу', 'найти', 'ремонт', 'построить', 'ищу', 'нужен']
+}
+
+WEBHOOK_USER_TYPE_KEYWORDS = {
+    'partner': [
+        'партнер', 'компания', 'регистрация', 'сотрудничать',
+        'юрлицо', 'ип', 'ооо', 'подрядчик', 'исполнитель',
+        'предлагаю услуги', 'строительная компания', 'стать партнером'
+    ],
+    'customer': [
+        'построить', 'ремонт', 'найти', 'ищу', 'нужен',
+        'дом', 'коттедж', 'дача', 'смета', 'стоимость',
+        'подрядчик', 'исполнитель', 'мастер'
+    ]
+}
+
+
+class IntentRouter:
+    """Классификатор намерений по ключевым словам
+
+    Ключевые слова собираются в префиксное дерево и компилируются в одно
+    выражение внутри lookahead в начале каждого слова: движок re за один
+    проход находит в каждой такой позиции самое длинное совпадение, а более
+    короткие слова, начинающиеся в той же позиции, добавляются по таблице
+    префиксов. Слово может относиться к нескольким намерениям - тогда оно
+    засчитывается каждому.
+    """
+
+    def __init__(self, intents: Dict[str, List[str]],
+                 weights: Optional[Dict[str, float]] = None):
+        self.intents = list(intents)
+        self.weights = weights or {}
+
+        # keyword -> [(intent, weight), ...]
+        self._keyword_intents: Dict[str, List[Tuple[str, float]]] = {}
+        for intent, keywords in intents.items():
+            for keyword in keywords:
+                keyword = keyword.lower()
+                self._keyword_intents.setdefault(keyword, []).append(
+                    (intent, self.weights.get(keyword, 1.0))
+                )
+
+        keywords = list(self._keyword_intents)
+        trie: Dict[str, Any] = {}
+        for keyword in keywords:
+            node = trie
+            for char in keyword:
+                node = node.setdefault(char, {})
+            node[''] = {}
+
+        self._pattern = re.compile(rf'\b(?=({_trie_pattern(trie)}))')
+        self._prefixes = {
+            keyword: tuple(other for other in keywords if keyword.startswith(other))
+            for keyword in keywords
+        }
+
+    def match(self, message: str) -> List[str]:
+        """Ключевые слова, найденные в сообщении"""
+        return sorted(self._scan(message))
+
+    def _scan(self, message: str) -> set:
+        found = set()
+        for keyword in set(self._pattern.findall(message.lower())):
+            found.update(self._prefixes[keyword])
+        return found
+
+    def score(self, message: str) -> Dict[str, float]:
+        """Сумма весов найденных ключевых слов по намерениям"""
+        scores = dict.fromkeys(self.intents, 0.0)
+        for keyword in self._scan(message):
+            for intent, weight in self._keyword_intents[keyword]:
+                scores[intent] += weight
+        return scores
+
+    def classify(self, message: str) -> Dict[str, Any]:
+        """Намерение с наибольшим счетом ('unknown' - нет совпадений или ничья)"""
+        scores = self.score(message)
+        label, best, tie = 'unknown', 0.0, False
+        for intent, value in scores.items():
+            if value > best:
+                label, best, tie = intent, value, False
+            elif value == best and value:
+                tie = True
+        if tie:
+            label = 'unknown'
+
+        return {
+            'label': label,
+            'scores': scores,
+            'matched': [intent for intent, value in scores.items() if value > 0]
+        }
+
+
+def _trie_pattern(node: Dict[str, Any]) -> str:
+    """Выражение по префиксному дереву (ключ '' - конец слова)
+
+    Продолжение слова проверяется раньше его окончания, поэтому
+    в каждой позиции выбирается самое длинное совпадение.
+    """
+    branches = [re.escape(char) + _trie_pattern(child)
+                for char, child in sorted(node.items()) if char]
+    if not branches:
+        return ''
+
+    body = branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+    return f'(?:{body})?' if '' in node else body
+
+
+# Экземпляры блоков: выражения компилируются один раз при импорте
+BOT_USER_TYPE_ROUTER = IntentRouter(BOT_USER_TYPE_KEYWORDS)
+WEBHOOK_USER_TYPE_ROUTER = IntentRouter(WEBHOOK_USER_TYPE_KEYWORDS)
+
+
+def benchmark(count: int = 100000, extra_keywords: int = 0, seed: int = 42) -> Dict[str, Any]:
+    """IntentRouter против перебора k in message по каждому слову
+
+    extra_keywords добавляет к каждому намерению синтетические ключевые
+    слова, чтобы оценить рост словаря.
+    """
+    rng = random.Random(seed)
+    intents = {
+        intent: keywords + [f'{intent[:3]}слово{i}' for i in range(extra_keywords)]
+        for intent, keywords in WEBHOOK_USER_TYPE_KEYWORDS.items()
+    }
+    router = IntentRouter(intents)
+    vocabulary = [keyword for keywords in WEBHOOK_USER_TYPE_KEYWORDS.values() for keyword in keywords] + [
+        'здравствуйте', 'подскажите', 'пожалуйста', 'сколько', 'сроки', 'материалы',
+        'фундамент', 'крыша', 'баня', 'участок', 'москва', 'область', 'спасибо'
+    ]
+    messages = [
+        ' '.join(rng.choice(vocabulary) for _ in range(rng.randint(3, 25)))
+        for _ in range(count)
+    ]
+
+    started = time.perf_counter()
+    for message in messages:
+        router.classify(message)
+    router_elapsed = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for message in messages:
+        message_lower = message.lower()
+        {intent: sum(1 for keyword in keywords if keyword in message_lower)
+         for intent, keywords in intents.items()}
+    scan_elapsed = time.perf_counter() - started
+
+    return {
+        'messages': count,
+        'keywords': sum(len(keywords) for keywords in intents.values()),
+        'avg_message_chars': round(sum(map(len, messages)) / count),
+        'router_per_second': round(count / router_elapsed),
+        'keyword_scan_per_second': round(count / scan_elapsed)
+    }
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description='Замер маршрутизатора намерений')
+    parser.add_argument('--count', type=int, default=100000)
+    parser.add_argument('--extra-keywords', type=int, default=0,
+                        help='Синтетические ключевые слова на намерение')
+    args = parser.parse_args(argv)
+
+    print(json.dumps(benchmark(args.count, args.extra_keywords), indent=2))
+
+
+if __name__ == '__main__':
+    main()
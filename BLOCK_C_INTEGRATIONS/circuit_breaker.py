@@ -0,0 +1,275 @@
+"""
+ЗАЩИТА ВНЕШНИХ ИНТЕГРАЦИЙ
+Circuit breaker и bulkhead для вызовов внешних API (ФНС, Protalk, Umnico, Tilda, платежи)
+"""
+
+import threading
+import time
+import logging
+import requests
+from typing import Dict, Any, Optional, Callable
+
+from .config import BlockCConfig
+
+logger = logging.getLogger(__name__)
+
+
+class IntegrationUnavailableError(requests.RequestException):
+    """Вызов внешнего API отклонен без обращения к сервису"""
+
+
+class CircuitOpenError(IntegrationUnavailableError):
+    """Circuit breaker разомкнут: сервис считается недоступным"""
+
+
+class BulkheadFullError(IntegrationUnavailableError):
+    """Все слоты bulkhead заняты: сервис перегружен"""
+
+
+class Bulkhead:
+    """Ограничение числа одновременных вызовов одного внешнего сервиса"""
+
+    def __init__(self, name: str, max_concurrent_calls: int = 10, max_wait: float = 0.0):
+        self.name = name
+        self.max_concurrent_calls = max_concurrent_calls
+        self.max_wait = max_wait
+        self._semaphore = threading.BoundedSemaphore(max_concurrent_calls)
+        self._lock = threading.Lock()
+        self._active_calls = 0
+        self._rejected_calls = 0
+
+    def acquire(self):
+        """Захват слота; при отсутствии свободных слотов - BulkheadFullError"""
+        if self.max_wait > 0:
+            acquired = self._semaphore.acquire(timeout=self.max_wait)
+        else:
+            acquired = self._semaphore.acquire(blocking=False)
+
+        with self._lock:
+            if not acquired:
+                self._rejected_calls += 1
+                raise BulkheadFullError(
+                    f'Превышен лимит одновременных запросов к {self.name} ({self.max_concurrent_calls})'
+                )
+            self._active_calls += 1
+
+    def release(self):
+        """Освобождение слота"""
+        with self._lock:
+            self._active_calls -= 1
+        self._semaphore.release()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Метрики bulkhead"""
+        with self._lock:
+            return {
+                'max_concurrent_calls': self.max_concurrent_calls,
+                'active_calls': self._active_calls,
+                'available_slots': self.max_concurrent_calls - self._active_calls,
+                'rejected_calls': self._rejected_calls
+            }
+
+
+class CircuitBreaker:
+    """Circuit breaker для одного внешнего сервиса
+
+    closed - вызовы проходят, ошибки подсчитываются;
+    open - вызовы отклоняются сразу до истечения recovery_timeout;
+    half_open - пропускается ограниченное число пробных вызовов.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name: str, failure_threshold: int = 5,
+                 recovery_timeout: float = 30.0, half_open_max_calls: int = 1,
+                 max_concurrent_calls: int = 10, max_wait: float = 0.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.bulkhead = Bulkhead(name, max_concurrent_calls, max_wait)
+        self._clock = clock
+        self._lock = threading.Lock()
+
+        self._state = self.CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._half_open_calls = 0
+
+        self._metrics = {
+            'total_calls': 0,
+            'successful_calls': 0,
+            'failed_calls': 0,
+            'rejected_calls': 0,
+            'times_opened': 0,
+            'total_latency': 0.0
+        }
+        self._last_failure: Optional[str] = None
+        self._last_failure_at: Optional[float] = None
+
+    @property
+    def state(self) -> str:
+        """Текущее состояние с учетом истечения recovery_timeout"""
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if self._state == self.OPEN and self._clock() - self._opened_at >= self.recovery_timeout:
+            self._state = self.HALF_OPEN
+            self._half_open_calls = 0
+            logger.info(f"Circuit breaker {self.name}: open -> half_open")
+        return self._state
+
+    def _before_call(self):
+        with self._lock:
+            state = self._current_state()
+
+            if state == self.OPEN:
+                self._metrics['rejected_calls'] += 1
+                retry_in = self.recovery_timeout - (self._clock() - self._opened_at)
+                raise CircuitOpenError(
+                    f'Сервис {self.name} временно недоступен, повтор через {max(retry_in, 0):.0f} сек'
+                )
+
+            if state == self.HALF_OPEN:
+                if self._half_open_calls >= self.half_open_max_calls:
+                    self._metrics['rejected_calls'] += 1
+                    raise CircuitOpenError(f'Сервис {self.name} проверяется после сбоя')
+                self._half_open_calls += 1
+
+            self._metrics['total_calls'] += 1
+
+    def _on_success(self, latency: float):
+        with self._lock:
+            self._metrics['successful_calls'] += 1
+            self._metrics['total_latency'] += latency
+            self._consecutive_failures = 0
+
+            if self._state == self.HALF_OPEN:
+                self._state = self.CLOSED
+                self._half_open_calls = 0
+                logger.info(f"Circuit breaker {self.name}: half_open -> closed")
+
+    def _on_failure(self, latency: float, reason: str):
+        with self._lock:
+            self._metrics['failed_calls'] += 1
+            self._metrics['total_latency'] += latency
+            self._consecutive_failures += 1
+            self._last_failure = reason
+            self._last_failure_at = time.time()
+
+            if self._state == self.HALF_OPEN or self._consecutive_failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    self._metrics['times_opened'] += 1
+                    logger.warning(f"Circuit breaker {self.name} opened: {reason}")
+                self._state = self.OPEN
+                self._opened_at = self._clock()
+                self._half_open_calls = 0
+
+    def call(self, func: Callable, *args, **kwargs):
+        """Вызов функции под защитой circuit breaker и bulkhead
+
+        Ошибкой сервиса считается любое исключение вызова или HTTP-ответ
+        со статусом 5xx.
+        """
+        self._before_call()
+
+        try:
+            self.bulkhead.acquire()
+        except BulkheadFullError:
+            with self._lock:
+                self._metrics['rejected_calls'] += 1
+                if self._state == self.HALF_OPEN:
+                    self._half_open_calls -= 1
+            raise
+
+        started = time.monotonic()
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            # Исключение не подтверждает восстановление сервиса: полуоткрытый
+            # circuit breaker по нему не замыкается
+            self._on_failure(time.monotonic() - started, str(e) or e.__class__.__name__)
+            raise
+        finally:
+            self.bulkhead.release()
+
+        status_code = getattr(result, 'status_code', None)
+        if isinstance(status_code, int) and status_code >= 500:
+            self._on_failure(time.monotonic() - started, f'HTTP {status_code}')
+        else:
+            self._on_success(time.monotonic() - started)
+
+        return result
+
+    def reset(self):
+        """Принудительное замыкание circuit breaker"""
+        with self._lock:
+            self._state = self.CLOSED
+            self._consecutive_failures = 0
+            self._half_open_calls = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Состояние и метрики circuit breaker"""
+        with self._lock:
+            state = self._current_state()
+            metrics = dict(self._metrics)
+            completed = metrics['successful_calls'] + metrics['failed_calls']
+
+            return {
+                'name': self.name,
+                'state': state,
+                'consecutive_failures': self._consecutive_failures,
+                'failure_threshold': self.failure_threshold,
+                'recovery_timeout': self.recovery_timeout,
+                'total_calls': metrics['total_calls'],
+                'successful_calls': metrics['successful_calls'],
+                'failed_calls': metrics['failed_calls'],
+                'rejected_calls': metrics['rejected_calls'],
+                'times_opened': metrics['times_opened'],
+                'failure_rate': round(metrics['failed_calls'] / completed, 4) if completed else 0.0,
+                'avg_latency_ms': round(metrics['total_latency'] / completed * 1000, 2) if completed else 0.0,
+                'last_failure': self._last_failure,
+                'last_failure_at': self._last_failure_at,
+                'bulkhead': self.bulkhead.get_stats()
+            }
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(upstream: str) -> CircuitBreaker:
+    """Получение общего для процесса circuit breaker внешнего сервиса"""
+    with _breakers_lock:
+        breaker = _breakers.get(upstream)
+        if breaker is None:
+            settings = {
+                **BlockCConfig.CIRCUIT_BREAKER_CONFIG['default'],
+                **BlockCConfig.CIRCUIT_BREAKER_CONFIG.get(upstream, {})
+            }
+            breaker = CircuitBreaker(upstream, **settings)
+            _breakers[upstream] = breaker
+        return breaker
+
+
+def get_circuit_breakers_status() -> Dict[str, Dict[str, Any]]:
+    """Состояние и метрики всех circuit breaker"""
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return {breaker.name: breaker.get_stats() for breaker in breakers}
+
+
+class ResilientSession(requests.Session):
+    """requests.Session, все запросы которой проходят через circuit breaker сервиса"""
+
+    def __init__(self, upstream: str):
+        super().__init__()
+        self.upstream = upstream
+        self.breaker = get_circuit_breaker(upstream)
+
+    def request(self, method, url, *args, **kwargs):
+        return self.breaker.call(super().request, method, url, *args, **kwargs)
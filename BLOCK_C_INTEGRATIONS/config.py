@@ -21,7 +21,12 @@ class BlockCConfig:
         'api_url': 'https://api.protalk.io',
         'webhook_path': '/webhook/protalk',
         'timeout': 10,
-        'max_message_length': 4096
+        'max_message_length': 4096,
+        'per_chat_rate': 1,  # Сообщений в секунду в один чат (лимит Telegram)
+        'broadcast_rate': 30,  # Сообщений в секунду на бота (лимит Telegram)
+        'broadcast_workers': 10,
+        'max_partner_cards': 5,
+        'max_send_retries': 3
     }
     
     # Настройки Umnico
@@ -29,14 +34,28 @@ class BlockCConfig:
         'api_url': 'https://umnico.com',
         'webhook_path': '/webhook/umnico',
         'widget_theme': 'light',
-        'widget_position': 'bottom-right'
+        'widget_position': 'bottom-right',
+        'event_batch_size': 100,
+        'event_flush_interval': 5,  # секунд
+        'event_spill_path': 'data/umnico_events.jsonl',
+        'conversation_db_path': 'data/umnico_conversations.db',
+        'history_page_size': 100,
+        'history_max_pages': 50,  # страниц за одну догрузку пользователя
+        'backfill_workers': 8
     }
     
     # Настройки Tilda
     TILDA_CONFIG = {
         'api_url': 'https://api.tildacdn.info',
         'partner_portal_url': 'https://партнер.дома-цены.рф',
-        'form_submission_url': '/webhook/tilda'
+        'form_submission_url': '/webhook/tilda',
+        'template_version': 1,  # Увеличить при изменении _generate_partner_html
+        'page_cache_db_path': 'data/tilda_pages.db',
+        'push_rate': 5,  # Запросов в секунду к API Tilda
+        'push_workers': 4,
+        'rebuild_batch_size': 500,
+        'stats_db_path': 'data/tilda_stats.db',
+        'stats_initial_days': 90  # Глубина первой загрузки статистики
     }
     
     # Настройки платежных систем
@@ -44,7 +63,16 @@ class BlockCConfig:
         'default_provider': 'yookassa',
         'currency': 'RUB',
         'tax_rate': 0.20,  # НДС 20%
-        'invoice_template': 'default'
+        'prices_include_vat': True,  # Цены тарифов указаны с НДС
+        'tariff_refresh_interval': 5,  # Секунды между проверками изменения тарифов
+        'invoice_template': 'default',
+        'idempotency_db_path': 'data/payment_idempotency.db',
+        'idempotency_key_ttl': 86400,  # ЮKassa хранит ключ идемпотентности 24 часа
+        'max_retries': 3,
+        'retry_backoff': 0.5,  # Секунды, удваивается с каждой попыткой
+        'history_page_size': 100,  # Максимум ЮKassa для списка платежей
+        'history_cache_db_path': 'data/payment_history.db',
+        'settled_statuses': ['succeeded', 'canceled']  # Платеж больше не меняется
     }
     
     # Настройки email
@@ -60,7 +88,47 @@ class BlockCConfig:
         'secret_header': 'X-Webhook-Secret',
         'signature_header': 'X-Signature',
         'timestamp_header': 'X-Timestamp',
-        'timestamp_tolerance': 300  # 5 минут
+        'timestamp_tolerance': 300,  # 5 минут
+        # Предыдущие секреты, принимаемые во время ротации (через запятую)
+        'previous_secrets': [
+            secret for secret in os.getenv('WEBHOOK_PREVIOUS_SECRETS', '').split(',') if secret
+        ],
+        # Источники, которые обязаны присылать время отправки (через запятую, например payment,tilda);
+        # остальные без заголовка времени проверяются подписью только по телу
+        'timestamp_sources': [
+            source for source in os.getenv('WEBHOOK_TIMESTAMP_SOURCES', '').split(',') if source
+        ],
+        'dedupe_ttl': 86400,  # Окно дедупликации повторных доставок (сутки)
+        'dedupe_max_local': 100000,
+        'inbox_db_path': 'data/webhook_inbox.db',
+        'dispatch_concurrency': {'payment': 4, 'tilda': 2, 'umnico': 8, 'protalk': 8},
+        'max_attempts': 5,
+        'retry_backoff': 2.0,  # Секунды, удваивается с каждой попыткой
+        'poll_interval': 0.5,
+        'processing_timeout': 300
+    }
+    
+    # Кэш подборок партнеров для постраничного показа
+    RECOMMENDATION_CACHE_CONFIG = {
+        'ttl': 3600,  # 1 час
+        'carousel_page_size': 5
+    }
+    
+    # Circuit breaker и bulkhead для внешних API
+    CIRCUIT_BREAKER_CONFIG = {
+        'default': {
+            'failure_threshold': 5,  # Ошибок подряд до размыкания
+            'recovery_timeout': 30,  # Секунд до пробного запроса
+            'half_open_max_calls': 1,
+            'max_concurrent_calls': 10,  # Слотов bulkhead на сервис
+            'max_wait': 0.0  # Ожидание слота, 0 - отказ сразу
+        },
+        'fns': {'max_concurrent_calls': 5, 'recovery_timeout': 60},
+        'protalk': {'max_concurrent_calls': 20},
+        'umnico': {'max_concurrent_calls': 10},
+        'tilda': {'max_concurrent_calls': 5},
+        'yookassa': {'max_concurrent_calls': 10, 'max_wait': 2.0},
+        'cloudpayments': {'max_concurrent_calls': 10, 'max_wait': 2.0}
     }
     
     @classmethod
@@ -126,6 +194,11 @@ class BlockCConfig:
         """Получение секрета для вебхука"""
         return os.getenv(f'{service.upper()}_WEBHOOK_SECRET', '')
     
+    @classmethod
+    def get_redis_url(cls) -> str:
+        """Получение URL Redis"""
+        return os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+    
     @classmethod
     def to_dict(cls) -> Dict[str, Any]:
         """Преобразование конфигурации в словарь"""
@@ -136,5 +209,7 @@ class BlockCConfig:
             'tilda': cls.TILDA_CONFIG,
             'payment': cls.PAYMENT_CONFIG,
             'email': cls.EMAIL_CONFIG,
-            'webhook': cls.WEBHOOK_CONFIG
+            'webhook': cls.WEBHOOK_CONFIG,
+            'recommendation_cache': cls.RECOMMENDATION_CACHE_CONFIG,
+            'circuit_breaker': cls.CIRCUIT_BREAKER_CONFIG
         }
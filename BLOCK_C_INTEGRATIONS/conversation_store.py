@@ -0,0 +1,245 @@
+"""
+ЛОКАЛЬНОЕ ХРАНИЛИЩЕ ДИАЛОГОВ UMNICO
+Инкрементальная синхронизация истории сообщений в SQLite
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Iterable
+
+from .config import BlockCConfig
+
+logger = logging.getLogger(__name__)
+
+
+class ConversationStore:
+    """История сообщений по пользователям с отметкой последнего синхронизированного сообщения"""
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path or BlockCConfig.UMNICO_CONFIG['conversation_db_path']
+
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._create_tables()
+
+    def _create_tables(self):
+        with self._lock, self._conn:
+            if self.db_path != ':memory:':
+                self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS messages (
+                    user_id TEXT NOT NULL,
+                    message_id TEXT NOT NULL,
+                    created_at TEXT,
+                    payload TEXT NOT NULL,
+                    PRIMARY KEY (user_id, message_id)
+                )
+            ''')
+            self._conn.execute(
+                'CREATE INDEX IF NOT EXISTS idx_messages_user_created ON messages (user_id, created_at)'
+            )
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS sync_state (
+                    user_id TEXT PRIMARY KEY,
+                    last_message_id TEXT,
+                    last_created_at TEXT,
+                    synced_at TEXT NOT NULL
+                )
+            ''')
+
+    def save_messages(self, user_id: str, messages: Iterable[Dict[str, Any]],
+                      advance_watermark: bool = True) -> int:
+        """Сохранение сообщений (повторы игнорируются) и сдвиг отметки синхронизации"""
+        rows = [
+            (
+                user_id,
+                str(message.get('id')),
+                message.get('created_at') or message.get('timestamp'),
+                json.dumps(message, ensure_ascii=False, default=str)
+            )
+            for message in messages
+            if message.get('id') is not None
+        ]
+
+        with self._lock, self._conn:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                'INSERT OR IGNORE INTO messages (user_id, message_id, created_at, payload) VALUES (?, ?, ?, ?)',
+                rows
+            )
+            inserted = self._conn.total_changes - before
+
+            if not advance_watermark:
+                return inserted
+
+            last = rows[-1] if rows else None
+            self._conn.execute('''
+                INSERT INTO sync_state (user_id, last_message_id, last_created_at, synced_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(user_id) DO UPDATE SET
+                    last_message_id = COALESCE(excluded.last_message_id, last_message_id),
+                    last_created_at = COALESCE(excluded.last_created_at, last_created_at),
+                    synced_at = excluded.synced_at
+            ''', (
+                user_id,
+                last[1] if last else None,
+                last[2] if last else None,
+                datetime.utcnow().isoformat()
+            ))
+
+        return inserted
+
+    def get_messages(self, user_id: str, limit: int = 50) -> List[Dict[str, Any]]:
+        """Последние limit сообщений пользователя в хронологическом порядке"""
+        with self._lock:
+            rows = self._conn.execute('''
+                SELECT payload FROM messages
+                WHERE user_id = ?
+                ORDER BY created_at DESC, rowid DESC
+                LIMIT ?
+            ''', (user_id, limit)).fetchall()
+
+        return [json.loads(row['payload']) for row in reversed(rows)]
+
+    def get_sync_state(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """Отметка последней синхронизации пользователя"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT * FROM sync_state WHERE user_id = ?', (user_id,)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def get_user_ids(self) -> List[str]:
+        """Пользователи, для которых есть локальная история"""
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT user_id FROM sync_state UNION SELECT user_id FROM messages'
+            ).fetchall()
+        return [row['user_id'] for row in rows]
+
+    def close(self):
+        self._conn.close()
+
+
+class ConversationSync:
+    """Синхронизация истории Umnico в ConversationStore
+
+    Первая синхронизация пользователя забирает последние page_size
+    сообщений (API отдает диалог с конца, постраничного чтения назад нет),
+    последующие - только сообщения после last_message_id, не более
+    max_pages страниц за вызов.
+    """
+
+    def __init__(self, connector, store: ConversationStore,
+                 page_size: Optional[int] = None, max_workers: Optional[int] = None,
+                 max_pages: Optional[int] = None):
+        self.connector = connector
+        self.store = store
+        self.page_size = page_size or BlockCConfig.UMNICO_CONFIG['history_page_size']
+        self.max_workers = max_workers or BlockCConfig.UMNICO_CONFIG['backfill_workers']
+        self.max_pages = max_pages or BlockCConfig.UMNICO_CONFIG['history_max_pages']
+
+    def sync_user(self, user_id: str) -> Dict[str, Any]:
+        """Догрузка новых сообщений пользователя
+
+        complete=False - догрузка остановлена по max_pages или потому, что
+        API вернул страницу без сдвига since_id; продолжится со следующим вызовом.
+        """
+        state = self.store.get_sync_state(user_id)
+        since_id = state['last_message_id'] if state else None
+        fetched = 0
+        complete = False
+
+        for _ in range(self.max_pages):
+            result = self.connector.get_user_conversation(
+                user_id, limit=self.page_size, since_id=since_id
+            )
+
+            if not result.get('success'):
+                if result.get('status_code') == 404:
+                    self.store.save_messages(user_id, [])
+                    complete = True
+                    break
+                return {**result, 'fetched': fetched}
+
+            messages = result.get('conversation', [])
+            if messages:
+                self.store.save_messages(user_id, messages)
+                fetched += len(messages)
+
+            if since_id is None or len(messages) < self.page_size:
+                # Первая синхронизация - одна страница последних сообщений
+                complete = len(messages) < self.page_size
+                break
+
+            last_id = str(messages[-1].get('id'))
+            if last_id == since_id:
+                logger.warning(f"Umnico ignored since_id for {user_id}, stopping sync")
+                break
+            since_id = last_id
+        else:
+            logger.warning(f"Conversation sync for {user_id} stopped after {self.max_pages} pages")
+
+        return {'success': True, 'user_id': user_id, 'fetched': fetched, 'complete': complete}
+
+    def get_history(self, user_id: str, limit: int = 50, refresh: bool = False) -> Dict[str, Any]:
+        """История диалога из локального хранилища (upstream - только для новых пользователей или refresh)
+
+        Новые входящие сообщения попадают в хранилище из вебхука Umnico
+        (WebhookHandler с conversation_sync вызывает record_message).
+
+        Если upstream недоступен, отдается локальная копия с stale=True;
+        без локальной копии возвращается ошибка синхронизации.
+        """
+        stale = False
+        if refresh or self.store.get_sync_state(user_id) is None:
+            sync_result = self.sync_user(user_id)
+            stale = not sync_result.get('success')
+
+        messages = self.store.get_messages(user_id, limit)
+        if stale:
+            if not messages and self.store.get_sync_state(user_id) is None:
+                return {
+                    'success': False,
+                    'error': sync_result.get('error', 'Ошибка синхронизации диалога'),
+                    'user_id': user_id
+                }
+            logger.warning(f"Conversation sync failed for {user_id}, serving local copy")
+
+        return {
+            'success': True,
+            'conversation': messages,
+            'user_id': user_id,
+            'message_count': len(messages),
+            'source': 'local',
+            'stale': stale
+        }
+
+    def record_message(self, user_id: str, message: Dict[str, Any]):
+        """Сохранение сообщения, пришедшего через вебхук (отметка синхронизации не сдвигается)"""
+        self.store.save_messages(user_id, [message], advance_watermark=False)
+
+    def backfill(self, user_ids: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Параллельная синхронизация пользователей ограниченным пулом потоков"""
+        user_ids = user_ids if user_ids is not None else self.store.get_user_ids()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            results = list(executor.map(self.sync_user, user_ids))
+
+        failed = [user_id for user_id, result in zip(user_ids, results) if not result.get('success')]
+        return {
+            'success': not failed,
+            'users': len(user_ids),
+            'messages_fetched': sum(r.get('fetched', 0) for r in results),
+            'failed_users': failed
+        }
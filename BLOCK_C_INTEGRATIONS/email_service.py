@@ -255,6 +255,9 @@ class EmailService:
             'leads_accepted': report_data.get('leads_accepted', 0),
             'response_rate': report_data.get('response_rate', 0),
             'rating_change': report_data.get('rating_change', 0),
+            'page_views': report_data.get('page_views', 0),
+            'page_visitors': report_data.get('page_visitors', 0),
+            'page_views_change': report_data.get('page_views_change', 0),
             'top_regions': report_data.get('top_regions', []),
             'recommendations': report_data.get('recommendations', []),
             'dashboard_url': report_data.get('dashboard_url'),
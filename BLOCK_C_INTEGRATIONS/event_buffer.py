@@ -0,0 +1,183 @@
+"""
+БУФЕР АНАЛИТИЧЕСКИХ СОБЫТИЙ
+Пакетная фоновая отправка событий с сохранением на диск при недоступности сервиса
+"""
+
+import json
+import logging
+import os
+import threading
+from collections import deque
+from typing import Dict, Any, List, Callable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class EventBuffer:
+    """Буфер событий с доставкой at-least-once
+
+    append() только добавляет событие в очередь. Фоновый поток отправляет
+    пакеты по достижении batch_size или раз в flush_interval секунд.
+    Пакет, который не удалось отправить, дописывается в spill-файл (JSON lines)
+    и переотправляется при следующих сбросах; файл очищается только после
+    успешной отправки.
+    """
+
+    def __init__(self, send_batch: Callable[[List[Dict[str, Any]]], bool],
+                 batch_size: int = 100, flush_interval: float = 5.0,
+                 spill_path: Optional[str] = None, name: str = 'events'):
+        self.send_batch = send_batch
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spill_path = spill_path
+        self.name = name
+
+        self._queue = deque()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+        self.stats = {
+            'appended': 0,
+            'sent': 0,
+            'spilled': 0,
+            'replayed': 0,
+            'failed_batches': 0
+        }
+
+    def start(self) -> 'EventBuffer':
+        """Запуск фонового потока отправки"""
+        if self._thread is None or not self._thread.is_alive():
+            self._stopping.clear()
+            self._thread = threading.Thread(
+                target=self._run, name=f'{self.name}-flusher', daemon=True
+            )
+            self._thread.start()
+        return self
+
+    def append(self, event: Dict[str, Any]):
+        """Добавление события (горячий путь - только append в очередь)"""
+        self._queue.append(event)
+        self.stats['appended'] += 1
+        if len(self._queue) >= self.batch_size:
+            self._wakeup.set()
+
+    def pending(self) -> int:
+        """Количество событий в памяти"""
+        return len(self._queue)
+
+    def close(self, timeout: float = 10.0):
+        """Остановка потока с финальным сбросом буфера"""
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        else:
+            self.flush()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Event buffer {self.name} flush error: {e}")
+        self.flush()
+
+    def flush(self) -> int:
+        """Отправка накопленных событий; возвращает число доставленных"""
+        with self._flush_lock:
+            delivered = 0
+            upstream_ok = True
+
+            if self._has_spill():
+                replayed, upstream_ok = self._replay_spill()
+                delivered += replayed
+
+            while self._queue:
+                batch = self._drain(self.batch_size)
+
+                if upstream_ok and self._send(batch):
+                    delivered += len(batch)
+                    self.stats['sent'] += len(batch)
+                    continue
+
+                # Сервис недоступен: сохраняем пакет и остаток очереди на диск
+                self._spill(batch + self._drain(len(self._queue)))
+                break
+
+            return delivered
+
+    def _drain(self, count: int) -> List[Dict[str, Any]]:
+        batch = []
+        while self._queue and len(batch) < count:
+            batch.append(self._queue.popleft())
+        return batch
+
+    def _send(self, batch: List[Dict[str, Any]]) -> bool:
+        try:
+            if self.send_batch(batch):
+                return True
+        except Exception as e:
+            logger.warning(f"Event buffer {self.name} send error: {e}")
+        self.stats['failed_batches'] += 1
+        return False
+
+    def _has_spill(self) -> bool:
+        return bool(self.spill_path) and os.path.exists(self.spill_path) \
+            and os.path.getsize(self.spill_path) > 0
+
+    def _spill(self, events: List[Dict[str, Any]]):
+        if not events:
+            return
+
+        if not self.spill_path:
+            # Без файла возвращаем события в очередь до следующей попытки
+            self._queue.extendleft(reversed(events))
+            return
+
+        directory = os.path.dirname(self.spill_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with open(self.spill_path, 'a', encoding='utf-8') as f:
+            for event in events:
+                f.write(json.dumps(event, ensure_ascii=False, default=str) + '\n')
+
+        self.stats['spilled'] += len(events)
+        logger.warning(f"Event buffer {self.name}: {len(events)} events spilled to {self.spill_path}")
+
+    def _replay_spill(self) -> Tuple[int, bool]:
+        """Переотправка событий из spill-файла: (отправлено, файл разобран полностью)"""
+        with open(self.spill_path, 'r', encoding='utf-8') as f:
+            events = [json.loads(line) for line in f if line.strip()]
+
+        sent = 0
+        while sent < len(events):
+            batch = events[sent:sent + self.batch_size]
+            if not self._send(batch):
+                break
+            sent += len(batch)
+
+        remaining = events[sent:]
+        tmp_path = f'{self.spill_path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for event in remaining:
+                f.write(json.dumps(event, ensure_ascii=False, default=str) + '\n')
+        os.replace(tmp_path, self.spill_path)
+
+        self.stats['replayed'] += sent
+        self.stats['sent'] += sent
+        return sent, not remaining
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Метрики буфера"""
+        return {
+            **self.stats,
+            'pending': len(self._queue),
+            'spill_pending': self._has_spill(),
+            'running': self._thread is not None and self._thread.is_alive()
+        }
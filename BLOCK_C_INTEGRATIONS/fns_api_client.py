@@ -8,6 +8,8 @@ import logging
 from typing import Dict, Any, Optional
 from datetime import datetime
 
+from .circuit_breaker import ResilientSession, IntegrationUnavailableError
+
 logger = logging.getLogger(__name__)
 
 class FNSAPIClient:
@@ -16,7 +18,7 @@ class FNSAPIClient:
     def __init__(self, api_key: str, base_url: str = "https://api-fns.ru"):
         self.api_key = api_key
         self.base_url = base_url.rstrip('/')
-        self.session = requests.Session()
+        self.session = ResilientSession('fns')
         self.session.headers.update({
             'User-Agent': 'HausPrice-Ecosystem/1.0',
             'Accept': 'application/json'
@@ -56,6 +58,13 @@ class FNSAPIClient:
                     'details': response.text[:200]
                 }
                 
+        except IntegrationUnavailableError as e:
+            logger.warning(f"FNS API unavailable, INN check rejected: {inn}")
+            return {
+                'success': False,
+                'error': 'Сервис ФНС временно недоступен',
+                'details': str(e)
+            }
         except requests.Timeout:
             logger.error(f"Timeout checking INN: {inn}")
             return {
@@ -0,0 +1,183 @@
+"""
+КЛЮЧИ ИДЕМПОТЕНТНОСТИ ПЛАТЕЖНЫХ ОПЕРАЦИЙ
+Детерминированные ключи из бизнес-идентификаторов, журнал операций
+и повтор запросов с тем же ключом
+"""
+
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Dict, Any, Optional, Callable
+
+import requests
+
+from .circuit_breaker import IntegrationUnavailableError
+from .config import BlockCConfig
+
+logger = logging.getLogger(__name__)
+
+# Пространство имен для uuid5: один и тот же бизнес-ключ дает один и тот же ключ
+IDEMPOTENCY_NAMESPACE = uuid.UUID('6f1c9a52-3d7e-4b8a-9c21-5e0d4f7a8b93')
+
+STARTED = 'started'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+
+
+def make_idempotency_key(operation: str, *business_ids: Any) -> str:
+    """Ключ идемпотентности операции (UUID, не длиннее 64 символов ЮKassa)"""
+    business_key = ':'.join(str(value) for value in business_ids)
+    return str(uuid.uuid5(IDEMPOTENCY_NAMESPACE, f'{operation}:{business_key}'))
+
+
+class IdempotencyStore:
+    """Журнал ключей идемпотентности (SQLite)
+
+    Ключ записывается до отправки запроса. Успешный ответ сохраняется,
+    и повторный вызов с тем же бизнес-ключом возвращает его без запроса
+    к платежной системе. Записи старше key_ttl (срок хранения ключа на
+    стороне платежной системы) не повторяются: ключ начинается заново.
+    """
+
+    def __init__(self, db_path: Optional[str] = None, key_ttl: Optional[int] = None):
+        config = BlockCConfig.PAYMENT_CONFIG
+        self.db_path = db_path or config['idempotency_db_path']
+        self.key_ttl = key_ttl or config['idempotency_key_ttl']
+
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._create_tables()
+        self.purge_expired()
+
+    def _create_tables(self):
+        with self._lock, self._conn:
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS idempotency_keys (
+                    idempotency_key TEXT PRIMARY KEY,
+                    operation TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    attempts INTEGER DEFAULT 0,
+                    response TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            ''')
+
+    def begin(self, idempotency_key: str, operation: str) -> Dict[str, Any]:
+        """Регистрация ключа перед запросом; возвращает текущую запись ключа"""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                'DELETE FROM idempotency_keys WHERE idempotency_key = ? AND created_at < ?',
+                (idempotency_key, now - self.key_ttl)
+            )
+            self._conn.execute('''
+                INSERT OR IGNORE INTO idempotency_keys
+                    (idempotency_key, operation, status, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (idempotency_key, operation, STARTED, now, now))
+            self._conn.execute(
+                'UPDATE idempotency_keys SET attempts = attempts + 1, updated_at = ? '
+                'WHERE idempotency_key = ? AND status != ?',
+                (now, idempotency_key, SUCCEEDED)
+            )
+            row = self._conn.execute(
+                'SELECT * FROM idempotency_keys WHERE idempotency_key = ?', (idempotency_key,)
+            ).fetchone()
+
+        record = dict(row)
+        record['response'] = json.loads(record['response']) if record['response'] else None
+        return record
+
+    def complete(self, idempotency_key: str, response: Dict[str, Any]):
+        """Сохранение успешного ответа"""
+        self._finish(idempotency_key, SUCCEEDED, response=response)
+
+    def fail(self, idempotency_key: str, error: str):
+        """Операция не выполнена (ключ можно использовать повторно)"""
+        self._finish(idempotency_key, FAILED, error=error)
+
+    def _finish(self, idempotency_key: str, status: str,
+                response: Optional[Dict[str, Any]] = None, error: Optional[str] = None):
+        with self._lock, self._conn:
+            self._conn.execute('''
+                UPDATE idempotency_keys
+                SET status = ?, response = COALESCE(?, response), error = ?, updated_at = ?
+                WHERE idempotency_key = ?
+            ''', (
+                status,
+                json.dumps(response, ensure_ascii=False, default=str) if response is not None else None,
+                error, time.time(), idempotency_key
+            ))
+
+    def get(self, idempotency_key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT * FROM idempotency_keys WHERE idempotency_key = ?', (idempotency_key,)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def completed_response(self, idempotency_key: str) -> Optional[Dict[str, Any]]:
+        """Сохраненный успешный ответ по ключу, если срок ключа не истек"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT response FROM idempotency_keys '
+                'WHERE idempotency_key = ? AND status = ? AND created_at >= ?',
+                (idempotency_key, SUCCEEDED, time.time() - self.key_ttl)
+            ).fetchone()
+        return json.loads(row['response']) if row and row['response'] else None
+
+    def purge_expired(self) -> int:
+        """Удаление ключей старше срока хранения на стороне платежной системы"""
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                'DELETE FROM idempotency_keys WHERE created_at < ?', (time.time() - self.key_ttl,)
+            )
+        return cursor.rowcount
+
+    def close(self):
+        self._conn.close()
+
+
+def request_with_retry(send: Callable[..., requests.Response], idempotency_key: str,
+                       max_retries: Optional[int] = None, backoff: Optional[float] = None,
+                       sleep: Callable[[float], None] = time.sleep, **kwargs) -> requests.Response:
+    """Запрос с повторами при сетевых ошибках, 429 и 5xx с тем же ключом
+
+    Заголовок Idempotence-Key передается в параметрах запроса, а не
+    в общей сессии, поэтому одновременные запросы не перетирают ключи
+    друг друга. Открытый circuit breaker не повторяется.
+    """
+    config = BlockCConfig.PAYMENT_CONFIG
+    max_retries = config['max_retries'] if max_retries is None else max_retries
+    backoff = config['retry_backoff'] if backoff is None else backoff
+
+    headers = {**kwargs.pop('headers', {}), 'Idempotence-Key': idempotency_key}
+
+    for attempt in range(max_retries + 1):
+        last_attempt = attempt == max_retries
+        try:
+            response = send(headers=headers, **kwargs)
+        except IntegrationUnavailableError:
+            raise
+        except requests.RequestException as e:
+            if last_attempt:
+                raise
+            logger.warning(f"Payment request {idempotency_key} failed ({e}), retrying")
+        else:
+            if (response.status_code != 429 and response.status_code < 500) or last_attempt:
+                return response
+            logger.warning(f"Payment request {idempotency_key} got {response.status_code}, retrying")
+
+        sleep(backoff * (2 ** attempt) * (1 + random.random() * 0.1))
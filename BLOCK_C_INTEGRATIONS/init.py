@@ -13,6 +13,16 @@ from .umnico_connector import UmnicoConnector
 from .tilda_connector import TildaConnector
 from .payment_gateway import PaymentGateway
 from .email_service import EmailService
+from .circuit_breaker import CircuitBreaker, get_circuit_breaker, get_circuit_breakers_status
+from .recommendation_cache import RecommendationCache
+from .conversation_store import ConversationStore, ConversationSync
+from .tilda_page_sync import PageRenderCache, TildaPageSync
+from .tilda_stats import TildaStatsWarehouse, TildaStatsSync
+from .webhook_ingest import WebhookIngestor, RedisDedupStore, LocalDedupStore
+from .webhook_inbox import WebhookInbox, InboxDispatcher
+from .idempotency import IdempotencyStore, make_idempotency_key
+from .payment_history import PaymentHistoryCache
+from .tariff_pricing import TariffPricing, get_tariff_pricing
 
 __all__ = [
     'WebhookHandler',
@@ -21,5 +31,25 @@ __all__ = [
     'UmnicoConnector',
     'TildaConnector',
     'PaymentGateway',
-    'EmailService'
+    'EmailService',
+    'CircuitBreaker',
+    'get_circuit_breaker',
+    'get_circuit_breakers_status',
+    'RecommendationCache',
+    'ConversationStore',
+    'ConversationSync',
+    'PageRenderCache',
+    'TildaPageSync',
+    'TildaStatsWarehouse',
+    'TildaStatsSync',
+    'WebhookIngestor',
+    'RedisDedupStore',
+    'LocalDedupStore',
+    'WebhookInbox',
+    'InboxDispatcher',
+    'IdempotencyStore',
+    'make_idempotency_key',
+    'PaymentHistoryCache',
+    'TariffPricing',
+    'get_tariff_pricing'
 ]
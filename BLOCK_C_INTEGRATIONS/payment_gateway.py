@@ -7,18 +7,33 @@ import requests
 import logging
 import json
 import base64
-from typing import Dict, Any, Optional, List
+import threading
+from typing import Dict, Any, Optional, List, Iterator
 from datetime import datetime, timedelta
 import uuid
 
+from .circuit_breaker import ResilientSession
+from .idempotency import (
+    IDEMPOTENCY_NAMESPACE, SUCCEEDED, IdempotencyStore, make_idempotency_key, request_with_retry
+)
+from .payment_history import PaymentHistoryCache, iter_cached_history
+from .tariff_pricing import get_tariff_pricing
+from .config import BlockCConfig
+
 logger = logging.getLogger(__name__)
 
+# Статусы ЮKassa, после которых платеж не будет оплачен
+# (истекший платеж тоже переходит в canceled)
+FINAL_UNSUCCESSFUL_STATUSES = ('canceled',)
+
 class PaymentGateway:
     """Платежный шлюз для обработки оплаты подписок"""
     
-    def __init__(self, provider: str = 'yookassa', **config):
+    def __init__(self, provider: str = 'yookassa',
+                 history_cache: Optional[PaymentHistoryCache] = None, **config):
         self.provider = provider.lower()
         self.config = config
+        self.history_cache = history_cache
         
         if self.provider == 'yookassa':
             self.gateway = YooKassaGateway(**config)
@@ -32,8 +47,13 @@ class PaymentGateway:
                       return_url: str) -> Dict[str, Any]:
         """Создание платежа"""
         try:
-            # Генерация уникального ID платежа
-            payment_id = str(uuid.uuid4())
+            # ID платежа выводится из счета/заказа, чтобы повторный вызов
+            # (в том числе из другого воркера) не создал второй платеж
+            business_key = metadata.get('invoice_number') or metadata.get('order_id')
+            if business_key:
+                payment_id = str(uuid.uuid5(IDEMPOTENCY_NAMESPACE, f'payment:{business_key}'))
+            else:
+                payment_id = str(uuid.uuid4())
             
             result = self.gateway.create_payment(
                 amount=amount,
@@ -122,7 +142,8 @@ class PaymentGateway:
             result = self.gateway.get_payment_history(
                 metadata_filter={'partner_code': partner_code},
                 start_date=start_date,
-                end_date=end_date
+                end_date=end_date,
+                cache=self.history_cache
             )
             
             return result
@@ -134,10 +155,26 @@ class PaymentGateway:
                 'error': f'Ошибка получения истории платежей: {str(e)}'
             }
     
-    def refund_payment(self, payment_id: str, amount: Optional[float] = None) -> Dict[str, Any]:
-        """Возврат платежа"""
+    def iter_payment_history(self, partner_code: str,
+                             start_date: Optional[str] = None,
+                             end_date: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """Постраничная история платежей партнера (от новых к старым)
+
+        Страницы запрашиваются по мере чтения; без start_date - вся история.
+        Ошибки платежной системы пробрасываются исключением.
+        """
+        return self.gateway.iter_payment_history(
+            metadata_filter={'partner_code': partner_code},
+            start_date=start_date,
+            end_date=end_date,
+            cache=self.history_cache
+        )
+    
+    def refund_payment(self, payment_id: str, amount: Optional[float] = None,
+                       refund_id: Optional[str] = None) -> Dict[str, Any]:
+        """Возврат платежа (refund_id - ID возврата в системе, см. YooKassaGateway)"""
         try:
-            return self.gateway.refund_payment(payment_id, amount)
+            return self.gateway.refund_payment(payment_id, amount, refund_id=refund_id)
         except Exception as e:
             logger.error(f"Error refunding payment {payment_id}: {e}")
             return {
@@ -146,15 +183,10 @@ class PaymentGateway:
             }
     
     def calculate_tariff_amount(self, tariff_plan: str) -> Dict[str, Any]:
-        """Расчет суммы платежа по тарифу"""
-        tariffs = {
-            'start': {'monthly': 0, 'yearly': 0},
-            'basic': {'monthly': 5000, 'yearly': 50000},  # Скидка 16.7%
-            'premium': {'monthly': 15000, 'yearly': 150000},
-            'business': {'monthly': 30000, 'yearly': 300000}
-        }
+        """Расчет суммы платежа по тарифу (общая таблица цен, суммы с НДС)"""
+        quote = get_tariff_pricing().quote(tariff_plan)
         
-        if tariff_plan not in tariffs:
+        if quote is None:
             return {
                 'success': False,
                 'error': f'Неизвестный тарифный план: {tariff_plan}'
@@ -163,7 +195,9 @@ class PaymentGateway:
         return {
             'success': True,
             'tariff_plan': tariff_plan,
-            'amounts': tariffs[tariff_plan],
+            'amounts': {period: price['amount'] for period, price in quote['prices'].items()},
+            'prices': quote['prices'],
+            'tax_rate': quote['tax_rate'],
             'currency': 'RUB',
             'description': f'Тарифный план: {tariff_plan}'
         }
@@ -173,7 +207,8 @@ class YooKassaGateway:
     """Интеграция с ЮKassa (Яндекс.Касса)"""
     
     def __init__(self, shop_id: str, secret_key: str, 
-                 api_url: str = "https://api.yookassa.ru/v3"):
+                 api_url: str = "https://api.yookassa.ru/v3",
+                 idempotency_store: Optional[IdempotencyStore] = None):
         self.shop_id = shop_id
         self.secret_key = secret_key
         self.api_url = api_url.rstrip('/')
@@ -181,12 +216,60 @@ class YooKassaGateway:
         auth_string = f"{shop_id}:{secret_key}"
         self.auth_header = f"Basic {base64.b64encode(auth_string.encode()).decode()}"
         
-        self.session = requests.Session()
+        # Idempotence-Key передается в заголовках каждого запроса,
+        # общая сессия не изменяется и безопасна для нескольких потоков
+        self.session = ResilientSession('yookassa')
         self.session.headers.update({
             'Authorization': self.auth_header,
-            'Content-Type': 'application/json',
-            'Idempotence-Key': ''  # Будет обновляться для каждого запроса
+            'Content-Type': 'application/json'
         })
+        self._idempotency_store = idempotency_store
+        self._store_lock = threading.Lock()
+    
+    @property
+    def idempotency_store(self) -> IdempotencyStore:
+        """Журнал ключей идемпотентности (по умолчанию открывается при первом запросе)"""
+        if self._idempotency_store is None:
+            with self._store_lock:
+                if self._idempotency_store is None:
+                    self._idempotency_store = IdempotencyStore()
+        return self._idempotency_store
+    
+    def _payment_canceled(self, yookassa_payment_id: Optional[str]) -> bool:
+        """Платеж ЮKassa отменен или истек (оплатить его уже нельзя)"""
+        if not yookassa_payment_id:
+            return False
+        status = self.verify_payment(yookassa_payment_id)
+        return status.get('success', False) and status.get('status') in FINAL_UNSUCCESSFUL_STATUSES
+    
+    def _idempotent_post(self, operation: str, idempotence_key: str, url: str,
+                         parse_response, error_message: str, **kwargs) -> Dict[str, Any]:
+        """POST с ключом идемпотентности: ключ сохраняется до запроса,
+        повторы идут с тем же ключом, успешный результат кэшируется"""
+        record = self.idempotency_store.begin(idempotence_key, operation)
+        if record['status'] == SUCCEEDED:
+            logger.info(f"YooKassa {operation} {idempotence_key} already completed")
+            return {**record['response'], 'idempotent_replay': True}
+        
+        try:
+            response = request_with_retry(self.session.post, idempotence_key, url=url, **kwargs)
+        except Exception as e:
+            self.idempotency_store.fail(idempotence_key, str(e))
+            raise
+        
+        if response.status_code == 200:
+            result = parse_response(response.json())
+            result['idempotence_key'] = idempotence_key
+            self.idempotency_store.complete(idempotence_key, result)
+            return result
+        
+        logger.error(f"YooKassa {operation} failed: {response.status_code} - {response.text}")
+        self.idempotency_store.fail(idempotence_key, f'HTTP {response.status_code}')
+        return {
+            'success': False,
+            'error': f'{error_message}: {response.status_code}',
+            'details': response.text[:200]
+        }
     
     def create_payment(self, amount: float, currency: str, 
                       description: str, metadata: Dict[str, Any],
@@ -195,9 +278,15 @@ class YooKassaGateway:
         try:
             url = f"{self.api_url}/payments"
             
-            # Генерация уникального ключа идемпотентности
-            idempotence_key = str(uuid.uuid4())
-            self.session.headers['Idempotence-Key'] = idempotence_key
+            # Ключ идемпотентности из ID платежа (повторы используют тот же ключ).
+            # Если платеж по ключу уже отменен или истек, его ссылку не
+            # возвращаем: следующий ключ выводится из ID отмененного платежа
+            payment_id = metadata.get('payment_id') or uuid.uuid4()
+            idempotence_key = make_idempotency_key('create_payment', payment_id)
+            cached = self.idempotency_store.completed_response(idempotence_key)
+            while cached and self._payment_canceled(cached.get('payment_id')):
+                idempotence_key = make_idempotency_key('create_payment', payment_id, cached['payment_id'])
+                cached = self.idempotency_store.completed_response(idempotence_key)
             
             # Конвертация суммы в копейки для RUB
             amount_value = int(amount * 100) if currency == 'RUB' else amount
@@ -217,27 +306,19 @@ class YooKassaGateway:
             }
             
             logger.info(f"Creating YooKassa payment: {description}")
-            response = self.session.post(url, json=payload, timeout=15)
-            
-            if response.status_code == 200:
-                data = response.json()
-                
-                return {
+            return self._idempotent_post(
+                'create_payment', idempotence_key, url,
+                lambda data: {
                     'success': True,
                     'payment_id': data.get('id'),
                     'confirmation_url': data.get('confirmation', {}).get('confirmation_url'),
                     'status': data.get('status'),
                     'amount': amount,
-                    'currency': currency,
-                    'idempotence_key': idempotence_key
-                }
-            else:
-                logger.error(f"YooKassa payment creation failed: {response.status_code} - {response.text}")
-                return {
-                    'success': False,
-                    'error': f'Ошибка создания платежа: {response.status_code}',
-                    'details': response.text[:200]
-                }
+                    'currency': currency
+                },
+                'Ошибка создания платежа',
+                json=payload, timeout=15
+            )
                 
         except Exception as e:
             logger.error(f"Error creating YooKassa payment: {e}")
@@ -251,9 +332,6 @@ class YooKassaGateway:
         try:
             url = f"{self.api_url}/payments/{payment_id}"
             
-            idempotence_key = str(uuid.uuid4())
-            self.session.headers['Idempotence-Key'] = idempotence_key
-            
             response = self.session.get(url, timeout=10)
             
             if response.status_code == 200:
@@ -267,7 +345,8 @@ class YooKassaGateway:
                     'currency': data.get('amount', {}).get('currency'),
                     'paid': data.get('paid'),
                     'metadata': data.get('metadata', {}),
-                    'created_at': data.get('created_at')
+                    'created_at': data.get('created_at'),
+                    'paid_at': data.get('captured_at')
                 }
             else:
                 return {
@@ -288,8 +367,13 @@ class YooKassaGateway:
         try:
             url = f"{self.api_url}/subscriptions"
             
-            idempotence_key = str(uuid.uuid4())
-            self.session.headers['Idempotence-Key'] = idempotence_key
+            start_date = datetime.now() + timedelta(days=1)
+            
+            # Одна подписка партнера на тариф с заданной даты начала
+            idempotence_key = make_idempotency_key(
+                'create_subscription', metadata.get('partner_code'), metadata.get('tariff_plan'),
+                interval, start_date.date().isoformat()
+            )
             
             # Конвертация суммы в копейки
             amount_value = int(amount * 100)
@@ -302,27 +386,22 @@ class YooKassaGateway:
                 'description': description,
                 'metadata': metadata,
                 'interval': interval,
-                'start_date': (datetime.now() + timedelta(days=1)).isoformat() + 'Z'
+                'start_date': start_date.isoformat() + 'Z'
             }
             
-            response = self.session.post(url, json=payload, timeout=15)
-            
-            if response.status_code == 200:
-                data = response.json()
-                
-                return {
+            return self._idempotent_post(
+                'create_subscription', idempotence_key, url,
+                lambda data: {
                     'success': True,
                     'subscription_id': data.get('id'),
                     'status': data.get('status'),
                     'amount': amount,
                     'interval': interval,
                     'confirmation_url': data.get('confirmation_url')
-                }
-            else:
-                return {
-                    'success': False,
-                    'error': f'Ошибка создания подписки: {response.status_code}'
-                }
+                },
+                'Ошибка создания подписки',
+                json=payload, timeout=15
+            )
                 
         except Exception as e:
             logger.error(f"Error creating YooKassa subscription: {e}")
@@ -336,22 +415,18 @@ class YooKassaGateway:
         try:
             url = f"{self.api_url}/subscriptions/{subscription_id}/cancel"
             
-            idempotence_key = str(uuid.uuid4())
-            self.session.headers['Idempotence-Key'] = idempotence_key
-            
-            response = self.session.post(url, timeout=10)
+            idempotence_key = make_idempotency_key('cancel_subscription', subscription_id)
             
-            if response.status_code == 200:
-                return {
+            return self._idempotent_post(
+                'cancel_subscription', idempotence_key, url,
+                lambda data: {
                     'success': True,
                     'subscription_id': subscription_id,
                     'message': 'Подписка отменена'
-                }
-            else:
-                return {
-                    'success': False,
-                    'error': f'Ошибка отмены подписки: {response.status_code}'
-                }
+                },
+                'Ошибка отмены подписки',
+                timeout=10
+            )
                 
         except Exception as e:
             logger.error(f"Error canceling YooKassa subscription {subscription_id}: {e}")
@@ -360,53 +435,85 @@ class YooKassaGateway:
                 'error': f'Ошибка отмены подписки: {str(e)}'
             }
     
+    def iter_payments(self, metadata_filter: Dict[str, Any],
+                      created_gte: Optional[str] = None,
+                      created_gt: Optional[str] = None,
+                      created_lte: Optional[str] = None,
+                      page_size: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        """Платежи от новых к старым; следующая страница (next_cursor)
+        запрашивается, только когда прочитана предыдущая"""
+        url = f"{self.api_url}/payments"
+        params = {'limit': page_size or BlockCConfig.PAYMENT_CONFIG['history_page_size']}
+        if created_gte:
+            params['created_at.gte'] = created_gte
+        if created_gt:
+            params['created_at.gt'] = created_gt
+        if created_lte:
+            params['created_at.lte'] = created_lte
+        
+        # Добавляем фильтр по метаданным
+        if metadata_filter:
+            for key, value in metadata_filter.items():
+                params[f'metadata.{key}'] = value
+        
+        while True:
+            response = self.session.get(url, params=params, timeout=10)
+            if response.status_code != 200:
+                raise requests.HTTPError(
+                    f'Ошибка получения истории платежей: {response.status_code}', response=response
+                )
+            
+            data = response.json()
+            for payment in data.get('items', []):
+                yield self._format_history_item(payment)
+            
+            next_cursor = data.get('next_cursor')
+            if not next_cursor:
+                break
+            params['cursor'] = next_cursor
+    
+    @staticmethod
+    def _format_history_item(payment: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            'id': payment.get('id'),
+            'status': payment.get('status'),
+            'amount': float(payment.get('amount', {}).get('value', 0)) / 100,
+            'currency': payment.get('amount', {}).get('currency'),
+            'description': payment.get('description'),
+            'metadata': payment.get('metadata', {}),
+            'created_at': payment.get('created_at'),
+            'paid': payment.get('paid')
+        }
+    
+    def iter_payment_history(self, metadata_filter: Dict[str, Any],
+                             start_date: Optional[str] = None, end_date: Optional[str] = None,
+                             cache: Optional[PaymentHistoryCache] = None) -> Iterator[Dict[str, Any]]:
+        """История платежей за период (даты YYYY-MM-DD) с кэшем завершенных платежей"""
+        return iter_cached_history(
+            self, cache, metadata_filter,
+            created_gte=f'{start_date}T00:00:00.000Z' if start_date else None,
+            created_lte=f'{end_date}T23:59:59.999Z' if end_date else None
+        )
+    
     def get_payment_history(self, metadata_filter: Dict[str, Any],
-                           start_date: str, end_date: str) -> Dict[str, Any]:
-        """Получение истории платежей"""
+                           start_date: str, end_date: str,
+                           cache: Optional[PaymentHistoryCache] = None) -> Dict[str, Any]:
+        """Получение истории платежей (все страницы)"""
         try:
-            url = f"{self.api_url}/payments"
+            payments = list(self.iter_payment_history(metadata_filter, start_date, end_date, cache))
             
-            params = {
-                'created_at.gte': f'{start_date}T00:00:00.000Z',
-                'created_at.lte': f'{end_date}T23:59:59.999Z',
-                'limit': 100
+            return {
+                'success': True,
+                'payments': payments,
+                'count': len(payments),
+                'period': f'{start_date} - {end_date}'
             }
-            
-            # Добавляем фильтр по метаданным
-            if metadata_filter:
-                for key, value in metadata_filter.items():
-                    params[f'metadata.{key}'] = value
-            
-            response = self.session.get(url, params=params, timeout=10)
-            
-            if response.status_code == 200:
-                data = response.json()
-                
-                payments = []
-                for payment in data.get('items', []):
-                    payments.append({
-                        'id': payment.get('id'),
-                        'status': payment.get('status'),
-                        'amount': float(payment.get('amount', {}).get('value', 0)) / 100,
-                        'currency': payment.get('amount', {}).get('currency'),
-                        'description': payment.get('description'),
-                        'metadata': payment.get('metadata', {}),
-                        'created_at': payment.get('created_at'),
-                        'paid': payment.get('paid')
-                    })
-                
-                return {
-                    'success': True,
-                    'payments': payments,
-                    'count': len(payments),
-                    'period': f'{start_date} - {end_date}'
-                }
-            else:
-                return {
-                    'success': False,
-                    'error': f'Ошибка получения истории платежей: {response.status_code}'
-                }
                 
+        except requests.HTTPError as e:
+            return {
+                'success': False,
+                'error': str(e)
+            }
         except Exception as e:
             logger.error(f"Error getting YooKassa payment history: {e}")
             return {
@@ -414,14 +521,19 @@ class YooKassaGateway:
                 'error': f'Ошибка получения истории платежей: {str(e)}'
             }
     
-    def refund_payment(self, payment_id: str, amount: Optional[float] = None) -> Dict[str, Any]:
-        """Возврат платежа"""
+    def refund_payment(self, payment_id: str, amount: Optional[float] = None,
+                       refund_id: Optional[str] = None) -> Dict[str, Any]:
+        """Возврат платежа
+
+        refund_id - ID возврата в системе (заявка на возврат): повтор с тем же
+        refund_id не создает второй возврат. Без него ключ берется из номера
+        возврата по платежу: первый еще не выполненный номер, так что повтор
+        после ошибки идет с тем же ключом, а следующий успешный возврат той же
+        суммы - с новым.
+        """
         try:
             url = f"{self.api_url}/refunds"
             
-            idempotence_key = str(uuid.uuid4())
-            self.session.headers['Idempotence-Key'] = idempotence_key
-            
             # Получаем информацию о платеже
             payment_info = self.verify_payment(payment_id)
             if not payment_info.get('success'):
@@ -438,24 +550,28 @@ class YooKassaGateway:
                 }
             }
             
-            response = self.session.post(url, json=payload, timeout=10)
-            
-            if response.status_code == 200:
-                data = response.json()
-                
-                return {
+            if refund_id:
+                idempotence_key = make_idempotency_key('refund', payment_id, refund_id)
+            else:
+                sequence = 0
+                while self.idempotency_store.completed_response(
+                        make_idempotency_key('refund', payment_id, f'#{sequence}')):
+                    sequence += 1
+                idempotence_key = make_idempotency_key('refund', payment_id, f'#{sequence}')
+            
+            return self._idempotent_post(
+                'refund', idempotence_key, url,
+                lambda data: {
                     'success': True,
                     'refund_id': data.get('id'),
                     'payment_id': payment_id,
                     'amount': refund_amount,
                     'status': data.get('status'),
                     'created_at': data.get('created_at')
-                }
-            else:
-                return {
-                    'success': False,
-                    'error': f'Ошибка возврата платежа: {response.status_code}'
-                }
+                },
+                'Ошибка возврата платежа',
+                json=payload, timeout=10
+            )
                 
         except Exception as e:
             logger.error(f"Error refunding YooKassa payment {payment_id}: {e}")
@@ -477,7 +593,7 @@ class CloudPaymentsGateway:
         auth_string = f"{public_id}:{api_secret}"
         self.auth_header = f"Basic {base64.b64encode(auth_string.encode()).decode()}"
         
-        self.session = requests.Session()
+        self.session = ResilientSession('cloudpayments')
         self.session.headers.update({
             'Authorization': self.auth_header,
             'Content-Type': 'application/json'
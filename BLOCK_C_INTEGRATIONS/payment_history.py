@@ -0,0 +1,170 @@
+"""
+КЭШ ИСТОРИИ ПЛАТЕЖЕЙ
+Локальная копия завершенных (неизменяемых) платежей: повторный просмотр
+истории запрашивает у платежной системы только новые платежи
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Dict, Any, Iterator, Optional
+
+from .config import BlockCConfig
+
+logger = logging.getLogger(__name__)
+
+
+def history_scope(metadata_filter: Dict[str, Any]) -> str:
+    """Ключ истории по фильтру метаданных (например, partner_code)"""
+    return json.dumps(metadata_filter or {}, sort_keys=True, ensure_ascii=False)
+
+
+class PaymentHistoryCache:
+    """Завершенные платежи по фильтру истории (SQLite)
+
+    Для каждого фильтра хранится отрезок [covered_from, watermark]:
+    все платежи в нем завершены и лежат в кэше. Повторный просмотр,
+    начинающийся внутри отрезка, запрашивает у платежной системы только
+    платежи новее watermark.
+    """
+
+    def __init__(self, db_path: Optional[str] = None):
+        config = BlockCConfig.PAYMENT_CONFIG
+        self.db_path = db_path or config['history_cache_db_path']
+        self.settled_statuses = set(config['settled_statuses'])
+
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._create_tables()
+
+    def _create_tables(self):
+        with self._lock, self._conn:
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS settled_payments (
+                    scope TEXT NOT NULL,
+                    payment_id TEXT NOT NULL,
+                    created_at TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    PRIMARY KEY (scope, payment_id)
+                )
+            ''')
+            self._conn.execute(
+                'CREATE INDEX IF NOT EXISTS idx_settled_payments_created '
+                'ON settled_payments (scope, created_at)'
+            )
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS payment_history_watermarks (
+                    scope TEXT PRIMARY KEY,
+                    covered_from TEXT NOT NULL,
+                    watermark TEXT NOT NULL,
+                    updated_at TEXT NOT NULL
+                )
+            ''')
+
+    def is_settled(self, payment: Dict[str, Any]) -> bool:
+        return payment.get('status') in self.settled_statuses
+
+    def save(self, scope: str, payment: Dict[str, Any]):
+        """Сохранение завершенного платежа"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO settled_payments (scope, payment_id, created_at, payload) '
+                'VALUES (?, ?, ?, ?)',
+                (scope, payment['id'], payment['created_at'],
+                 json.dumps(payment, ensure_ascii=False, default=str))
+            )
+
+    def get_coverage(self, scope: str) -> Optional[Dict[str, str]]:
+        """Покрытый кэшем отрезок: {'covered_from', 'watermark'} или None"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT covered_from, watermark FROM payment_history_watermarks WHERE scope = ?',
+                (scope,)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def set_coverage(self, scope: str, covered_from: str, watermark: str):
+        """covered_from - начало отрезка ('' - с начала истории)"""
+        with self._lock, self._conn:
+            self._conn.execute('''
+                INSERT OR REPLACE INTO payment_history_watermarks
+                    (scope, covered_from, watermark, updated_at)
+                VALUES (?, ?, ?, ?)
+            ''', (scope, covered_from, watermark, datetime.utcnow().isoformat()))
+
+    def iter_payments(self, scope: str, created_gte: Optional[str] = None,
+                      created_lte: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """Платежи из кэша от новых к старым"""
+        query = 'SELECT payload FROM settled_payments WHERE scope = ?'
+        params = [scope]
+        if created_gte:
+            query += ' AND created_at >= ?'
+            params.append(created_gte)
+        if created_lte:
+            query += ' AND created_at <= ?'
+            params.append(created_lte)
+        query += ' ORDER BY created_at DESC'
+
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        for row in rows:
+            yield json.loads(row['payload'])
+
+    def close(self):
+        self._conn.close()
+
+
+def iter_cached_history(gateway, cache: Optional[PaymentHistoryCache],
+                        metadata_filter: Dict[str, Any],
+                        created_gte: Optional[str] = None,
+                        created_lte: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """История платежей от новых к старым: новее watermark - из платежной
+    системы (постранично, по мере чтения), остальное - из кэша
+
+    Отрезок кэша обновляется, только если ответ платежной системы прочитан
+    до конца: прерванный перебор не гарантирует отсутствие пропусков.
+    """
+    if cache is None:
+        yield from gateway.iter_payments(metadata_filter, created_gte=created_gte,
+                                         created_lte=created_lte)
+        return
+
+    scope = history_scope(metadata_filter)
+    lower = created_gte or ''
+    coverage = cache.get_coverage(scope)
+    covered = bool(coverage) and coverage['covered_from'] <= lower <= coverage['watermark']
+    watermark = coverage['watermark'] if covered else None
+
+    if not (watermark and created_lte and watermark >= created_lte):
+        # Самый новый завершенный платеж, старше которого нет незавершенных
+        candidate = None
+        for payment in gateway.iter_payments(
+            metadata_filter,
+            created_gte=None if watermark else created_gte,
+            created_gt=watermark,
+            created_lte=created_lte
+        ):
+            if cache.is_settled(payment):
+                cache.save(scope, payment)
+                candidate = candidate or payment['created_at']
+            else:
+                candidate = None
+            yield payment
+
+        if candidate:
+            if covered:
+                cache.set_coverage(scope, coverage['covered_from'], candidate)
+            elif not coverage or candidate >= coverage['watermark']:
+                cache.set_coverage(scope, lower, candidate)
+
+    if watermark:
+        upper = min(watermark, created_lte) if created_lte else watermark
+        yield from cache.iter_payments(scope, created_gte=created_gte, created_lte=upper)
@@ -5,23 +5,42 @@
 
 import requests
 import logging
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, Any, List, Optional
 from datetime import datetime
 
+from .circuit_breaker import ResilientSession, IntegrationUnavailableError
+from .config import BlockCConfig
+from .rate_limiter import TokenBucket, KeyedRateLimiter
+from .recommendation_cache import RecommendationCache
+
 logger = logging.getLogger(__name__)
 
+# Открывающий или закрывающий тег разметки HTML Telegram
+HTML_TAG = re.compile(r'<(/?)([a-zA-Z][a-zA-Z0-9-]*)[^>]*>')
+
 class ProtalkConnector:
     """Коннектор для работы с Protalk ботами"""
     
-    def __init__(self, api_key: str, base_url: str = "https://api.protalk.io"):
+    def __init__(self, api_key: str, base_url: str = "https://api.protalk.io",
+                 recommendation_cache: Optional[RecommendationCache] = None):
         self.api_key = api_key
         self.base_url = base_url.rstrip('/')
-        self.session = requests.Session()
+        self.session = ResilientSession('protalk')
         self.session.headers.update({
             'Authorization': f'Bearer {api_key}',
             'Content-Type': 'application/json',
             'User-Agent': 'HausPrice-Ecosystem/1.0'
         })
+        
+        self.config = BlockCConfig.PROTALK_CONFIG
+        # Лимиты Telegram: ~1 сообщение в секунду в чат, ~30 в секунду на бота
+        self.chat_limiter = KeyedRateLimiter(self.config['per_chat_rate'])
+        self.broadcast_limiter = TokenBucket(self.config['broadcast_rate'])
+        self.sleep = time.sleep
+        self.recommendation_cache = recommendation_cache
     
     def send_message(self, chat_id: str, text: str, 
                     keyboard: Optional[List[List[Dict]]] = None,
@@ -59,9 +78,18 @@ class ProtalkConnector:
                 return {
                     'success': False,
                     'error': f'Ошибка отправки сообщения: {response.status_code}',
-                    'details': response.text[:200]
+                    'details': response.text[:200],
+                    'status_code': response.status_code,
+                    'retry_after': self._get_retry_after(response)
                 }
                 
+        except IntegrationUnavailableError as e:
+            logger.warning(f"Protalk unavailable, message to chat {chat_id} rejected")
+            return {
+                'success': False,
+                'error': 'Сервис Protalk временно недоступен',
+                'details': str(e)
+            }
         except requests.Timeout:
             logger.error(f"Timeout sending message to chat {chat_id}")
             return {
@@ -170,7 +198,9 @@ class ProtalkConnector:
             else:
                 return {
                     'success': False,
-                    'error': f'Ошибка отправки сообщения: {response.status_code}'
+                    'error': f'Ошибка отправки сообщения: {response.status_code}',
+                    'status_code': response.status_code,
+                    'retry_after': self._get_retry_after(response)
                 }
                 
         except Exception as e:
@@ -262,8 +292,13 @@ class ProtalkConnector:
         
         return cards
     
-    def send_partner_recommendations(self, chat_id: str, partners: List[Dict[str, Any]]) -> Dict[str, Any]:
-        """Отправка рекомендаций партнеров пользователю"""
+    def send_partner_recommendations(self, chat_id: str, partners: List[Dict[str, Any]],
+                                     request_hash: Optional[str] = None) -> Dict[str, Any]:
+        """Отправка рекомендаций партнеров пользователю
+
+        При наличии recommendation_cache и request_hash вся подборка сохраняется
+        в кэш, и кнопка "Следующий партнер" обслуживается через send_next_partner.
+        """
         try:
             if not partners:
                 return self.send_message(
@@ -271,19 +306,18 @@ class ProtalkConnector:
                     text="😕 К сожалению, по вашим критериям не найдено подходящих партнеров.\n\nПопробуйте изменить параметры поиска."
                 )
             
-            # Отправляем первого партнера с подробной информацией
-            first_partner = partners[0]
-            first_card = self.format_partner_card(first_partner)
-            
-            # Создаем клавиатуру для навигации
-            keyboard = [
-                [self.create_menu_button("✅ Принять заявку", "accept_lead")],
-                [self.create_menu_button("❓ Задать вопрос", "ask_question")],
-                [self.create_menu_button("📞 Позвонить", "call_partner")],
-                [self.create_menu_button("➡️ Следующий партнер", "next_partner")]
-            ]
+            if self.recommendation_cache and request_hash:
+                # Рендерим всю подборку один раз, дальше страницы берутся из кэша
+                cards = self.format_partners_list(partners)
+                self.recommendation_cache.save(chat_id, request_hash, partners, cards=cards)
+                first_card = cards[0]
+                keyboard = self._recommendation_keyboard(request_hash, 1, len(partners) > 1)
+            else:
+                # Отправляем первого партнера с подробной информацией
+                first_card = self.format_partner_card(partners[0])
+                keyboard = self._recommendation_keyboard()
             
-            # Отправляем сообщение с клавиатурой
+            # Отправляем сообщение с клавиатурой для навигации
             result = self.send_inline_keyboard(
                 chat_id=chat_id,
                 text=first_card,
@@ -305,6 +339,216 @@ class ProtalkConnector:
                 'error': f'Ошибка отправки рекомендаций: {str(e)}'
             }
     
+    def send_next_partner(self, chat_id: str, request_hash: str, index: int) -> Dict[str, Any]:
+        """Показ партнера с номером index из сохраненной подборки (callback next_partner)"""
+        try:
+            if not self.recommendation_cache:
+                return {'success': False, 'error': 'Кэш подборок не настроен'}
+            
+            page = self.recommendation_cache.get_page(chat_id, request_hash, index)
+            if not page or not page['cards']:
+                return {
+                    'success': False,
+                    'cache_miss': True,
+                    'error': 'Подборка устарела, требуется новый поиск',
+                    'request_hash': request_hash
+                }
+            
+            result = self.send_inline_keyboard(
+                chat_id=chat_id,
+                text=page['cards'][0],
+                inline_keyboard=self._recommendation_keyboard(request_hash, index + 1, page['has_next'])
+            )
+            
+            if result['success']:
+                result['partner_id'] = page['partner_ids'][0]
+                result['total_partners'] = page['total']
+                result['current_index'] = index
+            
+            return result
+            
+        except Exception as e:
+            logger.error(f"Error sending next partner to chat {chat_id}: {e}")
+            return {
+                'success': False,
+                'error': f'Ошибка отправки рекомендаций: {str(e)}'
+            }
+    
+    def send_partner_cards(self, chat_id: str, partners: List[Dict[str, Any]],
+                           limit: Optional[int] = None) -> Dict[str, Any]:
+        """Отправка нескольких карточек партнеров минимальным числом сообщений"""
+        if not partners:
+            return self.send_partner_recommendations(chat_id, partners)
+        
+        limit = limit or self.config['max_partner_cards']
+        cards = self.format_partners_list(partners[:limit])
+        messages = self._pack_cards(cards)
+        
+        started = time.monotonic()
+        for i, text in enumerate(messages):
+            self.chat_limiter.acquire(chat_id)
+            
+            if i == len(messages) - 1:
+                result = self.send_inline_keyboard(
+                    chat_id=chat_id,
+                    text=text,
+                    inline_keyboard=self._recommendation_keyboard()
+                )
+            else:
+                result = self.send_message(chat_id=chat_id, text=text)
+            
+            if not result['success']:
+                result['messages_sent'] = i
+                return result
+        
+        return {
+            'success': True,
+            'chat_id': chat_id,
+            'partners_shown': len(cards),
+            'total_partners': len(partners),
+            'current_index': len(cards) - 1,
+            'messages_sent': len(messages),
+            'duration': round(time.monotonic() - started, 3)
+        }
+    
+    def broadcast_message(self, chat_ids: List[str], text: str,
+                          inline_keyboard: Optional[List[List[Dict]]] = None,
+                          max_workers: Optional[int] = None) -> Dict[str, Any]:
+        """Массовая рассылка (например, уведомления о новых заявках) на максимальной скорости бота"""
+        max_workers = max_workers or self.config['broadcast_workers']
+        started = time.monotonic()
+        
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(
+                lambda chat_id: self._deliver_broadcast(chat_id, text, inline_keyboard),
+                chat_ids
+            ))
+        
+        failed = [
+            {'chat_id': chat_id, 'error': result.get('error')}
+            for chat_id, result in zip(chat_ids, results)
+            if not result.get('success')
+        ]
+        duration = time.monotonic() - started
+        sent = len(results) - len(failed)
+        
+        logger.info(f"Broadcast finished: {sent}/{len(results)} sent in {duration:.1f}s")
+        return {
+            'success': not failed,
+            'total': len(results),
+            'sent': sent,
+            'failed': failed,
+            'duration': round(duration, 3),
+            'messages_per_second': round(sent / duration, 2) if duration else sent
+        }
+    
+    def _deliver_broadcast(self, chat_id: str, text: str,
+                           inline_keyboard: Optional[List[List[Dict]]]) -> Dict[str, Any]:
+        """Доставка одного сообщения рассылки с повтором при 429"""
+        result = {'success': False, 'error': 'Сообщение не отправлено'}
+        
+        for attempt in range(self.config['max_send_retries']):
+            if attempt:
+                self.sleep(result.get('retry_after') or 1)
+            self.broadcast_limiter.acquire()
+            self.chat_limiter.acquire(chat_id)
+            
+            if inline_keyboard:
+                result = self.send_inline_keyboard(chat_id, text, inline_keyboard)
+            else:
+                result = self.send_message(chat_id, text)
+            
+            if result['success'] or result.get('status_code') != 429:
+                return result
+        
+        return result
+    
+    def _pack_cards(self, cards: List[str]) -> List[str]:
+        """Объединение карточек в сообщения не длиннее max_message_length"""
+        max_length = self.config['max_message_length']
+        messages = []
+        current = ''
+        
+        for card in cards:
+            candidate = f"{current}\n\n{card}" if current else card
+            if len(candidate) <= max_length:
+                current = candidate
+            else:
+                if current:
+                    messages.append(current)
+                current = self._truncate_html(card, max_length)
+        
+        if current:
+            messages.append(current)
+        
+        return messages
+    
+    def _truncate_html(self, text: str, max_length: int) -> str:
+        """Обрезка HTML до max_length символов без разрыва тегов и сущностей
+
+        Резка идет по последнему пробелу или переводу строки, незакрытые
+        теги закрываются.
+        """
+        if len(text) <= max_length:
+            return text
+        
+        end = max_length
+        while end > 0:
+            cut = text[:end]
+            # Тег или сущность (&amp;), разрезанные на границе
+            if cut.rfind('<') > cut.rfind('>'):
+                cut = cut[:cut.rfind('<')]
+            if cut.rfind('&') > cut.rfind(';'):
+                cut = cut[:cut.rfind('&')]
+            boundary = max(cut.rfind(' '), cut.rfind('\n'))
+            if boundary > 0 and boundary > cut.rfind('>'):
+                cut = cut[:boundary]
+            cut = cut.rstrip()
+            
+            open_tags = []
+            for match in HTML_TAG.finditer(cut):
+                closing, name = match.group(1), match.group(2).lower()
+                if not closing:
+                    open_tags.append(name)
+                elif name in open_tags:
+                    del open_tags[len(open_tags) - 1 - open_tags[::-1].index(name)]
+            
+            result = cut + ''.join(f'</{name}>' for name in reversed(open_tags))
+            if len(result) <= max_length:
+                return result
+            end = len(cut) - (len(result) - max_length)
+        
+        return ''
+    
+    def _recommendation_keyboard(self, request_hash: Optional[str] = None,
+                                 next_index: int = 1, has_next: bool = True) -> List[List[Dict[str, str]]]:
+        """Клавиатура навигации по рекомендациям"""
+        keyboard = [
+            [self.create_menu_button("✅ Принять заявку", "accept_lead")],
+            [self.create_menu_button("❓ Задать вопрос", "ask_question")],
+            [self.create_menu_button("📞 Позвонить", "call_partner")]
+        ]
+        
+        if has_next:
+            # Ссылка на подборку в кэше: next_partner:<request_hash>:<index>
+            callback = f"next_partner:{request_hash}:{next_index}" if request_hash else "next_partner"
+            keyboard.append([self.create_menu_button("➡️ Следующий партнер", callback)])
+        
+        return keyboard
+    
+    def _get_retry_after(self, response) -> Optional[int]:
+        """Время ожидания из ответа 429 (Telegram: parameters.retry_after)"""
+        if response.status_code != 429:
+            return None
+        try:
+            retry_after = response.json().get('parameters', {}).get('retry_after')
+        except (ValueError, AttributeError):
+            retry_after = None
+        try:
+            return int(retry_after or response.headers.get('Retry-After', 1))
+        except (TypeError, ValueError):
+            return 1
+    
     def update_webhook_url(self, webhook_url: str) -> Dict[str, Any]:
         """Обновление URL вебхука для бота"""
         try:
@@ -0,0 +1,81 @@
+"""
+ОГРАНИЧЕНИЕ ЧАСТОТЫ ЗАПРОСОВ
+Token bucket для соблюдения лимитов внешних API
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable
+
+
+class TokenBucket:
+    """Потокобезопасный token bucket: rate токенов в секунду, не более capacity подряд"""
+
+    def __init__(self, rate: float, capacity: float = None,
+                 clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], None] = time.sleep):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else rate)
+        self._tokens = self.capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._updated_at = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        elapsed = now - self._updated_at
+        if elapsed > 0:
+            self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+            self._updated_at = now
+
+    def try_acquire(self, tokens: float = 1.0) -> float:
+        """Попытка взять токены; возвращает 0 при успехе или время ожидания в секундах"""
+        with self._lock:
+            self._refill(self._clock())
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return 0.0
+            return (tokens - self._tokens) / self.rate
+
+    def acquire(self, tokens: float = 1.0):
+        """Блокирующее получение токенов"""
+        while True:
+            wait = self.try_acquire(tokens)
+            if wait <= 0:
+                return
+            self._sleep(wait)
+
+
+class KeyedRateLimiter:
+    """Отдельный token bucket на ключ (например, chat_id) с вытеснением старых ключей"""
+
+    def __init__(self, rate: float, capacity: float = None, max_keys: int = 10000,
+                 clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.rate = rate
+        self.capacity = capacity
+        self.max_keys = max_keys
+        self._clock = clock
+        self._sleep = sleep
+        self._buckets: 'OrderedDict[str, TokenBucket]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_bucket(self, key: str) -> TokenBucket:
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = TokenBucket(self.rate, self.capacity, self._clock, self._sleep)
+                self._buckets[key] = bucket
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+            return bucket
+
+    def acquire(self, key: str, tokens: float = 1.0):
+        """Блокирующее получение токенов для ключа"""
+        self.get_bucket(str(key)).acquire(tokens)
@@ -0,0 +1,114 @@
+"""
+КЭШ ПОДБОРОК ПАРТНЕРОВ
+Хранение ранжированного списка партнеров в Redis для постраничного показа
+(кнопка "Следующий партнер" в Protalk, карусель Umnico) без повторного подбора
+"""
+
+import hashlib
+import json
+import logging
+from typing import Dict, Any, List, Optional
+
+from .config import BlockCConfig
+
+logger = logging.getLogger(__name__)
+
+
+class RecommendationCache:
+    """Кэш результатов подбора по ключу (chat_id, request_hash)
+
+    Каждая подборка - один Redis hash с полями id:N, card:N, item:N и total,
+    поэтому любая страница читается одним HMGET.
+    """
+
+    KEY_PREFIX = 'recs'
+
+    def __init__(self, redis_client, ttl: Optional[int] = None):
+        self.redis = redis_client
+        self.ttl = ttl or BlockCConfig.RECOMMENDATION_CACHE_CONFIG['ttl']
+
+    @classmethod
+    def from_url(cls, redis_url: Optional[str] = None, ttl: Optional[int] = None) -> 'RecommendationCache':
+        """Создание кэша по URL Redis"""
+        import redis
+        return cls(redis.from_url(redis_url or BlockCConfig.get_redis_url()), ttl)
+
+    @staticmethod
+    def make_request_hash(request_data: Dict[str, Any]) -> str:
+        """Хэш параметров запроса заказчика (короткий - помещается в callback_data)"""
+        canonical = json.dumps(request_data, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha1(canonical.encode('utf-8')).hexdigest()[:16]
+
+    def _key(self, chat_id: str, request_hash: str) -> str:
+        return f"{self.KEY_PREFIX}:{chat_id}:{request_hash}"
+
+    def save(self, chat_id: str, request_hash: str, partners: List[Dict[str, Any]],
+             cards: Optional[List[str]] = None,
+             carousel_items: Optional[List[Dict[str, Any]]] = None) -> int:
+        """Сохранение ранжированной подборки с предрендеренными карточками"""
+        mapping = {'total': len(partners)}
+
+        for i, partner in enumerate(partners):
+            mapping[f'id:{i}'] = str(
+                partner.get('partner_code') or partner.get('partner_id') or partner.get('id', '')
+            )
+            if cards:
+                mapping[f'card:{i}'] = cards[i]
+            if carousel_items:
+                mapping[f'item:{i}'] = json.dumps(carousel_items[i], ensure_ascii=False)
+
+        key = self._key(chat_id, request_hash)
+        pipe = self.redis.pipeline()
+        pipe.delete(key)
+        pipe.hset(key, mapping=mapping)
+        pipe.expire(key, self.ttl)
+        pipe.execute()
+
+        logger.info(f"Cached {len(partners)} recommendations for chat {chat_id} ({request_hash})")
+        return len(partners)
+
+    def get_page(self, chat_id: str, request_hash: str,
+                 page: int, page_size: int = 1) -> Optional[Dict[str, Any]]:
+        """Получение страницы подборки; None - подборка истекла или не найдена"""
+        start = page * page_size
+        indexes = range(start, start + page_size)
+
+        fields = ['total']
+        for i in indexes:
+            fields.extend([f'id:{i}', f'card:{i}', f'item:{i}'])
+
+        values = self.redis.hmget(self._key(chat_id, request_hash), fields)
+        if values[0] is None:
+            return None
+
+        total = int(values[0])
+        partner_ids, cards, carousel_items = [], [], []
+
+        for offset in range(0, len(values) - 1, 3):
+            partner_id, card, item = values[1 + offset:4 + offset]
+            if partner_id is None:
+                break
+            partner_ids.append(self._decode(partner_id))
+            if card is not None:
+                cards.append(self._decode(card))
+            if item is not None:
+                carousel_items.append(json.loads(item))
+
+        return {
+            'request_hash': request_hash,
+            'page': page,
+            'page_size': page_size,
+            'total': total,
+            'partner_ids': partner_ids,
+            'cards': cards,
+            'carousel_items': carousel_items,
+            'has_next': start + page_size < total
+        }
+
+    def invalidate(self, chat_id: str, request_hash: str):
+        """Удаление подборки"""
+        self.redis.delete(self._key(chat_id, request_hash))
+
+    @staticmethod
+    def _decode(value) -> str:
+        return value.decode('utf-8') if isinstance(value, bytes) else value
@@ -0,0 +1,209 @@
+"""
+ТАБЛИЦА ЦЕН ТАРИФОВ
+Цены тариф × период (без НДС, НДС, с НДС) в целых копейках, рассчитанные
+один раз из MonetizationConfig.TARIFF_PLANS и ставки НДС. Если конфигурация
+Блока D не импортируется, используется прежняя таблица Блока C
+(FALLBACK_TARIFF_PLANS)
+"""
+
+import hashlib
+import json
+import logging
+import threading
+import time
+from decimal import Decimal, ROUND_HALF_UP
+from types import MappingProxyType
+from typing import Dict, Any, Callable, List, NamedTuple, Optional, Tuple
+
+from .config import BlockCConfig
+
+logger = logging.getLogger(__name__)
+
+PERIODS = ('monthly', 'quarterly', 'yearly')
+
+# Тарифы Блока C до перехода на MonetizationConfig (цены в рублях)
+FALLBACK_TARIFF_PLANS = {
+    'start': {'name': 'start', 'price_monthly': 0, 'price_yearly': 0},
+    'basic': {'name': 'basic', 'price_monthly': 5000, 'price_yearly': 50000},  # Скидка 16.7%
+    'premium': {'name': 'premium', 'price_monthly': 15000, 'price_yearly': 150000},
+    'business': {'name': 'business', 'price_monthly': 30000, 'price_yearly': 300000}
+}
+
+
+class TariffPrice(NamedTuple):
+    """Цена тарифа за период в копейках"""
+    net: int
+    vat: int
+    gross: int
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'net': self.net,
+            'vat': self.vat,
+            'gross': self.gross,
+            'amount': kopecks_to_rubles(self.gross)
+        }
+
+
+def to_kopecks(value: Any) -> int:
+    """Рубли (число или строка) в целые копейки без ошибок округления float"""
+    return int((Decimal(str(value)) * 100).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+
+
+def kopecks_to_rubles(value: int) -> float:
+    return value / 100
+
+
+def split_vat(amount: int, tax_rate: float, includes_vat: bool = True) -> TariffPrice:
+    """Разложение суммы в копейках на сумму без НДС, НДС и сумму с НДС"""
+    rate = Decimal(str(tax_rate))
+    if includes_vat:
+        vat = int((amount * rate / (1 + rate)).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+        return TariffPrice(amount - vat, vat, amount)
+
+    vat = int((amount * rate).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+    return TariffPrice(amount, vat, amount + vat)
+
+
+class PriceMatrix:
+    """Неизменяемая таблица цен: поиск по (тариф, период) - одно обращение к словарю"""
+
+    def __init__(self, plans: Dict[str, Dict[str, Any]], tax_rate: float,
+                 includes_vat: bool = True, version: str = ''):
+        self.tax_rate = tax_rate
+        self.version = version
+
+        prices: Dict[Tuple[str, str], TariffPrice] = {}
+        names: Dict[str, str] = {}
+        for code, plan in plans.items():
+            if not plan.get('is_active', True):
+                continue
+            names[code] = plan.get('name', code)
+            for period in PERIODS:
+                value = plan.get(f'price_{period}')
+                if value is not None:
+                    prices[(code, period)] = split_vat(to_kopecks(value), tax_rate, includes_vat)
+
+        self._prices = MappingProxyType(prices)
+        self.names = MappingProxyType(names)
+
+    def get(self, tariff_plan: str, period: str = 'monthly') -> Optional[TariffPrice]:
+        return self._prices.get((tariff_plan, period))
+
+    def periods(self, tariff_plan: str) -> Dict[str, TariffPrice]:
+        """Цены тарифа по всем периодам"""
+        return {
+            period: self._prices[(tariff_plan, period)]
+            for period in PERIODS if (tariff_plan, period) in self._prices
+        }
+
+    def __contains__(self, tariff_plan: str) -> bool:
+        return tariff_plan in self.names
+
+    def __len__(self) -> int:
+        return len(self._prices)
+
+
+_monetization_unavailable = False
+
+
+def _load_monetization_plans() -> Dict[str, Dict[str, Any]]:
+    """Тарифы Блока D (источник цен по умолчанию) или FALLBACK_TARIFF_PLANS"""
+    global _monetization_unavailable
+    if _monetization_unavailable:
+        return FALLBACK_TARIFF_PLANS
+
+    try:
+        from BLOCK_D_MONETIZATION.block_d.config import MonetizationConfig
+        return MonetizationConfig.TARIFF_PLANS
+    except Exception as e:
+        # Пакет Блока D может быть не установлен или не импортироваться
+        logger.warning(f"Block D tariff plans unavailable, using fallback prices: {e}")
+        _monetization_unavailable = True
+        return FALLBACK_TARIFF_PLANS
+
+
+class TariffPricing:
+    """Таблица цен с перестроением при изменении конфигурации
+
+    Таблица строится один раз и заменяется целиком, поэтому чтение
+    не требует блокировок. Не чаще раза в refresh_interval секунд
+    сравнивается отпечаток тарифов и ставки НДС; при расхождении таблица
+    пересчитывается.
+    """
+
+    def __init__(self, plans_source: Optional[Callable[[], Dict[str, Dict[str, Any]]]] = None,
+                 tax_rate_source: Optional[Callable[[], float]] = None,
+                 refresh_interval: Optional[float] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        config = BlockCConfig.PAYMENT_CONFIG
+        self.plans_source = plans_source or _load_monetization_plans
+        self.tax_rate_source = tax_rate_source or (lambda: BlockCConfig.PAYMENT_CONFIG['tax_rate'])
+        self.refresh_interval = config['tariff_refresh_interval'] if refresh_interval is None \
+            else refresh_interval
+        self.clock = clock
+
+        self._lock = threading.Lock()
+        self._matrix: Optional[PriceMatrix] = None
+        self._checked_at = 0.0
+
+    @property
+    def matrix(self) -> PriceMatrix:
+        matrix = self._matrix
+        if matrix is None or self.clock() - self._checked_at >= self.refresh_interval:
+            matrix = self.reload()
+        return matrix
+
+    def reload(self, force: bool = False) -> PriceMatrix:
+        """Пересчет таблицы, если тарифы или ставка НДС изменились"""
+        with self._lock:
+            plans = self.plans_source()
+            tax_rate = self.tax_rate_source()
+            version = _fingerprint(plans, tax_rate)
+
+            if force or self._matrix is None or self._matrix.version != version:
+                self._matrix = PriceMatrix(
+                    plans, tax_rate,
+                    includes_vat=BlockCConfig.PAYMENT_CONFIG['prices_include_vat'],
+                    version=version
+                )
+                logger.info(f"Tariff price matrix rebuilt: {len(self._matrix)} prices, version {version}")
+
+            self._checked_at = self.clock()
+            return self._matrix
+
+    def get(self, tariff_plan: str, period: str = 'monthly') -> Optional[TariffPrice]:
+        return self.matrix.get(tariff_plan, period)
+
+    def quote(self, tariff_plan: str) -> Optional[Dict[str, Any]]:
+        """Цены тарифа по периодам (None - тариф неизвестен или не активен)"""
+        matrix = self.matrix
+        if tariff_plan not in matrix:
+            return None
+        return {
+            'tariff_plan': tariff_plan,
+            'name': matrix.names[tariff_plan],
+            'tax_rate': matrix.tax_rate,
+            'prices': {period: price.as_dict() for period, price in matrix.periods(tariff_plan).items()}
+        }
+
+    def tariffs(self) -> List[str]:
+        return list(self.matrix.names)
+
+
+def _fingerprint(plans: Dict[str, Any], tax_rate: float) -> str:
+    payload = json.dumps([plans, tax_rate], sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()[:12]
+
+
+_pricing: Optional[TariffPricing] = None
+_pricing_lock = threading.Lock()
+
+
+def get_tariff_pricing() -> TariffPricing:
+    """Общая для процесса таблица цен (строится при первом обращении)"""
+    global _pricing
+    with _pricing_lock:
+        if _pricing is None:
+            _pricing = TariffPricing()
+        return _pricing
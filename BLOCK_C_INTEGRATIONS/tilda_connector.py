@@ -4,35 +4,39 @@
 """
 
 import requests
-import hashlib
-import hmac
 import logging
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Union
 from datetime import datetime
 
+from .circuit_breaker import ResilientSession
+from .config import BlockCConfig
+from .tilda_page_sync import PageRenderCache, page_content_hash, partner_page_alias
+from .webhook_signature import HmacVerifier
+
 logger = logging.getLogger(__name__)
 
 class TildaConnector:
     """Коннектор для работы с Tilda (личный кабинет партнера)"""
     
-    def __init__(self, public_key: str, secret_key: str, base_url: str = "https://api.tildacdn.info"):
+    def __init__(self, public_key: str, secret_key: str, base_url: str = "https://api.tildacdn.info",
+                 render_cache: Optional[PageRenderCache] = None,
+                 previous_secrets: Optional[List[str]] = None):
         self.public_key = public_key
         self.secret_key = secret_key
         self.base_url = base_url.rstrip('/')
-        self.session = requests.Session()
+        self.session = ResilientSession('tilda')
         self.session.headers.update({
             'User-Agent': 'HausPrice-Ecosystem/1.0'
         })
+        self.render_cache = render_cache
+        # Предыдущие секреты принимаются на время ротации ключа
+        if previous_secrets is None:
+            previous_secrets = BlockCConfig.WEBHOOK_CONFIG['previous_secrets']
+        self.verifier = HmacVerifier([secret_key] + list(previous_secrets))
     
-    def verify_webhook_signature(self, payload: str, signature: str) -> bool:
-        """Верификация подписи вебхука от Tilda"""
-        expected_signature = hmac.new(
-            self.secret_key.encode('utf-8'),
-            payload.encode('utf-8'),
-            hashlib.sha256
-        ).hexdigest()
-        
-        return hmac.compare_digest(expected_signature, signature)
+    def verify_webhook_signature(self, payload: Union[str, bytes], signature: str) -> bool:
+        """Верификация подписи вебхука от Tilda (payload - сырое тело запроса)"""
+        return self.verifier.verify(payload, signature)
     
     def create_partner_page(self, partner_data: Dict[str, Any]) -> Dict[str, Any]:
         """Создание страницы партнера в личном кабинете"""
@@ -43,6 +47,7 @@ class TildaConnector:
                 'publickey': self.public_key,
                 'secretkey': self.secret_key,
                 'title': f"Личный кабинет: {partner_data.get('company_name')}",
+                'alias': partner_page_alias(partner_data.get('partner_code')),
                 'html': self._generate_partner_html(partner_data),
                 'projectid': '000000',  # Нужно заменить на реальный ID проекта
                 'pagefolderid': '000000'  # Нужно заменить на реальный ID папки
@@ -55,6 +60,11 @@ class TildaConnector:
                 data = response.json()
                 page_url = data.get('url', '')
                 
+                if self.render_cache:
+                    self.render_cache.record_push(
+                        partner_data.get('partner_code'), data.get('id'), page_content_hash(partner_data)
+                    )
+                
                 return {
                     'success': True,
                     'page_id': data.get('id'),
@@ -77,9 +87,23 @@ class TildaConnector:
                 'error': f'Ошибка создания страницы: {str(e)}'
             }
     
-    def update_partner_page(self, page_id: str, partner_data: Dict[str, Any]) -> Dict[str, Any]:
-        """Обновление страницы партнера"""
+    def update_partner_page(self, page_id: str, partner_data: Dict[str, Any],
+                            force: bool = False) -> Dict[str, Any]:
+        """Обновление страницы партнера (пропускается, если видимые поля не изменились)"""
         try:
+            content_hash = page_content_hash(partner_data)
+            
+            if self.render_cache and not force:
+                cached = self.render_cache.get_page(partner_data.get('partner_code'))
+                if cached and cached['content_hash'] == content_hash:
+                    return {
+                        'success': True,
+                        'skipped': True,
+                        'page_id': page_id,
+                        'partner_code': partner_data.get('partner_code'),
+                        'message': 'Страница не изменилась'
+                    }
+            
             url = f"{self.base_url}/api/v1/updatepage/"
             
             payload = {
@@ -92,6 +116,9 @@ class TildaConnector:
             response = self.session.post(url, json=payload, timeout=15)
             
             if response.status_code == 200:
+                if self.render_cache:
+                    self.render_cache.record_push(partner_data.get('partner_code'), page_id, content_hash)
+                
                 return {
                     'success': True,
                     'page_id': page_id,
@@ -111,6 +138,37 @@ class TildaConnector:
                 'error': f'Ошибка обновления страницы: {str(e)}'
             }
     
+    def list_partner_pages(self) -> Dict[str, Any]:
+        """Страницы проекта (id, alias, title) - поиск уже созданных страниц партнеров"""
+        try:
+            url = f"{self.base_url}/api/v1/getpageslist/"
+            
+            params = {
+                'publickey': self.public_key,
+                'secretkey': self.secret_key,
+                'projectid': '000000'  # Нужно заменить на реальный ID проекта
+            }
+            
+            response = self.session.get(url, params=params, timeout=15)
+            
+            if response.status_code == 200:
+                return {
+                    'success': True,
+                    'pages': response.json().get('result', [])
+                }
+            else:
+                return {
+                    'success': False,
+                    'error': f'Ошибка получения списка страниц: {response.status_code}'
+                }
+                
+        except Exception as e:
+            logger.error(f"Error listing Tilda pages: {e}")
+            return {
+                'success': False,
+                'error': f'Ошибка получения списка страниц: {str(e)}'
+            }
+    
     def get_page_stats(self, page_id: str, start_date: str, end_date: str) -> Dict[str, Any]:
         """Получение статистики посещений страницы"""
         try:
@@ -0,0 +1,297 @@
+"""
+СИНХРОНИЗАЦИЯ СТРАНИЦ ПАРТНЕРОВ В TILDA
+Кэш отрисовки по хэшу содержимого, пакетная отправка измененных страниц
+и возобновляемая пересборка всех страниц с повтором неудачных
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Callable
+
+from .config import BlockCConfig
+from .rate_limiter import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Поля партнера, которые выводятся на странице (_generate_partner_html)
+PAGE_FIELDS = (
+    'company_name', 'partner_code', 'verification_status', 'rating',
+    'specializations', 'completed_projects', 'response_rate', 'phone', 'email'
+)
+
+
+def partner_page_alias(partner_code: Optional[str]) -> str:
+    """Адрес страницы партнера в проекте Tilda (по нему находится уже созданная страница)"""
+    return f'partner-{partner_code}'.lower()
+
+
+def page_content_hash(partner_data: Dict[str, Any]) -> str:
+    """Хэш видимого содержимого страницы (с учетом версии шаблона)"""
+    visible = {field: partner_data.get(field) for field in PAGE_FIELDS}
+    visible['_template_version'] = BlockCConfig.TILDA_CONFIG['template_version']
+    canonical = json.dumps(visible, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class PageRenderCache:
+    """Хэши опубликованных страниц и чекпоинты пересборки (SQLite)"""
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path or BlockCConfig.TILDA_CONFIG['page_cache_db_path']
+
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._create_tables()
+
+    def _create_tables(self):
+        with self._lock, self._conn:
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS tilda_pages (
+                    partner_code TEXT PRIMARY KEY,
+                    page_id TEXT,
+                    content_hash TEXT NOT NULL,
+                    pushed_at TEXT NOT NULL
+                )
+            ''')
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS tilda_rebuild_jobs (
+                    job_id TEXT PRIMARY KEY,
+                    last_partner_code TEXT,
+                    processed INTEGER DEFAULT 0,
+                    pushed INTEGER DEFAULT 0,
+                    skipped INTEGER DEFAULT 0,
+                    failed INTEGER DEFAULT 0,
+                    status TEXT NOT NULL,
+                    updated_at TEXT NOT NULL
+                )
+            ''')
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS tilda_rebuild_failures (
+                    job_id TEXT NOT NULL,
+                    partner_code TEXT NOT NULL,
+                    partner_data TEXT NOT NULL,
+                    failed_at TEXT NOT NULL,
+                    PRIMARY KEY (job_id, partner_code)
+                )
+            ''')
+
+    def get_page(self, partner_code: str) -> Optional[Dict[str, Any]]:
+        """Опубликованная страница партнера: page_id и хэш содержимого"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT * FROM tilda_pages WHERE partner_code = ?', (partner_code,)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def record_push(self, partner_code: str, page_id: Optional[str], content_hash: str):
+        """Фиксация успешно опубликованной версии страницы"""
+        with self._lock, self._conn:
+            self._conn.execute('''
+                INSERT INTO tilda_pages (partner_code, page_id, content_hash, pushed_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(partner_code) DO UPDATE SET
+                    page_id = COALESCE(excluded.page_id, page_id),
+                    content_hash = excluded.content_hash,
+                    pushed_at = excluded.pushed_at
+            ''', (partner_code, page_id, content_hash, datetime.utcnow().isoformat()))
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT * FROM tilda_rebuild_jobs WHERE job_id = ?', (job_id,)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def save_job(self, job: Dict[str, Any]):
+        with self._lock, self._conn:
+            self._conn.execute('''
+                INSERT OR REPLACE INTO tilda_rebuild_jobs
+                    (job_id, last_partner_code, processed, pushed, skipped, failed, status, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                job['job_id'], job['last_partner_code'], job['processed'], job['pushed'],
+                job['skipped'], job['failed'], job['status'], datetime.utcnow().isoformat()
+            ))
+
+    def record_failures(self, job_id: str, partners: List[Dict[str, Any]]):
+        """Партнеры, страницы которых не удалось опубликовать (для повтора)"""
+        now = datetime.utcnow().isoformat()
+        with self._lock, self._conn:
+            self._conn.executemany('''
+                INSERT OR REPLACE INTO tilda_rebuild_failures (job_id, partner_code, partner_data, failed_at)
+                VALUES (?, ?, ?, ?)
+            ''', [
+                (job_id, partner.get('partner_code'), json.dumps(partner, ensure_ascii=False, default=str), now)
+                for partner in partners
+            ])
+
+    def get_failures(self, job_id: str) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT partner_data FROM tilda_rebuild_failures WHERE job_id = ? ORDER BY partner_code',
+                (job_id,)
+            ).fetchall()
+        return [json.loads(row['partner_data']) for row in rows]
+
+    def clear_failures(self, job_id: str, partner_codes: List[str]):
+        with self._lock, self._conn:
+            self._conn.executemany(
+                'DELETE FROM tilda_rebuild_failures WHERE job_id = ? AND partner_code = ?',
+                [(job_id, code) for code in partner_codes]
+            )
+
+    def close(self):
+        self._conn.close()
+
+
+class TildaPageSync:
+    """Пакетная публикация страниц партнеров только при изменении содержимого"""
+
+    def __init__(self, connector, cache: PageRenderCache,
+                 rate: Optional[float] = None, max_workers: Optional[int] = None):
+        config = BlockCConfig.TILDA_CONFIG
+        self.connector = connector
+        self.cache = cache
+        self.limiter = TokenBucket(rate or config['push_rate'])
+        self.max_workers = max_workers or config['push_workers']
+
+        self._pages_lock = threading.Lock()
+        self._existing_pages: Optional[Dict[str, str]] = None
+
+    def _find_existing_page(self, partner_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Страница партнера в Tilda, которой нет в кэше (кэш пуст или потерян)
+
+        Список страниц проекта запрашивается один раз; страница ищется по
+        alias, созданные до появления alias - по заголовку.
+        Возвращает {'success': True, 'page_id': ...} (page_id None - страницы
+        нет) или ошибку запроса списка.
+        """
+        with self._pages_lock:
+            if self._existing_pages is None:
+                result = self.connector.list_partner_pages()
+                if not result.get('success'):
+                    return result
+                pages = {}
+                for page in result['pages']:
+                    for key in (page.get('alias'), page.get('title')):
+                        if key:
+                            pages.setdefault(key, str(page.get('id')))
+                self._existing_pages = pages
+
+        page_id = (self._existing_pages.get(partner_page_alias(partner_data.get('partner_code')))
+                   or self._existing_pages.get(f"Личный кабинет: {partner_data.get('company_name')}"))
+        return {'success': True, 'page_id': page_id}
+
+    def push_partner(self, partner_data: Dict[str, Any], force: bool = False) -> Dict[str, Any]:
+        """Публикация страницы одного партнера (создание или обновление)"""
+        partner_code = partner_data.get('partner_code')
+        content_hash = page_content_hash(partner_data)
+        page = self.cache.get_page(partner_code)
+
+        if page and page['content_hash'] == content_hash and not force:
+            return {'success': True, 'skipped': True, 'partner_code': partner_code,
+                    'page_id': page['page_id']}
+
+        page_id = page['page_id'] if page else None
+        if not page_id:
+            existing = self._find_existing_page(partner_data)
+            if not existing.get('success'):
+                return {**existing, 'partner_code': partner_code}
+            page_id = existing['page_id']
+
+        self.limiter.acquire()
+        if page_id:
+            result = self.connector.update_partner_page(page_id, partner_data, force=True)
+        else:
+            result = self.connector.create_partner_page(partner_data)
+            page_id = result.get('page_id')
+
+        if result.get('success'):
+            self.cache.record_push(partner_code, page_id, content_hash)
+        return result
+
+    def push_changed(self, partners: List[Dict[str, Any]], force: bool = False) -> Dict[str, Any]:
+        """Параллельная публикация измененных страниц с ограничением частоты запросов"""
+        started = time.monotonic()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            results = list(executor.map(lambda p: self.push_partner(p, force), partners))
+
+        skipped = sum(1 for r in results if r.get('skipped'))
+        failed = [p.get('partner_code') for p, r in zip(partners, results) if not r.get('success')]
+
+        return {
+            'success': not failed,
+            'total': len(partners),
+            'pushed': len(partners) - skipped - len(failed),
+            'skipped': skipped,
+            'failed': failed,
+            'duration': round(time.monotonic() - started, 3)
+        }
+
+    def rebuild_all(self, fetch_partners: Callable[[Optional[str], int], List[Dict[str, Any]]],
+                    job_id: str = 'rebuild_all', batch_size: Optional[int] = None,
+                    force: bool = False) -> Dict[str, Any]:
+        """Пересборка всех страниц партнеров с продолжением после сбоя
+
+        fetch_partners(after_partner_code, limit) должна возвращать партнеров,
+        упорядоченных по partner_code (keyset-пагинация). После каждой пачки
+        в чекпоинт записывается последний обработанный partner_code, а
+        партнеры с ошибкой - в список повтора. После прохода они публикуются
+        повторно; если ошибки остались, задача остается incomplete, и
+        следующий запуск повторит их снова.
+        """
+        batch_size = batch_size or BlockCConfig.TILDA_CONFIG['rebuild_batch_size']
+        job = self.cache.get_job(job_id)
+
+        if not job or job['status'] == 'completed':
+            job = {'job_id': job_id, 'last_partner_code': None, 'processed': 0,
+                   'pushed': 0, 'skipped': 0, 'failed': 0, 'status': 'running'}
+        else:
+            logger.info(f"Resuming Tilda rebuild {job_id} after {job['last_partner_code']}")
+            job['status'] = 'running'
+
+        while True:
+            partners = fetch_partners(job['last_partner_code'], batch_size)
+            if not partners:
+                break
+
+            result = self.push_changed(partners, force=force)
+            failed = set(result['failed'])
+            self.cache.record_failures(job_id, [p for p in partners if p.get('partner_code') in failed])
+            job['processed'] += result['total']
+            job['pushed'] += result['pushed']
+            job['skipped'] += result['skipped']
+            job['failed'] = len(self.cache.get_failures(job_id))
+            job['last_partner_code'] = partners[-1].get('partner_code')
+            self.cache.save_job(job)
+
+            logger.info(f"Tilda rebuild {job_id}: {job['processed']} processed")
+
+        retry = self.cache.get_failures(job_id)
+        if retry:
+            result = self.push_changed(retry, force=force)
+            failed = set(result['failed'])
+            self.cache.clear_failures(job_id, [p.get('partner_code') for p in retry
+                                               if p.get('partner_code') not in failed])
+            job['pushed'] += result['pushed']
+            job['skipped'] += result['skipped']
+            job['failed'] = len(failed)
+
+        job['status'] = 'incomplete' if job['failed'] else 'completed'
+        self.cache.save_job(job)
+        if job['failed']:
+            logger.warning(f"Tilda rebuild {job_id}: {job['failed']} partners still failing")
+        return {'success': job['failed'] == 0, **job}
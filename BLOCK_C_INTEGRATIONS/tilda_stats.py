@@ -0,0 +1,262 @@
+"""
+ХРАНИЛИЩЕ СТАТИСТИКИ СТРАНИЦ TILDA
+Дневные агрегаты посещений по страницам партнеров с инкрементальной синхронизацией
+"""
+
+import calendar
+import logging
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from typing import Dict, Any, List, Optional, Tuple
+
+from .config import BlockCConfig
+
+logger = logging.getLogger(__name__)
+
+METRICS = ('views', 'visitors', 'leads')
+
+
+class TildaStatsWarehouse:
+    """Дневные бакеты статистики страниц (SQLite)
+
+    Произвольный период считается суммой дневных строк, поэтому
+    отчеты и дашборды не обращаются к API Tilda.
+    """
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path or BlockCConfig.TILDA_CONFIG['stats_db_path']
+
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._create_tables()
+
+    def _create_tables(self):
+        with self._lock, self._conn:
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS tilda_page_stats_daily (
+                    page_id TEXT NOT NULL,
+                    day TEXT NOT NULL,
+                    partner_code TEXT,
+                    views INTEGER DEFAULT 0,
+                    visitors INTEGER DEFAULT 0,
+                    leads INTEGER DEFAULT 0,
+                    PRIMARY KEY (page_id, day)
+                )
+            ''')
+            self._conn.execute(
+                'CREATE INDEX IF NOT EXISTS idx_tilda_stats_day_partner '
+                'ON tilda_page_stats_daily (day, partner_code)'
+            )
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS tilda_stats_sync (
+                    page_id TEXT PRIMARY KEY,
+                    partner_code TEXT,
+                    last_synced_day TEXT NOT NULL,
+                    synced_at TEXT NOT NULL
+                )
+            ''')
+
+    def upsert_days(self, page_id: str, partner_code: Optional[str],
+                    days: List[Dict[str, Any]]) -> int:
+        """Запись дневных бакетов (повторная загрузка дня перезаписывает значения)"""
+        rows = [
+            (page_id, day['date'], partner_code,
+             int(day.get('views', 0)), int(day.get('visitors', 0)), int(day.get('leads', 0)))
+            for day in days
+        ]
+
+        with self._lock, self._conn:
+            self._conn.executemany('''
+                INSERT INTO tilda_page_stats_daily (page_id, day, partner_code, views, visitors, leads)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(page_id, day) DO UPDATE SET
+                    partner_code = excluded.partner_code,
+                    views = excluded.views,
+                    visitors = excluded.visitors,
+                    leads = excluded.leads
+            ''', rows)
+        return len(rows)
+
+    def mark_synced(self, page_id: str, partner_code: Optional[str], last_day: str):
+        with self._lock, self._conn:
+            self._conn.execute('''
+                INSERT INTO tilda_stats_sync (page_id, partner_code, last_synced_day, synced_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(page_id) DO UPDATE SET
+                    partner_code = excluded.partner_code,
+                    last_synced_day = excluded.last_synced_day,
+                    synced_at = excluded.synced_at
+            ''', (page_id, partner_code, last_day, datetime.utcnow().isoformat()))
+
+    def get_last_synced_day(self, page_id: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT last_synced_day FROM tilda_stats_sync WHERE page_id = ?', (page_id,)
+            ).fetchone()
+        return row['last_synced_day'] if row else None
+
+    def get_page_stats(self, page_id: str, start_date: str, end_date: str,
+                       include_days: bool = False) -> Dict[str, Any]:
+        """Статистика страницы за период (формат как у TildaConnector.get_page_stats)"""
+        with self._lock:
+            totals = self._conn.execute('''
+                SELECT COALESCE(SUM(views), 0) AS views,
+                       COALESCE(SUM(visitors), 0) AS visitors,
+                       COALESCE(SUM(leads), 0) AS leads,
+                       COUNT(*) AS days_with_data
+                FROM tilda_page_stats_daily
+                WHERE page_id = ? AND day BETWEEN ? AND ?
+            ''', (page_id, start_date, end_date)).fetchone()
+
+            stats = dict(totals)
+            if include_days:
+                stats['days'] = [dict(row) for row in self._conn.execute('''
+                    SELECT day AS date, views, visitors, leads
+                    FROM tilda_page_stats_daily
+                    WHERE page_id = ? AND day BETWEEN ? AND ?
+                    ORDER BY day
+                ''', (page_id, start_date, end_date))]
+
+        return {
+            'success': True,
+            'stats': stats,
+            'page_id': page_id,
+            'period': f'{start_date} - {end_date}',
+            'source': 'warehouse'
+        }
+
+    def get_partner_rollup(self, start_date: str, end_date: str,
+                           partner_codes: Optional[List[str]] = None) -> Dict[str, Dict[str, int]]:
+        """Суммы по партнерам за период (все страницы партнера)"""
+        query = '''
+            SELECT partner_code,
+                   SUM(views) AS views, SUM(visitors) AS visitors, SUM(leads) AS leads
+            FROM tilda_page_stats_daily
+            WHERE day BETWEEN ? AND ?
+        '''
+        params: List[Any] = [start_date, end_date]
+
+        if partner_codes:
+            query += f" AND partner_code IN ({', '.join('?' for _ in partner_codes)})"
+            params.extend(partner_codes)
+
+        query += ' GROUP BY partner_code'
+
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+
+        return {
+            row['partner_code']: {metric: row[metric] or 0 for metric in METRICS}
+            for row in rows
+        }
+
+    def get_monthly_report_stats(self, year: int, month: int) -> Dict[str, Dict[str, Any]]:
+        """Статистика страниц всех партнеров за месяц для send_monthly_report_email"""
+        start, end = month_bounds(year, month)
+        current = self.get_partner_rollup(start.isoformat(), end.isoformat())
+
+        prev_year, prev_month = (year - 1, 12) if month == 1 else (year, month - 1)
+        prev_start, prev_end = month_bounds(prev_year, prev_month)
+        previous = self.get_partner_rollup(prev_start.isoformat(), prev_end.isoformat())
+
+        ranked = sorted(current, key=lambda code: current[code]['views'], reverse=True)
+
+        return {
+            partner_code: {
+                'page_views': current[partner_code]['views'],
+                'page_visitors': current[partner_code]['visitors'],
+                'page_leads': current[partner_code]['leads'],
+                'page_views_change': current[partner_code]['views']
+                    - previous.get(partner_code, {}).get('views', 0),
+                'page_views_rank': rank
+            }
+            for rank, partner_code in enumerate(ranked, 1)
+        }
+
+    def close(self):
+        self._conn.close()
+
+
+def month_bounds(year: int, month: int) -> Tuple[date, date]:
+    """Первый и последний день месяца"""
+    return date(year, month, 1), date(year, month, calendar.monthrange(year, month)[1])
+
+
+class TildaStatsSync:
+    """Периодическая догрузка дневной статистики страниц из API Tilda
+
+    Каждая страница догружается с последнего полученного дня (он
+    перезагружается, так как мог быть неполным) по сегодняшний.
+    """
+
+    def __init__(self, connector, warehouse: TildaStatsWarehouse,
+                 max_workers: Optional[int] = None, initial_days: Optional[int] = None):
+        config = BlockCConfig.TILDA_CONFIG
+        self.connector = connector
+        self.warehouse = warehouse
+        self.max_workers = max_workers or config['push_workers']
+        self.initial_days = initial_days or config['stats_initial_days']
+
+    def sync_page(self, page_id: str, partner_code: Optional[str] = None,
+                  today: Optional[date] = None) -> Dict[str, Any]:
+        """Догрузка статистики одной страницы"""
+        today = today or date.today()
+        last_day = self.warehouse.get_last_synced_day(page_id)
+        start = date.fromisoformat(last_day) if last_day else today - timedelta(days=self.initial_days)
+
+        result = self.connector.get_page_stats(page_id, start.isoformat(), today.isoformat())
+        if not result.get('success'):
+            logger.warning(f"Tilda stats sync failed for page {page_id}: {result.get('error')}")
+            return {**result, 'page_id': page_id}
+
+        stats = result.get('stats') or {}
+        days = self._extract_days(stats)
+        if not days and not any(key in stats for key in ('days', 'items')):
+            logger.warning(f"Unexpected Tilda stats response for page {page_id}: {sorted(stats)}")
+
+        self.warehouse.upsert_days(page_id, partner_code, days)
+        if days:
+            # Отметка - последний фактически полученный день, а не сегодняшний:
+            # неразобранный или пустой ответ не должен терять данные
+            self.warehouse.mark_synced(page_id, partner_code, max(day['date'] for day in days))
+
+        return {'success': True, 'page_id': page_id, 'days': len(days)}
+
+    def sync_all(self, pages: List[Tuple[str, Optional[str]]],
+                 today: Optional[date] = None) -> Dict[str, Any]:
+        """Догрузка статистики списка страниц [(page_id, partner_code), ...]"""
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            results = list(executor.map(
+                lambda page: self.sync_page(page[0], page[1], today), pages
+            ))
+
+        failed = [r['page_id'] for r in results if not r.get('success')]
+        return {
+            'success': not failed,
+            'pages': len(pages),
+            'days_loaded': sum(r.get('days', 0) for r in results),
+            'failed_pages': failed
+        }
+
+    @staticmethod
+    def _extract_days(stats: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Дневные бакеты из ответа getpagestats"""
+        days = stats.get('days') or stats.get('items') or []
+        return [
+            {
+                'date': str(day.get('date'))[:10],
+                'views': day.get('views', day.get('pageviews', 0)),
+                'visitors': day.get('visitors', day.get('uniques', 0)),
+                'leads': day.get('leads', day.get('forms', 0))
+            }
+            for day in days
+            if day.get('date')
+        ]
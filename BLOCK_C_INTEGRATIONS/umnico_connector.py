@@ -6,24 +6,33 @@
 import requests
 import logging
 import json
+import uuid
 from typing import Dict, Any, List, Optional
 from datetime import datetime, timedelta
 
+from .circuit_breaker import ResilientSession
+from .config import BlockCConfig
+from .recommendation_cache import RecommendationCache
+from .event_buffer import EventBuffer
+
 logger = logging.getLogger(__name__)
 
 class UmnicoConnector:
     """Коннектор для работы с Umnico (чат-виджет на сайте)"""
     
-    def __init__(self, api_key: str, widget_token: str, base_url: str = "https://umnico.com"):
+    def __init__(self, api_key: str, widget_token: str, base_url: str = "https://umnico.com",
+                 recommendation_cache: Optional[RecommendationCache] = None):
         self.api_key = api_key
         self.widget_token = widget_token
         self.base_url = base_url.rstrip('/')
-        self.session = requests.Session()
+        self.session = ResilientSession('umnico')
         self.session.headers.update({
             'Authorization': f'Bearer {api_key}',
             'Content-Type': 'application/json',
             'User-Agent': 'HausPrice-Ecosystem/1.0'
         })
+        self.recommendation_cache = recommendation_cache
+        self.event_buffer: Optional[EventBuffer] = None
     
     def send_widget_message(self, user_id: str, message: str, 
                           message_type: str = 'text', 
@@ -166,11 +175,69 @@ class UmnicoConnector:
                 'error': f'Ошибка отправки карусели: {str(e)}'
             }
     
-    def get_user_conversation(self, user_id: str, limit: int = 50) -> Dict[str, Any]:
-        """Получение истории диалога с пользователем"""
+    def send_partner_carousel(self, user_id: str, partners: List[Dict[str, Any]],
+                              request_hash: Optional[str] = None,
+                              page_size: Optional[int] = None) -> Dict[str, Any]:
+        """Отправка первой страницы карусели партнеров с сохранением подборки в кэш"""
+        page_size = page_size or BlockCConfig.RECOMMENDATION_CACHE_CONFIG['carousel_page_size']
+        items = [self.create_partner_carousel_item(partner) for partner in partners]
+        
+        if not (self.recommendation_cache and request_hash):
+            return self.send_carousel(user_id, items[:page_size])
+        
+        self.recommendation_cache.save(user_id, request_hash, partners, carousel_items=items)
+        return self._send_carousel_items(
+            user_id, items[:page_size], request_hash, 0, len(items) > page_size
+        )
+    
+    def send_carousel_page(self, user_id: str, request_hash: str, page: int,
+                           page_size: Optional[int] = None) -> Dict[str, Any]:
+        """Отправка страницы карусели из кэша (postback more_partners)"""
+        page_size = page_size or BlockCConfig.RECOMMENDATION_CACHE_CONFIG['carousel_page_size']
+        
+        if not self.recommendation_cache:
+            return {'success': False, 'error': 'Кэш подборок не настроен'}
+        
+        cached = self.recommendation_cache.get_page(user_id, request_hash, page, page_size)
+        if not cached or not cached['carousel_items']:
+            return {
+                'success': False,
+                'cache_miss': True,
+                'error': 'Подборка устарела, требуется новый поиск',
+                'request_hash': request_hash
+            }
+        
+        result = self._send_carousel_items(
+            user_id, cached['carousel_items'], request_hash, page, cached['has_next']
+        )
+        result['total'] = cached['total']
+        return result
+    
+    def _send_carousel_items(self, user_id: str, items: List[Dict[str, Any]],
+                             request_hash: str, page: int, has_next: bool) -> Dict[str, Any]:
+        """Отправка страницы карусели с кнопкой перехода к следующей странице"""
+        if has_next and items:
+            last_item = dict(items[-1])
+            last_item['buttons'] = list(last_item.get('buttons', [])) + [{
+                'type': 'postback',
+                'title': '➡️ Показать еще',
+                'payload': f'more_partners:{request_hash}:{page + 1}'
+            }]
+            items = items[:-1] + [last_item]
+        
+        result = self.send_carousel(user_id, items)
+        result['page'] = page
+        result['has_next'] = has_next
+        return result
+    
+    def get_user_conversation(self, user_id: str, limit: int = 50,
+                              since_id: Optional[str] = None) -> Dict[str, Any]:
+        """Получение истории диалога с пользователем (since_id - только сообщения после указанного)"""
         try:
             url = f"{self.base_url}/api/v1/widget/conversations/{user_id}"
             params = {'limit': limit}
+            if since_id:
+                params['since_id'] = since_id
             
             response = self.session.get(url, params=params, timeout=10)
             
@@ -186,12 +253,14 @@ class UmnicoConnector:
                 return {
                     'success': False,
                     'error': 'Диалог с пользователем не найден',
-                    'user_id': user_id
+                    'user_id': user_id,
+                    'status_code': response.status_code
                 }
             else:
                 return {
                     'success': False,
-                    'error': f'Ошибка получения диалога: {response.status_code}'
+                    'error': f'Ошибка получения диалога: {response.status_code}',
+                    'status_code': response.status_code
                 }
                 
         except Exception as e:
@@ -232,9 +301,48 @@ class UmnicoConnector:
                 'error': f'Ошибка обновления профиля: {str(e)}'
             }
     
+    def enable_event_batching(self, batch_size: Optional[int] = None,
+                              flush_interval: Optional[float] = None,
+                              spill_path: Optional[str] = None) -> EventBuffer:
+        """Включение пакетной фоновой отправки событий для track_event"""
+        if self.event_buffer is None:
+            config = BlockCConfig.UMNICO_CONFIG
+            self.event_buffer = EventBuffer(
+                send_batch=self._send_events_batch,
+                batch_size=batch_size or config['event_batch_size'],
+                flush_interval=flush_interval or config['event_flush_interval'],
+                spill_path=spill_path or config['event_spill_path'],
+                name='umnico-events'
+            ).start()
+        return self.event_buffer
+    
+    def close(self):
+        """Остановка фоновой отправки с доставкой накопленных событий"""
+        if self.event_buffer is not None:
+            self.event_buffer.close()
+            self.event_buffer = None
+    
     def track_event(self, user_id: str, event_name: str, 
                    event_data: Optional[Dict] = None) -> Dict[str, Any]:
         """Отслеживание событий пользователя"""
+        if self.event_buffer is not None:
+            # event_id позволяет Umnico отбросить повторы при at-least-once доставке
+            event = {
+                'event_id': str(uuid.uuid4()),
+                'user_id': user_id,
+                'event': event_name,
+                'timestamp': datetime.utcnow().isoformat()
+            }
+            if event_data:
+                event['data'] = event_data
+            self.event_buffer.append(event)
+            return {
+                'success': True,
+                'queued': True,
+                'event_id': event['event_id'],
+                'user_id': user_id
+            }
+        
         try:
             url = f"{self.base_url}/api/v1/widget/events/track"
             
@@ -268,6 +376,23 @@ class UmnicoConnector:
                 'error': f'Ошибка отслеживания события: {str(e)}'
             }
     
+    def _send_events_batch(self, events: List[Dict[str, Any]]) -> bool:
+        """Отправка пакета событий одним запросом"""
+        url = f"{self.base_url}/api/v1/widget/events/batch"
+        
+        payload = {
+            'widget_token': self.widget_token,
+            'events': events
+        }
+        
+        response = self.session.post(url, json=payload, timeout=10)
+        
+        if response.status_code == 200:
+            return True
+        
+        logger.error(f"Failed to send events batch: {response.status_code} - {response.text[:200]}")
+        return False
+    
     def create_partner_carousel_item(self, partner: Dict[str, Any]) -> Dict[str, Any]:
         """Создание элемента карусели для партнера"""
         name = partner.get('company_name', 'Не указано')
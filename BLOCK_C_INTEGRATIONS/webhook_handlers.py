@@ -3,34 +3,41 @@
 Согласно ТЗ: ИНТЕГРАЦИЯ UMNICO + PROTALK
 """
 
-import hashlib
-import hmac
 import json
 import logging
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, List
 from datetime import datetime
 
+from BLOCK_B_BOT_AI.utils.intent_router import WEBHOOK_USER_TYPE_ROUTER
+
+from .config import BlockCConfig
+from .webhook_signature import HmacVerifier
+
 logger = logging.getLogger(__name__)
 
 class WebhookHandler:
     """Базовый обработчик вебхуков от внешних сервисов"""
     
-    def __init__(self, secret_key: str):
+    def __init__(self, secret_key: str, previous_secrets: Optional[List[str]] = None,
+                 conversation_sync=None):
         self.secret_key = secret_key
+        # ConversationSync: входящие сообщения Umnico пополняют локальную историю диалогов
+        self.conversation_sync = conversation_sync
+        # Предыдущие секреты принимаются на время ротации ключа
+        if previous_secrets is None:
+            previous_secrets = BlockCConfig.WEBHOOK_CONFIG['previous_secrets']
+        self.verifier = HmacVerifier([secret_key] + list(previous_secrets))
     
-    def verify_signature(self, payload: bytes, signature: str) -> bool:
-        """Верификация подписи вебхука"""
+    def verify_signature(self, payload: bytes, signature: str, timestamp: Optional[str] = None) -> bool:
+        """Верификация подписи вебхука по сырому телу запроса (bytes или memoryview)
+
+        timestamp - заголовок времени отправки, входящий в подпись
+        """
         if not self.secret_key:
             logger.warning("No secret key configured for webhook verification")
             return True  # В разработке пропускаем проверку
         
-        expected_signature = hmac.new(
-            self.secret_key.encode('utf-8'),
-            payload,
-            hashlib.sha256
-        ).hexdigest()
-        
-        return hmac.compare_digest(expected_signature, signature)
+        return self.verifier.verify(payload, signature, timestamp)
     
     def handle_protalk_webhook(self, data: Dict[str, Any]) -> Dict[str, Any]:
         """Обработка вебхука от Protalk бота"""
@@ -130,6 +137,18 @@ class WebhookHandler:
                 'message': f'Обработано действие: {action}'
             }
         
+        # Листание подборки: next_partner:<request_hash>:<index>
+        if data_text.startswith('next_partner:'):
+            parts = data_text.split(':')
+            if len(parts) == 3 and parts[2].isdigit():
+                return {
+                    'action': 'show_next_partner',
+                    'callback_id': callback_id,
+                    'chat_id': callback_data.get('message', {}).get('chat', {}).get('id'),
+                    'request_hash': parts[1],
+                    'index': int(parts[2])
+                }
+        
         return {'status': 'callback_processed'}
     
     def handle_umnico_webhook(self, data: Dict[str, Any]) -> Dict[str, Any]:
@@ -140,6 +159,7 @@ class WebhookHandler:
             session_id = data.get('sessionId')
             
             logger.info(f"Processing Umnico webhook from user {user_id}")
+            self._record_umnico_message(data)
             
             # Определение типа пользователя по сообщению
             if self._is_partner_message(message):
@@ -187,6 +207,21 @@ class WebhookHandler:
             logger.error(f"Error handling Umnico webhook: {e}")
             return {'status': 'error', 'error': str(e)}
     
+    def _record_umnico_message(self, data: Dict[str, Any]):
+        """Сохранение сообщения в локальную историю (ошибка хранилища не мешает ответу)"""
+        if self.conversation_sync is None or not data.get('userId') or not data.get('messageId'):
+            return
+        
+        try:
+            self.conversation_sync.record_message(data['userId'], {
+                'id': data['messageId'],
+                'text': data.get('message', ''),
+                'created_at': data.get('timestamp') or datetime.utcnow().isoformat(),
+                'session_id': data.get('sessionId')
+            })
+        except Exception as e:
+            logger.warning(f"Failed to store Umnico message {data['messageId']}: {e}")
+    
     def handle_tilda_webhook(self, data: Dict[str, Any]) -> Dict[str, Any]:
         """Обработка вебхука от Tilda (личный кабинет)"""
         try:
@@ -263,30 +298,13 @@ class WebhookHandler:
     
     def _detect_user_type(self, message: str) -> str:
         """Определение типа пользователя по сообщению"""
-        message_lower = message.lower()
-        
-        # Ключевые слова для партнера
-        partner_keywords = [
-            'партнер', 'компания', 'регистрация', 'сотрудничать',
-            'юрлицо', 'ип', 'ооо', 'подрядчик', 'исполнитель',
-            'предлагаю услуги', 'строительная компания', 'стать партнером'
-        ]
+        matched = WEBHOOK_USER_TYPE_ROUTER.classify(message)['matched']
         
-        # Ключевые слова для заказчика
-        customer_keywords = [
-            'построить', 'ремонт', 'найти', 'ищу', 'нужен',
-            'дом', 'коттедж', 'дача', 'смета', 'стоимость',
-            'подрядчик', 'исполнитель', 'мастер'
-        ]
-        
-        partner_match = any(keyword in message_lower for keyword in partner_keywords)
-        customer_match = any(keyword in message_lower for keyword in customer_keywords)
-        
-        if partner_match and not customer_match:
+        if matched == ['partner']:
             return 'potential_partner'
-        elif customer_match and not partner_match:
+        elif matched == ['customer']:
             return 'customer'
-        elif partner_match and customer_match:
+        elif matched:
             # Если есть оба типа ключевых слов, спрашиваем уточнение
             return 'ambiguous'
         else:
@@ -294,10 +312,4 @@ class WebhookHandler:
     
     def _is_partner_message(self, message: str) -> bool:
         """Определение, является ли сообщение от партнера"""
-        partner_keywords = [
-            'партнер', 'компания', 'регистрация', 'сотрудничать',
-            'юрлицо', 'ип', 'ооо', 'подрядчик', 'исполнитель'
-        ]
-        
-        message_lower = message.lower()
-        return any(keyword in message_lower for keyword in partner_keywords)
+        return WEBHOOK_USER_TYPE_ROUTER.score(message)['partner'] > 0
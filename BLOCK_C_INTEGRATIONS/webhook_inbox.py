@@ -0,0 +1,375 @@
+"""
+ВХОДЯЩАЯ ОЧЕРЕДЬ ВЕБХУКОВ
+Сохранение сырых событий одной записью и асинхронная обработка пулом
+с ограничением по источникам, повторами и очередью недоставленных (DLQ)
+
+Повтор событий за период (восстановление, нагрузочное тестирование):
+    python -m BLOCK_C_INTEGRATIONS.webhook_inbox replay --since 2024-05-01T00:00 --until 2024-05-01T12:00
+    python -m BLOCK_C_INTEGRATIONS.webhook_inbox replay --since ... --source payment --copies 10
+    python -m BLOCK_C_INTEGRATIONS.webhook_inbox dead-letters
+    python -m BLOCK_C_INTEGRATIONS.webhook_inbox stats
+"""
+
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Callable
+
+from .config import BlockCConfig
+from .webhook_ingest import WEBHOOK_HANDLERS
+
+logger = logging.getLogger(__name__)
+
+PENDING = 'pending'
+DONE = 'done'
+DEAD = 'dead'
+
+
+class WebhookInbox:
+    """Журнал входящих вебхуков (SQLite)
+
+    Прием - один INSERT сырого тела запроса; статус события меняет
+    только диспетчер.
+    """
+
+    def __init__(self, db_path: Optional[str] = None, clock: Callable[[], float] = time.time):
+        self.db_path = db_path or BlockCConfig.WEBHOOK_CONFIG['inbox_db_path']
+        self.clock = clock
+
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._create_tables()
+
+    def _create_tables(self):
+        with self._lock, self._conn:
+            if self.db_path != ':memory:':
+                self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS webhook_inbox (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    source TEXT NOT NULL,
+                    event_id TEXT,
+                    payload BLOB NOT NULL,
+                    received_at REAL NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt_at REAL NOT NULL,
+                    last_error TEXT,
+                    updated_at REAL NOT NULL
+                )
+            ''')
+            self._conn.execute(
+                'CREATE INDEX IF NOT EXISTS idx_webhook_inbox_ready '
+                'ON webhook_inbox (source, status, next_attempt_at)'
+            )
+            self._conn.execute(
+                'CREATE INDEX IF NOT EXISTS idx_webhook_inbox_received ON webhook_inbox (received_at)'
+            )
+
+    def append(self, source: str, event_id: Optional[str], payload: bytes) -> int:
+        """Сохранение события; возвращает id записи"""
+        now = self.clock()
+        with self._lock, self._conn:
+            cursor = self._conn.execute('''
+                INSERT INTO webhook_inbox (source, event_id, payload, received_at, next_attempt_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (source, event_id, payload, now, now, now))
+        return cursor.lastrowid
+
+    def claim(self, source: str, limit: int) -> List[Dict[str, Any]]:
+        """Выборка готовых к обработке событий источника с переводом в processing"""
+        now = self.clock()
+        with self._lock, self._conn:
+            rows = self._conn.execute('''
+                SELECT * FROM webhook_inbox
+                WHERE source = ? AND status = 'pending' AND next_attempt_at <= ?
+                ORDER BY id
+                LIMIT ?
+            ''', (source, now, limit)).fetchall()
+
+            if rows:
+                self._conn.executemany(
+                    "UPDATE webhook_inbox SET status = 'processing', attempts = attempts + 1, "
+                    "updated_at = ? WHERE id = ?",
+                    [(now, row['id']) for row in rows]
+                )
+
+        return [{**dict(row), 'attempts': row['attempts'] + 1} for row in rows]
+
+    def mark_done(self, inbox_id: int):
+        self._set_status(inbox_id, DONE)
+
+    def mark_retry(self, inbox_id: int, error: str, next_attempt_at: float):
+        self._set_status(inbox_id, PENDING, error, next_attempt_at)
+
+    def mark_dead(self, inbox_id: int, error: str):
+        self._set_status(inbox_id, DEAD, error)
+
+    def _set_status(self, inbox_id: int, status: str, error: Optional[str] = None,
+                    next_attempt_at: Optional[float] = None):
+        with self._lock, self._conn:
+            self._conn.execute('''
+                UPDATE webhook_inbox
+                SET status = ?, last_error = COALESCE(?, last_error),
+                    next_attempt_at = COALESCE(?, next_attempt_at), updated_at = ?
+                WHERE id = ?
+            ''', (status, error, next_attempt_at, self.clock(), inbox_id))
+
+    def recover_stale(self, timeout: float) -> int:
+        """Возврат в очередь событий, зависших в processing (после падения процесса)"""
+        now = self.clock()
+        with self._lock, self._conn:
+            cursor = self._conn.execute('''
+                UPDATE webhook_inbox SET status = 'pending', next_attempt_at = ?, updated_at = ?
+                WHERE status = 'processing' AND updated_at < ?
+            ''', (now, now, now - timeout))
+        return cursor.rowcount
+
+    def replay(self, since: float, until: float, source: Optional[str] = None,
+               copies: int = 0) -> int:
+        """Повтор событий за период
+
+        copies=0 - события возвращаются в очередь (восстановление),
+        copies=N - каждое событие добавляется N раз новыми записями (нагрузка).
+        """
+        query = 'WHERE received_at >= ? AND received_at < ?'
+        params: List[Any] = [since, until]
+        if source:
+            query += ' AND source = ?'
+            params.append(source)
+
+        now = self.clock()
+        with self._lock, self._conn:
+            if not copies:
+                cursor = self._conn.execute(f'''
+                    UPDATE webhook_inbox
+                    SET status = 'pending', attempts = 0, next_attempt_at = ?, updated_at = ?
+                    {query}
+                ''', [now, now] + params)
+                return cursor.rowcount
+
+            rows = self._conn.execute(
+                f'SELECT source, event_id, payload FROM webhook_inbox {query} ORDER BY id', params
+            ).fetchall()
+            self._conn.executemany('''
+                INSERT INTO webhook_inbox (source, event_id, payload, received_at, next_attempt_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', [
+                (row['source'], row['event_id'], row['payload'], now, now, now)
+                for row in rows for _ in range(copies)
+            ])
+            return len(rows) * copies
+
+    def get_dead_letters(self, source: Optional[str] = None, limit: int = 100) -> List[Dict[str, Any]]:
+        """События, исчерпавшие попытки обработки"""
+        query = "SELECT id, source, event_id, received_at, attempts, last_error FROM webhook_inbox " \
+                "WHERE status = 'dead'"
+        params: List[Any] = []
+        if source:
+            query += ' AND source = ?'
+            params.append(source)
+        query += ' ORDER BY id LIMIT ?'
+        params.append(limit)
+
+        with self._lock:
+            return [dict(row) for row in self._conn.execute(query, params)]
+
+    def get_stats(self) -> Dict[str, Dict[str, int]]:
+        """Количество событий по источникам и статусам"""
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT source, status, COUNT(*) AS count FROM webhook_inbox GROUP BY source, status'
+            ).fetchall()
+
+        stats: Dict[str, Dict[str, int]] = {}
+        for row in rows:
+            stats.setdefault(row['source'], {})[row['status']] = row['count']
+        return stats
+
+    def close(self):
+        self._conn.close()
+
+
+class InboxDispatcher:
+    """Обработка событий из WebhookInbox обработчиками WebhookHandler
+
+    У каждого источника свой пул потоков размера dispatch_concurrency[source],
+    поэтому медленные платежные обработчики не задерживают сообщения чатов.
+    Ошибка обработчика (исключение или status='error') ведет к повтору
+    с экспоненциальной задержкой, после max_attempts событие уходит в DLQ.
+    Результат обработчика передается в on_result(source, event, result).
+    """
+
+    def __init__(self, handler, inbox: WebhookInbox,
+                 on_result: Optional[Callable[[str, Dict[str, Any], Dict[str, Any]], None]] = None,
+                 concurrency: Optional[Dict[str, int]] = None,
+                 max_attempts: Optional[int] = None, retry_backoff: Optional[float] = None,
+                 poll_interval: Optional[float] = None):
+        config = BlockCConfig.WEBHOOK_CONFIG
+        self.handler = handler
+        self.inbox = inbox
+        self.on_result = on_result
+        self.concurrency = concurrency or config['dispatch_concurrency']
+        self.max_attempts = max_attempts or config['max_attempts']
+        self.retry_backoff = retry_backoff if retry_backoff is not None else config['retry_backoff']
+        self.poll_interval = poll_interval or config['poll_interval']
+
+        self._executors = {
+            source: ThreadPoolExecutor(max_workers=limit, thread_name_prefix=f'inbox-{source}')
+            for source, limit in self.concurrency.items()
+        }
+        self._in_flight = {source: 0 for source in self.concurrency}
+        self._in_flight_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self.stats = {'processed': 0, 'retried': 0, 'dead': 0}
+
+    def start(self) -> 'InboxDispatcher':
+        """Запуск фонового опроса очереди"""
+        self.inbox.recover_stale(BlockCConfig.WEBHOOK_CONFIG['processing_timeout'])
+        if self._thread is None or not self._thread.is_alive():
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name='inbox-dispatcher', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout: float = 10.0):
+        """Остановка опроса с ожиданием текущих обработчиков"""
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        for executor in self._executors.values():
+            executor.shutdown(wait=True)
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                if not self.dispatch_once():
+                    self._stopping.wait(self.poll_interval)
+            except Exception as e:
+                logger.error(f"Inbox dispatcher error: {e}")
+                self._stopping.wait(self.poll_interval)
+
+    def dispatch_once(self) -> int:
+        """Передача в пулы готовых событий в пределах свободных слотов"""
+        submitted = 0
+        for source, executor in self._executors.items():
+            with self._in_flight_lock:
+                free = self.concurrency[source] - self._in_flight[source]
+            if free <= 0:
+                continue
+
+            for event in self.inbox.claim(source, free):
+                with self._in_flight_lock:
+                    self._in_flight[source] += 1
+                executor.submit(self._process, event)
+                submitted += 1
+        return submitted
+
+    def drain(self, timeout: float = 30.0) -> bool:
+        """Синхронная обработка очереди до опустошения (тесты, CLI)"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            submitted = self.dispatch_once()
+            with self._in_flight_lock:
+                busy = any(self._in_flight.values())
+            if not submitted and not busy:
+                return True
+            time.sleep(0.01)
+        return False
+
+    def _process(self, event: Dict[str, Any]):
+        source = event['source']
+        try:
+            data = json.loads(event['payload'])
+            result = getattr(self.handler, WEBHOOK_HANDLERS[source])(data)
+            if result.get('status') == 'error':
+                raise RuntimeError(result.get('error', 'Ошибка обработчика'))
+
+            if self.on_result:
+                self.on_result(source, event, result)
+
+            self.inbox.mark_done(event['id'])
+            self.stats['processed'] += 1
+
+        except Exception as e:
+            self._fail(event, str(e))
+
+        finally:
+            with self._in_flight_lock:
+                self._in_flight[source] -= 1
+
+    def _fail(self, event: Dict[str, Any], error: str):
+        if event['attempts'] >= self.max_attempts:
+            self.inbox.mark_dead(event['id'], error)
+            self.stats['dead'] += 1
+            logger.error(f"Webhook {event['source']}:{event['event_id']} moved to DLQ: {error}")
+            return
+
+        delay = self.retry_backoff * (2 ** (event['attempts'] - 1))
+        self.inbox.mark_retry(event['id'], error, self.inbox.clock() + delay)
+        self.stats['retried'] += 1
+        logger.warning(f"Webhook {event['source']}:{event['event_id']} retry in {delay}s: {error}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Метрики диспетчера"""
+        with self._in_flight_lock:
+            in_flight = dict(self._in_flight)
+        return {**self.stats, 'in_flight': in_flight, 'queue': self.inbox.get_stats()}
+
+
+def _parse_time(value: str) -> float:
+    return datetime.fromisoformat(value).timestamp()
+
+
+def main(argv: Optional[List[str]] = None):
+    """CLI входящей очереди вебхуков"""
+    parser = argparse.ArgumentParser(description='Входящая очередь вебхуков')
+    parser.add_argument('--db', default=None, help='Путь к базе очереди')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    replay_parser = commands.add_parser('replay', help='Повтор событий за период')
+    replay_parser.add_argument('--since', required=True, help='Начало периода (ISO 8601)')
+    replay_parser.add_argument('--until', default=None, help='Конец периода (ISO 8601), по умолчанию - сейчас')
+    replay_parser.add_argument('--source', default=None, help='payment, tilda, umnico или protalk')
+    replay_parser.add_argument('--copies', type=int, default=0,
+                               help='Добавить N копий каждого события (нагрузочное тестирование)')
+
+    dead_parser = commands.add_parser('dead-letters', help='События в DLQ')
+    dead_parser.add_argument('--source', default=None)
+    dead_parser.add_argument('--limit', type=int, default=100)
+
+    commands.add_parser('stats', help='Количество событий по статусам')
+
+    args = parser.parse_args(argv)
+    inbox = WebhookInbox(args.db)
+
+    try:
+        if args.command == 'replay':
+            until = _parse_time(args.until) if args.until else time.time()
+            count = inbox.replay(_parse_time(args.since), until, args.source, args.copies)
+            print(f'Поставлено в очередь событий: {count}')
+        elif args.command == 'dead-letters':
+            for row in inbox.get_dead_letters(args.source, args.limit):
+                print(json.dumps(row, ensure_ascii=False))
+        else:
+            print(json.dumps(inbox.get_stats(), ensure_ascii=False, indent=2))
+    finally:
+        inbox.close()
+
+
+if __name__ == '__main__':
+    main()
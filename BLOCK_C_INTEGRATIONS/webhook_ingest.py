@@ -0,0 +1,240 @@
+"""
+ПРИЕМ ВЕБХУКОВ С ДЕДУПЛИКАЦИЕЙ
+Проверка подписи и времени отправки, отсев повторных доставок по идентификатору события
+"""
+
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Callable, Iterable, Union
+
+from .config import BlockCConfig
+
+logger = logging.getLogger(__name__)
+
+# Источник вебхука -> метод WebhookHandler
+WEBHOOK_HANDLERS = {
+    'payment': 'handle_payment_webhook',
+    'tilda': 'handle_tilda_webhook',
+    'umnico': 'handle_umnico_webhook',
+    'protalk': 'handle_protalk_webhook'
+}
+
+
+class RedisDedupStore:
+    """Множество обработанных событий в Redis (ключ с TTL на событие)
+
+    SET NX EX атомарно занимает идентификатор, поэтому одновременные
+    повторные доставки на разных инстансах обрабатываются один раз.
+    """
+
+    KEY_PREFIX = 'webhook:seen'
+
+    def __init__(self, redis_client, ttl: Optional[int] = None):
+        self.redis = redis_client
+        self.ttl = ttl or BlockCConfig.WEBHOOK_CONFIG['dedupe_ttl']
+
+    @classmethod
+    def from_url(cls, redis_url: Optional[str] = None, ttl: Optional[int] = None) -> 'RedisDedupStore':
+        """Создание хранилища по URL Redis"""
+        import redis
+        return cls(redis.from_url(redis_url or BlockCConfig.get_redis_url()), ttl)
+
+    def _key(self, event_key: str) -> str:
+        return f"{self.KEY_PREFIX}:{event_key}"
+
+    def claim(self, event_key: str) -> bool:
+        """Занять событие; False - событие уже обрабатывалось"""
+        return bool(self.redis.set(self._key(event_key), 1, nx=True, ex=self.ttl))
+
+    def release(self, event_key: str):
+        """Освободить событие, чтобы повторная доставка была обработана"""
+        self.redis.delete(self._key(event_key))
+
+
+class LocalDedupStore:
+    """Ограниченное множество обработанных событий в памяти процесса (TTL + LRU)"""
+
+    def __init__(self, ttl: Optional[int] = None, max_entries: Optional[int] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        config = BlockCConfig.WEBHOOK_CONFIG
+        self.ttl = ttl or config['dedupe_ttl']
+        self.max_entries = max_entries or config['dedupe_max_local']
+        self.clock = clock
+        self._seen: 'OrderedDict[str, float]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def claim(self, event_key: str) -> bool:
+        now = self.clock()
+        with self._lock:
+            expires_at = self._seen.get(event_key)
+            if expires_at is not None and expires_at > now:
+                return False
+
+            self._seen[event_key] = now + self.ttl
+            self._seen.move_to_end(event_key)
+
+            # Записи добавляются в порядке истечения, поэтому чистим с головы
+            while self._seen:
+                oldest_expiry = next(iter(self._seen.values()))
+                if oldest_expiry > now and len(self._seen) <= self.max_entries:
+                    break
+                self._seen.popitem(last=False)
+            return True
+
+    def release(self, event_key: str):
+        with self._lock:
+            self._seen.pop(event_key, None)
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+
+def extract_event_id(source: str, data: Dict[str, Any], raw_body: bytes) -> str:
+    """Идентификатор события провайдера (при отсутствии - хэш тела запроса)"""
+    event_id = data.get('event_id') or data.get('id')
+
+    if not event_id:
+        if source == 'payment':
+            obj = data.get('object') or {}
+            payment_id = data.get('payment_id') or obj.get('id')
+            status = data.get('status') or obj.get('status') or data.get('event')
+            if payment_id:
+                event_id = f'{payment_id}:{status}'
+        elif source == 'protalk':
+            event_id = data.get('update_id') or (data.get('callback_query') or {}).get('id') \
+                or (data.get('message') or {}).get('message_id')
+        elif source == 'umnico':
+            event_id = data.get('messageId')
+        elif source == 'tilda':
+            event_id = data.get('tranid')
+
+    if not event_id:
+        event_id = hashlib.sha256(raw_body).hexdigest()
+    return str(event_id)
+
+
+class WebhookIngestor:
+    """Входная точка вебхуков перед WebhookHandler
+
+    Порядок: подпись ("время.тело") -> время отправки -> разбор JSON ->
+    занятие event id -> обработчик. Время отправки входит в подпись, поэтому
+    подменить его у перехваченного запроса нельзя. Проверка времени включается
+    по источникам (timestamp_sources): для них запрос без заголовка времени
+    отклоняется. Остальные источники без заголовка проверяются подписью только
+    по телу, и от повторов их защищает дедупликация по event id (в пределах
+    dedupe_ttl). Повторная доставка подтверждается без запуска обработчика.
+    Если обработчик завершился ошибкой, event id освобождается, и повтор
+    от провайдера будет обработан.
+
+    С inbox (WebhookInbox) обработчик не вызывается: событие сохраняется
+    в очередь и подтверждается, обработку выполняет InboxDispatcher.
+    """
+
+    def __init__(self, handler, dedup_store=None, timestamp_tolerance: Optional[int] = None,
+                 timestamp_sources: Optional[Iterable[str]] = None, inbox=None,
+                 clock: Callable[[], float] = time.time):
+        config = BlockCConfig.WEBHOOK_CONFIG
+        self.handler = handler
+        self.dedup_store = dedup_store or LocalDedupStore()
+        self.inbox = inbox
+        self.timestamp_tolerance = timestamp_tolerance or config['timestamp_tolerance']
+        self.timestamp_sources = frozenset(
+            config['timestamp_sources'] if timestamp_sources is None else timestamp_sources
+        )
+        self.clock = clock
+
+        self.stats = {
+            'received': 0,
+            'processed': 0,
+            'duplicates': 0,
+            'rejected': 0
+        }
+
+    def ingest(self, source: str, raw_body: Union[bytes, memoryview],
+               headers: Dict[str, str]) -> Dict[str, Any]:
+        """Прием вебхука: raw_body - тело запроса без декодирования
+
+        Подпись и время проверяются до разбора JSON, поэтому поддельные
+        запросы отклоняются без затрат на парсинг.
+        """
+        self.stats['received'] += 1
+        config = BlockCConfig.WEBHOOK_CONFIG
+
+        if source not in WEBHOOK_HANDLERS:
+            return self._reject(source, f'Неизвестный источник вебхука: {source}')
+
+        timestamp = headers.get(config['timestamp_header'])
+        if timestamp is None and source in self.timestamp_sources:
+            return self._reject(source, 'Отсутствует время отправки вебхука')
+
+        signature = headers.get(config['signature_header'], '')
+        if not self.handler.verify_signature(raw_body, signature, timestamp):
+            return self._reject(source, 'Неверная подпись вебхука')
+
+        timestamp_error = self._check_timestamp(timestamp)
+        if timestamp_error:
+            return self._reject(source, timestamp_error)
+
+        try:
+            data = json.loads(raw_body.tobytes() if isinstance(raw_body, memoryview) else raw_body)
+        except ValueError:
+            return self._reject(source, 'Некорректный JSON')
+        if not isinstance(data, dict):
+            return self._reject(source, 'Некорректный JSON')
+
+        event_id = extract_event_id(source, data, raw_body)
+        event_key = f'{source}:{event_id}'
+
+        if not self.dedup_store.claim(event_key):
+            self.stats['duplicates'] += 1
+            logger.info(f"Duplicate {source} webhook {event_id} acknowledged")
+            return {'status': 'duplicate', 'event_id': event_id}
+
+        if self.inbox is not None:
+            try:
+                inbox_id = self.inbox.append(source, event_id, raw_body)
+            except Exception:
+                self.dedup_store.release(event_key)
+                raise
+            self.stats['processed'] += 1
+            return {'status': 'accepted', 'event_id': event_id, 'inbox_id': inbox_id}
+
+        try:
+            result = getattr(self.handler, WEBHOOK_HANDLERS[source])(data)
+        except Exception:
+            self.dedup_store.release(event_key)
+            raise
+
+        if result.get('status') == 'error':
+            self.dedup_store.release(event_key)
+        else:
+            self.stats['processed'] += 1
+
+        return {**result, 'event_id': event_id}
+
+    def _check_timestamp(self, value: Optional[str]) -> Optional[str]:
+        """Проверка времени отправки (unix-время в секундах)"""
+        if value is None:
+            return None
+
+        try:
+            sent_at = float(value)
+        except (TypeError, ValueError):
+            return 'Некорректное время отправки вебхука'
+
+        if abs(self.clock() - sent_at) > self.timestamp_tolerance:
+            return 'Время отправки вебхука вне допустимого окна'
+        return None
+
+    def _reject(self, source: str, error: str) -> Dict[str, Any]:
+        self.stats['rejected'] += 1
+        logger.warning(f"Rejected {source} webhook: {error}")
+        return {'status': 'rejected', 'error': error}
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Метрики приема вебхуков"""
+        return dict(self.stats)
@@ -0,0 +1,134 @@
+"""
+ПРОВЕРКА ПОДПИСЕЙ ВЕБХУКОВ
+HMAC-SHA256 по сырому телу запроса с поддержкой ротации секретов
+
+Замер пропускной способности (одно ядро):
+    python -m BLOCK_C_INTEGRATIONS.webhook_signature --count 200000 --size 1024
+"""
+
+import argparse
+import hashlib
+import hmac
+import json
+import time
+from typing import Dict, Any, List, Optional, Union
+
+Payload = Union[bytes, bytearray, memoryview, str]
+
+
+class HmacVerifier:
+    """Проверка HMAC-подписи с заранее подготовленными ключами
+
+    Для каждого секрета один раз создается HMAC-объект с уже обработанным
+    ключом; проверка копирует его состояние (copy()) и хэширует тело без
+    повторной подготовки ключа. Первый секрет - текущий, остальные -
+    предыдущие, которые принимаются на время ротации.
+    """
+
+    def __init__(self, secrets: List[str], digestmod=hashlib.sha256):
+        self.secrets = [secret for secret in secrets if secret]
+        self._templates = [
+            hmac.new(secret.encode('utf-8'), digestmod=digestmod) for secret in self.secrets
+        ]
+
+    def __bool__(self) -> bool:
+        return bool(self._templates)
+
+    def sign(self, payload: Payload, timestamp: Optional[str] = None) -> str:
+        """Подпись текущим секретом (с timestamp - подписывается "timestamp.тело")"""
+        if not self._templates:
+            raise ValueError('Не задан секрет для подписи вебхуков')
+        return self._digest(self._templates[0], _as_bytes(payload), timestamp)
+
+    def verify(self, payload: Payload, signature: Optional[str],
+               timestamp: Optional[str] = None) -> bool:
+        """Проверка подписи любым из активных секретов
+
+        С timestamp подпись должна покрывать и время отправки: тело,
+        повторенное со свежим заголовком времени, не проходит проверку.
+        """
+        if not signature:
+            return False
+
+        signature = signature.strip().lower()
+        if signature.startswith('sha256='):
+            signature = signature[7:]
+
+        data = _as_bytes(payload)
+        for template in self._templates:
+            if hmac.compare_digest(self._digest(template, data, timestamp), signature):
+                return True
+        return False
+
+    @staticmethod
+    def _digest(template, data, timestamp: Optional[str]) -> str:
+        mac = template.copy()
+        if timestamp is not None:
+            mac.update(f'{timestamp}.'.encode('utf-8'))
+        mac.update(data)
+        return mac.hexdigest()
+
+
+def _as_bytes(payload: Payload):
+    """Тело запроса без копирования (str кодируется - так передают подпись Tilda)"""
+    if isinstance(payload, str):
+        return payload.encode('utf-8')
+    return payload
+
+
+def benchmark(count: int = 100000, size: int = 1024, secrets: int = 2) -> Dict[str, Any]:
+    """Замер проверенных вебхуков в секунду в одном потоке"""
+    from .webhook_handlers import WebhookHandler
+    from .webhook_ingest import WebhookIngestor, LocalDedupStore
+
+    keys = [f'secret_{i}' for i in range(secrets)]
+    verifier = HmacVerifier(keys)
+
+    filler = 'x' * max(size - 80, 0)
+    bodies = [
+        json.dumps({'payment_id': f'pay_{i}', 'status': 'succeeded', 'comment': filler}).encode('utf-8')
+        for i in range(min(count, 1000))
+    ]
+    timestamp = str(int(time.time()))
+    signatures = [verifier.sign(body, timestamp) for body in bodies]
+
+    started = time.perf_counter()
+    for i in range(count):
+        verifier.verify(memoryview(bodies[i % len(bodies)]), signatures[i % len(bodies)], timestamp)
+    verify_elapsed = time.perf_counter() - started
+
+    class NullHandler(WebhookHandler):
+        def handle_payment_webhook(self, data):
+            return {'status': 'ok'}
+
+    ingestor = WebhookIngestor(
+        NullHandler(keys[0], previous_secrets=keys[1:]),
+        LocalDedupStore(max_entries=count + 1)
+    )
+    started = time.perf_counter()
+    for i in range(count):
+        body = bodies[i % len(bodies)]
+        ingestor.ingest('payment', body, {'X-Signature': signatures[i % len(bodies)], 'X-Timestamp': timestamp})
+    ingest_elapsed = time.perf_counter() - started
+
+    return {
+        'count': count,
+        'payload_bytes': len(bodies[0]),
+        'secrets': secrets,
+        'verify_per_second': round(count / verify_elapsed),
+        'ingest_per_second': round(count / ingest_elapsed)
+    }
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description='Замер проверки подписей вебхуков')
+    parser.add_argument('--count', type=int, default=100000)
+    parser.add_argument('--size', type=int, default=1024, help='Размер тела вебхука в байтах')
+    parser.add_argument('--secrets', type=int, default=2, help='Количество активных секретов')
+    args = parser.parse_args(argv)
+
+    print(json.dumps(benchmark(args.count, args.size, args.secrets), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -52,6 +52,13 @@ class MonetizationConfig:
     INVOICE = {
         'number_format': 'INV-{date}-{partner_id}-{seq:04d}',
         'due_days': 7,
+        # Номера счетов выдаются блоками из общей последовательности (hi/lo)
+        'sequence_db_path': 'data/id_sequences.db',
+        'sequence_block_size': 100,
+        # Пакетное выставление счетов
+        'storage_dir': 'data/invoices',
+        'billing_db_path': 'data/billing_runs.db',
+        'billing_chunk_size': 500,
         'company_details': {
             'name': 'HAUS Price Ecosystem',
             'inn': '1234567890',
@@ -0,0 +1,293 @@
+"""
+BillingPipeline - пакетное выставление счетов по подпискам для блока D
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+CREATED = 'created'
+STORED = 'stored'
+
+
+class ContentAddressedStorage:
+    """Файлы счетов по SHA-256 содержимого: root/ab/cd/<hash>.html
+    
+    Одинаковый счет записывается один раз; запись атомарна (временный
+    файл + os.replace), поэтому прерванный запуск не оставляет битых файлов.
+    """
+    
+    def __init__(self, root, extension='.html'):
+        self.root = root
+        self.extension = extension
+        os.makedirs(root, exist_ok=True)
+    
+    def path(self, content_hash):
+        return os.path.join(self.root, content_hash[:2], content_hash[2:4], content_hash + self.extension)
+    
+    def put(self, content):
+        """Сохранение содержимого (bytes), возвращает хэш"""
+        content_hash = hashlib.sha256(content).hexdigest()
+        path = self.path(content_hash)
+        if os.path.exists(path):
+            return content_hash
+        
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+        return content_hash
+    
+    def get(self, content_hash):
+        with open(self.path(content_hash), 'rb') as f:
+            return f.read()
+
+
+class BillingJournal:
+    """Журнал пакетного выставления счетов (SQLite)
+    
+    Номер и данные счета записываются до рендеринга: повторный запуск
+    за тот же период пропускает сохраненные счета и дорисовывает
+    созданные с теми же номерами. Если два запуска одновременно создали
+    счет одной подписки, рендерится счет, записанный в журнал первым.
+    """
+    
+    def __init__(self, db_path):
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS billing_items (
+                    period TEXT NOT NULL,
+                    subscription_id TEXT NOT NULL,
+                    invoice_number TEXT NOT NULL,
+                    invoice TEXT NOT NULL,
+                    content_hash TEXT,
+                    status TEXT NOT NULL,
+                    PRIMARY KEY (period, subscription_id)
+                )
+            ''')
+            self._conn.execute(
+                'CREATE INDEX IF NOT EXISTS idx_billing_items_invoice_number ON billing_items (invoice_number)'
+            )
+    
+    def get_items(self, period, subscription_ids):
+        """Записи журнала по подпискам: subscription_id -> строка"""
+        ids = [str(subscription_id) for subscription_id in subscription_ids]
+        if not ids:
+            return {}
+        
+        placeholders = ','.join('?' * len(ids))
+        with self._lock:
+            rows = self._conn.execute(
+                f'SELECT * FROM billing_items WHERE period = ? AND subscription_id IN ({placeholders})',
+                [period, *ids]
+            ).fetchall()
+        return {row['subscription_id']: row for row in rows}
+    
+    def record_created(self, period, entries):
+        """entries - [(subscription_id, invoice)]
+        
+        Возвращает счета из журнала (subscription_id -> invoice): для подписок,
+        записанных другим запуском, - его счет, а не переданный.
+        """
+        ids = [str(subscription_id) for subscription_id, _ in entries]
+        placeholders = ','.join('?' * len(ids))
+        with self._lock, self._conn:
+            self._conn.executemany(
+                'INSERT OR IGNORE INTO billing_items (period, subscription_id, invoice_number, invoice, status) '
+                'VALUES (?, ?, ?, ?, ?)',
+                [(period, str(subscription_id), invoice['invoice_number'],
+                  json.dumps(invoice, ensure_ascii=False), CREATED)
+                 for subscription_id, invoice in entries]
+            )
+            rows = self._conn.execute(
+                f'SELECT subscription_id, invoice FROM billing_items '
+                f'WHERE period = ? AND subscription_id IN ({placeholders})',
+                [period, *ids]
+            ).fetchall()
+        return {row['subscription_id']: json.loads(row['invoice']) for row in rows}
+    
+    def find_invoice(self, invoice_number):
+        """Запись журнала по номеру счета (или None)"""
+        with self._lock:
+            return self._conn.execute(
+                'SELECT * FROM billing_items WHERE invoice_number = ?', (invoice_number,)
+            ).fetchone()
+    
+    def mark_stored(self, period, results):
+        """results - [(subscription_id, content_hash)]"""
+        with self._lock, self._conn:
+            self._conn.executemany(
+                'UPDATE billing_items SET content_hash = ?, status = ? WHERE period = ? AND subscription_id = ?',
+                [(content_hash, STORED, period, str(subscription_id)) for subscription_id, content_hash in results]
+            )
+    
+    def get_stats(self, period):
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT status, COUNT(*) AS count FROM billing_items WHERE period = ? GROUP BY status', (period,)
+            ).fetchall()
+        return {row['status']: row['count'] for row in rows}
+    
+    def close(self):
+        self._conn.close()
+
+
+# Состояние процесса-исполнителя (задается initializer пула)
+_worker_storage = None
+_worker_company = None
+
+
+_worker_render = None
+
+
+def _init_worker(storage_root, company_details):
+    global _worker_storage, _worker_company, _worker_render
+    # Рендерер нужен только исполнителям: журнал и хранилище импортируются без него
+    from services.invoice_generator import render_invoice_html
+    
+    _worker_storage = ContentAddressedStorage(storage_root)
+    _worker_company = company_details
+    _worker_render = render_invoice_html
+
+
+def _render_and_store(invoice):
+    """Рендеринг и сохранение счета в процессе-исполнителе"""
+    content = _worker_render(invoice, _worker_company).encode('utf-8')
+    return _worker_storage.put(content), len(content)
+
+
+def find_invoice_file(invoice_config, invoice_number):
+    """Путь к сохраненному файлу счета по номеру (или None)
+    
+    invoice_config - MonetizationConfig.INVOICE (storage_dir, billing_db_path).
+    """
+    if not os.path.exists(invoice_config['billing_db_path']):
+        return None
+    
+    journal = BillingJournal(invoice_config['billing_db_path'])
+    try:
+        row = journal.find_invoice(invoice_number)
+    finally:
+        journal.close()
+    
+    if row is None or row['status'] != STORED:
+        return None
+    return ContentAddressedStorage(invoice_config['storage_dir']).path(row['content_hash'])
+
+
+class BillingPipeline:
+    """Выставление счетов по всем оплачиваемым подпискам за период
+    
+    Подписки обрабатываются частями по chunk_size: номера счетов выдаются
+    в основном процессе и записываются в журнал, HTML рендерится
+    и сохраняется в пуле процессов.
+    """
+    
+    def __init__(self, config, invoice_generator, subscription_manager,
+                 storage=None, journal=None, chunk_size=None, workers=None, client_info=None):
+        self.config = config
+        self.invoice_generator = invoice_generator
+        self.subscription_manager = subscription_manager
+        self.storage = storage or ContentAddressedStorage(config.INVOICE['storage_dir'])
+        self.journal = journal or BillingJournal(config.INVOICE['billing_db_path'])
+        self.chunk_size = chunk_size or config.INVOICE['billing_chunk_size']
+        self.workers = workers or os.cpu_count() or 1
+        self.client_info = client_info or (lambda subscription: {'name': subscription['partner_id']})
+        print("✅ BillingPipeline инициализирован")
+    
+    def billable_subscriptions(self):
+        """Активные подписки с ненулевой ценой"""
+        return [
+            subscription for subscription in self.subscription_manager.store.all()
+            if subscription.get('status') == 'active' and subscription.get('price')
+        ]
+    
+    def run(self, period, subscriptions=None):
+        """Счета за период (например, '2024-05'); возвращает отчет со скоростью"""
+        started = time.monotonic()
+        subscriptions = self.billable_subscriptions() if subscriptions is None else subscriptions
+        report = {'period': period, 'total': len(subscriptions), 'invoices': 0,
+                  'skipped': 0, 'chunks': 0, 'bytes': 0}
+        
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                 initargs=(self.storage.root, self.config.INVOICE['company_details'])) as executor:
+            for offset in range(0, len(subscriptions), self.chunk_size):
+                chunk = subscriptions[offset:offset + self.chunk_size]
+                pending = self._prepare_chunk(period, chunk, report)
+                if not pending:
+                    continue
+                
+                invoices = [invoice for _, invoice in pending]
+                results = list(executor.map(
+                    _render_and_store, invoices,
+                    chunksize=max(1, len(invoices) // (self.workers * 4))
+                ))
+                self.journal.mark_stored(period, [
+                    (subscription_id, content_hash)
+                    for (subscription_id, _), (content_hash, _) in zip(pending, results)
+                ])
+                
+                report['invoices'] += len(results)
+                report['bytes'] += sum(size for _, size in results)
+                report['chunks'] += 1
+        
+        elapsed = time.monotonic() - started
+        report['duration'] = round(elapsed, 3)
+        report['per_second'] = round(report['invoices'] / elapsed, 1) if elapsed else None
+        print(f"✅ Счета за {period}: {report['invoices']} новых, {report['skipped']} уже выставлено, "
+              f"{report['per_second']} счетов/с")
+        return report
+    
+    def _prepare_chunk(self, period, chunk, report):
+        """Счета части без сохраненных: новые получают номер, созданные берутся из журнала"""
+        existing = self.journal.get_items(period, [sub['subscription_id'] for sub in chunk])
+        pending = []
+        created = []
+        
+        for subscription in chunk:
+            row = existing.get(str(subscription['subscription_id']))
+            if row is not None and row['status'] == STORED:
+                report['skipped'] += 1
+                continue
+            
+            if row is not None:
+                invoice = json.loads(row['invoice'])
+            else:
+                invoice = self._build_invoice(subscription, period)
+                created.append((subscription['subscription_id'], invoice))
+            pending.append((subscription['subscription_id'], invoice))
+        
+        if created:
+            # Параллельный запуск мог записать свои счета раньше: рендерятся счета журнала
+            recorded = self.journal.record_created(period, created)
+            pending = [
+                (subscription_id, recorded.get(str(subscription_id), invoice))
+                for subscription_id, invoice in pending
+            ]
+        return pending
+    
+    def _build_invoice(self, subscription, period):
+        price = subscription['price']
+        items = [{
+            'name': f"Подписка {subscription.get('tariff_name', subscription['tariff_code'])} за {period}",
+            'quantity': 1,
+            'price': price,
+            'total': price
+        }]
+        return self.invoice_generator.build_invoice(
+            subscription['partner_id'], self.client_info(subscription), items, subscription['tariff_code']
+        )
@@ -0,0 +1,165 @@
+"""
+IdService - идентификаторы и последовательности номеров для блока D
+"""
+
+import os
+import secrets
+import sqlite3
+import threading
+import time
+
+# Crockford base32 (без I, L, O, U)
+ULID_ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+
+_ulid_lock = threading.Lock()
+_last_ulid = (0, 0)
+
+
+def new_ulid(timestamp_ms=None):
+    """ULID: 48 бит времени в мс + 80 случайных бит, 26 символов
+    
+    Сортируется по времени создания; в пределах одной миллисекунды
+    случайная часть увеличивается, поэтому id одного процесса монотонны.
+    """
+    global _last_ulid
+    
+    with _ulid_lock:
+        now = int(time.time() * 1000) if timestamp_ms is None else timestamp_ms
+        last_time, last_random = _last_ulid
+        if now <= last_time:
+            now, randomness = last_time, last_random + 1
+            if randomness >> 80:
+                now, randomness = last_time + 1, secrets.randbits(79)
+        else:
+            randomness = secrets.randbits(80)
+        _last_ulid = (now, randomness)
+    
+    value = (now << 80) | randomness
+    return ''.join(ULID_ALPHABET[(value >> shift) & 31] for shift in range(125, -1, -5))
+
+
+class InMemoryBlockAllocator:
+    """Выдача блоков номеров в памяти (один процесс, тесты)"""
+    
+    def __init__(self, start=1):
+        self._next = {}
+        self._start = start
+        self._lock = threading.Lock()
+    
+    def allocate(self, name, size):
+        with self._lock:
+            first = self._next.get(name, self._start)
+            self._next[name] = first + size
+            return first
+
+
+class SQLiteBlockAllocator:
+    """Выдача блоков номеров из файла SQLite (несколько процессов на одном сервере)
+    
+    BEGIN IMMEDIATE сериализует выдачу между процессами: каждый блок
+    выдается ровно одному процессу.
+    """
+    
+    def __init__(self, db_path, start=1):
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        
+        self.db_path = db_path
+        self.start = start
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS id_sequences (
+                name TEXT PRIMARY KEY,
+                next_value INTEGER NOT NULL
+            )
+        ''')
+    
+    def allocate(self, name, size):
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = self._conn.execute(
+                    'SELECT next_value FROM id_sequences WHERE name = ?', (name,)
+                ).fetchone()
+                first = row[0] if row else self.start
+                self._conn.execute(
+                    'INSERT OR REPLACE INTO id_sequences (name, next_value) VALUES (?, ?)',
+                    (name, first + size)
+                )
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+            return first
+    
+    def close(self):
+        self._conn.close()
+
+
+class SQLBlockAllocator:
+    """Выдача блоков номеров из общей БД (SQLAlchemy engine, несколько серверов)
+    
+    UPDATE ... RETURNING атомарен: строка последовательности блокируется
+    на время одного короткого запроса.
+    """
+    
+    def __init__(self, engine, start=1):
+        from sqlalchemy import text
+        
+        self.engine = engine
+        self.start = start
+        self._text = text
+        with engine.begin() as conn:
+            conn.execute(text(
+                'CREATE TABLE IF NOT EXISTS id_sequences ('
+                'name VARCHAR(50) PRIMARY KEY, next_value BIGINT NOT NULL)'
+            ))
+    
+    def allocate(self, name, size):
+        text = self._text
+        with self.engine.begin() as conn:
+            row = conn.execute(text(
+                'UPDATE id_sequences SET next_value = next_value + :size '
+                'WHERE name = :name RETURNING next_value'
+            ), {'name': name, 'size': size}).fetchone()
+            if row:
+                return row[0] - size
+        
+        try:
+            with self.engine.begin() as conn:
+                conn.execute(text(
+                    'INSERT INTO id_sequences (name, next_value) VALUES (:name, :next_value)'
+                ), {'name': name, 'next_value': self.start + size})
+            return self.start
+        except Exception:
+            # Строку одновременно создал другой процесс
+            return self.allocate(name, size)
+
+
+class HiLoSequence:
+    """Последовательность номеров блоками (hi/lo)
+    
+    Из БД за один запрос берется блок из block_size номеров, дальше номера
+    выдаются из памяти. Номера уникальны между процессами и возрастают
+    в пределах процесса; неиспользованный остаток блока при перезапуске
+    теряется (пропуски допустимы).
+    """
+    
+    def __init__(self, name, allocator, block_size=100):
+        self.name = name
+        self.allocator = allocator
+        self.block_size = block_size
+        self._next = 0
+        self._limit = 0
+        self._lock = threading.Lock()
+    
+    def next(self):
+        with self._lock:
+            if self._next >= self._limit:
+                self._next = self.allocator.allocate(self.name, self.block_size)
+                self._limit = self._next + self.block_size
+            value = self._next
+            self._next += 1
+            return value
@@ -5,16 +5,56 @@ InvoiceGenerator - генерация счетов для блока D
 
 from datetime import datetime, timedelta
 
+import jinja2
+
+from services.id_service import HiLoSequence, SQLiteBlockAllocator
+
+# Шаблон компилируется один раз при импорте модуля (в каждом процессе)
+INVOICE_TEMPLATE = jinja2.Environment(autoescape=True).from_string('''<html>
+<head><meta charset="utf-8"><title>Счет №{{ invoice.invoice_number }}</title></head>
+<body>
+    <h1>Счет на оплату №{{ invoice.invoice_number }}</h1>
+    <p>Поставщик: {{ company.name }}, ИНН {{ company.inn }}, {{ company.address }}</p>
+    <p>Клиент: {{ invoice.client_info.get('name', 'Не указано') }}</p>
+    <table>
+        <tr><th>Наименование</th><th>Кол-во</th><th>Цена</th><th>Сумма</th></tr>
+        {%- for item in invoice['items'] %}
+        <tr><td>{{ item.name }}</td><td>{{ item.get('quantity', 1) }}</td><td>{{ item.get('price', 0) }}</td><td>{{ item.get('total', item.get('price', 0)) }}</td></tr>
+        {%- endfor %}
+    </table>
+    <p>Сумма: {{ invoice.total_amount }} {{ invoice.currency }}</p>
+    <p>Дата: {{ invoice.invoice_date[:10] }}</p>
+    <p>Оплатить до: {{ invoice.due_date[:10] }}</p>
+</body>
+</html>
+''')
+
+
+def render_invoice_html(invoice, company_details):
+    """HTML счета по скомпилированному шаблону"""
+    return INVOICE_TEMPLATE.render(invoice=invoice, company=company_details)
+
 class InvoiceGenerator:
     """Генератор счетов блока D"""
     
-    def __init__(self, config):
+    def __init__(self, config, sequence=None):
         self.config = config
-        self._invoice_counter = 1
+        # Общая для всех процессов последовательность номеров счетов
+        self.sequence = sequence or HiLoSequence(
+            'invoice',
+            SQLiteBlockAllocator(config.INVOICE['sequence_db_path']),
+            config.INVOICE['sequence_block_size']
+        )
         print("✅ InvoiceGenerator инициализирован")
     
     def create_invoice(self, partner_id, client_info, items, tariff_code=None):
         """Создание счета"""
+        invoice = self.build_invoice(partner_id, client_info, items, tariff_code)
+        print(f"✅ Создан счет: {invoice['invoice_number']}")
+        return invoice
+    
+    def build_invoice(self, partner_id, client_info, items, tariff_code=None):
+        """Данные счета с новым номером (без вывода, для пакетной генерации)"""
         invoice_number = self._generate_invoice_number(partner_id)
         
         # Рассчитываем сумму
@@ -34,27 +74,18 @@ class InvoiceGenerator:
             'created_at': datetime.now().isoformat()
         }
         
-        print(f"✅ Создан счет: {invoice_number}")
         return invoice
     
     def _generate_invoice_number(self, partner_id):
         """Генерация номера счета"""
-        date_str = datetime.now().strftime('%y%m%d')
-        seq = self._invoice_counter
-        self._invoice_counter += 1
-        return f"INV-{date_str}-{partner_id}-{seq:04d}"
+        return self.config.INVOICE['number_format'].format(
+            date=datetime.now().strftime('%y%m%d'),
+            partner_id=partner_id,
+            seq=self.sequence.next()
+        )
     
     def get_invoice_html(self, invoice):
         """Получение HTML счета"""
-        return f"""
-        <html>
-        <head><title>Счет №{invoice['invoice_number']}</title></head>
-        <body>
-            <h1>Счет на оплату №{invoice['invoice_number']}</h1>
-            <p>Клиент: {invoice['client_info'].get('name', 'Не указано')}</p>
-            <p>Сумма: {invoice['total_amount']} {invoice['currency']}</p>
-            <p>Дата: {invoice['invoice_date'][:10]}</p>
-        </body>
-        </html>
-        """
+        return render_invoice_html(invoice, self.config.INVOICE['company_details'])
+
 EOF
@@ -5,17 +5,24 @@ PaymentProcessor - обработчик платежей для блока D
 
 from datetime import datetime
 
+from services.id_service import new_ulid
+
 class PaymentProcessor:
     """Обработчик платежей блока D"""
     
     def __init__(self, config):
         self.config = config
         self._payments = {}
+        # RevenueAnalytics регистрируется сам и получает завершенные платежи
+        self.analytics = None
+        # RenewalScheduler регистрируется сам и продлевает подписки по оплате
+        self.scheduler = None
         print("✅ PaymentProcessor инициализирован")
     
-    def create_payment(self, amount, currency='RUB', description='', partner_id=None, tariff_code=None):
-        """Создание платежа"""
-        payment_id = f"pay_{partner_id}_{datetime.now().strftime('%Y%m%d%H%M%S')}"
+    def create_payment(self, amount, currency='RUB', description='', partner_id=None, tariff_code=None,
+                       subscription_id=None):
+        """Создание платежа (subscription_id - продлеваемая подписка)"""
+        payment_id = f"pay_{new_ulid()}"
         
         payment = {
             'payment_id': payment_id,
@@ -25,6 +32,7 @@ class PaymentProcessor:
             'description': description,
             'status': 'pending',
             'tariff_code': tariff_code,
+            'subscription_id': subscription_id,
             'payment_url': f"https://payment.example.com/{payment_id}",
             'created_at': datetime.now().isoformat()
         }
@@ -37,8 +45,13 @@ class PaymentProcessor:
         """Обработка платежа"""
         payment = self._payments.get(payment_id)
         if payment:
-            payment['status'] = 'completed'
-            payment['paid_at'] = datetime.now().isoformat()
+            if payment['status'] != 'completed':
+                payment['status'] = 'completed'
+                payment['paid_at'] = datetime.now().isoformat()
+                if self.analytics:
+                    self.analytics.on_payment_completed(payment)
+                if self.scheduler and payment.get('subscription_id'):
+                    self.scheduler.on_payment_completed(payment)
             print(f"✅ Платеж обработан: {payment_id}")
             return True
         return False
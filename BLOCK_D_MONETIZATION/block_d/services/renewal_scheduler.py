@@ -0,0 +1,257 @@
+"""
+RenewalScheduler - продление и завершение подписок по сроку для блока D
+"""
+
+import heapq
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from services.subscription_manager import PERIOD_DAYS
+
+class RenewalScheduler:
+    """Планировщик продления подписок
+    
+    Очередь (heap) ближайших сроков окончания строится запросом по индексу
+    expires_at на горизонт horizon_days; поток спит до ближайшего срока
+    (или до следующего пополнения очереди), а не опрашивает таблицу.
+    Подошедшие подписки обрабатываются пачками по batch_size, платежи
+    создаются параллельно, не более max_workers одновременно.
+    
+    Записи очереди не удаляются при изменении подписки: при извлечении
+    запись сверяется с текущим expires_at и устаревшие пропускаются.
+    
+    Созданный платеж продления записывается в renewal_payment_id подписки
+    (ожидает оплаты продления). Срок продлевается только после оплаты:
+    по вызову PaymentProcessor.process_payment или при следующей проверке
+    статуса платежа через retry_delay. Если за max_attempts проверок платеж
+    не оплачен, подписка истекает.
+    """
+    
+    def __init__(self, subscription_manager, payment_processor, batch_size=100, max_workers=8,
+                 horizon_days=7, retry_delay=timedelta(hours=1), max_attempts=3, clock=datetime.now):
+        self.subscription_manager = subscription_manager
+        self.payment_processor = payment_processor
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.horizon = timedelta(days=horizon_days)
+        self.retry_delay = retry_delay
+        self.max_attempts = max_attempts
+        self.clock = clock
+        
+        self._queue = []
+        # subscription_id -> (неудачных попыток, время следующей попытки)
+        self._attempts = {}
+        self._refill_at = None
+        self._condition = threading.Condition()
+        self._store_lock = threading.Lock()
+        self._thread = None
+        self._stopped = True
+        
+        subscription_manager.scheduler = self
+        payment_processor.scheduler = self
+        print("✅ RenewalScheduler инициализирован")
+    
+    def rebuild(self):
+        """Восстановление очереди из хранилища (после перезапуска и на горизонт вперед)"""
+        now = self.clock()
+        subscriptions = self.subscription_manager.store.expiring_between(datetime.min, now + self.horizon)
+        
+        with self._condition:
+            self._queue = [
+                (self._due_at(sub), str(sub['subscription_id']), sub['subscription_id'], sub['expires_at'])
+                for sub in subscriptions
+            ]
+            heapq.heapify(self._queue)
+            self._refill_at = now + self.horizon / 2
+            self._condition.notify()
+        return len(self._queue)
+    
+    def schedule(self, subscription, due_at=None):
+        """Добавление подписки в очередь (новая подписка или перенос срока)"""
+        if subscription.get('status') != 'active' or not subscription.get('expires_at'):
+            return
+        
+        due_at = due_at or _as_datetime(subscription['expires_at'])
+        if self._refill_at is not None and due_at > self.clock() + self.horizon:
+            return  # попадет в очередь при следующем пополнении
+        
+        with self._condition:
+            heapq.heappush(self._queue, (due_at, str(subscription['subscription_id']),
+                                         subscription['subscription_id'], subscription['expires_at']))
+            self._condition.notify()
+    
+    def _due_at(self, subscription):
+        """Срок обработки: окончание подписки или время повторной попытки платежа"""
+        due_at = _as_datetime(subscription['expires_at'])
+        _, retry_at = self._attempts.get(subscription['subscription_id'], (0, None))
+        return max(due_at, retry_at) if retry_at else due_at
+    
+    def next_deadline(self):
+        with self._condition:
+            return self._queue[0][0] if self._queue else None
+    
+    def run_once(self):
+        """Обработка всех подписок со сроком не позже текущего момента"""
+        report = {'renewed': 0, 'pending': 0, 'expired': 0, 'retry': 0, 'failed': 0, 'skipped': 0}
+        
+        if self._refill_at is None or self.clock() >= self._refill_at:
+            self.rebuild()
+        
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while True:
+                batch = self._pop_due(self.clock())
+                if not batch:
+                    break
+                for outcome in executor.map(self._process, batch):
+                    report[outcome] += 1
+        
+        return report
+    
+    def start(self):
+        """Запуск фонового потока"""
+        if self._thread and self._thread.is_alive():
+            return
+        
+        self._stopped = False
+        self._thread = threading.Thread(target=self._loop, name='renewal-scheduler', daemon=True)
+        self._thread.start()
+        print("✅ RenewalScheduler запущен")
+    
+    def stop(self, timeout=5):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        if self._thread:
+            self._thread.join(timeout)
+    
+    def _loop(self):
+        while not self._stopped:
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"❌ Ошибка продления подписок: {e}")
+            
+            with self._condition:
+                if self._stopped:
+                    break
+                self._condition.wait(timeout=self._sleep_seconds())
+    
+    def _sleep_seconds(self):
+        """Время до ближайшего срока или пополнения очереди (вызывается под блокировкой)"""
+        wake_at = self._refill_at
+        if self._queue and (wake_at is None or self._queue[0][0] < wake_at):
+            wake_at = self._queue[0][0]
+        if wake_at is None:
+            return self.horizon.total_seconds() / 2
+        return max((wake_at - self.clock()).total_seconds(), 0)
+    
+    def _pop_due(self, now):
+        """Следующая пачка подошедших записей без устаревших"""
+        batch = []
+        with self._condition:
+            while self._queue and self._queue[0][0] <= now and len(batch) < self.batch_size:
+                batch.append(heapq.heappop(self._queue))
+        return batch
+    
+    def _process(self, entry):
+        _, _, subscription_id, expires_at = entry
+        subscription = self.subscription_manager.get_subscription(subscription_id)
+        
+        # Подписка отменена, продлена или срок перенесен после постановки в очередь
+        if not subscription or subscription.get('status') != 'active' \
+                or subscription.get('expires_at') != expires_at:
+            return 'skipped'
+        
+        if not subscription.get('auto_renewal'):
+            self._update(subscription_id, status='expired')
+            return 'expired'
+        
+        # Платеж продления уже создан - проверяем его статус
+        payment_id = subscription.get('renewal_payment_id')
+        payment = self.payment_processor.get_payment(payment_id) if payment_id else None
+        
+        if payment is None or payment.get('status') == 'failed':
+            try:
+                payment = self._charge(subscription)
+            except Exception as e:
+                print(f"❌ Ошибка платежа продления {subscription_id}: {e}")
+                payment = None
+            
+            if payment and payment.get('status') != 'failed':
+                with self._store_lock:
+                    current = self.subscription_manager.get_subscription(subscription_id)
+                    # Подписка изменилась, пока создавался платеж
+                    if not current or current.get('expires_at') != expires_at \
+                            or current.get('renewal_payment_id') != payment_id:
+                        return 'skipped'
+                    self.subscription_manager.update_subscription(
+                        subscription_id, renewal_payment_id=payment['payment_id']
+                    )
+        
+        if payment and payment.get('status') == 'completed':
+            return 'renewed' if self._complete_renewal(subscription_id, payment) else 'skipped'
+        
+        attempts = self._attempts.get(subscription_id, (0, None))[0] + 1
+        if attempts >= self.max_attempts:
+            self._attempts.pop(subscription_id, None)
+            self._update(subscription_id, status='expired')
+            return 'failed'
+        
+        retry_at = self.clock() + self.retry_delay
+        self._attempts[subscription_id] = (attempts, retry_at)
+        self.schedule(subscription, due_at=retry_at)
+        return 'pending' if payment and payment.get('status') != 'failed' else 'retry'
+    
+    def on_payment_completed(self, payment):
+        """Оплата платежа продления (вызывается PaymentProcessor.process_payment)"""
+        if self._complete_renewal(payment['subscription_id'], payment):
+            print(f"✅ Подписка продлена: {payment['subscription_id']}")
+    
+    def _complete_renewal(self, subscription_id, payment):
+        """Продление срока по оплаченному платежу (один раз на платеж)"""
+        with self._store_lock:
+            subscription = self.subscription_manager.get_subscription(subscription_id)
+            if not subscription or subscription.get('renewal_payment_id') != payment['payment_id']:
+                return None
+            
+            # Подписка, истекшая до оплаты, продлевается с момента оплаты
+            start = _as_datetime(subscription['expires_at'])
+            if subscription.get('status') != 'active':
+                start = max(start, self.clock())
+            days = PERIOD_DAYS.get(subscription.get('billing_period'), PERIOD_DAYS['monthly'])
+            renewed = self.subscription_manager.update_subscription(
+                subscription_id,
+                status='active',
+                expires_at=(start + timedelta(days=days)).isoformat(),
+                last_payment_id=payment['payment_id'],
+                renewal_payment_id=None
+            )
+        
+        self._attempts.pop(subscription_id, None)
+        self.schedule(renewed)
+        return renewed
+    
+    def _charge(self, subscription):
+        """Платеж за следующий период по текущей цене тарифа"""
+        price = self.subscription_manager.tariff_service.get_price(
+            subscription['tariff_code'], subscription.get('billing_period', 'monthly')
+        )
+        amount = price.gross / 100 if price else subscription['price']
+        
+        return self.payment_processor.create_payment(
+            amount=amount,
+            currency='RUB',
+            description=f"Продление подписки {subscription['subscription_id']}",
+            partner_id=subscription['partner_id'],
+            tariff_code=subscription['tariff_code'],
+            subscription_id=subscription['subscription_id']
+        )
+    
+    def _update(self, subscription_id, **changes):
+        with self._store_lock:
+            return self.subscription_manager.update_subscription(subscription_id, **changes)
+
+
+def _as_datetime(value):
+    return value if isinstance(value, datetime) else datetime.fromisoformat(value)
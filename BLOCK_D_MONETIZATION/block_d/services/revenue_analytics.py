@@ -3,42 +3,198 @@ cat > BLOCK_D_MONETIZATION/block_d/services/revenue_analytics.py << 'EOF'
 RevenueAnalytics - аналитика доходов для блока D
 """
 
-from datetime import datetime
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+
+ACTIVE = 'active'
+NEW = 'new'
+CHURN_STATUSES = ('expired', 'cancelled')
+
+# Количество месяцев в периоде оплаты (для приведения цены к MRR)
+MONTHS_IN_PERIOD = {'monthly': 1, 'quarterly': 3, 'yearly': 12}
+
+
+def monthly_amount(price, period):
+    """Вклад подписки в MRR"""
+    return round((price or 0) / MONTHS_IN_PERIOD.get(period or 'monthly', 1), 2)
+
+
+def _as_day(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.fromisoformat(str(value)).date()
+
+
+class InMemoryRevenueAggregates:
+    """Дневные агрегаты доходов и переходов подписок в памяти
+    
+    Тот же интерфейс, что у backend.services.revenue_aggregates.RevenueAggregates:
+    события увеличивают счетчики, отчеты читают агрегаты, а не платежи.
+    """
+    
+    def __init__(self):
+        self._partner_daily = defaultdict(lambda: [0.0, 0])   # (день, партнер) -> [выручка, платежей]
+        self._tariff_daily = defaultdict(lambda: [0.0, 0])    # (день, тариф) -> [выручка, платежей]
+        self._transitions = defaultdict(lambda: [0, 0.0])     # (день, тариф, из, в) -> [переходов, ΔMRR]
+    
+    def record_payment(self, partner_id, tariff_plan, amount, paid_at):
+        """Завершенный платеж"""
+        day = _as_day(paid_at)
+        for bucket in (self._partner_daily[(day, partner_id)],
+                       self._tariff_daily[(day, tariff_plan or 'unknown')]):
+            bucket[0] += amount or 0
+            bucket[1] += 1
+    
+    def record_subscription_transition(self, tariff_plan, from_status, to_status, mrr_amount,
+                                       at=None, previous_mrr_amount=None):
+        """Смена статуса подписки (from_status='new' - создание)"""
+        if from_status == to_status and previous_mrr_amount is None:
+            return
+        
+        previous = mrr_amount if previous_mrr_amount is None else previous_mrr_amount
+        delta = (mrr_amount if to_status == ACTIVE else 0) - (previous if from_status == ACTIVE else 0)
+        
+        bucket = self._transitions[(_as_day(at or datetime.now()), tariff_plan or 'unknown',
+                                    from_status, to_status)]
+        bucket[0] += 1
+        bucket[1] += delta
+    
+    def revenue_by_day(self, start, end):
+        """Выручка по дням в [start, end)"""
+        days = defaultdict(lambda: [0.0, 0])
+        for (day, _), (revenue, count) in self._tariff_daily.items():
+            if start <= day < end:
+                days[day][0] += revenue
+                days[day][1] += count
+        return [{'day': day, 'revenue': round(revenue, 2), 'payment_count': count}
+                for day, (revenue, count) in sorted(days.items())]
+    
+    def revenue_by_tariff(self, start, end):
+        tariffs = defaultdict(lambda: [0.0, 0])
+        for (day, tariff_plan), (revenue, count) in self._tariff_daily.items():
+            if start <= day < end:
+                tariffs[tariff_plan][0] += revenue
+                tariffs[tariff_plan][1] += count
+        return {tariff_plan: {'revenue': round(revenue, 2), 'payment_count': count}
+                for tariff_plan, (revenue, count) in tariffs.items()}
+    
+    def top_partners(self, start, end, limit=10):
+        partners = defaultdict(lambda: [0.0, 0])
+        for (day, partner_id), (revenue, count) in self._partner_daily.items():
+            if start <= day < end:
+                partners[partner_id][0] += revenue
+                partners[partner_id][1] += count
+        top = sorted(partners.items(), key=lambda item: (-item[1][0], item[0]))[:limit]
+        return [{'partner_id': partner_id, 'total_spent': round(revenue, 2), 'payment_count': count}
+                for partner_id, (revenue, count) in top]
+    
+    def partner_totals(self, partner_id):
+        days = sorted((day, values) for (day, pid), values in self._partner_daily.items()
+                      if pid == partner_id)
+        return {
+            'total_spent': round(sum(values[0] for _, values in days), 2),
+            'payment_count': sum(values[1] for _, values in days),
+            'active_months': len({(day.year, day.month) for day, _ in days}),
+            'first_payment': days[0][0].isoformat() if days else None,
+            'last_payment': days[-1][0].isoformat() if days else None
+        }
+    
+    def mrr(self, as_of=None):
+        """MRR на конец дня as_of: сумма изменений MRR по дням"""
+        as_of = as_of or date.today()
+        return round(sum(delta for (day, _, _, _), (_, delta) in self._transitions.items()
+                         if day <= as_of), 2)
+    
+    def churn(self, start, end):
+        """Отток за [start, end): ушедшие подписки / активные на начало периода"""
+        active_at_start = 0
+        churned = 0
+        for (day, _, from_status, to_status), (count, _) in self._transitions.items():
+            if from_status == to_status:
+                continue
+            if day < start:
+                active_at_start += count if to_status == ACTIVE else 0
+                active_at_start -= count if from_status == ACTIVE else 0
+            elif day < end and from_status == ACTIVE and to_status in CHURN_STATUSES:
+                churned += count
+        
+        return {
+            'active_at_start': active_at_start,
+            'churned': churned,
+            'churn_rate': round(churned / active_at_start * 100, 2) if active_at_start else 0.0
+        }
+
 
 class RevenueAnalytics:
-    """Аналитика доходов блока D"""
+    """Аналитика доходов блока D
     
-    def __init__(self, config):
+    Получает события от PaymentProcessor (завершение платежа) и
+    SubscriptionManager (создание и смена статуса подписки) и обновляет
+    агрегаты; aggregates - InMemoryRevenueAggregates или RevenueAggregates
+    бэкенда (таблицы revenue_daily_*).
+    """
+    
+    def __init__(self, config, aggregates=None, payment_processor=None, subscription_manager=None):
         self.config = config
+        self.aggregates = aggregates or InMemoryRevenueAggregates()
+        if payment_processor is not None:
+            payment_processor.analytics = self
+        if subscription_manager is not None:
+            subscription_manager.analytics = self
         print("✅ RevenueAnalytics инициализирован")
     
+    def on_payment_completed(self, payment):
+        """Событие PaymentProcessor: платеж завершен"""
+        self.aggregates.record_payment(
+            payment.get('partner_id'), payment.get('tariff_code'),
+            payment['amount'], payment.get('paid_at') or datetime.now()
+        )
+    
+    def on_subscription_changed(self, before, after):
+        """Событие SubscriptionManager: before=None - новая подписка"""
+        self.aggregates.record_subscription_transition(
+            after.get('tariff_code'),
+            before['status'] if before else NEW,
+            after['status'],
+            monthly_amount(after.get('price'), after.get('billing_period')),
+            at=datetime.now(),
+            previous_mrr_amount=monthly_amount(before.get('price'), before.get('billing_period'))
+            if before and before.get('price') != after.get('price') else None
+        )
+    
     def calculate_mrr(self):
         """Расчет Monthly Recurring Revenue"""
-        # Демо данные
         return {
-            'current_mrr': 125000,
+            'current_mrr': self.aggregates.mrr(),
             'currency': 'RUB',
             'calculated_at': datetime.now().isoformat()
         }
     
     def calculate_churn_rate(self, period_days=30):
         """Расчет уровня оттока"""
-        # Демо данные
+        end = date.today() + timedelta(days=1)
+        churn = self.aggregates.churn(end - timedelta(days=period_days), end)
         return {
-            'churn_rate': 5.2,
+            'churn_rate': churn['churn_rate'],
+            'active_at_start': churn['active_at_start'],
+            'churned': churn['churned'],
             'period_days': period_days,
             'calculated_at': datetime.now().isoformat()
         }
     
-    def get_top_partners(self, limit=10):
+    def get_top_partners(self, limit=10, period_days=30):
         """Топ партнеров по объему платежей"""
-        # Демо данные
-        partners = []
-        for i in range(1, limit + 1):
-            partners.append({
-                'partner_id': f'partner_{i:03d}',
-                'revenue': 50000 + i * 10000,
-                'rank': i
-            })
-        return partners
+        end = date.today() + timedelta(days=1)
+        top = self.aggregates.top_partners(end - timedelta(days=period_days), end, limit)
+        return [
+            {
+                'partner_id': item['partner_id'],
+                'revenue': item['total_spent'],
+                'payment_count': item['payment_count'],
+                'rank': rank
+            }
+            for rank, item in enumerate(top, 1)
+        ]
 EOF
@@ -5,13 +5,24 @@ SubscriptionManager - управление подписками для блок
 
 from datetime import datetime, timedelta
 
+from services.id_service import new_ulid
+from services.subscription_store import InMemorySubscriptionStore
+
+# Длительность периодов оплаты в днях
+PERIOD_DAYS = {'monthly': 30, 'quarterly': 90, 'yearly': 365}
+
 class SubscriptionManager:
     """Менеджер подписок блока D"""
     
-    def __init__(self, config, tariff_service):
+    def __init__(self, config, tariff_service, store=None):
         self.config = config
         self.tariff_service = tariff_service
-        self._subscriptions = {}
+        # InMemorySubscriptionStore или SQLSubscriptionStore (таблица subscriptions)
+        self.store = store or InMemorySubscriptionStore()
+        # RenewalScheduler регистрируется сам и получает новые подписки
+        self.scheduler = None
+        # RevenueAnalytics регистрируется сам и получает смены статусов
+        self.analytics = None
         print("✅ SubscriptionManager инициализирован")
     
     def create_subscription(self, partner_id, tariff_code, billing_period='monthly'):
@@ -20,16 +31,15 @@ class SubscriptionManager:
         if not tariff:
             raise ValueError(f"Тариф {tariff_code} не найден")
         
-        subscription_id = f"sub_{partner_id}_{datetime.now().strftime('%Y%m%d%H%M%S')}"
+        price = self.tariff_service.get_price(tariff_code, billing_period)
+        if price is None:
+            raise ValueError(f"Для тарифа {tariff_code} нет цены за период {billing_period}")
+        
+        subscription_id = f"sub_{new_ulid()}"
         start_date = datetime.now()
         
         # Рассчитываем дату истечения
-        if billing_period == 'monthly':
-            expires_at = start_date + timedelta(days=30)
-        elif billing_period == 'quarterly':
-            expires_at = start_date + timedelta(days=90)
-        else:  # yearly
-            expires_at = start_date + timedelta(days=365)
+        expires_at = start_date + timedelta(days=PERIOD_DAYS.get(billing_period, PERIOD_DAYS['yearly']))
         
         subscription = {
             'subscription_id': subscription_id,
@@ -38,25 +48,42 @@ class SubscriptionManager:
             'tariff_name': tariff['name'],
             'billing_period': billing_period,
             'status': 'active',
-            'price': tariff['price_monthly'],
+            'price': price.gross / 100,
+            'price_net_kopecks': price.net,
+            'price_vat_kopecks': price.vat,
+            'price_kopecks': price.gross,
             'start_date': start_date.isoformat(),
             'expires_at': expires_at.isoformat(),
             'auto_renewal': True,
             'created_at': datetime.now().isoformat()
         }
         
-        self._subscriptions[subscription_id] = subscription
-        print(f"✅ Создана подписка: {subscription_id}")
+        subscription = self.store.add(subscription)
+        if self.scheduler:
+            self.scheduler.schedule(subscription)
+        if self.analytics:
+            self.analytics.on_subscription_changed(None, subscription)
+        print(f"✅ Создана подписка: {subscription['subscription_id']}")
         return subscription
     
     def get_subscription(self, subscription_id):
         """Получение подписки"""
-        return self._subscriptions.get(subscription_id)
+        return self.store.get(subscription_id)
     
     def get_partner_subscription(self, partner_id):
         """Получение подписки партнера"""
-        for sub in self._subscriptions.values():
-            if sub['partner_id'] == partner_id and sub['status'] == 'active':
-                return sub
-        return None
+        return self.store.get_active(partner_id)
+    
+    def update_subscription(self, subscription_id, **changes):
+        """Изменение подписки (статус, срок, автопродление) с обновлением индексов"""
+        before = self.store.get(subscription_id) if self.analytics else None
+        before = dict(before) if before else None
+        subscription = self.store.update(subscription_id, **changes)
+        if self.analytics and before and subscription:
+            self.analytics.on_subscription_changed(before, subscription)
+        return subscription
+    
+    def get_expiring_subscriptions(self, days=7):
+        """Активные подписки, истекающие в ближайшие days дней"""
+        return self.store.expiring_within(days)
 EOF
@@ -0,0 +1,220 @@
+"""
+SubscriptionStore - хранилище подписок блока D с индексами
+"""
+
+import bisect
+import threading
+from datetime import datetime, timedelta
+
+ACTIVE = 'active'
+
+# Поля блока D -> поля модели Subscription (для частичных обновлений)
+SQL_FIELDS = {
+    'status': 'status',
+    'tariff_code': 'tariff_plan',
+    'billing_period': 'period',
+    'price': 'price',
+    'leads_included': 'leads_included',
+    'start_date': 'starts_at',
+    'expires_at': 'expires_at',
+    'auto_renewal': 'auto_renewal',
+    'renewal_payment_id': 'renewal_payment_id',
+    'last_payment_id': 'last_renewal_payment_id'
+}
+
+
+def _as_datetime(value):
+    if value is None or isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(value)
+
+
+class InMemorySubscriptionStore:
+    """Подписки в памяти
+    
+    Индексы: партнер -> активные подписки в порядке активации (словарь)
+    и отсортированный список (expires_at, subscription_id) активных
+    подписок: выборка истекающих за период - двоичный поиск и k записей.
+    Изменять подписки нужно через update(), иначе индексы устареют.
+    Методы потокобезопасны (RenewalScheduler продлевает подписки из пула потоков).
+    """
+    
+    def __init__(self):
+        self._subscriptions = {}
+        self._active_by_partner = {}
+        self._expiry = []
+        self._lock = threading.RLock()
+    
+    def add(self, subscription):
+        """Сохранение новой подписки"""
+        subscription = dict(subscription)
+        with self._lock:
+            self._subscriptions[subscription['subscription_id']] = subscription
+            if subscription.get('status') == ACTIVE:
+                self._index_partner(subscription)
+                self._index_expiry(subscription)
+        return subscription
+    
+    def get(self, subscription_id):
+        return self._subscriptions.get(subscription_id)
+    
+    def get_active(self, partner_id):
+        """Активная подписка партнера с самым поздним сроком окончания
+        
+        При равных сроках - активированная последней (как id в SQL).
+        """
+        with self._lock:
+            active = self._active_by_partner.get(partner_id)
+            if not active:
+                return None
+            subscriptions = [self._subscriptions[subscription_id] for subscription_id in active]
+        return max(reversed(subscriptions), key=lambda subscription: _as_datetime(subscription['expires_at']))
+    
+    def update(self, subscription_id, **changes):
+        """Изменение подписки с обновлением индексов"""
+        with self._lock:
+            subscription = self._subscriptions.get(subscription_id)
+            if subscription is None:
+                return None
+            
+            was_active = subscription.get('status') == ACTIVE
+            if was_active:
+                self._unindex_expiry(subscription)
+            
+            subscription.update(changes)
+            
+            is_active = subscription.get('status') == ACTIVE
+            if was_active and not is_active:
+                self._unindex_partner(subscription)
+            elif is_active and not was_active:
+                self._index_partner(subscription)
+            if is_active:
+                self._index_expiry(subscription)
+        return subscription
+    
+    def expiring_between(self, start, end):
+        """Активные подписки с expires_at в [start, end), по возрастанию срока"""
+        with self._lock:
+            left = bisect.bisect_left(self._expiry, (_as_datetime(start), ''))
+            right = bisect.bisect_left(self._expiry, (_as_datetime(end), ''))
+            return [self._subscriptions[subscription_id] for _, subscription_id in self._expiry[left:right]]
+    
+    def expiring_within(self, days, now=None):
+        """Активные подписки, истекающие в ближайшие days дней"""
+        now = now or datetime.now()
+        return self.expiring_between(now, now + timedelta(days=days))
+    
+    def next_expiry(self):
+        """Ближайший срок окончания активной подписки (или None)"""
+        with self._lock:
+            return self._expiry[0][0] if self._expiry else None
+    
+    def all(self):
+        with self._lock:
+            return list(self._subscriptions.values())
+    
+    def _index_partner(self, subscription):
+        self._active_by_partner.setdefault(subscription['partner_id'], {})[subscription['subscription_id']] = None
+    
+    def _unindex_partner(self, subscription):
+        active = self._active_by_partner.get(subscription['partner_id'], {})
+        active.pop(subscription['subscription_id'], None)
+        if not active:
+            self._active_by_partner.pop(subscription['partner_id'], None)
+    
+    def _expiry_key(self, subscription):
+        return (_as_datetime(subscription['expires_at']), str(subscription['subscription_id']))
+    
+    def _index_expiry(self, subscription):
+        if subscription.get('expires_at'):
+            bisect.insort(self._expiry, self._expiry_key(subscription))
+    
+    def _unindex_expiry(self, subscription):
+        if subscription.get('expires_at'):
+            key = self._expiry_key(subscription)
+            position = bisect.bisect_left(self._expiry, key)
+            if position < len(self._expiry) and self._expiry[position] == key:
+                del self._expiry[position]
+
+
+class SQLSubscriptionStore:
+    """Подписки в таблице subscriptions (backend.models.Subscription)
+    
+    Выборки идут по индексам (partner_id, status) и (status, expires_at).
+    Идентификатор блока D (sub_<ULID>) хранится в subscription_code;
+    подписки, созданные без него, доступны по числовому id.
+    """
+    
+    def __init__(self, session=None):
+        from backend.models import db, Subscription
+        from models.adapters import SubscriptionAdapter
+        
+        self.session = session or db.session
+        self.model = Subscription
+        self.adapter = SubscriptionAdapter
+    
+    def add(self, subscription):
+        row = self.model(**self.adapter.from_block_d_format(subscription))
+        self.session.add(row)
+        self.session.commit()
+        return self.adapter.to_block_d_format(row)
+    
+    def _row(self, subscription_id):
+        if isinstance(subscription_id, int):
+            return self.session.get(self.model, subscription_id)
+        return self.session.query(self.model).filter_by(subscription_code=subscription_id).first()
+    
+    def get(self, subscription_id):
+        row = self._row(subscription_id)
+        return self.adapter.to_block_d_format(row) if row else None
+    
+    def get_active(self, partner_id):
+        row = (
+            self.session.query(self.model)
+            .filter(self.model.partner_id == partner_id, self.model.status == ACTIVE)
+            .order_by(self.model.expires_at.desc(), self.model.id.desc())
+            .first()
+        )
+        return self.adapter.to_block_d_format(row) if row else None
+    
+    def update(self, subscription_id, **changes):
+        row = self._row(subscription_id)
+        if row is None:
+            return None
+        
+        for key, value in changes.items():
+            if key in SQL_FIELDS:
+                if key in ('start_date', 'expires_at'):
+                    value = _as_datetime(value)
+                setattr(row, SQL_FIELDS[key], value)
+        self.session.commit()
+        return self.adapter.to_block_d_format(row)
+    
+    def expiring_between(self, start, end):
+        rows = (
+            self.session.query(self.model)
+            .filter(
+                self.model.status == ACTIVE,
+                self.model.expires_at >= _as_datetime(start),
+                self.model.expires_at < _as_datetime(end)
+            )
+            .order_by(self.model.expires_at)
+            .all()
+        )
+        return [self.adapter.to_block_d_format(row) for row in rows]
+    
+    def expiring_within(self, days, now=None):
+        now = now or datetime.utcnow()
+        return self.expiring_between(now, now + timedelta(days=days))
+    
+    def next_expiry(self):
+        row = (
+            self.session.query(self.model.expires_at)
+            .filter(self.model.status == ACTIVE)
+            .order_by(self.model.expires_at)
+            .first()
+        )
+        return row[0] if row else None
+    
+    def all(self):
+        return [self.adapter.to_block_d_format(row) for row in self.session.query(self.model).all()]
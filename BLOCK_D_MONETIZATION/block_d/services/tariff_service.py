@@ -0,0 +1,39 @@
+"""
+TariffService - тарифы и цены для блока D
+"""
+
+# Общая таблица цен Блока C (корень репозитория должен быть в PYTHONPATH)
+from BLOCK_C_INTEGRATIONS.tariff_pricing import TariffPricing
+
+class TariffService:
+    """Сервис тарифов блока D
+    
+    Цены берутся из общей таблицы (тариф × период, копейки без НДС / НДС / с НДС),
+    которая пересчитывается при изменении config.TARIFF_PLANS.
+    """
+    
+    def __init__(self, config, pricing=None):
+        self.config = config
+        self.pricing = pricing or TariffPricing(plans_source=lambda: self.config.TARIFF_PLANS)
+        print("✅ TariffService инициализирован")
+    
+    def get_tariff(self, tariff_code):
+        """Получение тарифа с ценами по периодам"""
+        tariff = self.config.TARIFF_PLANS.get(tariff_code)
+        if not tariff or not tariff.get('is_active', True):
+            return None
+        
+        quote = self.pricing.quote(tariff_code)
+        return {
+            'code': tariff_code,
+            **tariff,
+            'prices': quote['prices'] if quote else {}
+        }
+    
+    def get_all_tariffs(self):
+        """Все активные тарифы"""
+        return [self.get_tariff(code) for code in self.pricing.tariffs()]
+    
+    def get_price(self, tariff_code, billing_period='monthly'):
+        """Цена тарифа за период (TariffPrice в копейках) или None"""
+        return self.pricing.get(tariff_code, billing_period)
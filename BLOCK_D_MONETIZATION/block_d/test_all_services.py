@@ -1,10 +1,11 @@
-cat > BLOCK_D_MONETIZATION/block_d/test_all_services.py << 'EOF'
 """
 Тест всех сервисов блока D
 """
 
 import sys
 import os
+import tempfile
+from datetime import datetime, timedelta
 
 # Добавляем текущую директорию в путь
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
@@ -27,6 +28,8 @@ def test_all_services():
         from services.invoice_generator import InvoiceGenerator
         from services.revenue_analytics import RevenueAnalytics
         from services.notification_service import NotificationService
+        from services.renewal_scheduler import RenewalScheduler
+        from services.billing_pipeline import BillingPipeline, BillingJournal, ContentAddressedStorage
         
         print("✅ Все сервисы импортированы")
         
@@ -60,11 +63,57 @@ def test_all_services():
         )
         print(f"   ✓ Создана подписка: {subscription['subscription_id']}")
         
+        active = subscription_manager.get_partner_subscription('test_partner_001')
+        expiring = subscription_manager.get_expiring_subscriptions(days=31)
+        print(f"   ✓ Активная подписка партнера: {active['subscription_id']}")
+        print(f"   ✓ Истекают в ближайшие 31 день: {len(expiring)}")
+        
+        renewal_scheduler = RenewalScheduler(subscription_manager, payment_processor)
+        print(f"   ✓ Подписок в очереди продления: {renewal_scheduler.rebuild()}")
+        print(f"   ✓ Ближайший срок: {renewal_scheduler.next_deadline()}")
+        
+        # Продление только после оплаты платежа продления
+        renewal_manager = SubscriptionManager(config, tariff_service)
+        renewal_payments = PaymentProcessor(config)
+        paid = renewal_manager.create_subscription('renewal_partner_001', 'professional')
+        unpaid = renewal_manager.create_subscription('renewal_partner_002', 'professional')
+        now = [datetime.fromisoformat(paid['expires_at']) + timedelta(minutes=1)]
+        scheduler = RenewalScheduler(renewal_manager, renewal_payments, max_attempts=3,
+                                     retry_delay=timedelta(hours=1), clock=lambda: now[0])
+        
+        report = scheduler.run_once()
+        assert report['pending'] == 2 and report['renewed'] == 0
+        paid = renewal_manager.get_subscription(paid['subscription_id'])
+        assert paid['expires_at'] < now[0].isoformat() and paid['renewal_payment_id']
+        
+        renewal_payments.process_payment(paid['renewal_payment_id'])
+        paid = renewal_manager.get_subscription(paid['subscription_id'])
+        assert paid['expires_at'] > now[0].isoformat() and paid['renewal_payment_id'] is None
+        print(f"   ✓ Подписка продлена после оплаты до {paid['expires_at']}")
+        
+        for _ in range(2):
+            now[0] += timedelta(hours=1)
+            report = scheduler.run_once()
+        assert report['failed'] == 1
+        assert renewal_manager.get_subscription(unpaid['subscription_id'])['status'] == 'expired'
+        assert renewal_manager.get_subscription(paid['subscription_id'])['status'] == 'active'
+        print("   ✓ Неоплаченная подписка истекла после 3 проверок платежа")
+        
         # 4. Тестируем RevenueAnalytics
         print("\n4. Тестирование RevenueAnalytics:")
-        revenue_analytics = RevenueAnalytics(config)
+        revenue_analytics = RevenueAnalytics(
+            config, payment_processor=payment_processor, subscription_manager=subscription_manager
+        )
+        subscription_manager.create_subscription(
+            partner_id='test_partner_002',
+            tariff_code='professional',
+            billing_period='monthly'
+        )
+        payment_processor.process_payment(payment['payment_id'])
         mrr = revenue_analytics.calculate_mrr()
+        top_partners = revenue_analytics.get_top_partners(limit=3)
         print(f"   ✓ Рассчитан MRR: {mrr['current_mrr']} руб")
+        print(f"   ✓ Топ партнеров: {[item['partner_id'] for item in top_partners]}")
         
         # 5. Тестируем InvoiceGenerator
         print("\n5. Тестирование InvoiceGenerator:")
@@ -100,6 +149,44 @@ def test_all_services():
         email_sent = notification_service.send_invoice_email(invoice, 'test@example.com')
         print(f"   ✓ Тест отправки счета: {'Успешно' if email_sent else 'Не удалось'}")
         
+        # 7. Тестируем BillingPipeline
+        print("\n7. Тестирование BillingPipeline:")
+        with tempfile.TemporaryDirectory() as tmp:
+            storage = ContentAddressedStorage(os.path.join(tmp, 'invoices'))
+            first_hash = storage.put('Счет'.encode('utf-8'))
+            assert storage.put('Счет'.encode('utf-8')) == first_hash
+            assert storage.get(first_hash) == 'Счет'.encode('utf-8')
+            stored_files = [name for _, _, names in os.walk(storage.root) for name in names]
+            assert stored_files == [first_hash + '.html']
+            print("   ✓ Одинаковое содержимое сохраняется один раз")
+            
+            billing_manager = SubscriptionManager(config, tariff_service)
+            for index in range(5):
+                billing_manager.create_subscription(f'billing_partner_{index:03d}', 'professional')
+            journal_path = os.path.join(tmp, 'billing.db')
+            pipeline = BillingPipeline(config, invoice_generator, billing_manager, storage=storage,
+                                       journal=BillingJournal(journal_path), chunk_size=2, workers=2)
+            
+            # Прерванный запуск: счета двух подписок созданы, но не сохранены
+            subscriptions = pipeline.billable_subscriptions()
+            interrupted = pipeline._prepare_chunk('2024-05', subscriptions[:2], {'skipped': 0})
+            numbers = {subscription_id: invoice['invoice_number'] for subscription_id, invoice in interrupted}
+            pipeline.journal.close()
+            
+            pipeline.journal = BillingJournal(journal_path)
+            report = pipeline.run('2024-05')
+            assert report['invoices'] == 5 and report['skipped'] == 0
+            items = pipeline.journal.get_items('2024-05', numbers)
+            assert {key: row['invoice_number'] for key, row in items.items()} == \
+                {str(key): number for key, number in numbers.items()}
+            print("   ✓ Повторный запуск дорисовал счета с теми же номерами")
+            
+            report = pipeline.run('2024-05')
+            assert report['invoices'] == 0 and report['skipped'] == 5
+            assert pipeline.journal.get_stats('2024-05') == {'stored': 5}
+            pipeline.journal.close()
+            print("   ✓ Сохраненные счета пропускаются")
+        
         print("\n" + "=" * 70)
         print("✅ ВСЕ СЕРВИСЫ БЛОКА D РАБОТАЮТ КОРРЕКТНО!")
         print("=" * 70)
@@ -120,4 +207,3 @@ def test_all_services():
 if __name__ == "__main__":
     success = test_all_services()
     sys.exit(0 if success else 1)
-EOF
@@ -1,2 +1,6 @@
 from .partner_models import Partner, PartnerVerificationLog
 from .payment_models import Payment, Subscription
+from .analytics_models import (
+    RevenueDailyPartner, RevenueDailyTariff, SubscriptionTransitionDaily,
+    PartnerLtvSnapshot, CohortRevenueSnapshot, ChurnSnapshot
+)
@@ -0,0 +1,85 @@
+"""
+Агрегаты аналитики доходов (обновляются по событиям платежей и подписок)
+"""
+
+from backend import db
+
+
+class RevenueDailyPartner(db.Model):
+    """Выручка партнера за день"""
+    __tablename__ = 'revenue_daily_partner'
+    
+    day = db.Column(db.Date, primary_key=True)
+    partner_id = db.Column(db.String(50), primary_key=True)
+    
+    revenue = db.Column(db.Float, nullable=False, default=0)
+    payment_count = db.Column(db.Integer, nullable=False, default=0)
+    
+    __table_args__ = (
+        # Выручка партнера за все время (LTV)
+        db.Index('ix_revenue_daily_partner_partner', 'partner_id', 'day'),
+    )
+
+
+class RevenueDailyTariff(db.Model):
+    """Выручка тарифа за день"""
+    __tablename__ = 'revenue_daily_tariff'
+    
+    day = db.Column(db.Date, primary_key=True)
+    tariff_plan = db.Column(db.String(30), primary_key=True)
+    
+    revenue = db.Column(db.Float, nullable=False, default=0)
+    payment_count = db.Column(db.Integer, nullable=False, default=0)
+
+
+class SubscriptionTransitionDaily(db.Model):
+    """Переходы статусов подписок за день и изменение MRR"""
+    __tablename__ = 'subscription_transitions_daily'
+    
+    day = db.Column(db.Date, primary_key=True)
+    tariff_plan = db.Column(db.String(30), primary_key=True)
+    from_status = db.Column(db.String(20), primary_key=True)  # 'new' - новая подписка
+    to_status = db.Column(db.String(20), primary_key=True)
+    
+    transition_count = db.Column(db.Integer, nullable=False, default=0)
+    mrr_delta = db.Column(db.Float, nullable=False, default=0)
+
+
+class PartnerLtvSnapshot(db.Model):
+    """LTV партнера на момент пересчета когорт"""
+    __tablename__ = 'partner_ltv_snapshot'
+    
+    partner_id = db.Column(db.String(50), primary_key=True)
+    cohort = db.Column(db.Date, nullable=False)  # месяц первого платежа
+    
+    total_spent = db.Column(db.Float, nullable=False, default=0)
+    payment_count = db.Column(db.Integer, nullable=False, default=0)
+    active_months = db.Column(db.Integer, nullable=False, default=0)
+    first_payment = db.Column(db.DateTime)
+    last_payment = db.Column(db.DateTime)
+    computed_at = db.Column(db.DateTime, nullable=False)
+
+
+class CohortRevenueSnapshot(db.Model):
+    """Когорта × месяц жизни: выручка и число платящих партнеров"""
+    __tablename__ = 'cohort_revenue_snapshot'
+    
+    cohort = db.Column(db.Date, primary_key=True)
+    month_offset = db.Column(db.Integer, primary_key=True)
+    
+    cohort_size = db.Column(db.Integer, nullable=False)
+    active_partners = db.Column(db.Integer, nullable=False)
+    revenue = db.Column(db.Float, nullable=False)
+
+
+class ChurnSnapshot(db.Model):
+    """Отток подписок по месяцам"""
+    __tablename__ = 'churn_monthly_snapshot'
+    
+    period = db.Column(db.Date, primary_key=True)
+    
+    active_at_start = db.Column(db.Integer, nullable=False)
+    started = db.Column(db.Integer, nullable=False)
+    churned = db.Column(db.Integer, nullable=False)
+    churn_rate = db.Column(db.Float, nullable=False)
+    computed_at = db.Column(db.DateTime, nullable=False)
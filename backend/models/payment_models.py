@@ -7,7 +7,18 @@ from backend import db
 
 
 class Payment(db.Model):
+    # В PostgreSQL таблица секционирована по месяцам created_at (миграция
+    # 003_payment_partitions, обслуживание - services.payment_partitions):
+    # первичный ключ там (id, created_at), уникальность payment_number
+    # проверяет триггер по несекционированной таблице payment_numbers
     __tablename__ = 'payments'
+    __table_args__ = (
+        # Топ партнеров за период: диапазон по paid_at, группировка по partner_id
+        # (в PostgreSQL - покрывающий: сумма, статус и ключ секционирования
+        # читаются из индекса)
+        db.Index('ix_payments_paid_at_partner', 'paid_at', 'partner_id',
+                 postgresql_include=['amount', 'status', 'created_at']),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     payment_number = db.Column(db.String(50), unique=True, nullable=False)
@@ -31,7 +42,7 @@ class Payment(db.Model):
     payment_url = db.Column(db.String(500))
     
     # Временные метки
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)  # ключ секционирования
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     paid_at = db.Column(db.DateTime)
     
@@ -52,10 +63,28 @@ class Payment(db.Model):
         }
 
 
+# История платежей партнера, новые первыми
+db.Index('ix_payments_partner_created', Payment.partner_id, Payment.created_at.desc())
+
+# Сверка статусов: только незавершенные платежи в порядке id
+OPEN_PAYMENT_STATUSES = ('pending', 'processing')
+db.Index('ix_payments_open', Payment.id,
+         postgresql_where=Payment.status.in_(OPEN_PAYMENT_STATUSES),
+         sqlite_where=Payment.status.in_(OPEN_PAYMENT_STATUSES))
+
+
 class Subscription(db.Model):
     __tablename__ = 'subscriptions'
+    __table_args__ = (
+        # Активная подписка партнера и выборка истекающих подписок
+        db.Index('ix_subscriptions_partner_status', 'partner_id', 'status'),
+        db.Index('ix_subscriptions_status_expires', 'status', 'expires_at'),
+        db.Index('ux_subscriptions_subscription_code', 'subscription_code', unique=True),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
+    # Идентификатор подписки блока D (sub_<ULID>)
+    subscription_code = db.Column(db.String(40))
     partner_id = db.Column(db.String(50), db.ForeignKey('partners.partner_id'), nullable=False)
     
     tariff_plan = db.Column(db.String(30), nullable=False)
@@ -69,8 +98,13 @@ class Subscription(db.Model):
     expires_at = db.Column(db.DateTime, nullable=False)
     auto_renewal = db.Column(db.Boolean, default=True)
     
-    # Ссылка на последний платеж
-    last_payment_id = db.Column(db.Integer, db.ForeignKey('payments.id'))
+    # Последний платеж (payments.id) - без внешнего ключа: ключ
+    # секционированной payments включает created_at
+    last_payment_id = db.Column(db.Integer)
+    # Платеж продления, ожидающий оплаты (Блок D, RenewalScheduler)
+    renewal_payment_id = db.Column(db.String(64))
+    # Последний оплаченный платеж продления (Блок D)
+    last_renewal_payment_id = db.Column(db.String(64))
     
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -5,13 +5,39 @@ API эндпоинты для системы платежей
 from flask import Blueprint, request, jsonify, send_file
 from backend.services.invoice_generator import InvoiceGenerator
 from backend.services.revenue_analytics import RevenueAnalytics
+from backend.services.revenue_events import RevenueEventRecorder
+from backend.services.top_partners import RollingTopPartners
 from backend.models import db, Payment, Partner
+from BLOCK_C_INTEGRATIONS.tariff_pricing import get_tariff_pricing, to_kopecks
 from datetime import datetime, timedelta
+from decimal import InvalidOperation
+import logging
 import os
 
+logger = logging.getLogger(__name__)
+
 payment_bp = Blueprint('payment', __name__)
 invoice_generator = InvoiceGenerator()
-revenue_analytics = RevenueAnalytics()
+# Топ партнеров за 7/30/90 дней в памяти: пополняется платежами, завершенными
+# в этом процессе, и перечитывается из таблицы (платежи других воркеров)
+TOP_PARTNERS_RELOAD = 300  # секунд
+rolling_top_partners = RollingTopPartners()
+revenue_analytics = RevenueAnalytics(rolling=rolling_top_partners)
+# Завершенные платежи и смены подписок, сохраненные через db.session, - в агрегаты доходов
+revenue_events = RevenueEventRecorder(lambda: revenue_analytics.aggregates).install(db.session)
+tariff_pricing = get_tariff_pricing()
+
+
+@payment_bp.record_once
+def start_top_partners_reloader(state):
+    """Перечитывание окон топа партнеров в фоновом потоке, а не в запросах"""
+    app = state.app
+
+    def engine():
+        with app.app_context():
+            return db.engine
+
+    rolling_top_partners.start_reloader(engine, TOP_PARTNERS_RELOAD)
 
 
 @payment_bp.route('/api/v1/payments/create-invoice', methods=['POST'])
@@ -24,6 +50,16 @@ def create_invoice():
         if not data.get(field):
             return jsonify({'error': f'Отсутствует обязательное поле: {field}'}), 400
     
+    try:
+        amount = to_kopecks(data['amount'])
+    except (InvalidOperation, ValueError, TypeError):
+        return jsonify({'error': 'Некорректная сумма'}), 400
+    
+    # Сумма счета по известному тарифу должна совпадать с ценой из таблицы
+    price = tariff_pricing.get(data['tariff_plan'], data.get('billing_period', 'monthly'))
+    if price is not None and amount != price.gross:
+        return jsonify({'error': 'Сумма не соответствует цене тарифа'}), 400
+    
     result = invoice_generator.create_invoice(
         partner_id=data['partner_id'],
         amount=data['amount'],
@@ -32,6 +68,8 @@ def create_invoice():
     )
     
     if result:
+        if price is not None:
+            result = {**result, 'price': price.as_dict()}
         return jsonify({'success': True, 'data': result})
     else:
         return jsonify({'error': 'Не удалось создать счет'}), 500
@@ -52,16 +90,30 @@ def get_invoice(invoice_number):
 def download_invoice(invoice_number):
     """Скачивание счета в формате HTML"""
     payment = Payment.query.filter_by(payment_number=invoice_number).first()
+    # Счета пакетного выставления (Блок D) не связаны с платежом: файл ищется по журналу
+    invoice_file = payment.invoice_file if payment and payment.invoice_file \
+        else billing_invoice_file(invoice_number)
     
-    if not payment or not payment.invoice_file:
+    if not invoice_file:
         return jsonify({'error': 'Файл счета не найден'}), 404
     
-    if os.path.exists(payment.invoice_file):
-        return send_file(payment.invoice_file, as_attachment=True, download_name=f'{invoice_number}.html')
+    if os.path.exists(invoice_file):
+        return send_file(invoice_file, as_attachment=True, download_name=f'{invoice_number}.html')
     else:
         return jsonify({'error': 'Файл счета не найден на сервере'}), 404
 
 
+def billing_invoice_file(invoice_number):
+    """Файл счета из журнала BillingPipeline (хранилище по хэшу содержимого) или None"""
+    try:
+        from BLOCK_D_MONETIZATION.block_d.config import MonetizationConfig
+        from BLOCK_D_MONETIZATION.block_d.services.billing_pipeline import find_invoice_file
+    except Exception as e:
+        logger.warning(f"Block D billing journal unavailable: {e}")
+        return None
+    return find_invoice_file(MonetizationConfig.INVOICE, invoice_number)
+
+
 @payment_bp.route('/api/v1/analytics/revenue/monthly', methods=['GET'])
 def get_monthly_revenue():
     """Получение месячной статистики доходов"""
@@ -113,6 +165,17 @@ def get_churn_rate():
         return jsonify({'error': 'Не удалось рассчитать уровень оттока'}), 500
 
 
+@payment_bp.route('/api/v1/analytics/cohorts', methods=['GET'])
+def get_cohort_report():
+    """Получение когорт партнеров и оттока по месяцам"""
+    result = revenue_analytics.get_cohort_report()
+    
+    if result:
+        return jsonify({'success': True, 'data': result})
+    else:
+        return jsonify({'error': 'Не удалось получить когортный отчет'}), 500
+
+
 @payment_bp.route('/api/v1/analytics/forecast', methods=['GET'])
 def get_revenue_forecast():
     """Получение прогноза доходов"""
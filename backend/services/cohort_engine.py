@@ -0,0 +1,353 @@
+"""
+Когортный пересчет LTV и оттока
+
+Таблицы payments и subscriptions читаются один раз потоково (серверный
+курсор, пачками); по массивам NumPy за один проход считаются LTV всех
+партнеров, матрица когорта × месяц жизни и отток по всем месяцам.
+Результат сохраняется снимком, после чего LTV партнера - чтение одной
+строки по первичному ключу.
+"""
+
+import argparse
+import json
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Dict, Any, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import Table, String, select, insert, delete, func, type_coerce
+
+logger = logging.getLogger(__name__)
+
+CHURN_STATUSES = ('expired', 'cancelled')
+
+
+def _months(values: np.ndarray) -> np.ndarray:
+    """datetime64 -> номер месяца от 1970-01"""
+    return values.astype('datetime64[M]').astype(np.int64)
+
+
+def _month_start(month: int):
+    return np.datetime64(int(month), 'M').astype('datetime64[D]').item()
+
+
+# Больше ячеек партнер × месяц - уникальные пары через сортировку, а не битовую карту
+MAX_BITMAP_CELLS = 50_000_000
+
+
+def _unique_keys(keys: np.ndarray, size: int) -> np.ndarray:
+    """Уникальные ключи из [0, size) по возрастанию"""
+    if size > MAX_BITMAP_CELLS:
+        return np.unique(keys)
+    seen = np.zeros(size, dtype=bool)
+    seen[keys] = True
+    return np.flatnonzero(seen)
+
+
+class PartnerMonths(NamedTuple):
+    """Месяцы платежей относительно первого месяца истории"""
+    origin: int             # первый месяц истории (от 1970-01)
+    span: int               # число месяцев истории
+    relative: np.ndarray    # месяц каждого платежа, 0..span-1
+    active: np.ndarray      # уникальные пары партнер * span + месяц
+
+
+class CohortEngine:
+    """Снимки partner_ltv_snapshot, cohort_revenue_snapshot, churn_monthly_snapshot"""
+
+    def __init__(self, engine=None, tables: Optional[Tuple[Table, ...]] = None,
+                 chunk_size: int = 50000, clock=datetime.utcnow):
+        if engine is None or tables is None:
+            from backend.models import (
+                db, Payment, Subscription, PartnerLtvSnapshot, CohortRevenueSnapshot, ChurnSnapshot
+            )
+            engine = engine or db.engine
+            tables = tables or (
+                Payment.__table__, Subscription.__table__, PartnerLtvSnapshot.__table__,
+                CohortRevenueSnapshot.__table__, ChurnSnapshot.__table__
+            )
+
+        self.engine = engine
+        self.payments, self.subscriptions, self.ltv_table, self.cohort_table, self.churn_table = tables
+        self.chunk_size = chunk_size
+        self.clock = clock
+
+    # ---- Пересчет ----
+
+    def rebuild(self) -> Dict[str, Any]:
+        """Полный пересчет снимков; возвращает отчет с длительностью этапов"""
+        started = time.monotonic()
+        now = self.clock()
+
+        with self.engine.connect() as conn:
+            partner_ids, partner_index, paid_at, amount = self._load_payments(conn)
+            sub_start, sub_end = self._load_subscriptions(conn)
+        loaded = time.monotonic()
+
+        activity = self._partner_months(partner_index, paid_at, len(partner_ids))
+        partners = self._partner_rows(partner_ids, partner_index, paid_at, amount, activity, now)
+        cohorts = self._cohort_rows(partner_index, amount, activity, len(partner_ids))
+        churn = self._churn_rows(sub_start, sub_end, (now.year - 1970) * 12 + now.month - 1, now)
+        computed = time.monotonic()
+
+        with self.engine.begin() as conn:
+            for table, rows in ((self.ltv_table, partners), (self.cohort_table, cohorts),
+                                (self.churn_table, churn)):
+                conn.execute(delete(table))
+                if rows:
+                    conn.execute(insert(table), rows)
+        finished = time.monotonic()
+
+        report = {
+            'payments': int(amount.size),
+            'subscriptions': int(sub_start.size),
+            'partners': len(partners),
+            'cohort_cells': len(cohorts),
+            'churn_periods': len(churn),
+            'load_seconds': round(loaded - started, 3),
+            'compute_seconds': round(computed - loaded, 3),
+            'save_seconds': round(finished - computed, 3),
+            'duration': round(finished - started, 3)
+        }
+        logger.info(f"Cohort snapshot rebuilt: {report}")
+        return report
+
+    def _stream(self, conn, query):
+        """Пачки строк с серверного курсора"""
+        result = conn.execution_options(stream_results=True, yield_per=self.chunk_size).execute(query)
+        yield from result.partitions()
+
+    def _time_column(self, column):
+        """SQLite хранит время строкой ISO 8601: ее разбирает NumPy, а не
+        SQLAlchemy построчно"""
+        if self.engine.dialect.name == 'sqlite':
+            return type_coerce(column, String)
+        return column
+
+    def _load_payments(self, conn) -> Tuple[List[str], np.ndarray, np.ndarray, np.ndarray]:
+        columns = self.payments.c
+        query = select(columns.partner_id, self._time_column(columns.paid_at), columns.amount).where(
+            columns.status == 'completed', columns.paid_at.isnot(None)
+        )
+
+        index: Dict[str, int] = {}
+        partner_chunks, time_chunks, amount_chunks = [], [], []
+        for chunk in self._stream(conn, query):
+            partner_column, paid_column, amount_column = zip(*chunk)
+            partner_chunks.append(np.fromiter(
+                (index.setdefault(partner_id, len(index)) for partner_id in partner_column),
+                dtype=np.int64, count=len(chunk)
+            ))
+            time_chunks.append(np.array(paid_column, dtype='datetime64[us]'))
+            amount_chunks.append(np.array(amount_column, dtype=float))
+
+        if not partner_chunks:
+            return [], np.zeros(0, np.int64), np.zeros(0, 'datetime64[us]'), np.zeros(0)
+
+        return (list(index), np.concatenate(partner_chunks),
+                np.concatenate(time_chunks), np.nan_to_num(np.concatenate(amount_chunks)))
+
+    def _load_subscriptions(self, conn) -> Tuple[np.ndarray, np.ndarray]:
+        """Месяц начала и месяц ухода (-1 - подписка не завершена)"""
+        columns = self.subscriptions.c
+        query = select(self._time_column(columns.starts_at), self._time_column(columns.updated_at),
+                       columns.status)
+
+        start_chunks, end_chunks = [], []
+        for chunk in self._stream(conn, query):
+            starts, updates, statuses = zip(*chunk)
+            start = _months(np.array(starts, dtype='datetime64[us]'))
+            end = _months(np.array([u or s for u, s in zip(updates, starts)], dtype='datetime64[us]'))
+            churned = np.isin(np.array(statuses, dtype=object), CHURN_STATUSES)
+            start_chunks.append(start)
+            end_chunks.append(np.where(churned, end, -1))
+
+        if not start_chunks:
+            return np.zeros(0, np.int64), np.zeros(0, np.int64)
+        return np.concatenate(start_chunks), np.concatenate(end_chunks)
+
+    def _partner_months(self, partner_index: np.ndarray, paid_at: np.ndarray,
+                        count: int) -> Optional[PartnerMonths]:
+        if not count:
+            return None
+
+        months = _months(paid_at)
+        origin = int(months.min())
+        span = int(months.max()) - origin + 1
+        relative = months - origin
+        active = _unique_keys(partner_index * span + relative, count * span)
+        return PartnerMonths(origin, span, relative, active)
+
+    def _partner_rows(self, partner_ids: List[str], partner_index: np.ndarray, paid_at: np.ndarray,
+                      amount: np.ndarray, activity: Optional[PartnerMonths],
+                      now: datetime) -> List[Dict[str, Any]]:
+        count = len(partner_ids)
+        if not count:
+            return []
+
+        ticks = paid_at.astype(np.int64)
+        first = np.full(count, np.iinfo(np.int64).max)
+        last = np.full(count, np.iinfo(np.int64).min)
+        np.minimum.at(first, partner_index, ticks)
+        np.maximum.at(last, partner_index, ticks)
+
+        total = np.bincount(partner_index, weights=amount, minlength=count).round(2)
+        payments = np.bincount(partner_index, minlength=count)
+        active_months = np.bincount(activity.active // activity.span, minlength=count)
+        first_at = first.astype('datetime64[us]')
+        cohort = first_at.astype('datetime64[M]').astype('datetime64[D]')
+
+        return [
+            {'partner_id': partner_id, 'cohort': cohort_day, 'total_spent': spent,
+             'payment_count': n, 'active_months': m, 'first_payment': first_payment,
+             'last_payment': last_payment, 'computed_at': now}
+            for partner_id, cohort_day, spent, n, m, first_payment, last_payment in zip(
+                partner_ids, cohort.tolist(), total.tolist(), payments.tolist(), active_months.tolist(),
+                first_at.tolist(), last.astype('datetime64[us]').tolist()
+            )
+        ]
+
+    def _cohort_rows(self, partner_index: np.ndarray, amount: np.ndarray,
+                     activity: Optional[PartnerMonths], count: int) -> List[Dict[str, Any]]:
+        """Матрица когорта (месяц первого платежа) × месяц жизни"""
+        if not count:
+            return []
+
+        origin, span, relative, active_keys = activity
+
+        cohort = np.full(count, span, dtype=np.int64)
+        np.minimum.at(cohort, partner_index, relative)
+        payment_cohort = cohort[partner_index]
+        cells = payment_cohort * span + (relative - payment_cohort)
+
+        revenue = np.bincount(cells, weights=amount, minlength=span * span).reshape(span, span)
+        active_partner = active_keys // span
+        active_cells = cohort[active_partner] * span + (active_keys % span - cohort[active_partner])
+        active = np.bincount(active_cells, minlength=span * span).reshape(span, span)
+        size = np.bincount(cohort, minlength=span)
+
+        rows = []
+        for cohort_index, offset in zip(*np.nonzero(active)):
+            rows.append({
+                'cohort': _month_start(origin + cohort_index),
+                'month_offset': int(offset),
+                'cohort_size': int(size[cohort_index]),
+                'active_partners': int(active[cohort_index, offset]),
+                'revenue': round(float(revenue[cohort_index, offset]), 2)
+            })
+        return rows
+
+    def _churn_rows(self, start: np.ndarray, end: np.ndarray, current: int,
+                    now: datetime) -> List[Dict[str, Any]]:
+        """Отток по месяцам: ушедшие за месяц / активные на его начало"""
+        if not start.size:
+            return []
+
+        origin = int(start.min())
+        length = max(current, int(start.max())) - origin + 1
+        ended = end >= 0
+
+        started = np.bincount(start - origin, minlength=length)[:length]
+        ended_all = np.bincount(end[ended] - origin, minlength=length)[:length]
+        # Начатые и завершенные в одном месяце не входят в активные на начало месяца
+        counted = ended & (end > start)
+        churned = np.bincount(end[counted] - origin, minlength=length)[:length]
+
+        active_at_start = np.concatenate([[0], np.cumsum(started - ended_all)[:-1]])
+        rate = np.divide(churned * 100, active_at_start, out=np.zeros(length),
+                         where=active_at_start > 0).round(2)
+
+        return [
+            {'period': _month_start(origin + index), 'active_at_start': int(active_at_start[index]),
+             'started': int(started[index]), 'churned': int(churned[index]),
+             'churn_rate': float(rate[index]), 'computed_at': now}
+            for index in range(length)
+        ]
+
+    # ---- Чтение снимка ----
+
+    def partner_ltv(self, partner_id: str) -> Optional[Dict[str, Any]]:
+        """LTV партнера из снимка (None - партнера нет в последнем пересчете)"""
+        with self.engine.connect() as conn:
+            row = conn.execute(
+                select(self.ltv_table).where(self.ltv_table.c.partner_id == partner_id)
+            ).first()
+        if row is None:
+            return None
+
+        row = row._mapping
+        return {
+            'partner_id': row['partner_id'],
+            'cohort': row['cohort'].strftime('%Y-%m'),
+            'total_spent': row['total_spent'],
+            'payment_count': row['payment_count'],
+            'active_months': row['active_months'],
+            'first_payment': row['first_payment'].isoformat() if row['first_payment'] else None,
+            'last_payment': row['last_payment'].isoformat() if row['last_payment'] else None,
+            'computed_at': row['computed_at'].isoformat()
+        }
+
+    def cohorts(self) -> List[Dict[str, Any]]:
+        """Когорты с выручкой и удержанием по месяцам жизни"""
+        table = self.cohort_table
+        query = select(table).order_by(table.c.cohort, table.c.month_offset)
+
+        result: Dict[str, Dict[str, Any]] = {}
+        with self.engine.connect() as conn:
+            for row in conn.execute(query):
+                cohort = result.setdefault(row.cohort.strftime('%Y-%m'), {
+                    'cohort': row.cohort.strftime('%Y-%m'), 'size': row.cohort_size,
+                    'revenue': [], 'active_partners': [], 'ltv': 0.0
+                })
+                cohort['revenue'].append({'month_offset': row.month_offset, 'revenue': row.revenue})
+                cohort['active_partners'].append({'month_offset': row.month_offset,
+                                                  'partners': row.active_partners})
+                cohort['ltv'] += row.revenue / row.cohort_size
+
+        for cohort in result.values():
+            cohort['ltv'] = round(cohort['ltv'], 2)
+        return list(result.values())
+
+    def churn_history(self) -> List[Dict[str, Any]]:
+        table = self.churn_table
+        with self.engine.connect() as conn:
+            return [
+                {'period': row.period.strftime('%Y-%m'), 'active_at_start': row.active_at_start,
+                 'started': row.started, 'churned': row.churned, 'churn_rate': row.churn_rate}
+                for row in conn.execute(select(table).order_by(table.c.period))
+            ]
+
+    def computed_at(self) -> Optional[datetime]:
+        """Время последнего пересчета (None - снимков еще нет)"""
+        with self.engine.connect() as conn:
+            return conn.execute(select(func.max(self.ltv_table.c.computed_at))).scalar() \
+                or conn.execute(select(func.max(self.churn_table.c.computed_at))).scalar()
+
+
+def main(argv: Optional[List[str]] = None):
+    """Ночной пересчет когорт: python -m backend.services.cohort_engine"""
+    parser = argparse.ArgumentParser(description='Пересчет когортных LTV и оттока')
+    parser.add_argument('--database-url', default=os.getenv('DATABASE_URL'),
+                        help='URL базы данных (по умолчанию DATABASE_URL)')
+    parser.add_argument('--chunk-size', type=int, default=50000)
+    args = parser.parse_args(argv)
+
+    if not args.database_url:
+        parser.error('не задан --database-url или DATABASE_URL')
+
+    from sqlalchemy import create_engine
+    from backend.models import (
+        Payment, Subscription, PartnerLtvSnapshot, CohortRevenueSnapshot, ChurnSnapshot
+    )
+
+    engine = create_engine(args.database_url)
+    tables = (Payment.__table__, Subscription.__table__, PartnerLtvSnapshot.__table__,
+              CohortRevenueSnapshot.__table__, ChurnSnapshot.__table__)
+    report = CohortEngine(engine, tables, chunk_size=args.chunk_size).rebuild()
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
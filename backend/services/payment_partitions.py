@@ -0,0 +1,245 @@
+"""
+Помесячные партиции таблицы payments (PostgreSQL)
+
+Таблица payments секционирована по RANGE (created_at): одна партиция на
+месяц (payments_y2024m01) и партиция по умолчанию payments_default для
+строк вне созданных диапазонов. Структуру создает миграция
+003_payment_partitions; здесь - обслуживание:
+
+- ensure: партиции текущего и следующих месяцев (ежедневно из cron:
+  python -m backend.services.payment_partitions ensure);
+- archive: отсоединение партиций старше срока хранения и перенос в схему
+  archive (или удаление).
+
+Запросы по периоду оплаты (paid_at) не ограничивают created_at: срок
+между созданием и оплатой не ограничен, такие запросы проходят индекс
+ix_payments_paid_at_partner каждой партиции.
+
+Уникальность payment_number в секционированной таблице обеспечивает
+несекционированная таблица payment_numbers (триггер миграции 003).
+
+В SQLite (тесты) таблица обычная: ensure и archive ничего не делают.
+"""
+
+import argparse
+import json
+import logging
+import os
+import re
+from datetime import date, datetime
+from typing import Dict, Any, List, Optional
+
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+# Партиции вперед от текущего месяца
+DEFAULT_AHEAD_MONTHS = 3
+
+# Срок хранения в основной таблице, месяцев
+DEFAULT_KEEP_MONTHS = 36
+
+DEFAULT_ARCHIVE_SCHEMA = 'archive'
+
+_BOUND = re.compile(r"FROM \('([^']+)'\) TO \('([^']+)'\)")
+
+
+def month_start(value) -> date:
+    return date(value.year, value.month, 1)
+
+
+def add_months(month: date, count: int) -> date:
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table: str, month: date) -> str:
+    return f'{table}_y{month.year}m{month.month:02d}'
+
+
+def partition_ddl(table: str, month: date) -> str:
+    """CREATE TABLE для партиции месяца month"""
+    return (
+        f'CREATE TABLE IF NOT EXISTS {partition_name(table, month)} PARTITION OF {table} '
+        f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+    )
+
+
+def parse_bound(bound: str) -> Optional[Dict[str, date]]:
+    """Границы из pg_get_expr(relpartbound); None - партиция по умолчанию"""
+    match = _BOUND.search(bound)
+    if match is None:
+        return None
+    start, end = (datetime.fromisoformat(value).date() for value in match.groups())
+    return {'start': start, 'end': end}
+
+
+class PaymentPartitions:
+    """Создание и архивирование помесячных партиций payments"""
+
+    def __init__(self, engine=None, table: str = 'payments',
+                 archive_schema: str = DEFAULT_ARCHIVE_SCHEMA, clock=datetime.utcnow):
+        if engine is None:
+            from backend.models import db
+            engine = db.engine
+
+        self.engine = engine
+        self.table = table
+        self.archive_schema = archive_schema
+        self.clock = clock
+
+    @property
+    def default_partition(self) -> str:
+        return f'{self.table}_default'
+
+    def is_partitioned(self) -> bool:
+        """Таблица секционирована (только PostgreSQL после миграции 003)"""
+        if self.engine.dialect.name != 'postgresql':
+            return False
+
+        with self.engine.connect() as conn:
+            return conn.execute(
+                text('SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:table)'),
+                {'table': self.table}
+            ).first() is not None
+
+    def partitions(self) -> List[Dict[str, Any]]:
+        """Партиции по возрастанию месяца; партиция по умолчанию - последней"""
+        if not self.is_partitioned():
+            return []
+
+        with self.engine.connect() as conn:
+            rows = conn.execute(text(
+                'SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) '
+                'FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid '
+                'WHERE i.inhparent = to_regclass(:table)'
+            ), {'table': self.table}).all()
+
+        result = []
+        for name, bound in rows:
+            bounds = parse_bound(bound) or {'start': None, 'end': None}
+            result.append({'name': name, **bounds})
+        return sorted(result, key=lambda item: (item['start'] is None, item['start'] or date.min))
+
+    def ensure(self, ahead: int = DEFAULT_AHEAD_MONTHS) -> List[str]:
+        """Партиции текущего месяца и ahead следующих; возвращает созданные"""
+        if not self.is_partitioned():
+            logger.info(f'{self.table} is not partitioned, nothing to create')
+            return []
+
+        existing = {item['name'] for item in self.partitions()}
+        current = month_start(self.clock())
+        created = []
+        for offset in range(ahead + 1):
+            month = add_months(current, offset)
+            name = partition_name(self.table, month)
+            if name not in existing:
+                self._create(month)
+                created.append(name)
+
+        if created:
+            logger.info(f'Created partitions: {", ".join(created)}')
+        return created
+
+    def _create(self, month: date):
+        """Новая партиция; строки месяца из партиции по умолчанию переносятся в нее"""
+        name = partition_name(self.table, month)
+        start, end = month, add_months(month, 1)
+
+        with self.engine.begin() as conn:
+            stray = conn.execute(text(
+                f'SELECT count(*) FROM {self.default_partition} '
+                'WHERE created_at >= :start AND created_at < :end'
+            ), {'start': start, 'end': end}).scalar()
+
+            if not stray:
+                conn.execute(text(partition_ddl(self.table, month)))
+                return
+
+            # Новая партиция не может пересекаться со строками партиции по
+            # умолчанию: строки переносятся в отдельную таблицу, затем она
+            # подключается (индексы создаются при ATTACH)
+            conn.execute(text(f'CREATE TABLE {name} (LIKE {self.table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'))
+            conn.execute(text(
+                f'WITH moved AS (DELETE FROM {self.default_partition} '
+                'WHERE created_at >= :start AND created_at < :end RETURNING *) '
+                f'INSERT INTO {name} SELECT * FROM moved'
+            ), {'start': start, 'end': end})
+            conn.execute(text(
+                f'ALTER TABLE {self.table} ATTACH PARTITION {name} '
+                f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+            ))
+            logger.info(f'Moved {stray} rows from {self.default_partition} to {name}')
+
+    def archive(self, keep_months: int = DEFAULT_KEEP_MONTHS, drop: bool = False) -> List[str]:
+        """Отсоединение партиций, целиком старше keep_months месяцев
+
+        Отсоединенные партиции переносятся в схему archive_schema (остаются
+        доступны для выгрузки) или удаляются при drop=True. Дневные агрегаты
+        доходов и когортные снимки уже посчитаны и не меняются; полный
+        пересчет после архивации охватывает только оставшиеся месяцы.
+        """
+        if keep_months < 1:
+            raise ValueError('keep_months must be positive')
+        if not self.is_partitioned():
+            logger.info(f'{self.table} is not partitioned, nothing to archive')
+            return []
+
+        horizon = add_months(month_start(self.clock()), -keep_months)
+        expired = [item['name'] for item in self.partitions()
+                   if item['end'] is not None and item['end'] <= horizon]
+
+        for name in expired:
+            with self.engine.begin() as conn:
+                conn.execute(text(f'ALTER TABLE {self.table} DETACH PARTITION {name}'))
+                if drop:
+                    conn.execute(text(f'DROP TABLE {name}'))
+                else:
+                    conn.execute(text(f'CREATE SCHEMA IF NOT EXISTS {self.archive_schema}'))
+                    conn.execute(text(f'ALTER TABLE {name} SET SCHEMA {self.archive_schema}'))
+            logger.info(f'{"Dropped" if drop else "Archived"} partition {name}')
+
+        return expired
+
+
+def main(argv: Optional[List[str]] = None):
+    """Обслуживание партиций: python -m backend.services.payment_partitions ensure|archive|list"""
+    parser = argparse.ArgumentParser(description='Помесячные партиции таблицы payments')
+    parser.add_argument('--database-url', default=os.getenv('DATABASE_URL'),
+                        help='URL базы данных (по умолчанию DATABASE_URL)')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    commands.add_parser('list', help='партиции и их границы')
+
+    ensure = commands.add_parser('ensure', help='создать партиции текущего и следующих месяцев')
+    ensure.add_argument('--ahead', type=int, default=DEFAULT_AHEAD_MONTHS)
+
+    archive = commands.add_parser('archive', help='отсоединить партиции старше срока хранения')
+    archive.add_argument('--keep-months', type=int, default=DEFAULT_KEEP_MONTHS)
+    archive.add_argument('--schema', default=DEFAULT_ARCHIVE_SCHEMA)
+    archive.add_argument('--drop', action='store_true', help='удалить вместо переноса в схему')
+
+    args = parser.parse_args(argv)
+    if not args.database_url:
+        parser.error('не задан --database-url или DATABASE_URL')
+
+    from sqlalchemy import create_engine
+    engine = create_engine(args.database_url)
+
+    if args.command == 'list':
+        partitions = PaymentPartitions(engine)
+        result = [{'name': item['name'],
+                   'start': item['start'].isoformat() if item['start'] else None,
+                   'end': item['end'].isoformat() if item['end'] else None}
+                  for item in partitions.partitions()]
+    elif args.command == 'ensure':
+        result = {'created': PaymentPartitions(engine).ensure(args.ahead)}
+    else:
+        partitions = PaymentPartitions(engine, archive_schema=args.schema)
+        result = {'detached': partitions.archive(args.keep_months, drop=args.drop)}
+
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,244 @@
+"""
+Сверка статусов платежей с платежными системами
+
+Незавершенные платежи (pending, processing) выбираются пачками по id
+(keyset-пагинация), статусы запрашиваются параллельно с ограничением
+частоты, изменения пачки записываются в одной транзакции. Строка
+обновляется, только если ее статус не изменился с момента выборки
+(вебхук или параллельная сверка могли завершить платеж раньше).
+"""
+
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Iterable
+
+from sqlalchemy import Select, Table, select, update, bindparam
+
+from BLOCK_C_INTEGRATIONS.rate_limiter import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+OPEN_STATUSES = ('pending', 'processing')
+
+# Статус платежной системы -> статус Payment
+PROVIDER_STATUS_MAP = {
+    'yookassa': {
+        'pending': 'pending',
+        'waiting_for_capture': 'processing',
+        'succeeded': 'completed',
+        'canceled': 'failed'
+    },
+    'cloudpayments': {
+        'AwaitingAuthentication': 'pending',
+        'Authorized': 'processing',
+        'Completed': 'completed',
+        'Cancelled': 'failed',
+        'Declined': 'failed'
+    }
+}
+
+
+class PaymentReconciler:
+    """Сверка незавершенных платежей со статусами в ЮKassa/CloudPayments
+
+    gateways - шлюзы Блока C по значению Payment.payment_system
+    (объекты с методом verify_payment(payment_system_id)).
+    aggregates - RevenueAggregates: завершенные при сверке платежи
+    добавляются в агрегаты доходов (для таблицы payments приложения -
+    по умолчанию).
+    """
+
+    def __init__(self, gateways: Dict[str, Any], engine=None, table: Optional[Table] = None,
+                 batch_size: int = 1000, max_workers: int = 32, rate: float = 200,
+                 aggregates=None):
+        if engine is None or table is None:
+            from backend.models import db, Payment
+            from backend.services.revenue_aggregates import RevenueAggregates
+            engine = engine or db.engine
+            table = table if table is not None else Payment.__table__
+            aggregates = aggregates if aggregates is not None else RevenueAggregates()
+
+        self.gateways = gateways
+        self.engine = engine
+        self.table = table
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.limiter = TokenBucket(rate)
+        self.aggregates = aggregates
+
+    def run(self, statuses: Iterable[str] = OPEN_STATUSES,
+            max_payments: Optional[int] = None) -> Dict[str, Any]:
+        """Сверка всех незавершенных платежей; возвращает отчет о расхождениях"""
+        started = time.monotonic()
+        report = {
+            'checked': 0,
+            'updated': 0,
+            'unchanged': 0,
+            'errors': 0,
+            'skipped': 0,
+            'conflicts': 0,
+            'transitions': {},
+            'amount_mismatch': [],
+            'failed_ids': []
+        }
+        statuses = list(statuses)
+        last_id = 0
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while max_payments is None or report['checked'] < max_payments:
+                limit = self.batch_size if max_payments is None \
+                    else min(self.batch_size, max_payments - report['checked'])
+                rows = self._fetch_batch(statuses, last_id, limit)
+                if not rows:
+                    break
+
+                last_id = rows[-1]['id']
+                results = list(executor.map(self._check, rows))
+                updates = self._collect(rows, results, report)
+
+                if updates:
+                    applied = self._apply(updates)
+                    report['conflicts'] += len(updates) - len(applied)
+                    report['updated'] -= len(updates) - len(applied)
+                    if self.aggregates is not None and applied:
+                        self._record_revenue(rows, applied)
+
+                logger.info(f"Reconciliation: {report['checked']} checked, {report['updated']} updated")
+
+        elapsed = time.monotonic() - started
+        report['duration'] = round(elapsed, 3)
+        report['per_second'] = round(report['checked'] / elapsed, 1) if elapsed else None
+        return report
+
+    def _fetch_batch(self, statuses: List[str], after_id: int, limit: int) -> List[Dict[str, Any]]:
+        """Следующая пачка незавершенных платежей (WHERE id > последнего обработанного)"""
+        query = self.batch_query(statuses, after_id, limit)
+        with self.engine.connect() as conn:
+            return [dict(row._mapping) for row in conn.execute(query)]
+
+    def batch_query(self, statuses: List[str], after_id: int, limit: int) -> Select:
+        """Запрос пачки (частичный индекс ix_payments_open)"""
+        columns = self.table.c
+        selected = [columns.id, columns.status, columns.amount,
+                    columns.payment_system, columns.payment_system_id]
+        if self.aggregates is not None:
+            selected += [columns.partner_id, columns.tariff_plan]
+        return (
+            select(*selected)
+            # Статусы подставляются литералами: с параметрами планировщик не может
+            # доказать условие частичного индекса
+            .where(columns.status.in_(bindparam('open_statuses', list(statuses), expanding=True,
+                                                literal_execute=True)),
+                   columns.id > after_id)
+            .order_by(columns.id)
+            .limit(limit)
+        )
+
+    def _check(self, row: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Запрос статуса платежа (None - платеж не привязан к платежной системе)"""
+        gateway = self.gateways.get(row['payment_system'])
+        if gateway is None or not row['payment_system_id']:
+            return None
+
+        self.limiter.acquire()
+        try:
+            return gateway.verify_payment(row['payment_system_id'])
+        except Exception as e:
+            return {'success': False, 'error': str(e)}
+
+    def _collect(self, rows: List[Dict[str, Any]], results: List[Optional[Dict[str, Any]]],
+                 report: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Сравнение локальных и внешних статусов, подготовка обновлений"""
+        updates = []
+        now = datetime.utcnow()
+
+        for row, result in zip(rows, results):
+            report['checked'] += 1
+
+            if result is None:
+                report['skipped'] += 1
+                continue
+
+            if not result.get('success'):
+                report['errors'] += 1
+                report['failed_ids'].append(row['id'])
+                continue
+
+            status_map = PROVIDER_STATUS_MAP.get(row['payment_system'], {})
+            new_status = status_map.get(result.get('status'))
+
+            if result.get('amount') is not None and row['amount'] is not None \
+                    and round(float(result['amount']), 2) != round(float(row['amount']), 2):
+                report['amount_mismatch'].append({
+                    'id': row['id'], 'local': row['amount'], 'provider': result['amount']
+                })
+
+            if new_status is None or new_status == row['status']:
+                report['unchanged'] += 1
+                continue
+
+            transition = f"{row['status']}->{new_status}"
+            report['transitions'][transition] = report['transitions'].get(transition, 0) + 1
+            report['updated'] += 1
+
+            paid_at = None
+            if new_status == 'completed':
+                paid_at = _parse_time(result.get('paid_at')) or now
+
+            updates.append({
+                'b_id': row['id'],
+                'b_old_status': row['status'],
+                'b_status': new_status,
+                'b_paid_at': paid_at,
+                'b_updated_at': now
+            })
+
+        return updates
+
+    def _apply(self, updates: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Обновление статусов пачки в одной транзакции
+
+        Каждая строка обновляется отдельным запросом с условием на прежний
+        статус: возвращаются только обновления, которые совпали со строкой
+        (executemany не сообщает, какие из строк изменены).
+        """
+        columns = self.table.c
+        statement = (
+            update(self.table)
+            .where(columns.id == bindparam('b_id'), columns.status == bindparam('b_old_status'))
+            .values(
+                status=bindparam('b_status'),
+                paid_at=bindparam('b_paid_at'),
+                updated_at=bindparam('b_updated_at')
+            )
+        )
+        with self.engine.begin() as conn:
+            return [item for item in updates if conn.execute(statement, item).rowcount == 1]
+
+    def _record_revenue(self, rows: List[Dict[str, Any]], updates: List[Dict[str, Any]]):
+        """Завершенные платежи пачки - в агрегаты доходов"""
+        by_id = {row['id']: row for row in rows}
+        self.aggregates.record_payments(
+            {
+                'partner_id': by_id[item['b_id']]['partner_id'],
+                'tariff_plan': by_id[item['b_id']]['tariff_plan'],
+                'amount': by_id[item['b_id']]['amount'],
+                'paid_at': item['b_paid_at']
+            }
+            for item in updates if item['b_status'] == 'completed'
+        )
+
+
+def _parse_time(value: Optional[str]) -> Optional[datetime]:
+    """Время из ответа платежной системы (ISO 8601) в naive UTC"""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if parsed.tzinfo is not None:
+        parsed = (parsed - parsed.utcoffset()).replace(tzinfo=None)
+    return parsed
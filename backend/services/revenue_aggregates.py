@@ -0,0 +1,320 @@
+"""
+Материализованные агрегаты доходов
+
+Дневная выручка по партнерам и тарифам и дневные переходы статусов
+подписок обновляются по событиям (upsert с приращением), поэтому
+дашборды читают O(дней) строк агрегатов, а не O(платежей).
+"""
+
+import logging
+from collections import defaultdict
+from datetime import date, datetime
+from typing import Dict, Any, List, Optional, Iterable, Tuple
+
+from sqlalchemy import Table, select, update, insert, delete, func, case, and_, extract
+
+logger = logging.getLogger(__name__)
+
+ACTIVE = 'active'
+NEW = 'new'
+CHURN_STATUSES = ('expired', 'cancelled')
+
+# Количество месяцев в периоде оплаты (для приведения цены к MRR)
+MONTHS_IN_PERIOD = {'monthly': 1, 'quarterly': 3, 'yearly': 12}
+
+
+def monthly_amount(price: Optional[float], period: Optional[str]) -> float:
+    """Вклад подписки в MRR"""
+    return round((price or 0) / MONTHS_IN_PERIOD.get(period or 'monthly', 1), 2)
+
+
+def _as_day(value) -> date:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.fromisoformat(str(value)).date()
+
+
+class RevenueAggregates:
+    """Агрегаты revenue_daily_partner, revenue_daily_tariff, subscription_transitions_daily"""
+
+    def __init__(self, engine=None, tables: Optional[Tuple[Table, Table, Table]] = None):
+        if engine is None or tables is None:
+            from backend.models import db, RevenueDailyPartner, RevenueDailyTariff, SubscriptionTransitionDaily
+            engine = engine or db.engine
+            tables = tables or (
+                RevenueDailyPartner.__table__,
+                RevenueDailyTariff.__table__,
+                SubscriptionTransitionDaily.__table__
+            )
+
+        self.engine = engine
+        self.partner_daily, self.tariff_daily, self.transitions = tables
+        # Получают каждую записанную пачку платежей (например, RollingTopPartners)
+        self.listeners: List[Any] = []
+
+    # ---- События ----
+
+    def record_payment(self, partner_id: str, tariff_plan: Optional[str], amount: float, paid_at):
+        """Завершенный платеж"""
+        self.record_payments([{
+            'partner_id': partner_id, 'tariff_plan': tariff_plan, 'amount': amount, 'paid_at': paid_at
+        }])
+
+    def record_payments(self, payments: Iterable[Dict[str, Any]]) -> int:
+        """Пакет завершенных платежей: суммируется в памяти, затем один upsert на таблицу"""
+        payments = list(payments)
+        by_partner = defaultdict(lambda: [0.0, 0])
+        by_tariff = defaultdict(lambda: [0.0, 0])
+        count = 0
+
+        for payment in payments:
+            day = _as_day(payment['paid_at'])
+            amount = float(payment['amount'] or 0)
+            for bucket in (by_partner[(day, payment['partner_id'])],
+                           by_tariff[(day, payment.get('tariff_plan') or 'unknown')]):
+                bucket[0] += amount
+                bucket[1] += 1
+            count += 1
+
+        if not count:
+            return 0
+
+        with self.engine.begin() as conn:
+            self._upsert(conn, self.partner_daily, ['day', 'partner_id'], ['revenue', 'payment_count'], [
+                {'day': day, 'partner_id': partner_id, 'revenue': round(revenue, 2), 'payment_count': n}
+                for (day, partner_id), (revenue, n) in by_partner.items()
+            ])
+            self._upsert(conn, self.tariff_daily, ['day', 'tariff_plan'], ['revenue', 'payment_count'], [
+                {'day': day, 'tariff_plan': tariff_plan, 'revenue': round(revenue, 2), 'payment_count': n}
+                for (day, tariff_plan), (revenue, n) in by_tariff.items()
+            ])
+
+        for listener in self.listeners:
+            listener.record_payments(payments)
+        return count
+
+    def record_subscription_transition(self, tariff_plan: str, from_status: str, to_status: str,
+                                       mrr_amount: float, at=None,
+                                       previous_mrr_amount: Optional[float] = None):
+        """Смена статуса подписки (from_status='new' - создание)
+
+        mrr_amount - вклад подписки в MRR после перехода (см. monthly_amount),
+        previous_mrr_amount - до перехода, если цена менялась.
+        """
+        if from_status == to_status and previous_mrr_amount is None:
+            return
+
+        previous = mrr_amount if previous_mrr_amount is None else previous_mrr_amount
+        delta = (mrr_amount if to_status == ACTIVE else 0) - (previous if from_status == ACTIVE else 0)
+
+        with self.engine.begin() as conn:
+            self._upsert(conn, self.transitions, ['day', 'tariff_plan', 'from_status', 'to_status'],
+                         ['transition_count', 'mrr_delta'], [{
+                             'day': _as_day(at or datetime.utcnow()),
+                             'tariff_plan': tariff_plan or 'unknown',
+                             'from_status': from_status,
+                             'to_status': to_status,
+                             'transition_count': 1,
+                             'mrr_delta': round(delta, 2)
+                         }])
+
+    def _upsert(self, conn, table: Table, keys: List[str], increments: List[str],
+                rows: List[Dict[str, Any]]):
+        """INSERT ... ON CONFLICT DO UPDATE SET column = column + excluded.column"""
+        if not rows:
+            return
+
+        dialect = conn.dialect.name
+        if dialect in ('postgresql', 'sqlite'):
+            if dialect == 'postgresql':
+                from sqlalchemy.dialects.postgresql import insert as dialect_insert
+            else:
+                from sqlalchemy.dialects.sqlite import insert as dialect_insert
+
+            statement = dialect_insert(table)
+            statement = statement.on_conflict_do_update(
+                index_elements=keys,
+                set_={column: table.c[column] + statement.excluded[column] for column in increments}
+            )
+            conn.execute(statement, rows)
+            return
+
+        for row in rows:
+            condition = and_(*(table.c[key] == row[key] for key in keys))
+            result = conn.execute(
+                update(table).where(condition)
+                .values({column: table.c[column] + row[column] for column in increments})
+            )
+            if result.rowcount == 0:
+                conn.execute(insert(table).values(**row))
+
+    # ---- Перестроение ----
+
+    def rebuild(self, payments: Optional[Table] = None, subscriptions: Optional[Table] = None):
+        """Полное перестроение агрегатов из payments и subscriptions (первичное заполнение)"""
+        if payments is None or subscriptions is None:
+            from backend.models import Payment, Subscription
+            payments = payments if payments is not None else Payment.__table__
+            subscriptions = subscriptions if subscriptions is not None else Subscription.__table__
+
+        day = func.date(payments.c.paid_at)
+        completed = and_(payments.c.status == 'completed', payments.c.paid_at.isnot(None))
+
+        with self.engine.begin() as conn:
+            for table in (self.partner_daily, self.tariff_daily, self.transitions):
+                conn.execute(delete(table))
+
+            conn.execute(insert(self.partner_daily).from_select(
+                ['day', 'partner_id', 'revenue', 'payment_count'],
+                select(day, payments.c.partner_id, func.sum(payments.c.amount), func.count())
+                .where(completed).group_by(day, payments.c.partner_id)
+            ))
+            tariff = func.coalesce(payments.c.tariff_plan, 'unknown')
+            conn.execute(insert(self.tariff_daily).from_select(
+                ['day', 'tariff_plan', 'revenue', 'payment_count'],
+                select(day, tariff, func.sum(payments.c.amount), func.count())
+                .where(completed).group_by(day, tariff)
+            ))
+
+            # Из текущего состояния восстанавливаются создание и последний переход
+            transitions = defaultdict(lambda: [0, 0.0])
+            columns = subscriptions.c
+            rows = conn.execution_options(yield_per=10000).execute(select(
+                columns.tariff_plan, columns.status, columns.price, columns.period,
+                columns.starts_at, columns.updated_at
+            ))
+            for row in rows:
+                mrr = monthly_amount(row.price, row.period)
+                tariff_plan = row.tariff_plan or 'unknown'
+                created = transitions[(_as_day(row.starts_at), tariff_plan, NEW, ACTIVE)]
+                created[0] += 1
+                created[1] += mrr
+                if row.status != ACTIVE:
+                    ended = transitions[(_as_day(row.updated_at or row.starts_at), tariff_plan, ACTIVE, row.status)]
+                    ended[0] += 1
+                    ended[1] -= mrr
+
+            if transitions:
+                conn.execute(insert(self.transitions), [
+                    {'day': key[0], 'tariff_plan': key[1], 'from_status': key[2], 'to_status': key[3],
+                     'transition_count': n, 'mrr_delta': round(delta, 2)}
+                    for key, (n, delta) in transitions.items()
+                ])
+
+        logger.info("Revenue aggregates rebuilt")
+
+    # ---- Чтение ----
+
+    def revenue_by_day(self, start: date, end: date) -> List[Dict[str, Any]]:
+        """Выручка по дням в [start, end)"""
+        table = self.tariff_daily
+        query = (
+            select(table.c.day, func.sum(table.c.revenue), func.sum(table.c.payment_count))
+            .where(table.c.day >= start, table.c.day < end)
+            .group_by(table.c.day).order_by(table.c.day)
+        )
+        with self.engine.connect() as conn:
+            return [{'day': row[0], 'revenue': round(row[1] or 0, 2), 'payment_count': int(row[2] or 0)}
+                    for row in conn.execute(query)]
+
+    def revenue_by_tariff(self, start: date, end: date) -> Dict[str, Dict[str, Any]]:
+        table = self.tariff_daily
+        query = (
+            select(table.c.tariff_plan, func.sum(table.c.revenue), func.sum(table.c.payment_count))
+            .where(table.c.day >= start, table.c.day < end)
+            .group_by(table.c.tariff_plan)
+        )
+        with self.engine.connect() as conn:
+            return {row[0]: {'revenue': round(row[1] or 0, 2), 'payment_count': int(row[2] or 0)}
+                    for row in conn.execute(query)}
+
+    def monthly_revenue_by_tariff(self, end: Optional[date] = None) -> List[Tuple[int, int, str, float]]:
+        """Выручка по (год, месяц, тариф) до end (не включая)"""
+        table = self.tariff_daily
+        year = extract('year', table.c.day)
+        month = extract('month', table.c.day)
+        query = select(year, month, table.c.tariff_plan, func.sum(table.c.revenue))
+        if end is not None:
+            query = query.where(table.c.day < end)
+        query = query.group_by(year, month, table.c.tariff_plan).order_by(year, month)
+
+        with self.engine.connect() as conn:
+            return [(int(row[0]), int(row[1]), row[2], float(row[3] or 0)) for row in conn.execute(query)]
+
+    def version(self) -> str:
+        """Версия данных о выручке: меняется с каждым учтенным платежом"""
+        table = self.tariff_daily
+        query = select(func.count(), func.sum(table.c.payment_count),
+                       func.sum(table.c.revenue), func.max(table.c.day))
+        with self.engine.connect() as conn:
+            rows, payments, revenue, last_day = conn.execute(query).one()
+        return f'{rows}:{payments or 0}:{round(revenue or 0, 2)}:{last_day}'
+
+    def top_partners(self, start: date, end: date, limit: int = 10) -> List[Dict[str, Any]]:
+        table = self.partner_daily
+        revenue = func.sum(table.c.revenue)
+        query = (
+            select(table.c.partner_id, revenue, func.sum(table.c.payment_count))
+            .where(table.c.day >= start, table.c.day < end)
+            .group_by(table.c.partner_id)
+            .order_by(revenue.desc(), table.c.partner_id)
+            .limit(limit)
+        )
+        with self.engine.connect() as conn:
+            return [{'partner_id': row[0], 'total_spent': round(row[1] or 0, 2), 'payment_count': int(row[2] or 0)}
+                    for row in conn.execute(query)]
+
+    def partner_totals(self, partner_id: str) -> Dict[str, Any]:
+        """Выручка партнера за все время по дневным строкам партнера"""
+        table = self.partner_daily
+        query = (
+            select(table.c.day, table.c.revenue, table.c.payment_count)
+            .where(table.c.partner_id == partner_id)
+            .order_by(table.c.day)
+        )
+        with self.engine.connect() as conn:
+            rows = conn.execute(query).fetchall()
+
+        return {
+            'total_spent': round(sum(row[1] for row in rows), 2),
+            'payment_count': sum(row[2] for row in rows),
+            'active_months': len({(row[0].year, row[0].month) for row in rows}),
+            'first_payment': rows[0][0].isoformat() if rows else None,
+            'last_payment': rows[-1][0].isoformat() if rows else None
+        }
+
+    def mrr(self, as_of: Optional[date] = None) -> float:
+        """MRR на конец дня as_of: сумма изменений MRR по дням"""
+        table = self.transitions
+        query = select(func.coalesce(func.sum(table.c.mrr_delta), 0)).where(
+            table.c.day <= (as_of or date.today())
+        )
+        with self.engine.connect() as conn:
+            return round(conn.execute(query).scalar() or 0, 2)
+
+    def churn(self, start: date, end: date) -> Dict[str, Any]:
+        """Отток за [start, end): ушедшие подписки / активные на начало периода"""
+        table = self.transitions
+        changed = table.c.from_status != table.c.to_status
+        became_active = func.sum(case((table.c.to_status == ACTIVE, table.c.transition_count), else_=0))
+        left_active = func.sum(case((table.c.from_status == ACTIVE, table.c.transition_count), else_=0))
+
+        with self.engine.connect() as conn:
+            activated, deactivated = conn.execute(
+                select(became_active, left_active).where(table.c.day < start, changed)
+            ).one()
+            churned = conn.execute(
+                select(func.coalesce(func.sum(table.c.transition_count), 0)).where(
+                    table.c.day >= start, table.c.day < end,
+                    table.c.from_status == ACTIVE, table.c.to_status.in_(CHURN_STATUSES)
+                )
+            ).scalar()
+
+        active_at_start = int((activated or 0) - (deactivated or 0))
+        return {
+            'active_at_start': active_at_start,
+            'churned': int(churned or 0),
+            'churn_rate': round(churned / active_at_start * 100, 2) if active_at_start else 0.0
+        }
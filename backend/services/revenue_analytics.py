@@ -1,17 +1,254 @@
 """
-Минимальная версия для тестов
+Аналитика доходов
+
+Отчеты читаются из материализованных агрегатов (см. revenue_aggregates):
+время ответа зависит от длины периода в днях, а не от числа платежей.
 """
 
+import logging
+from calendar import monthrange
+from datetime import date, datetime, timedelta
+from typing import Dict, Any, List, Optional
+
+from sqlalchemy import Table
+
+from backend.services.cohort_engine import CohortEngine
+from backend.services.revenue_aggregates import RevenueAggregates
+from backend.services.revenue_forecast import RevenueForecaster
+from backend.services.top_partners import RollingTopPartners, query_top_partners
+
+logger = logging.getLogger(__name__)
+
+
 class RevenueAnalytics:
-    def get_monthly_revenue(self, year=None, month=None):
+    """Отчеты по доходам, MRR, оттоку и партнерам"""
+
+    # Максимальный горизонт прогноза, месяцев
+    MAX_FORECAST_MONTHS = 36
+
+    def __init__(self, aggregates: Optional[RevenueAggregates] = None,
+                 cohorts: Optional[CohortEngine] = None,
+                 rolling: Optional[RollingTopPartners] = None,
+                 payments: Optional[Table] = None):
+        self._aggregates = aggregates
+        self._cohorts = cohorts
+        self._forecaster: Optional[RevenueForecaster] = None
+        # Скользящие окна топа партнеров: только в процессе, который записывает платежи
+        self.rolling = rolling
+        if rolling is not None and aggregates is not None:
+            aggregates.listeners.append(rolling)
+        self._payments = payments
+
+    @property
+    def aggregates(self) -> RevenueAggregates:
+        # db.engine доступен только в контексте приложения
+        if self._aggregates is None:
+            self._aggregates = RevenueAggregates()
+            if self.rolling is not None:
+                self._aggregates.listeners.append(self.rolling)
+        return self._aggregates
+
+    @property
+    def payments(self) -> Table:
+        if self._payments is None:
+            from backend.models import Payment
+            self._payments = Payment.__table__
+        return self._payments
+
+    @property
+    def cohorts(self) -> CohortEngine:
+        if self._cohorts is None:
+            self._cohorts = CohortEngine()
+        return self._cohorts
+
+    @property
+    def forecaster(self) -> RevenueForecaster:
+        if self._forecaster is None:
+            self._forecaster = RevenueForecaster(self.aggregates)
+        return self._forecaster
+
+    def get_monthly_revenue(self, year: Optional[int] = None,
+                            month: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """Доходы за месяц: итог, по тарифам и по дням"""
+        today = date.today()
+        year = year or today.year
+        month = month or today.month
+
+        try:
+            start = date(year, month, 1)
+            end = start + timedelta(days=monthrange(year, month)[1])
+
+            by_tariff = self.aggregates.revenue_by_tariff(start, end)
+            daily = self.aggregates.revenue_by_day(start, end)
+        except Exception as e:
+            logger.error(f"Error calculating monthly revenue: {e}")
+            return None
+
+        total = round(sum(item['revenue'] for item in by_tariff.values()), 2)
+        count = sum(item['payment_count'] for item in by_tariff.values())
+
         return {
-            'total_revenue': 0,
-            'payment_count': 0,
-            'average_payment': 0
+            'period': f'{year}-{month:02d}',
+            'total_revenue': total,
+            'payment_count': count,
+            'average_payment': total / count if count else 0,
+            'revenue_by_tariff': by_tariff,
+            'daily_revenue': [
+                {'date': item['day'].isoformat(), 'revenue': item['revenue'],
+                 'payment_count': item['payment_count']}
+                for item in daily
+            ]
         }
-    
-    def get_partner_lifetime_value(self, partner_id):
+
+    def get_yearly_revenue(self, year: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """Доходы за год по месяцам"""
+        year = year or date.today().year
+
+        try:
+            daily = self.aggregates.revenue_by_day(date(year, 1, 1), date(year + 1, 1, 1))
+        except Exception as e:
+            logger.error(f"Error calculating yearly revenue: {e}")
+            return None
+
+        months = {month: {'revenue': 0.0, 'payment_count': 0} for month in range(1, 13)}
+        for item in daily:
+            bucket = months[item['day'].month]
+            bucket['revenue'] += item['revenue']
+            bucket['payment_count'] += item['payment_count']
+
+        total = round(sum(bucket['revenue'] for bucket in months.values()), 2)
         return {
-            'total_spent': 0,
-            'payment_count': 0
+            'year': year,
+            'total_revenue': total,
+            'payment_count': sum(bucket['payment_count'] for bucket in months.values()),
+            'monthly_revenue': [
+                {'month': month, 'revenue': round(bucket['revenue'], 2),
+                 'payment_count': bucket['payment_count']}
+                for month, bucket in months.items()
+            ]
         }
+
+    def get_partner_lifetime_value(self, partner_id: str) -> Optional[Dict[str, Any]]:
+        """LTV партнера из когортного снимка; партнеров, появившихся после
+        пересчета, - по дневным агрегатам"""
+        try:
+            totals = self.cohorts.partner_ltv(partner_id)
+            if totals is None:
+                totals = self.aggregates.partner_totals(partner_id)
+        except Exception as e:
+            logger.error(f"Error calculating partner LTV: {e}")
+            return None
+
+        count = totals['payment_count']
+        return {
+            'partner_id': partner_id,
+            'total_spent': totals['total_spent'],
+            'payment_count': count,
+            'average_payment': totals['total_spent'] / count if count else 0,
+            'active_months': totals['active_months'],
+            'first_payment': totals['first_payment'],
+            'last_payment': totals['last_payment'],
+            'cohort': totals.get('cohort'),
+            'computed_at': totals.get('computed_at')
+        }
+
+    def get_churn_rate(self, period_days: int = 30) -> Optional[Dict[str, Any]]:
+        """Отток подписок за последние period_days дней"""
+        end = date.today() + timedelta(days=1)
+        start = end - timedelta(days=period_days)
+
+        try:
+            churn = self.aggregates.churn(start, end)
+        except Exception as e:
+            logger.error(f"Error calculating churn rate: {e}")
+            return None
+
+        return {
+            'total_partners': churn['active_at_start'],
+            'lost_partners': churn['churned'],
+            'churn_rate': churn['churn_rate'],
+            'period_days': period_days
+        }
+
+    def get_cohort_report(self) -> Optional[Dict[str, Any]]:
+        """Когорты партнеров и отток по месяцам из последнего пересчета"""
+        try:
+            computed_at = self.cohorts.computed_at()
+            cohorts = self.cohorts.cohorts()
+            churn = self.cohorts.churn_history()
+        except Exception as e:
+            logger.error(f"Error reading cohort report: {e}")
+            return None
+
+        return {
+            'computed_at': computed_at.isoformat() if computed_at else None,
+            'cohorts': cohorts,
+            'churn': churn
+        }
+
+    def calculate_mrr(self, as_of: Optional[date] = None) -> Optional[Dict[str, Any]]:
+        """MRR по накопленным изменениям активных подписок"""
+        try:
+            mrr = self.aggregates.mrr(as_of)
+        except Exception as e:
+            logger.error(f"Error calculating MRR: {e}")
+            return None
+
+        return {
+            'current_mrr': mrr,
+            'currency': 'RUB',
+            'as_of': (as_of or date.today()).isoformat()
+        }
+
+    def get_revenue_forecast(self, months: int = 6) -> Optional[Dict[str, Any]]:
+        """Прогноз выручки на months месяцев: итог и по тарифам с доверительными интервалами"""
+        if not 1 <= months <= self.MAX_FORECAST_MONTHS:
+            return None
+
+        try:
+            return self.forecaster.forecast(months)
+        except Exception as e:
+            logger.error(f"Error building revenue forecast: {e}")
+            return None
+
+    def get_top_partners(self, limit: int = 10, period_days: int = 30) -> List[Dict[str, Any]]:
+        """Топ партнеров по сумме платежей за последние period_days дней
+
+        Окна RollingTopPartners (7/30/90 дней) после прогрева читаются из
+        памяти, остальные периоды - сгруппированным запросом с LIMIT по
+        индексу (paid_at, partner_id).
+        """
+        try:
+            if self.rolling is not None and self.rolling.loaded_at is not None \
+                    and period_days in self.rolling.windows:
+                top = self.rolling.top(period_days, limit)
+            else:
+                end = datetime.utcnow()
+                top = query_top_partners(self.aggregates.engine, self.payments,
+                                         end - timedelta(days=period_days), end, limit)
+            names = self._company_names([item['partner_id'] for item in top])
+        except Exception as e:
+            logger.error(f"Error getting top partners: {e}")
+            return []
+
+        return [
+            {
+                'partner_id': item['partner_id'],
+                'company_name': names.get(item['partner_id']),
+                'total_spent': item['total_spent'],
+                'payment_count': item['payment_count'],
+                'rank': rank
+            }
+            for rank, item in enumerate(top, 1)
+        ]
+
+    def _company_names(self, partner_ids: List[str]) -> Dict[str, str]:
+        """Названия компаний только для партнеров из топа"""
+        if not partner_ids:
+            return {}
+
+        from backend.models import db, Partner
+        rows = db.session.query(Partner.partner_id, Partner.company_name).filter(
+            Partner.partner_id.in_(partner_ids)
+        ).all()
+        return {partner_id: company_name for partner_id, company_name in rows}
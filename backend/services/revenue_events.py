@@ -0,0 +1,126 @@
+"""
+Запись агрегатов доходов по изменениям моделей
+
+Завершение платежа (Payment.status -> completed) и смена статуса или цены
+подписки, сохраненные через ORM-сессию, после фиксации транзакции
+передаются в RevenueAggregates. Сверка платежей (payment_reconciliation)
+обновляет таблицу без ORM и записывает агрегаты сама.
+"""
+
+import logging
+from datetime import datetime
+from typing import Dict, Any, List, Callable
+
+from sqlalchemy import event, inspect
+
+from backend.services.revenue_aggregates import NEW, monthly_amount
+
+logger = logging.getLogger(__name__)
+
+COMPLETED = 'completed'
+
+# Ключ session.info: события сессии до фиксации транзакции
+PENDING_KEY = 'revenue_events'
+
+
+def _change(obj, attribute: str):
+    """(прежнее значение, новое значение) атрибута в текущем flush"""
+    history = inspect(obj).attrs[attribute].history
+    old = history.deleted[0] if history.deleted else None
+    return old, getattr(obj, attribute)
+
+
+def _keep_value(target, value, oldvalue, initiator):
+    return value
+
+
+class RevenueEventRecorder:
+    """Слушатель сессии: платежи и переходы подписок -> агрегаты доходов
+
+    aggregates_factory вызывается при фиксации транзакции (db.engine
+    доступен только в контексте приложения). По умолчанию отслеживаются
+    backend.models.Payment и Subscription.
+    """
+
+    def __init__(self, aggregates_factory: Callable[[], Any], payment_model=None, subscription_model=None):
+        if payment_model is None or subscription_model is None:
+            from backend.models import Payment, Subscription
+            payment_model = payment_model or Payment
+            subscription_model = subscription_model or Subscription
+
+        self.aggregates_factory = aggregates_factory
+        self.payment_model = payment_model
+        self.subscription_model = subscription_model
+
+    def install(self, session):
+        """Подписка на события сессии (Session, sessionmaker или db.session)"""
+        # Прежнее значение загружается при присваивании, даже если атрибут
+        # истек после commit (иначе история изменения пуста)
+        for attribute in (self.payment_model.status, self.subscription_model.status,
+                          self.subscription_model.price, self.subscription_model.period):
+            event.listen(attribute, 'set', _keep_value, active_history=True)
+        event.listen(session, 'after_flush', self._collect)
+        event.listen(session, 'after_commit', self._record)
+        event.listen(session, 'after_soft_rollback', self._discard)
+        return self
+
+    def _collect(self, session, flush_context):
+        pending = session.info.setdefault(PENDING_KEY, {'payments': [], 'transitions': []})
+        for obj in list(session.new) + list(session.dirty):
+            if isinstance(obj, self.payment_model):
+                self._collect_payment(obj, obj in session.new, pending['payments'])
+            elif isinstance(obj, self.subscription_model):
+                self._collect_subscription(obj, obj in session.new, pending['transitions'])
+
+    @staticmethod
+    def _collect_payment(payment, is_new: bool, payments: List[Dict[str, Any]]):
+        old_status, status = _change(payment, 'status')
+        if status != COMPLETED or (not is_new and old_status in (None, COMPLETED)):
+            return
+        payments.append({
+            'partner_id': payment.partner_id,
+            'tariff_plan': payment.tariff_plan,
+            'amount': payment.amount,
+            'paid_at': payment.paid_at or datetime.utcnow()
+        })
+
+    @staticmethod
+    def _collect_subscription(subscription, is_new: bool, transitions: List[Dict[str, Any]]):
+        old_status, status = _change(subscription, 'status')
+        old_price, price = _change(subscription, 'price')
+        old_period, period = _change(subscription, 'period')
+
+        if is_new:
+            old_status = NEW
+        elif old_status is None and old_price is None and old_period is None:
+            return
+
+        mrr = monthly_amount(price, period)
+        previous = monthly_amount(old_price if old_price is not None else price,
+                                  old_period if old_period is not None else period)
+        transitions.append({
+            'tariff_plan': subscription.tariff_plan,
+            'from_status': old_status if old_status is not None else status,
+            'to_status': status,
+            'mrr_amount': mrr,
+            'previous_mrr_amount': previous if previous != mrr else None
+        })
+
+    def _record(self, session):
+        pending = session.info.pop(PENDING_KEY, None)
+        if not pending or not (pending['payments'] or pending['transitions']):
+            return
+
+        aggregates = self.aggregates_factory()
+        try:
+            if pending['payments']:
+                aggregates.record_payments(pending['payments'])
+            for transition in pending['transitions']:
+                aggregates.record_subscription_transition(**transition)
+        except Exception as e:
+            # Данные уже зафиксированы; агрегаты восстанавливаются через rebuild()
+            logger.error(f"Failed to record revenue aggregates: {e}")
+
+    @staticmethod
+    def _discard(session, previous_transaction):
+        session.info.pop(PENDING_KEY, None)
@@ -0,0 +1,149 @@
+"""
+Прогноз доходов
+
+Помесячная выручка по тарифам загружается из агрегатов в матрицу
+месяцы × (тарифы + итог); тренд и сезонность подбираются одним
+методом наименьших квадратов сразу для всех столбцов. Результат
+кэшируется по (горизонт, версия данных).
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+from datetime import date
+from statistics import NormalDist
+from typing import Dict, Any, Callable, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+TOTAL = 'total'
+
+# Меньше - прогноз не строится; с двух лет истории добавляется сезонность
+MIN_HISTORY_MONTHS = 3
+SEASONAL_HISTORY_MONTHS = 24
+
+
+def fit_forecast(series: np.ndarray, horizon: int, first_month: int,
+                 confidence: float = 0.95) -> Tuple[np.ndarray, np.ndarray, np.ndarray, str]:
+    """Прогноз на horizon месяцев для каждого столбца series (месяцы × ряды)
+
+    first_month - календарный месяц (1-12) первой строки series.
+    Возвращает (прогноз, нижняя граница, верхняя граница, модель);
+    границы - интервал предсказания с уровнем confidence.
+    """
+    history = series.shape[0]
+    steps = np.arange(history + horizon, dtype=float)
+    columns = [np.ones_like(steps), steps]
+    model = 'trend'
+
+    if history >= SEASONAL_HISTORY_MONTHS:
+        # Январь - базовый уровень, остальные 11 месяцев - фиктивные переменные
+        calendar_month = (first_month - 1 + np.arange(history + horizon)) % 12
+        columns.append((calendar_month[:, None] == np.arange(1, 12)[None, :]).astype(float))
+        model = 'trend+seasonality'
+
+    design = np.column_stack(columns)
+    past, future = design[:history], design[history:]
+
+    coefficients, *_ = np.linalg.lstsq(past, series, rcond=None)
+    residuals = series - past @ coefficients
+    dof = max(history - design.shape[1], 1)
+    sigma = np.sqrt((residuals ** 2).sum(axis=0) / dof)
+
+    # Дисперсия предсказания: sigma² · (1 + x₀ᵀ(XᵀX)⁻¹x₀)
+    leverage = np.einsum('ij,jk,ik->i', future, np.linalg.pinv(past.T @ past), future)
+    z = NormalDist().inv_cdf((1 + confidence) / 2)
+    spread = z * np.sqrt(1 + leverage)[:, None] * sigma[None, :]
+
+    mean = np.maximum(future @ coefficients, 0)
+    return mean, np.maximum(mean - spread, 0), mean + spread, model
+
+
+class RevenueForecaster:
+    """Прогноз выручки по тарифам и в целом с доверительными интервалами
+
+    aggregates - RevenueAggregates (monthly_revenue_by_tariff, version).
+    Текущий (неполный) месяц в историю не входит.
+    """
+
+    def __init__(self, aggregates, confidence: float = 0.95, cache_size: int = 32,
+                 today: Callable[[], date] = date.today):
+        self.aggregates = aggregates
+        self.confidence = confidence
+        self.cache_size = cache_size
+        self.today = today
+
+        self._lock = threading.Lock()
+        self._cache: 'OrderedDict[Tuple[int, str, date], Dict[str, Any]]' = OrderedDict()
+
+    def forecast(self, months: int = 6) -> Dict[str, Any]:
+        current = self.today().replace(day=1)
+        key = (months, self.aggregates.version(), current)
+
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+
+        result = self._build(months, current, key[1])
+
+        with self._lock:
+            self._cache[key] = result
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return result
+
+    def _build(self, months: int, current: date, version: str) -> Dict[str, Any]:
+        first, tariffs, series = self._load(current)
+        result = {
+            'months': months,
+            'confidence': self.confidence,
+            'data_version': version,
+            'history_months': series.shape[0],
+            'model': None,
+            'forecast': [],
+            'by_tariff': {tariff: [] for tariff in tariffs}
+        }
+
+        if series.shape[0] < MIN_HISTORY_MONTHS:
+            logger.info(f"Revenue forecast skipped: {series.shape[0]} months of history")
+            return result
+
+        mean, lower, upper, model = fit_forecast(series, months, first[1], self.confidence)
+        start = first[0] * 12 + first[1] - 1 + series.shape[0]
+        periods = [f'{index // 12}-{index % 12 + 1:02d}' for index in range(start, start + months)]
+
+        def column(index: int) -> List[Dict[str, Any]]:
+            return [
+                {'period': period, 'revenue': round(float(m), 2),
+                 'lower': round(float(lo), 2), 'upper': round(float(hi), 2)}
+                for period, m, lo, hi in zip(periods, mean[:, index], lower[:, index], upper[:, index])
+            ]
+
+        result['model'] = model
+        result['by_tariff'] = {tariff: column(index) for index, tariff in enumerate(tariffs)}
+        result['forecast'] = column(len(tariffs))
+        return result
+
+    def _load(self, current: date) -> Tuple[Tuple[int, int], List[str], np.ndarray]:
+        """Матрица месяцы × (тарифы + итог) с нулями в месяцах без платежей"""
+        rows = self.aggregates.monthly_revenue_by_tariff(end=current)
+        if not rows:
+            return (current.year, current.month), [], np.zeros((0, 1))
+
+        tariffs = sorted({row[2] for row in rows})
+        column = {tariff: index for index, tariff in enumerate(tariffs)}
+
+        month_index = np.fromiter((row[0] * 12 + row[1] - 1 for row in rows), dtype=np.int64, count=len(rows))
+        tariff_index = np.fromiter((column[row[2]] for row in rows), dtype=np.int64, count=len(rows))
+        revenue = np.fromiter((row[3] for row in rows), dtype=float, count=len(rows))
+
+        origin = int(month_index.min())
+        length = current.year * 12 + current.month - 1 - origin
+        series = np.zeros((length, len(tariffs) + 1))
+        np.add.at(series, (month_index - origin, tariff_index), revenue)
+        series[:, -1] = series[:, :-1].sum(axis=1)
+
+        return (origin // 12, origin % 12 + 1), tariffs, series
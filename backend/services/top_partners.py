@@ -0,0 +1,229 @@
+"""
+Топ партнеров по выручке
+
+В SQL - сгруппированный запрос с LIMIT по диапазону paid_at (индекс
+ix_payments_paid_at_partner, в PostgreSQL - на каждой партиции). В памяти - скользящие окна (7/30/90 дней)
+с кучей, которые обновляются при каждом завершенном платеже: повторное
+чтение топа без новых платежей не выполняет вычислений.
+"""
+
+import heapq
+import itertools
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Any, Callable, Iterable, List, Optional, Tuple
+
+from sqlalchemy import Select, Table, select, func
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WINDOWS = (7, 30, 90)
+
+
+def top_partners_query(payments: Table, start: datetime, end: datetime, limit: int = 10) -> Select:
+    """Запрос топа: диапазон paid_at по индексу ix_payments_paid_at_partner"""
+    columns = payments.c
+    revenue = func.sum(columns.amount)
+    return (
+        select(columns.partner_id, revenue, func.count())
+        .where(columns.paid_at >= start, columns.paid_at < end, columns.status == 'completed')
+        .group_by(columns.partner_id)
+        .order_by(revenue.desc(), columns.partner_id)
+        .limit(limit)
+    )
+
+
+def query_top_partners(engine, payments: Table, start: datetime, end: datetime,
+                       limit: int = 10) -> List[Dict[str, Any]]:
+    """Топ партнеров по завершенным платежам с paid_at в [start, end)"""
+    query = top_partners_query(payments, start, end, limit)
+    with engine.connect() as conn:
+        return [{'partner_id': row[0], 'total_spent': round(row[1] or 0, 2), 'payment_count': int(row[2])}
+                for row in conn.execute(query)]
+
+
+class RollingWindow:
+    """Суммы партнеров за последние days дней и куча для выбора топа
+
+    Куча хранит (-сумма, партнер) и не удаляет устаревшие записи сразу:
+    запись действительна, пока сумма партнера не изменилась. При чтении
+    устаревшие записи отбрасываются насовсем, топ кэшируется до следующего
+    изменения сумм.
+    """
+
+    def __init__(self, days: int):
+        self.days = days
+        self.period = timedelta(days=days)
+
+        self._events: List[Tuple[datetime, int, str, float]] = []   # куча по времени платежа
+        self._sequence = itertools.count()
+        self._totals: Dict[str, float] = {}
+        self._counts: Dict[str, int] = {}
+        self._heap: List[Tuple[float, str]] = []
+        self._top: Optional[List[Dict[str, Any]]] = None
+
+    def add(self, partner_id: str, amount: float, paid_at: datetime, now: datetime):
+        if paid_at <= now - self.period:
+            return
+
+        heapq.heappush(self._events, (paid_at, next(self._sequence), partner_id, amount))
+        self._change(partner_id, amount, 1)
+
+    def expire(self, now: datetime):
+        """Исключение платежей, вышедших из окна"""
+        horizon = now - self.period
+        while self._events and self._events[0][0] <= horizon:
+            _, _, partner_id, amount = heapq.heappop(self._events)
+            self._change(partner_id, -amount, -1)
+
+    def _change(self, partner_id: str, amount: float, count: int):
+        self._counts[partner_id] = self._counts.get(partner_id, 0) + count
+        if self._counts[partner_id] == 0:
+            del self._counts[partner_id]
+            del self._totals[partner_id]
+        else:
+            total = self._totals.get(partner_id, 0.0) + amount
+            self._totals[partner_id] = total
+            heapq.heappush(self._heap, (-total, partner_id))
+        self._top = None
+
+        if len(self._heap) > 4 * len(self._totals) + 64:
+            self._heap = [(-total, partner_id) for partner_id, total in self._totals.items()]
+            heapq.heapify(self._heap)
+
+    def top(self, limit: int) -> List[Dict[str, Any]]:
+        if self._top is not None and (len(self._top) >= limit or len(self._top) == len(self._totals)):
+            return self._top[:limit]
+
+        valid: List[Tuple[float, str]] = []
+        seen = set()
+        while self._heap and len(valid) < limit:
+            entry = heapq.heappop(self._heap)
+            negative_total, partner_id = entry
+            if partner_id not in seen and self._totals.get(partner_id) == -negative_total:
+                seen.add(partner_id)
+                valid.append(entry)
+        for entry in valid:
+            heapq.heappush(self._heap, entry)
+
+        self._top = [
+            {'partner_id': partner_id, 'total_spent': round(-negative_total, 2),
+             'payment_count': self._counts[partner_id]}
+            for negative_total, partner_id in valid
+        ]
+        return self._top
+
+    def __len__(self) -> int:
+        return len(self._totals)
+
+
+class RollingTopPartners:
+    """Топ партнеров за скользящие окна, обновляемый по завершенным платежам
+
+    Подключается к RevenueAggregates.listeners (получает те же пачки
+    платежей, что и дневные агрегаты) и прогревается из таблицы payments
+    за самое длинное окно (load). Платежи, завершенные в других процессах,
+    попадают в окна при следующем перечитывании фоновым потоком (start_reloader).
+    """
+
+    def __init__(self, windows: Iterable[int] = DEFAULT_WINDOWS,
+                 clock: Callable[[], datetime] = datetime.utcnow):
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._reloader: Optional[threading.Thread] = None
+        self._windows = {days: RollingWindow(days) for days in windows}
+        # Время последней загрузки из таблицы (None - окна не прогреты)
+        self.loaded_at: Optional[datetime] = None
+
+    @property
+    def windows(self) -> Tuple[int, ...]:
+        return tuple(sorted(self._windows))
+
+    def record_payment(self, partner_id: str, amount: float, paid_at: datetime):
+        """Завершенный платеж"""
+        self.record_payments([{'partner_id': partner_id, 'amount': amount, 'paid_at': paid_at}])
+
+    def record_payments(self, payments: Iterable[Dict[str, Any]]):
+        now = self.clock()
+        with self._lock:
+            for payment in payments:
+                for window in self._windows.values():
+                    window.add(payment['partner_id'], float(payment['amount'] or 0), payment['paid_at'], now)
+
+    def top(self, days: int, limit: int = 10) -> List[Dict[str, Any]]:
+        """Топ за окно days (KeyError - окно не отслеживается)"""
+        with self._lock:
+            window = self._windows[days]
+            window.expire(self.clock())
+            return window.top(limit)
+
+    def load(self, engine, payments: Optional[Table] = None) -> int:
+        """Прогрев из завершенных платежей за самое длинное окно
+
+        Окна строятся заново и заменяют текущие, поэтому повторный вызов
+        не учитывает платежи дважды.
+        """
+        if payments is None:
+            from backend.models import Payment
+            payments = Payment.__table__
+
+        columns = payments.c
+        now = self.clock()
+        since = now - timedelta(days=max(self._windows))
+        query = select(columns.partner_id, columns.amount, columns.paid_at).where(
+            columns.paid_at > since, columns.status == 'completed'
+        )
+
+        windows = {days: RollingWindow(days) for days in self._windows}
+        loaded = 0
+        with engine.connect() as conn:
+            result = conn.execution_options(stream_results=True, yield_per=10000).execute(query)
+            for chunk in result.partitions():
+                for row in chunk:
+                    for window in windows.values():
+                        window.add(row.partner_id, float(row.amount or 0), row.paid_at, now)
+                loaded += len(chunk)
+
+        with self._lock:
+            self._windows = windows
+            self.loaded_at = now
+        return loaded
+
+    def start_reloader(self, engine: Callable[[], Any], interval: float, max_backoff: float = 3600,
+                       payments: Optional[Table] = None) -> threading.Thread:
+        """Фоновое перечитывание окон раз в interval секунд
+
+        engine - функция, возвращающая engine (вызывается в фоновом потоке).
+        Первая загрузка - сразу после запуска. После ошибки пауза удваивается
+        (не больше max_backoff), после успешной загрузки снова равна interval.
+        Повторный вызов возвращает уже запущенный поток.
+        """
+        with self._reload_lock:
+            if self._reloader is None or not self._reloader.is_alive():
+                self._stop.clear()
+                self._reloader = threading.Thread(
+                    target=self._reload_loop, args=(engine, interval, max_backoff, payments),
+                    name='top-partners-reloader', daemon=True
+                )
+                self._reloader.start()
+            return self._reloader
+
+    def stop_reloader(self, timeout: Optional[float] = None):
+        self._stop.set()
+        if self._reloader is not None:
+            self._reloader.join(timeout)
+
+    def _reload_loop(self, engine, interval: float, max_backoff: float, payments: Optional[Table]):
+        delay, failures = 0.0, 0
+        while not self._stop.wait(delay):
+            try:
+                self.load(engine(), payments)
+            except Exception:
+                failures += 1
+                delay = min(interval * 2 ** failures, max_backoff)
+                logger.exception(f'Top partners reload failed ({failures} in a row), next attempt in {delay:.0f} s')
+            else:
+                delay, failures = interval, 0
@@ -102,7 +102,7 @@ class SubscriptionAdapter:
             days_remaining = max(0, days_remaining)
         
         return {
-            'subscription_id': subscription.id,
+            'subscription_id': subscription.subscription_code or subscription.id,
             'partner_id': subscription.partner_id,
             'tariff_code': subscription.tariff_plan,
             'tariff_name': subscription.tariff_plan,  # Нужно преобразовать код в имя
@@ -113,6 +113,8 @@ class SubscriptionAdapter:
             'start_date': subscription.starts_at.isoformat() if subscription.starts_at else None,
             'expires_at': subscription.expires_at.isoformat() if subscription.expires_at else None,
             'auto_renewal': subscription.auto_renewal,
+            'renewal_payment_id': subscription.renewal_payment_id,
+            'last_payment_id': subscription.last_renewal_payment_id,
             'next_billing_date': subscription.expires_at.isoformat() if subscription.expires_at else None,
             'cancelled_at': None,  # Нужно добавить поле
             'cancellation_reason': None,  # Нужно добавить поле
@@ -137,6 +139,7 @@ class SubscriptionAdapter:
             Словарь для создания/обновления Subscription
         """
         return {
+            'subscription_code': data.get('subscription_id'),
             'partner_id': data.get('partner_id'),
             'tariff_plan': data.get('tariff_code'),
             'status': data.get('status', 'active'),
@@ -145,5 +148,7 @@ class SubscriptionAdapter:
             'leads_included': data.get('leads_included', 0),
             'starts_at': datetime.fromisoformat(data['start_date']) if data.get('start_date') else datetime.utcnow(),
             'expires_at': datetime.fromisoformat(data['expires_at']) if data.get('expires_at') else None,
-            'auto_renewal': data.get('auto_renewal', True)
+            'auto_renewal': data.get('auto_renewal', True),
+            'renewal_payment_id': data.get('renewal_payment_id'),
+            'last_renewal_payment_id': data.get('last_payment_id')
         }
@@ -0,0 +1,28 @@
+"""
+Применение миграций BLOCK_A_PARTNERS_DB в тестах
+"""
+
+import os
+
+from alembic import command
+from alembic.config import Config
+
+MIGRATIONS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                          'BLOCK_A_PARTNERS_DB', 'migrations')
+
+
+def migration_config(conn=None) -> Config:
+    """Конфигурация Alembic без alembic.ini; conn - соединение, на котором выполняются ревизии"""
+    config = Config()
+    config.set_main_option('script_location', MIGRATIONS)
+    if conn is not None:
+        config.attributes['connection'] = conn
+    return config
+
+
+def upgrade(conn, revision: str = 'head'):
+    command.upgrade(migration_config(conn), revision)
+
+
+def downgrade(conn, revision: str):
+    command.downgrade(migration_config(conn), revision)
@@ -0,0 +1,92 @@
+"""
+Тесты журнала пакетного выставления счетов блока D
+"""
+
+import itertools
+import os
+import sys
+
+# Модули сервисов блока D импортируются как services.* из каталога block_d
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                'BLOCK_D_MONETIZATION', 'block_d', 'services'))
+
+from billing_pipeline import (  # noqa: E402
+    BillingJournal, BillingPipeline, ContentAddressedStorage, find_invoice_file
+)
+
+
+class FakeInvoiceGenerator:
+    """Счета с номерами из общей последовательности"""
+
+    def __init__(self, numbers):
+        self.numbers = numbers
+
+    def build_invoice(self, partner_id, client_info, items, tariff_code=None):
+        return {'invoice_number': f'INV-{next(self.numbers):04d}', 'partner_id': partner_id, 'items': items}
+
+
+def subscription(number):
+    return {'subscription_id': f'sub_{number}', 'partner_id': f'P{number}', 'tariff_code': 'basic',
+            'price': 5000, 'status': 'active'}
+
+
+class TestBillingJournal:
+    """Тесты BillingJournal"""
+
+    def setup_method(self):
+        """Настройка перед каждым тестом"""
+        self.numbers = itertools.count(1)
+
+    def _pipeline(self, tmp_path):
+        return BillingPipeline(
+            config=None, invoice_generator=FakeInvoiceGenerator(self.numbers), subscription_manager=None,
+            storage=ContentAddressedStorage(str(tmp_path / 'invoices')),
+            journal=BillingJournal(str(tmp_path / 'billing.db')), chunk_size=10, workers=1
+        )
+
+    def test_record_created_returns_first_invoice(self, tmp_path):
+        """Тест: второй запуск получает номер, записанный первым"""
+        first = BillingJournal(str(tmp_path / 'billing.db'))
+        second = BillingJournal(str(tmp_path / 'billing.db'))
+
+        assert first.record_created('2024-05', [('sub_1', {'invoice_number': 'INV-0001'})]) == {
+            'sub_1': {'invoice_number': 'INV-0001'}
+        }
+        recorded = second.record_created('2024-05', [
+            ('sub_1', {'invoice_number': 'INV-0002'}), ('sub_2', {'invoice_number': 'INV-0003'})
+        ])
+
+        assert recorded == {'sub_1': {'invoice_number': 'INV-0001'}, 'sub_2': {'invoice_number': 'INV-0003'}}
+        assert second.find_invoice('INV-0002') is None
+
+    def test_overlapping_runs_render_journal_numbers(self, tmp_path):
+        """Тест: пересекающиеся запуски рендерят счета с номерами из журнала"""
+        first, second = self._pipeline(tmp_path), self._pipeline(tmp_path)
+        subscriptions = [subscription(number) for number in range(3)]
+
+        pending_first = first._prepare_chunk('2024-05', subscriptions, {'skipped': 0})
+        # Второй запуск успел прочитать журнал до записи первого
+        second.journal.get_items = lambda period, ids: {}
+        pending_second = second._prepare_chunk('2024-05', subscriptions, {'skipped': 0})
+
+        assert [invoice['invoice_number'] for _, invoice in pending_first] == ['INV-0001', 'INV-0002', 'INV-0003']
+        assert pending_second == pending_first
+
+    def test_find_invoice_file(self, tmp_path):
+        """Тест поиска файла сохраненного счета по номеру"""
+        config = {'billing_db_path': str(tmp_path / 'billing.db'), 'storage_dir': str(tmp_path / 'invoices')}
+        assert find_invoice_file(config, 'INV-0001') is None
+
+        journal = BillingJournal(config['billing_db_path'])
+        storage = ContentAddressedStorage(config['storage_dir'])
+        journal.record_created('2024-05', [('sub_1', {'invoice_number': 'INV-0001'})])
+        assert find_invoice_file(config, 'INV-0001') is None
+
+        content_hash = storage.put('<html>INV-0001</html>'.encode('utf-8'))
+        journal.mark_stored('2024-05', [('sub_1', content_hash)])
+        journal.close()
+
+        path = find_invoice_file(config, 'INV-0001')
+        with open(path, 'rb') as f:
+            assert f.read() == '<html>INV-0001</html>'.encode('utf-8')
+        assert find_invoice_file(config, 'INV-9999') is None
@@ -0,0 +1,114 @@
+"""
+Тесты circuit breaker и bulkhead для внешних интеграций (Блок C)
+"""
+
+import pytest
+import requests
+from unittest.mock import Mock
+
+from BLOCK_C_INTEGRATIONS.circuit_breaker import (
+    CircuitBreaker, CircuitOpenError, BulkheadFullError
+)
+
+
+class FakeClock:
+    """Управляемые часы для проверки recovery_timeout"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestCircuitBreaker:
+    """Тесты CircuitBreaker"""
+
+    def setup_method(self):
+        """Настройка перед каждым тестом"""
+        self.clock = FakeClock()
+        self.breaker = CircuitBreaker(
+            'fns', failure_threshold=3, recovery_timeout=30,
+            max_concurrent_calls=2, clock=self.clock
+        )
+
+    def _fail(self):
+        with pytest.raises(requests.Timeout):
+            self.breaker.call(Mock(side_effect=requests.Timeout('timeout')))
+
+    def test_opens_after_threshold(self):
+        """Тест размыкания после серии ошибок"""
+        for _ in range(3):
+            self._fail()
+
+        assert self.breaker.state == CircuitBreaker.OPEN
+
+        upstream = Mock()
+        with pytest.raises(CircuitOpenError):
+            self.breaker.call(upstream)
+        upstream.assert_not_called()
+
+    def test_server_errors_count_as_failures(self):
+        """Тест учета ответов 5xx как ошибок сервиса"""
+        for _ in range(3):
+            self.breaker.call(Mock(return_value=Mock(status_code=503)))
+
+        assert self.breaker.state == CircuitBreaker.OPEN
+
+    def test_half_open_recovery(self):
+        """Тест восстановления после recovery_timeout"""
+        for _ in range(3):
+            self._fail()
+
+        self.clock.now += 31
+        assert self.breaker.state == CircuitBreaker.HALF_OPEN
+
+        self.breaker.call(Mock(return_value=Mock(status_code=200)))
+        assert self.breaker.state == CircuitBreaker.CLOSED
+
+    def test_half_open_failure_reopens(self):
+        """Тест повторного размыкания при ошибке пробного запроса"""
+        for _ in range(3):
+            self._fail()
+
+        self.clock.now += 31
+        self._fail()
+
+        assert self.breaker.state == CircuitBreaker.OPEN
+        assert self.breaker.get_stats()['times_opened'] == 2
+
+    def test_unexpected_error_does_not_close_half_open(self):
+        """Тест: прочее исключение пробного запроса не замыкает circuit breaker"""
+        for _ in range(3):
+            self._fail()
+
+        self.clock.now += 31
+        with pytest.raises(ValueError):
+            self.breaker.call(Mock(side_effect=ValueError('invalid json')))
+
+        assert self.breaker.state == CircuitBreaker.OPEN
+
+    def test_bulkhead_rejects_when_full(self):
+        """Тест отказа при исчерпании слотов bulkhead"""
+        self.breaker.bulkhead.acquire()
+        self.breaker.bulkhead.acquire()
+
+        with pytest.raises(BulkheadFullError):
+            self.breaker.call(Mock())
+
+        stats = self.breaker.get_stats()
+        assert stats['rejected_calls'] == 1
+        assert stats['bulkhead']['available_slots'] == 0
+        assert stats['state'] == CircuitBreaker.CLOSED
+
+    def test_stats(self):
+        """Тест метрик circuit breaker"""
+        self.breaker.call(Mock(return_value=Mock(status_code=200)))
+        self._fail()
+
+        stats = self.breaker.get_stats()
+        assert stats['total_calls'] == 2
+        assert stats['successful_calls'] == 1
+        assert stats['failed_calls'] == 1
+        assert stats['failure_rate'] == 0.5
+        assert stats['bulkhead']['active_calls'] == 0
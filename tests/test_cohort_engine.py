@@ -0,0 +1,148 @@
+"""
+Тесты когортного пересчета LTV и оттока
+"""
+
+from datetime import date, datetime
+
+from sqlalchemy import (
+    create_engine, MetaData, Table, Column, Integer, String, Float, Date, DateTime
+)
+from sqlalchemy.pool import StaticPool
+
+from backend.services.cohort_engine import CohortEngine
+
+
+class TestCohortEngine:
+    """Тесты CohortEngine"""
+
+    def setup_method(self):
+        """Настройка перед каждым тестом"""
+        self.engine = create_engine('sqlite://', connect_args={'check_same_thread': False},
+                                    poolclass=StaticPool)
+        metadata = MetaData()
+        self.payments = Table(
+            'payments', metadata,
+            Column('id', Integer, primary_key=True),
+            Column('partner_id', String(50)),
+            Column('amount', Float),
+            Column('status', String(20)),
+            Column('paid_at', DateTime)
+        )
+        self.subscriptions = Table(
+            'subscriptions', metadata,
+            Column('id', Integer, primary_key=True),
+            Column('status', String(20)),
+            Column('starts_at', DateTime),
+            Column('updated_at', DateTime)
+        )
+        snapshots = (
+            Table('partner_ltv_snapshot', metadata,
+                  Column('partner_id', String(50), primary_key=True),
+                  Column('cohort', Date, nullable=False),
+                  Column('total_spent', Float), Column('payment_count', Integer),
+                  Column('active_months', Integer),
+                  Column('first_payment', DateTime), Column('last_payment', DateTime),
+                  Column('computed_at', DateTime)),
+            Table('cohort_revenue_snapshot', metadata,
+                  Column('cohort', Date, primary_key=True),
+                  Column('month_offset', Integer, primary_key=True),
+                  Column('cohort_size', Integer), Column('active_partners', Integer),
+                  Column('revenue', Float)),
+            Table('churn_monthly_snapshot', metadata,
+                  Column('period', Date, primary_key=True),
+                  Column('active_at_start', Integer), Column('started', Integer),
+                  Column('churned', Integer), Column('churn_rate', Float),
+                  Column('computed_at', DateTime))
+        )
+        metadata.create_all(self.engine)
+
+        self.cohort_engine = CohortEngine(
+            self.engine, (self.payments, self.subscriptions) + snapshots,
+            chunk_size=2, clock=lambda: datetime(2024, 4, 10)
+        )
+
+    def _insert(self, payments, subscriptions=()):
+        with self.engine.begin() as conn:
+            if payments:
+                conn.execute(self.payments.insert(), [
+                    {'partner_id': partner_id, 'amount': amount, 'status': status, 'paid_at': paid_at}
+                    for partner_id, amount, status, paid_at in payments
+                ])
+            if subscriptions:
+                conn.execute(self.subscriptions.insert(), [
+                    {'status': status, 'starts_at': starts_at, 'updated_at': updated_at}
+                    for status, starts_at, updated_at in subscriptions
+                ])
+
+    def test_partner_ltv_snapshot(self):
+        """Тест LTV всех партнеров за один проход"""
+        self._insert([
+            ('P1', 5000, 'completed', datetime(2024, 1, 5)),
+            ('P1', 5000, 'completed', datetime(2024, 1, 25)),
+            ('P1', 15000, 'completed', datetime(2024, 3, 1)),
+            ('P1', 9000, 'pending', None),
+            ('P2', 1000, 'completed', datetime(2024, 2, 10)),
+        ])
+
+        report = self.cohort_engine.rebuild()
+        ltv = self.cohort_engine.partner_ltv('P1')
+
+        assert report['payments'] == 4
+        assert report['partners'] == 2
+        assert ltv['cohort'] == '2024-01'
+        assert ltv['total_spent'] == 25000
+        assert ltv['payment_count'] == 3
+        assert ltv['active_months'] == 2
+        assert ltv['first_payment'] == '2024-01-05T00:00:00'
+        assert ltv['last_payment'] == '2024-03-01T00:00:00'
+        assert self.cohort_engine.partner_ltv('UNKNOWN') is None
+
+    def test_cohort_matrix(self):
+        """Тест матрицы когорта × месяц жизни"""
+        self._insert([
+            ('P1', 100, 'completed', datetime(2024, 1, 5)),
+            ('P2', 200, 'completed', datetime(2024, 1, 6)),
+            ('P1', 300, 'completed', datetime(2024, 3, 5)),
+            ('P3', 400, 'completed', datetime(2024, 2, 5)),
+        ])
+
+        self.cohort_engine.rebuild()
+        cohorts = {cohort['cohort']: cohort for cohort in self.cohort_engine.cohorts()}
+
+        january = cohorts['2024-01']
+        assert january['size'] == 2
+        assert january['revenue'] == [{'month_offset': 0, 'revenue': 300}, {'month_offset': 2, 'revenue': 300}]
+        assert january['active_partners'][1] == {'month_offset': 2, 'partners': 1}
+        assert january['ltv'] == 300
+        assert cohorts['2024-02']['size'] == 1
+
+    def test_churn_for_every_month(self):
+        """Тест оттока по всем месяцам"""
+        self._insert([], [
+            ('active', datetime(2024, 1, 1), datetime(2024, 1, 1)),
+            ('active', datetime(2024, 1, 2), datetime(2024, 1, 2)),
+            ('cancelled', datetime(2024, 1, 3), datetime(2024, 2, 15)),
+            ('expired', datetime(2024, 1, 4), datetime(2024, 3, 4)),
+            ('cancelled', datetime(2024, 3, 1), datetime(2024, 3, 20)),
+        ])
+
+        self.cohort_engine.rebuild()
+        churn = {item['period']: item for item in self.cohort_engine.churn_history()}
+
+        assert list(churn) == ['2024-01', '2024-02', '2024-03', '2024-04']
+        assert churn['2024-01'] == {'period': '2024-01', 'active_at_start': 0, 'started': 4,
+                                    'churned': 0, 'churn_rate': 0.0}
+        assert churn['2024-02']['churn_rate'] == 25.0
+        assert churn['2024-03']['active_at_start'] == 3
+        assert churn['2024-03']['churned'] == 1
+        assert churn['2024-04']['active_at_start'] == 2
+
+    def test_rebuild_replaces_snapshot(self):
+        """Тест замены снимка при повторном пересчете"""
+        self._insert([('P1', 100, 'completed', datetime(2024, 1, 5))])
+        self.cohort_engine.rebuild()
+        self._insert([('P1', 50, 'completed', datetime(2024, 2, 5))])
+        self.cohort_engine.rebuild()
+
+        assert self.cohort_engine.partner_ltv('P1')['total_spent'] == 150
+        assert self.cohort_engine.computed_at() == datetime(2024, 4, 10)
@@ -0,0 +1,142 @@
+"""
+Тесты локального хранилища диалогов Umnico (Блок C)
+"""
+
+from BLOCK_C_INTEGRATIONS.conversation_store import ConversationStore, ConversationSync
+from BLOCK_C_INTEGRATIONS.webhook_handlers import WebhookHandler
+
+
+class FakeUmnico:
+    """Диалог Umnico: последние limit сообщений или сообщения после since_id"""
+
+    def __init__(self, messages, honor_since_id=True):
+        self.messages = messages
+        self.honor_since_id = honor_since_id
+        self.available = True
+        self.missing = False
+        self.requests = []
+
+    def get_user_conversation(self, user_id, limit=50, since_id=None):
+        self.requests.append(since_id)
+        if not self.available:
+            return {'success': False, 'error': 'Ошибка получения диалога: 503', 'status_code': 503}
+        if self.missing:
+            return {'success': False, 'error': 'Dialog not found', 'status_code': 404}
+
+        if since_id is not None and self.honor_since_id:
+            position = next(i for i, m in enumerate(self.messages) if m['id'] == since_id)
+            page = self.messages[position + 1:position + 1 + limit]
+        else:
+            page = self.messages[-limit:]
+        return {'success': True, 'conversation': page, 'user_id': user_id}
+
+
+def make_messages(count, start=0):
+    return [{'id': str(i), 'text': f'msg {i}', 'created_at': f'2024-05-01T10:{i // 60:02d}:{i % 60:02d}'}
+            for i in range(start, start + count)]
+
+
+class TestConversationSync:
+    """Тесты ConversationSync"""
+
+    def setup_method(self):
+        """Настройка перед каждым тестом"""
+        self.store = ConversationStore(':memory:')
+        self.umnico = FakeUmnico(make_messages(25))
+        self.sync = ConversationSync(self.umnico, self.store, page_size=10, max_workers=2, max_pages=5)
+
+    def test_first_sync_takes_latest_page(self):
+        """Тест первой синхронизации: одна страница последних сообщений"""
+        result = self.sync.sync_user('U1')
+
+        assert result == {'success': True, 'user_id': 'U1', 'fetched': 10, 'complete': False}
+        assert self.umnico.requests == [None]
+        assert self.store.get_sync_state('U1')['last_message_id'] == '24'
+
+    def test_incremental_sync_pages_after_watermark(self):
+        """Тест догрузки только новых сообщений постранично"""
+        self.sync.sync_user('U1')
+        self.umnico.messages += make_messages(23, start=25)
+
+        result = self.sync.sync_user('U1')
+
+        assert result['fetched'] == 23
+        assert result['complete'] is True
+        assert self.umnico.requests[1:] == ['24', '34', '44']
+        assert self.store.get_messages('U1', limit=1)[0]['id'] == '47'
+
+    def test_stops_when_since_id_ignored(self):
+        """Тест остановки, если API не учитывает since_id"""
+        self.umnico.honor_since_id = False
+        self.sync.sync_user('U1')
+
+        result = self.sync.sync_user('U1')
+
+        assert result['success'] is True
+        assert result['complete'] is False
+        assert len(self.umnico.requests) == 2
+
+    def test_page_limit(self):
+        """Тест ограничения числа страниц за вызов"""
+        self.sync.sync_user('U1')
+        self.umnico.messages += make_messages(100, start=25)
+
+        result = self.sync.sync_user('U1')
+
+        assert result['fetched'] == 50
+        assert result['complete'] is False
+        assert self.store.get_sync_state('U1')['last_message_id'] == '74'
+
+    def test_history_fails_without_local_copy(self):
+        """Тест ошибки, если upstream недоступен и локальной истории нет"""
+        self.umnico.available = False
+
+        result = self.sync.get_history('U1')
+
+        assert result['success'] is False
+        assert result['error'] == 'Ошибка получения диалога: 503'
+
+    def test_history_serves_stale_local_copy(self):
+        """Тест отдачи локальной копии с пометкой stale при сбое upstream"""
+        self.sync.sync_user('U1')
+        self.umnico.available = False
+
+        result = self.sync.get_history('U1', limit=5, refresh=True)
+
+        assert result['success'] is True
+        assert result['stale'] is True
+        assert [m['id'] for m in result['conversation']] == ['20', '21', '22', '23', '24']
+
+    def test_webhook_message_does_not_move_watermark(self):
+        """Тест сообщения из вебхука: сохраняется без сдвига отметки"""
+        self.sync.sync_user('U1')
+        self.sync.record_message('U1', {'id': '99', 'text': 'hi', 'created_at': '2024-05-02T00:00:00'})
+
+        assert self.store.get_sync_state('U1')['last_message_id'] == '24'
+        assert self.store.get_messages('U1', limit=1)[0]['id'] == '99'
+
+    def test_missing_dialog_by_status_code(self):
+        """Тест: диалог, которого нет в Umnico (404), - пустая история без ошибки"""
+        self.umnico.missing = True
+
+        result = self.sync.get_history('U1')
+
+        assert result['success'] is True
+        assert result['conversation'] == []
+        assert self.store.get_sync_state('U1') is not None
+
+    def test_umnico_webhook_updates_history(self):
+        """Тест: сообщение из вебхука Umnico видно в истории без refresh"""
+        handler = WebhookHandler('', conversation_sync=self.sync)
+        self.sync.get_history('U1')
+
+        handler.handle_umnico_webhook({
+            'userId': 'U1', 'sessionId': 'S1', 'messageId': '99',
+            'message': 'Нужен ремонт кухни', 'timestamp': '2024-05-02T00:00:00'
+        })
+        result = self.sync.get_history('U1', limit=2)
+
+        assert self.umnico.requests == [None]
+        assert [m['id'] for m in result['conversation']] == ['24', '99']
+        assert result['conversation'][-1]['text'] == 'Нужен ремонт кухни'
+        assert self.store.get_sync_state('U1')['last_message_id'] == '24'
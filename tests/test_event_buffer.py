@@ -0,0 +1,69 @@
+"""
+Тесты буфера аналитических событий (Блок C)
+"""
+
+import os
+
+from BLOCK_C_INTEGRATIONS.event_buffer import EventBuffer
+
+
+class TestEventBuffer:
+    """Тесты EventBuffer"""
+
+    def setup_method(self):
+        """Настройка перед каждым тестом"""
+        self.sent_batches = []
+        self.upstream_available = True
+
+    def _send(self, batch):
+        if not self.upstream_available:
+            return False
+        self.sent_batches.append(list(batch))
+        return True
+
+    def test_flush_in_batches(self):
+        """Тест отправки пакетами по batch_size"""
+        buffer = EventBuffer(self._send, batch_size=10)
+        for i in range(25):
+            buffer.append({'event': f'e{i}'})
+
+        assert buffer.flush() == 25
+        assert [len(batch) for batch in self.sent_batches] == [10, 10, 5]
+        assert buffer.pending() == 0
+
+    def test_spill_and_replay(self, tmp_path):
+        """Тест сохранения на диск и повторной доставки"""
+        spill_path = str(tmp_path / 'events.jsonl')
+        buffer = EventBuffer(self._send, batch_size=10, spill_path=spill_path)
+
+        self.upstream_available = False
+        for i in range(15):
+            buffer.append({'event': f'e{i}'})
+        assert buffer.flush() == 0
+        assert buffer.get_stats()['spilled'] == 15
+
+        self.upstream_available = True
+        buffer.append({'event': 'late'})
+        assert buffer.flush() == 16
+
+        delivered = [event['event'] for batch in self.sent_batches for event in batch]
+        assert delivered == [f'e{i}' for i in range(15)] + ['late']
+        assert os.path.getsize(spill_path) == 0
+
+    def test_requeue_without_spill_file(self):
+        """Тест возврата событий в очередь без spill-файла"""
+        buffer = EventBuffer(self._send, batch_size=10)
+
+        self.upstream_available = False
+        buffer.append({'event': 'e1'})
+        buffer.flush()
+
+        assert buffer.pending() == 1
+
+    def test_background_flush_on_close(self):
+        """Тест финальной доставки при остановке"""
+        buffer = EventBuffer(self._send, batch_size=100, flush_interval=60).start()
+        buffer.append({'event': 'e1'})
+        buffer.close()
+
+        assert self.sent_batches == [[{'event': 'e1'}]]
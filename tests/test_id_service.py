@@ -0,0 +1,129 @@
+"""
+Тесты идентификаторов и последовательностей номеров блока D
+"""
+
+import os
+import sys
+import threading
+
+from sqlalchemy import create_engine
+
+# Модули сервисов блока D импортируются как services.* из каталога block_d
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                'BLOCK_D_MONETIZATION', 'block_d', 'services'))
+
+import id_service  # noqa: E402
+from id_service import (  # noqa: E402
+    HiLoSequence, InMemoryBlockAllocator, SQLBlockAllocator, SQLiteBlockAllocator, ULID_ALPHABET, new_ulid
+)
+
+
+def allocate_concurrently(allocators, count=50, size=10):
+    """Блоки из нескольких потоков, по одному аллокатору (соединению) на поток"""
+    blocks = []
+    lock = threading.Lock()
+
+    def run(allocator):
+        for _ in range(count):
+            first = allocator.allocate('invoice', size)
+            with lock:
+                blocks.append(first)
+
+    threads = [threading.Thread(target=run, args=(allocator,)) for allocator in allocators]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return blocks
+
+
+class TestULID:
+    """Тесты ULID"""
+
+    def setup_method(self):
+        """Настройка перед каждым тестом"""
+        id_service._last_ulid = (0, 0)
+
+    def test_monotonic_within_millisecond(self):
+        """Тест возрастания id в одной миллисекунде"""
+        ids = [new_ulid(timestamp_ms=1717243200000) for _ in range(1000)]
+
+        assert ids == sorted(ids)
+        assert len(set(ids)) == 1000
+        assert all(len(value) == 26 and set(value) <= set(ULID_ALPHABET) for value in ids)
+        assert new_ulid(timestamp_ms=1717243200001) > ids[-1]
+
+    def test_clock_going_back(self):
+        """Тест: id не убывают при отставании часов"""
+        later = new_ulid(timestamp_ms=1717243300000)
+        earlier = new_ulid(timestamp_ms=1717243200000)
+
+        assert earlier > later
+
+    def test_random_overflow(self):
+        """Тест переполнения случайной части: время сдвигается на 1 мс"""
+        id_service._last_ulid = (1717243400000, (1 << 80) - 2)
+        last = new_ulid(timestamp_ms=1717243400000)
+        overflow = new_ulid(timestamp_ms=1717243400000)
+
+        assert overflow > last
+        assert id_service._last_ulid[0] == 1717243400001
+
+
+class TestHiLoSequence:
+    """Тесты последовательности номеров блоками"""
+
+    def test_block_rollover(self):
+        """Тест перехода к следующему блоку"""
+        allocator = InMemoryBlockAllocator()
+        first = HiLoSequence('invoice', allocator, block_size=3)
+        second = HiLoSequence('invoice', allocator, block_size=3)
+
+        assert first.next() == 1
+        assert second.next() == 4
+        assert [first.next() for _ in range(3)] == [2, 3, 7]
+        assert [second.next() for _ in range(3)] == [5, 6, 10]
+
+    def test_threads_unique(self):
+        """Тест уникальности номеров при выдаче из нескольких потоков"""
+        sequence = HiLoSequence('invoice', InMemoryBlockAllocator(), block_size=7)
+        numbers = []
+
+        def run():
+            numbers.extend(sequence.next() for _ in range(500))
+
+        threads = [threading.Thread(target=run) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert sorted(numbers) == list(range(1, 2001))
+
+
+class TestBlockAllocators:
+    """Тесты выдачи блоков через общую БД"""
+
+    def test_sqlite_unique_across_connections(self, tmp_path):
+        """Тест: каждый блок выдается одному соединению с файлом SQLite"""
+        path = str(tmp_path / 'ids' / 'sequences.db')
+        allocators = [SQLiteBlockAllocator(path) for _ in range(4)]
+        try:
+            blocks = allocate_concurrently(allocators)
+        finally:
+            for allocator in allocators:
+                allocator.close()
+
+        assert sorted(blocks) == list(range(1, 2001, 10))
+
+    def test_sql_unique_across_engines(self, tmp_path):
+        """Тест: каждый блок выдается одному engine (разные серверы)"""
+        url = f"sqlite:///{tmp_path / 'sequences.db'}"
+        engines = [create_engine(url, connect_args={'timeout': 30}) for _ in range(4)]
+        try:
+            blocks = allocate_concurrently([SQLBlockAllocator(engine, start=1000) for engine in engines])
+        finally:
+            for engine in engines:
+                engine.dispose()
+
+        assert sorted(blocks) == list(range(1000, 3000, 10))
@@ -0,0 +1,86 @@
+"""
+Тесты маршрутизатора намерений по ключевым словам (Блоки B и C)
+"""
+
+import random
+
+from BLOCK_B_BOT_AI.utils.intent_router import (
+    IntentRouter, BOT_USER_TYPE_KEYWORDS, BOT_USER_TYPE_ROUTER, WEBHOOK_USER_TYPE_KEYWORDS
+)
+from BLOCK_C_INTEGRATIONS.webhook_handlers import WebhookHandler
+
+
+def naive_scores(intents, message):
+    """Перебор: слово засчитывается, если с него начинается слово сообщения"""
+    message = message.lower()
+
+    def found(keyword):
+        start = message.find(keyword)
+        while start != -1:
+            if start == 0 or not (message[start - 1].isalnum() or message[start - 1] == '_'):
+                return True
+            start = message.find(keyword, start + 1)
+        return False
+
+    return {intent: float(sum(1 for keyword in keywords if found(keyword)))
+            for intent, keywords in intents.items()}
+
+
+class TestIntentRouter:
+    """Тесты IntentRouter"""
+
+    def setup_method(self):
+        """Настройка перед каждым тестом"""
+        rng = random.Random(7)
+        vocabulary = [keyword for keywords in WEBHOOK_USER_TYPE_KEYWORDS.values() for keyword in keywords] + [
+            'здравствуйте', 'баня', 'участок', 'Москва', 'ИП Иванов', 'Домострой', 'партнерство',
+            'типа', 'подрядчика', 'ремонта,', 'недорого'
+        ]
+        self.messages = [' '.join(rng.choice(vocabulary) for _ in range(rng.randint(1, 12)))
+                         for _ in range(500)]
+
+    def test_matches_word_start_scan(self):
+        """Тест совпадения с перебором по началам слов"""
+        for intents in (BOT_USER_TYPE_KEYWORDS, WEBHOOK_USER_TYPE_KEYWORDS):
+            router = IntentRouter(intents)
+            for message in self.messages:
+                assert router.score(message) == naive_scores(intents, message), message
+
+    def test_word_boundaries(self):
+        """Тест: ключевое слово только в начале слова, окончания не важны"""
+        router = IntentRouter({'partner': ['ип', 'партнер']})
+
+        assert router.match('Типа привет') == []
+        assert router.match('ИП Иванов, хотим стать партнером') == ['ип', 'партнер']
+
+    def test_bot_labels(self):
+        """Тест меток бота: больший счет побеждает, ничья - unknown"""
+        assert BOT_USER_TYPE_ROUTER.classify('хочу построить дом')['label'] == 'customer'
+        assert BOT_USER_TYPE_ROUTER.classify('хочу стать партнером')['label'] == 'partner'
+        assert BOT_USER_TYPE_ROUTER.classify('Я исполнитель')['label'] == 'partner'
+        assert BOT_USER_TYPE_ROUTER.classify('Типа привет')['label'] == 'unknown'
+        assert BOT_USER_TYPE_ROUTER.classify('добрый день') == {
+            'label': 'unknown', 'scores': {'partner': 0.0, 'customer': 0.0}, 'matched': []
+        }
+
+
+class TestWebhookUserType:
+    """Тесты определения типа пользователя в обработчике вебхуков"""
+
+    def setup_method(self):
+        """Настройка перед каждым тестом"""
+        self.handler = WebhookHandler('')
+
+    def test_detect_user_type(self):
+        """Тест: ключевые слова обоих типов - уточнение, даже при разном счете"""
+        assert self.handler._detect_user_type('Мы строительная компания') == 'potential_partner'
+        assert self.handler._detect_user_type('Хочу стать партнером') == 'potential_partner'
+        assert self.handler._detect_user_type('Нужна смета на коттедж') == 'customer'
+        assert self.handler._detect_user_type('компания ищет подрядчика на ремонт дома') == 'ambiguous'
+        assert self.handler._detect_user_type('Типа привет') == 'unknown'
+        assert self.handler._detect_user_type('Добрый день') == 'unknown'
+
+    def test_is_partner_message(self):
+        """Тест признака сообщения партнера"""
+        assert self.handler._is_partner_message('ООО Вектор, хотим сотрудничать')
+        assert not self.handler._is_partner_message('Сколько стоит баня?')
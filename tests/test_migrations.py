@@ -0,0 +1,64 @@
+"""
+Тесты цепочки миграций BLOCK_A_PARTNERS_DB на SQLite
+"""
+
+from datetime import datetime
+
+from alembic.script import ScriptDirectory
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.pool import StaticPool
+
+from tests.migration_helpers import downgrade, migration_config, upgrade
+
+
+class TestMigrations:
+    """Тесты upgrade/downgrade всех ревизий"""
+
+    def setup_method(self):
+        """Настройка перед каждым тестом"""
+        self.engine = create_engine('sqlite://', connect_args={'check_same_thread': False},
+                                    poolclass=StaticPool)
+
+    def test_single_head(self):
+        """Тест линейной цепочки ревизий"""
+        script = ScriptDirectory.from_config(migration_config())
+
+        assert script.get_heads() == ['004_revenue_aggregates']
+        assert script.get_revision('002_payment_indexes').down_revision == '001a_payments'
+
+    def test_upgrade_creates_payment_tables(self):
+        """Тест создания payments и subscriptions с индексами"""
+        with self.engine.connect() as conn:
+            upgrade(conn)
+            inspector = inspect(conn)
+
+            assert {'payments', 'subscriptions', 'revenue_daily_partner'} <= set(inspector.get_table_names())
+            assert {index['name'] for index in inspector.get_indexes('payments')} >= {
+                'ix_payments_partner_created', 'ix_payments_open', 'ix_payments_paid_at_partner'
+            }
+            assert {'subscription_code', 'renewal_payment_id', 'last_renewal_payment_id'} <= {
+                column['name'] for column in inspector.get_columns('subscriptions')
+            }
+            assert {(fk['referred_table'], tuple(fk['referred_columns']))
+                    for fk in inspector.get_foreign_keys('payments')} == {('partners', ('partner_id',))}
+
+    def test_partner_id_backfilled(self):
+        """Тест заполнения partners.partner_id из partner_code"""
+        with self.engine.connect() as conn:
+            upgrade(conn, '001_initial')
+            conn.execute(text(
+                "INSERT INTO partners (partner_code, company_name, inn, created_at, updated_at) "
+                "VALUES ('P1', 'ООО Тест', '7700000000', :now, :now)"
+            ), {'now': datetime(2024, 5, 1)})
+            conn.commit()
+            upgrade(conn)
+
+            assert conn.execute(text('SELECT partner_id FROM partners')).scalar() == 'P1'
+
+    def test_downgrade_to_base(self):
+        """Тест полного отката"""
+        with self.engine.connect() as conn:
+            upgrade(conn)
+            downgrade(conn, 'base')
+
+            assert inspect(conn).get_table_names() == ['alembic_version']
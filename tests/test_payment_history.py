@@ -0,0 +1,126 @@
+"""
+Тесты постраничной истории платежей и кэша завершенных платежей (Блок C)
+"""
+
+from unittest.mock import Mock
+
+from BLOCK_C_INTEGRATIONS.config import BlockCConfig
+from BLOCK_C_INTEGRATIONS.idempotency import IdempotencyStore
+from BLOCK_C_INTEGRATIONS.payment_gateway import PaymentGateway
+from BLOCK_C_INTEGRATIONS.payment_history import PaymentHistoryCache
+
+
+class FakeYooKassaList:
+    """Список платежей ЮKassa: от новых к старым, страницы по cursor"""
+
+    def __init__(self, payments):
+        self.payments = payments
+        self.requests = []
+
+    def get(self, url, params=None, timeout=None):
+        self.requests.append(dict(params))
+        items = [
+            payment for payment in sorted(self.payments, key=lambda p: p['created_at'], reverse=True)
+            if payment['metadata']['partner_code'] == params['metadata.partner_code']
+            and ('created_at.gte' not in params or payment['created_at'] >= params['created_at.gte'])
+            and ('created_at.gt' not in params or payment['created_at'] > params['created_at.gt'])
+            and ('created_at.lte' not in params or payment['created_at'] <= params['created_at.lte'])
+        ]
+        offset = int(params.get('cursor', 0))
+        page = items[offset:offset + params['limit']]
+
+        response = Mock(status_code=200)
+        response.json.return_value = {
+            'items': page,
+            'next_cursor': str(offset + len(page)) if offset + len(page) < len(items) else None
+        }
+        return response
+
+
+def make_payment(number, day, status='succeeded'):
+    return {
+        'id': f'pay_{number}',
+        'status': status,
+        'amount': {'value': '500000', 'currency': 'RUB'},
+        'description': 'Подписка',
+        'metadata': {'partner_code': 'P1'},
+        'created_at': f'2024-05-{day:02d}T10:00:00.000Z',
+        'paid': status == 'succeeded'
+    }
+
+
+class TestPaymentHistory:
+    """Тесты истории платежей"""
+
+    def setup_method(self):
+        """Настройка перед каждым тестом"""
+        self.cache = PaymentHistoryCache(':memory:')
+        self.gateway = PaymentGateway('yookassa', history_cache=self.cache, shop_id='shop',
+                                      secret_key='key', idempotency_store=IdempotencyStore(':memory:'))
+        self.api = FakeYooKassaList([make_payment(i, i) for i in range(1, 26)])
+        self.gateway.gateway.session.get = self.api.get
+
+    def test_follows_cursor(self, monkeypatch):
+        """Тест чтения всех страниц по next_cursor"""
+        monkeypatch.setitem(BlockCConfig.PAYMENT_CONFIG, 'history_page_size', 10)
+        result = self.gateway.get_payment_history('P1', '2024-05-01', '2024-05-31')
+
+        assert result['success'] is True
+        assert result['count'] == 25
+        assert [p['id'] for p in result['payments']][:2] == ['pay_25', 'pay_24']
+        assert result['payments'][0]['amount'] == 5000.0
+        assert [r.get('cursor') for r in self.api.requests] == [None, '10', '20']
+
+    def test_lazy_paging(self):
+        """Тест ленивого запроса страниц"""
+        self.gateway.history_cache = None
+        history = self.gateway.gateway.iter_payments({'partner_code': 'P1'}, page_size=10)
+
+        first = next(history)
+        assert first['id'] == 'pay_25'
+        assert len(self.api.requests) == 1
+
+    def test_repeat_view_fetches_only_new(self):
+        """Тест повторного просмотра: запрашиваются только платежи новее отметки"""
+        first = self.gateway.get_payment_history('P1', '2024-05-01', '2024-05-31')
+        assert first['count'] == 25
+
+        self.api.payments.append(make_payment(26, 26))
+        self.api.requests.clear()
+        second = self.gateway.get_payment_history('P1', '2024-05-01', '2024-05-31')
+
+        assert second['count'] == 26
+        assert [p['id'] for p in second['payments']][:2] == ['pay_26', 'pay_25']
+        assert self.api.requests[0]['created_at.gt'] == '2024-05-25T10:00:00.000Z'
+        assert len(self.api.requests) == 1
+
+    def test_pending_payment_refetched(self):
+        """Тест незавершенного платежа: отметка не переходит через него"""
+        self.api.payments[19] = make_payment(20, 20, status='pending')
+        self.gateway.get_payment_history('P1', '2024-05-01', '2024-05-31')
+
+        coverage = self.cache.get_coverage('{"partner_code": "P1"}')
+        assert coverage['watermark'] == '2024-05-19T10:00:00.000Z'
+
+        self.api.payments[19] = make_payment(20, 20)
+        result = self.gateway.get_payment_history('P1', '2024-05-01', '2024-05-31')
+        statuses = {p['id']: p['status'] for p in result['payments']}
+
+        assert result['count'] == 25
+        assert statuses['pay_20'] == 'succeeded'
+
+    def test_partial_read_keeps_watermark(self):
+        """Тест прерванного чтения: отрезок кэша не обновляется"""
+        history = self.gateway.iter_payment_history('P1')
+        next(history)
+        history.close()
+
+        assert self.cache.get_coverage('{"partner_code": "P1"}') is None
+
+    def test_http_error(self):
+        """Тест ошибки платежной системы"""
+        self.gateway.gateway.session.get = Mock(return_value=Mock(status_code=500))
+        result = self.gateway.get_payment_history('P1', '2024-05-01', '2024-05-31')
+
+        assert result['success'] is False
+        assert '500' in result['error']
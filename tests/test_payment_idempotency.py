@@ -0,0 +1,149 @@
+"""
+Тесты идемпотентности платежей ЮKassa (Блок C)
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import Mock
+
+from BLOCK_C_INTEGRATIONS.config import BlockCConfig
+from BLOCK_C_INTEGRATIONS.idempotency import IdempotencyStore, make_idempotency_key
+from BLOCK_C_INTEGRATIONS.payment_gateway import PaymentGateway, YooKassaGateway
+
+
+class FakeYooKassa:
+    """ЮKassa: один платеж на ключ идемпотентности, первые ответы - 503"""
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.payments = {}
+        self.statuses = {}
+        self.requests = []
+        self._lock = threading.Lock()
+
+    def post(self, url, json=None, headers=None, timeout=None):
+        key = headers['Idempotence-Key']
+        with self._lock:
+            self.requests.append(key)
+            if self.failures:
+                self.failures -= 1
+                return Mock(status_code=503, text='unavailable')
+            payment_id = self.payments.setdefault(key, f'yk_{len(self.payments) + 1}')
+
+        response = Mock(status_code=200)
+        response.json.return_value = {
+            'id': payment_id, 'status': 'pending',
+            'confirmation': {'confirmation_url': f'https://pay/{payment_id}'}
+        }
+        return response
+
+    def get(self, url, timeout=None):
+        payment_id = url.rsplit('/', 1)[-1]
+        response = Mock(status_code=200)
+        response.json.return_value = {
+            'id': payment_id, 'status': self.statuses.get(payment_id, 'pending'),
+            'amount': {'value': '100000', 'currency': 'RUB'}
+        }
+        return response
+
+
+class TestPaymentIdempotency:
+    """Тесты ключей идемпотентности и повторов"""
+
+    def setup_method(self):
+        """Настройка перед каждым тестом"""
+        self.store = IdempotencyStore(':memory:')
+        self.gateway = PaymentGateway('yookassa', shop_id='shop', secret_key='key',
+                                      idempotency_store=self.store)
+        self.api = FakeYooKassa()
+        self.gateway.gateway.session.post = self.api.post
+        self.gateway.gateway.session.get = self.api.get
+
+    def _create(self, invoice_number='INV-1'):
+        return self.gateway.create_payment(
+            1000, 'RUB', 'Подписка', {'invoice_number': invoice_number}, 'https://return'
+        )
+
+    def test_retry_reuses_key(self, monkeypatch):
+        """Тест повтора после 5xx с тем же ключом"""
+        monkeypatch.setitem(BlockCConfig.PAYMENT_CONFIG, 'retry_backoff', 0)
+        self.api.failures = 2
+
+        result = self._create()
+
+        assert result['success']
+        assert len(set(self.api.requests)) == 1
+        assert len(self.api.requests) == 3
+
+    def test_repeated_call_served_from_store(self):
+        """Тест повторного вызова для того же счета без запроса к ЮKassa"""
+        first = self._create()
+        second = self._create()
+
+        assert second['idempotent_replay']
+        assert second['confirmation_url'] == first['confirmation_url']
+        assert len(self.api.requests) == 1
+
+    def test_concurrent_workers_single_charge(self):
+        """Тест одновременного создания платежа из многих потоков"""
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            results = list(executor.map(lambda _: self._create('INV-42'), range(50)))
+
+        assert all(result['success'] for result in results)
+        assert len(self.api.payments) == 1
+        assert len({result['confirmation_url'] for result in results}) == 1
+
+    def test_keys_derived_from_business_ids(self):
+        """Тест детерминированных ключей"""
+        assert make_idempotency_key('refund', 'pay_1', 'R1') == make_idempotency_key('refund', 'pay_1', 'R1')
+        assert make_idempotency_key('refund', 'pay_1', 'R1') != make_idempotency_key('refund', 'pay_1', 'R2')
+        assert 'Idempotence-Key' not in self.gateway.gateway.session.headers
+
+    def test_canceled_payment_not_replayed(self):
+        """Тест: для отмененного (истекшего) платежа создается новый"""
+        first = self._create()
+        self.api.statuses['yk_1'] = 'canceled'
+
+        second = self._create()
+        third = self._create()
+
+        assert second['confirmation_url'] != first['confirmation_url']
+        assert 'idempotent_replay' not in second
+        assert third['idempotent_replay']
+        assert third['confirmation_url'] == second['confirmation_url']
+        assert len(self.api.payments) == 2
+
+    def test_expired_key_not_replayed(self):
+        """Тест: ключ старше срока хранения не повторяет сохраненный ответ"""
+        self._create()
+        self.store.key_ttl = 60
+        self.store._conn.execute('UPDATE idempotency_keys SET created_at = ?', (time.time() - 120,))
+
+        result = self._create()
+
+        assert 'idempotent_replay' not in result
+        assert len(self.api.requests) == 2
+
+    def test_partial_refunds_of_same_amount(self):
+        """Тест двух частичных возвратов одной суммы"""
+        first = self.gateway.refund_payment('yk_1', 100)
+        second = self.gateway.refund_payment('yk_1', 100)
+
+        assert first['refund_id'] != second['refund_id']
+        assert 'idempotent_replay' not in second
+
+    def test_refund_replayed_by_refund_id(self):
+        """Тест повтора возврата с тем же ID возврата"""
+        first = self.gateway.refund_payment('yk_1', 100, refund_id='R1')
+        second = self.gateway.refund_payment('yk_1', 100, refund_id='R1')
+
+        assert second['idempotent_replay']
+        assert second['refund_id'] == first['refund_id']
+        assert len(self.api.requests) == 1
+
+    def test_store_opened_lazily(self):
+        """Тест: конструктор шлюза не открывает журнал ключей"""
+        gateway = YooKassaGateway('shop', 'key')
+
+        assert gateway._idempotency_store is None
@@ -0,0 +1,146 @@
+"""
+Тесты помесячных партиций payments
+"""
+
+import json
+from contextlib import contextmanager
+from datetime import date, datetime
+from unittest.mock import Mock
+
+import pytest
+from sqlalchemy import create_engine
+
+from backend.services.payment_partitions import (
+    PaymentPartitions, add_months, main, parse_bound, partition_ddl, partition_name
+)
+
+
+class FakePostgres:
+    """Движок PostgreSQL: отвечает на запросы к каталогу и записывает остальные"""
+
+    def __init__(self, partitions, stray_rows=0):
+        self.dialect = Mock()
+        self.dialect.name = 'postgresql'
+        self.partitions = partitions
+        self.stray_rows = stray_rows
+        self.statements = []
+
+    def execute(self, statement, params=None):
+        sql = str(statement)
+        result = Mock()
+        if 'pg_partitioned_table' in sql:
+            result.first.return_value = (1,)
+        elif 'pg_inherits' in sql:
+            result.all.return_value = self.partitions
+        elif sql.startswith('SELECT count(*)'):
+            result.scalar.return_value = self.stray_rows
+        else:
+            self.statements.append(sql)
+        return result
+
+    @contextmanager
+    def connect(self):
+        yield self
+
+    begin = connect
+
+
+def bound(start, end):
+    return f"FOR VALUES FROM ('{start} 00:00:00') TO ('{end} 00:00:00')"
+
+
+class TestPartitionNames:
+    """Тесты имен, границ и DDL партиций"""
+
+    def test_month_arithmetic_and_names(self):
+        """Тест перехода через год и имен партиций"""
+        assert add_months(date(2024, 11, 1), 3) == date(2025, 2, 1)
+        assert add_months(date(2024, 1, 1), -1) == date(2023, 12, 1)
+        assert partition_name('payments', date(2024, 3, 1)) == 'payments_y2024m03'
+        assert partition_ddl('payments', date(2024, 12, 1)) == (
+            'CREATE TABLE IF NOT EXISTS payments_y2024m12 PARTITION OF payments '
+            "FOR VALUES FROM ('2024-12-01') TO ('2025-01-01')"
+        )
+
+    def test_parse_bound(self):
+        """Тест разбора pg_get_expr(relpartbound)"""
+        assert parse_bound(bound('2024-01-01', '2024-02-01')) == {
+            'start': date(2024, 1, 1), 'end': date(2024, 2, 1)
+        }
+        assert parse_bound('DEFAULT') is None
+
+
+class TestPaymentPartitions:
+    """Тесты создания и архивирования партиций"""
+
+    def setup_method(self):
+        """Настройка перед каждым тестом"""
+        self.now = datetime(2024, 6, 15)
+        self.engine = FakePostgres([
+            ('payments_y2021m05', bound('2021-05-01', '2021-06-01')),
+            ('payments_y2021m06', bound('2021-06-01', '2021-07-01')),
+            ('payments_y2024m06', bound('2024-06-01', '2024-07-01')),
+            ('payments_default', 'DEFAULT'),
+        ])
+        self.partitions = PaymentPartitions(self.engine, clock=lambda: self.now)
+
+    def test_partitions_sorted_default_last(self):
+        """Тест списка партиций по возрастанию месяца"""
+        names = [item['name'] for item in self.partitions.partitions()]
+        assert names == ['payments_y2021m05', 'payments_y2021m06', 'payments_y2024m06', 'payments_default']
+
+    def test_ensure_creates_missing_months(self):
+        """Тест создания партиций на месяцы вперед"""
+        created = self.partitions.ensure(ahead=2)
+
+        assert created == ['payments_y2024m07', 'payments_y2024m08']
+        assert self.engine.statements == [partition_ddl('payments', date(2024, 7, 1)),
+                                          partition_ddl('payments', date(2024, 8, 1))]
+
+    def test_ensure_moves_rows_from_default(self):
+        """Тест переноса строк месяца из партиции по умолчанию"""
+        self.engine.stray_rows = 5
+
+        assert self.partitions.ensure(ahead=1) == ['payments_y2024m07']
+        assert self.engine.statements[0].startswith('CREATE TABLE payments_y2024m07 (LIKE payments')
+        assert 'DELETE FROM payments_default' in self.engine.statements[1]
+        assert self.engine.statements[2] == (
+            "ALTER TABLE payments ATTACH PARTITION payments_y2024m07 FOR VALUES FROM ('2024-07-01') TO ('2024-08-01')"
+        )
+
+    def test_archive_detaches_expired_partitions(self):
+        """Тест отсоединения партиций старше срока хранения"""
+        detached = self.partitions.archive(keep_months=36)
+
+        assert detached == ['payments_y2021m05']
+        assert self.engine.statements == [
+            'ALTER TABLE payments DETACH PARTITION payments_y2021m05',
+            'CREATE SCHEMA IF NOT EXISTS archive',
+            'ALTER TABLE payments_y2021m05 SET SCHEMA archive'
+        ]
+
+    def test_archive_drop(self):
+        """Тест удаления отсоединенных партиций"""
+        assert self.partitions.archive(keep_months=35, drop=True) == ['payments_y2021m05', 'payments_y2021m06']
+        assert self.engine.statements[-1] == 'DROP TABLE payments_y2021m06'
+
+    def test_archive_requires_retention(self):
+        """Тест запрета архивации текущего месяца"""
+        with pytest.raises(ValueError):
+            self.partitions.archive(keep_months=0)
+
+
+class TestSqlite:
+    """Тесты обычной таблицы в SQLite"""
+
+    def test_noop_without_partitioning(self, capsys):
+        """Тест: в SQLite партиции не создаются и не отсоединяются"""
+        partitions = PaymentPartitions(create_engine('sqlite://'))
+
+        assert partitions.is_partitioned() is False
+        assert partitions.partitions() == []
+        assert partitions.ensure() == []
+        assert partitions.archive() == []
+
+        main(['--database-url', 'sqlite://', 'ensure'])
+        assert json.loads(capsys.readouterr().out) == {'created': []}
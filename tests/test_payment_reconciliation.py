@@ -0,0 +1,164 @@
+"""
+Тесты сверки статусов платежей
+"""
+
+import threading
+from datetime import datetime
+
+from sqlalchemy import (
+    create_engine, MetaData, Table, Column, Integer, String, Float, DateTime, select
+)
+from sqlalchemy.pool import StaticPool
+
+from backend.services.payment_reconciliation import PaymentReconciler
+
+
+class MockProvider:
+    """Локальная платежная система: статус по номеру платежа"""
+
+    def __init__(self, statuses):
+        self.statuses = statuses
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def verify_payment(self, payment_id):
+        with self._lock:
+            self.calls += 1
+        if payment_id not in self.statuses:
+            return {'success': False, 'error': 'Ошибка проверки платежа: 404'}
+        status, amount = self.statuses[payment_id]
+        return {'success': True, 'payment_id': payment_id, 'status': status, 'amount': amount,
+                'paid_at': '2024-05-01T10:00:00.000Z' if status == 'succeeded' else None}
+
+
+class TestPaymentReconciler:
+    """Тесты PaymentReconciler"""
+
+    def setup_method(self):
+        """Настройка перед каждым тестом"""
+        self.engine = create_engine('sqlite://', connect_args={'check_same_thread': False},
+                                    poolclass=StaticPool)
+        metadata = MetaData()
+        self.payments = Table(
+            'payments', metadata,
+            Column('id', Integer, primary_key=True),
+            Column('partner_id', Integer),
+            Column('tariff_plan', String(20)),
+            Column('amount', Float),
+            Column('status', String(20)),
+            Column('payment_system', String(30)),
+            Column('payment_system_id', String(100)),
+            Column('created_at', DateTime),
+            Column('updated_at', DateTime),
+            Column('paid_at', DateTime)
+        )
+        metadata.create_all(self.engine)
+
+    def _insert(self, rows):
+        with self.engine.begin() as conn:
+            conn.execute(self.payments.insert(), rows)
+
+    def _statuses(self):
+        with self.engine.connect() as conn:
+            return {row.id: row for row in conn.execute(select(self.payments))}
+
+    def test_bulk_update_and_drift_report(self):
+        """Тест обновления статусов и отчета о расхождениях"""
+        self._insert([
+            {'id': 1, 'amount': 5000, 'status': 'pending', 'payment_system': 'yookassa', 'payment_system_id': 'yk_1'},
+            {'id': 2, 'amount': 5000, 'status': 'pending', 'payment_system': 'yookassa', 'payment_system_id': 'yk_2'},
+            {'id': 3, 'amount': 5000, 'status': 'processing', 'payment_system': 'yookassa', 'payment_system_id': 'yk_3'},
+            {'id': 4, 'amount': 5000, 'status': 'pending', 'payment_system': 'yookassa', 'payment_system_id': 'yk_404'},
+            {'id': 5, 'amount': 5000, 'status': 'completed', 'payment_system': 'yookassa', 'payment_system_id': 'yk_5'},
+            {'id': 6, 'amount': 5000, 'status': 'pending', 'payment_system': 'sberbank', 'payment_system_id': 'sb_6'},
+        ])
+        provider = MockProvider({
+            'yk_1': ('succeeded', 5000), 'yk_2': ('pending', 5000),
+            'yk_3': ('canceled', 4000), 'yk_5': ('succeeded', 5000)
+        })
+
+        reconciler = PaymentReconciler({'yookassa': provider}, self.engine, self.payments, batch_size=2)
+        report = reconciler.run()
+
+        assert report['checked'] == 5
+        assert report['updated'] == 2
+        assert report['transitions'] == {'pending->completed': 1, 'processing->failed': 1}
+        assert report['failed_ids'] == [4]
+        assert report['skipped'] == 1
+        assert report['amount_mismatch'] == [{'id': 3, 'local': 5000, 'provider': 4000}]
+
+        rows = self._statuses()
+        assert rows[1].status == 'completed'
+        assert rows[1].paid_at == datetime(2024, 5, 1, 10, 0)
+        assert rows[3].status == 'failed'
+
+    def test_large_backlog(self):
+        """Тест сверки 20 000 платежей пачками"""
+        count = 20000
+        self._insert([
+            {'id': i, 'amount': 100, 'status': 'pending', 'payment_system': 'yookassa',
+             'payment_system_id': f'yk_{i}'}
+            for i in range(1, count + 1)
+        ])
+        provider = MockProvider({f'yk_{i}': ('succeeded', 100) for i in range(1, count + 1)})
+
+        reconciler = PaymentReconciler({'yookassa': provider}, self.engine, self.payments,
+                                       batch_size=1000, rate=1_000_000)
+        report = reconciler.run()
+
+        assert report['updated'] == count
+        assert provider.calls == count
+        assert all(row.status == 'completed' for row in self._statuses().values())
+
+    def test_concurrent_completion_not_recorded_twice(self):
+        """Тест: платеж, завершенный вебхуком во время сверки, не попадает в доходы повторно"""
+        self._insert([
+            {'id': 1, 'amount': 5000, 'status': 'pending', 'payment_system': 'yookassa', 'payment_system_id': 'yk_1'},
+            {'id': 2, 'amount': 3000, 'status': 'pending', 'payment_system': 'yookassa', 'payment_system_id': 'yk_2'},
+        ])
+        provider = MockProvider({'yk_1': ('succeeded', 5000), 'yk_2': ('succeeded', 3000)})
+        verify = provider.verify_payment
+
+        def verify_after_webhook(payment_id):
+            if payment_id == 'yk_1':
+                with self.engine.begin() as conn:
+                    conn.execute(self.payments.update().where(self.payments.c.id == 1)
+                                 .values(status='completed'))
+            return verify(payment_id)
+
+        provider.verify_payment = verify_after_webhook
+        aggregates = RecordingAggregates()
+
+        reconciler = PaymentReconciler({'yookassa': provider}, self.engine, self.payments,
+                                       max_workers=1, aggregates=aggregates)
+        report = reconciler.run()
+
+        assert report['updated'] == 1
+        assert report['conflicts'] == 1
+        assert [payment['amount'] for payment in aggregates.payments] == [3000]
+
+    def test_late_payment_recorded(self):
+        """Тест: платеж, оплаченный через полгода после создания, записывается"""
+        self._insert([
+            {'id': 1, 'amount': 5000, 'status': 'pending', 'payment_system': 'yookassa', 'payment_system_id': 'yk_1',
+             'created_at': datetime(2023, 11, 1)},
+        ])
+        provider = MockProvider({'yk_1': ('succeeded', 5000)})
+        aggregates = RecordingAggregates()
+
+        report = PaymentReconciler({'yookassa': provider}, self.engine, self.payments,
+                                   aggregates=aggregates).run()
+
+        assert report['updated'] == 1
+        assert self._statuses()[1].status == 'completed'
+        assert aggregates.payments[0]['paid_at'] == datetime(2024, 5, 1, 10, 0)
+
+
+class RecordingAggregates:
+    """Агрегаты доходов: запоминают записанные платежи"""
+
+    def __init__(self):
+        self.payments = []
+
+    def record_payments(self, payments):
+        self.payments.extend(payments)
@@ -348,6 +348,21 @@ class TestPaymentRoutes:
         assert 'error' in data
         assert 'Отсутствует обязательное поле' in data['error']
 
+    def test_create_invoice_invalid_amount(self, client):
+        """Тест нечисловой суммы счета"""
+        test_data = {
+            'partner_id': 'TEST001',
+            'amount': 'пять тысяч',
+            'tariff_plan': 'professional'
+        }
+
+        response = client.post('/api/v1/payments/create-invoice',
+                             json=test_data)
+
+        assert response.status_code == 400
+        data = json.loads(response.data)
+        assert data['error'] == 'Некорректная сумма'
+
 
 class TestIntegration:
     """Интеграционные тесты"""
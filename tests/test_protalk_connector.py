@@ -0,0 +1,195 @@
+"""
+Тесты отправки карточек и рассылки Protalk (Блок C)
+"""
+
+import re
+
+from BLOCK_C_INTEGRATIONS.protalk_connector import ProtalkConnector
+from BLOCK_C_INTEGRATIONS.rate_limiter import KeyedRateLimiter, TokenBucket
+
+
+class FakeClock:
+    """Часы, которые двигает только sleep"""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class FakeResponse:
+    def __init__(self, status_code, body=None, headers=None):
+        self.status_code = status_code
+        self.body = body or {}
+        self.headers = headers or {}
+        self.text = str(self.body)
+
+    def json(self):
+        return self.body
+
+
+class FakeSession:
+    """Ответы Protalk по очереди; после очереди - 200"""
+
+    def __init__(self, responses=()):
+        self.responses = list(responses)
+        self.sent = []
+
+    def post(self, url, json=None, timeout=None):
+        self.sent.append(json)
+        return self.responses.pop(0) if self.responses else FakeResponse(200, {'message_id': len(self.sent)})
+
+
+def partner(number):
+    return {
+        'company_name': f'ООО Партнер {number}',
+        'specializations': ['Кровля', 'Фасады'],
+        'rating': 4.8,
+        'completed_projects': 120,
+        'regions': ['Москва'],
+        'phone': '+7 900 000-00-00',
+        'email': f'p{number}@example.com'
+    }
+
+
+def tags_balanced(text):
+    """Все теги закрыты в правильном порядке, ни один тег не разрезан"""
+    stack = []
+    for closing, name in re.findall(r'<(/?)(\w+)[^>]*>', text):
+        if closing:
+            if not stack or stack.pop() != name:
+                return False
+        else:
+            stack.append(name)
+    return not stack and text.count('<') == text.count('>')
+
+
+class TestTokenBucket:
+    """Тесты ограничителя частоты"""
+
+    def test_pacing(self):
+        """Тест: после пачки capacity токенов - rate в секунду"""
+        clock = FakeClock()
+        bucket = TokenBucket(rate=2, capacity=3, clock=clock, sleep=clock.sleep)
+
+        times = []
+        for _ in range(7):
+            bucket.acquire()
+            times.append(clock.now)
+
+        assert times == [0.0, 0.0, 0.0, 0.5, 1.0, 1.5, 2.0]
+
+    def test_try_acquire_wait(self):
+        """Тест времени ожидания без блокировки"""
+        clock = FakeClock()
+        bucket = TokenBucket(rate=1, clock=clock, sleep=clock.sleep)
+
+        assert bucket.try_acquire() == 0
+        assert bucket.try_acquire() == 1.0
+        clock.now = 0.25
+        assert bucket.try_acquire() == 0.75
+
+    def test_keyed_buckets_independent(self):
+        """Тест: чаты ограничиваются независимо, старые ключи вытесняются"""
+        clock = FakeClock()
+        limiter = KeyedRateLimiter(rate=1, max_keys=2, clock=clock, sleep=clock.sleep)
+
+        limiter.acquire('chat-1')
+        limiter.acquire('chat-2')
+        assert clock.now == 0
+        limiter.acquire('chat-1')
+        assert clock.now == 1.0
+
+        limiter.acquire('chat-3')
+        assert len(limiter._buckets) == 2
+        assert 'chat-1' in limiter._buckets and 'chat-2' not in limiter._buckets
+
+
+class TestProtalkSending:
+    """Тесты отправки карточек и рассылки"""
+
+    def setup_method(self):
+        """Настройка перед каждым тестом"""
+        self.clock = FakeClock()
+        self.connector = ProtalkConnector('test-key')
+        self.connector.session = FakeSession()
+        self.connector.sleep = self.clock.sleep
+        self.connector.chat_limiter = KeyedRateLimiter(1, clock=self.clock, sleep=self.clock.sleep)
+        self.connector.broadcast_limiter = TokenBucket(30, clock=self.clock, sleep=self.clock.sleep)
+
+    def test_cards_packed_into_one_message(self):
+        """Тест: пять карточек - одно сообщение с клавиатурой"""
+        result = self.connector.send_partner_cards('chat-1', [partner(i) for i in range(5)])
+
+        assert result['success']
+        assert result['messages_sent'] == 1
+        assert result['partners_shown'] == 5
+        sent = self.connector.session.sent
+        assert len(sent) == 1
+        assert sent[0]['text'].count('Партнер #') == 5
+        assert 'inline_keyboard' in sent[0]['reply_markup']
+
+    def test_cards_split_by_message_limit(self):
+        """Тест: сообщения не длиннее лимита, отправка темпом чата"""
+        self.connector.config = dict(self.connector.config, max_message_length=700)
+
+        result = self.connector.send_partner_cards('chat-1', [partner(i) for i in range(5)])
+
+        sent = self.connector.session.sent
+        assert result['messages_sent'] == len(sent) > 1
+        assert all(len(payload['text']) <= 700 for payload in sent)
+        assert sum(payload['text'].count('Партнер #') for payload in sent) == 5
+        assert self.clock.now == len(sent) - 1
+
+    def test_long_card_truncated_on_tag_boundary(self):
+        """Тест: длинная карточка обрезается без разрыва тегов"""
+        card = '<b>Партнер #1</b>\n' + ' '.join(f'<i>слово{i}</i> &amp;' for i in range(200))
+
+        for max_length in range(20, 400, 7):
+            packed = self.connector._truncate_html(card, max_length)
+            assert len(packed) <= max_length
+            assert tags_balanced(packed)
+            assert not re.search(r'&\w*$', packed)
+
+        assert self.connector._truncate_html('<b>Название</b> компании', 12) == '<b>Назва</b>'
+
+    def test_broadcast_retries_after_429(self):
+        """Тест: ответ 429 повторяется через retry_after"""
+        self.connector.session = FakeSession([
+            FakeResponse(429, {'parameters': {'retry_after': 7}}),
+        ])
+
+        result = self.connector.broadcast_message(['chat-1'], 'Новая заявка', max_workers=1)
+
+        assert result['success']
+        assert result['sent'] == 1
+        assert 7 in self.clock.sleeps
+        assert len(self.connector.session.sent) == 2
+
+    def test_broadcast_gives_up_after_retries(self):
+        """Тест: после max_send_retries ответов 429 чат попадает в failed"""
+        self.connector.session = FakeSession([
+            FakeResponse(429, headers={'Retry-After': '2'}) for _ in range(3)
+        ])
+
+        result = self.connector.broadcast_message(['chat-1'], 'Новая заявка', max_workers=1)
+
+        assert not result['success']
+        assert result['failed'] == [{'chat_id': 'chat-1', 'error': 'Ошибка отправки сообщения: 429'}]
+        assert self.clock.sleeps == [2, 2]
+
+    def test_broadcast_other_errors_not_retried(self):
+        """Тест: ошибки, кроме 429, не повторяются"""
+        self.connector.session = FakeSession([FakeResponse(500)])
+
+        result = self.connector.broadcast_message(['chat-1', 'chat-2'], 'Новая заявка', max_workers=1)
+
+        assert result['sent'] == 1
+        assert [failure['chat_id'] for failure in result['failed']] == ['chat-1']
+        assert len(self.connector.session.sent) == 2
@@ -0,0 +1,119 @@
+"""
+Регрессионные тесты планов запросов: горячие запросы к payments и
+subscriptions должны использовать индексы, а не полный просмотр таблицы
+"""
+
+import random
+import re
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, event, MetaData, Table, select, text
+from sqlalchemy.pool import StaticPool
+
+from backend.services.payment_reconciliation import PaymentReconciler, OPEN_STATUSES
+from backend.services.top_partners import top_partners_query
+from tests.migration_helpers import upgrade
+
+# "SCAN payments" без "USING ... INDEX" - последовательный просмотр
+FULL_SCAN = re.compile(r'^SCAN (TABLE )?(payments|subscriptions)\b(?!.*USING)')
+
+class TestQueryPlans:
+    """Тесты EXPLAIN QUERY PLAN для индексов payments и subscriptions"""
+
+    def setup_method(self):
+        """Настройка перед каждым тестом"""
+        self.engine = create_engine('sqlite://', connect_args={'check_same_thread': False},
+                                    poolclass=StaticPool)
+        with self.engine.connect() as conn:
+            upgrade(conn)
+        metadata = MetaData()
+        self.payments = Table('payments', metadata, autoload_with=self.engine)
+        self.subscriptions = Table('subscriptions', metadata, autoload_with=self.engine)
+
+        now = datetime(2024, 6, 1)
+        rng = random.Random(42)
+        statuses = ['completed'] * 95 + ['pending'] * 3 + ['processing', 'failed']
+        with self.engine.begin() as conn:
+            conn.execute(self.payments.insert(), [
+                {'payment_number': f'INV-{index}', 'partner_id': f'P{index % 500}', 'amount': 5000,
+                 'status': rng.choice(statuses), 'created_at': now - timedelta(hours=index),
+                 'paid_at': now - timedelta(hours=index)}
+                for index in range(5000)
+            ])
+            conn.execute(self.subscriptions.insert(), [
+                {'partner_id': f'P{index % 500}', 'tariff_plan': 'professional', 'price': 5000,
+                 'status': rng.choice(['active', 'expired', 'cancelled']),
+                 'starts_at': now - timedelta(days=30), 'expires_at': now + timedelta(days=index % 60)}
+                for index in range(2000)
+            ])
+            conn.execute(text('ANALYZE'))
+
+    def _plan(self, query) -> list:
+        sql = str(query.compile(self.engine, compile_kwargs={'literal_binds': True}))
+        with self.engine.connect() as conn:
+            return [row[-1] for row in conn.execute(text(f'EXPLAIN QUERY PLAN {sql}'))]
+
+    def _executed_plan(self, run) -> list:
+        """План запроса в том виде, в каком его выполняет код (с параметрами)"""
+        executed = []
+
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            executed.append((statement, parameters))
+
+        event.listen(self.engine, 'before_cursor_execute', capture)
+        try:
+            run()
+        finally:
+            event.remove(self.engine, 'before_cursor_execute', capture)
+
+        statement, parameters = executed[-1]
+        with self.engine.connect() as conn:
+            return [row[-1] for row in conn.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters)]
+
+    def _assert_plan(self, plan: list, index: str, ordered: bool = False):
+        assert not [line for line in plan if FULL_SCAN.match(line)], plan
+        assert any(index in line for line in plan), plan
+        if ordered:
+            assert not any('TEMP B-TREE' in line for line in plan), plan
+
+    def _assert_uses(self, query, index: str, ordered: bool = False):
+        self._assert_plan(self._plan(query), index, ordered)
+
+    def test_partner_payment_history(self):
+        """Тест истории платежей партнера (новые первыми)"""
+        columns = self.payments.c
+        query = select(self.payments).where(columns.partner_id == 'P1') \
+            .order_by(columns.created_at.desc()).limit(20)
+        self._assert_uses(query, 'ix_payments_partner_created', ordered=True)
+
+    def test_reconciliation_batch(self):
+        """Тест пачки сверки: частичный индекс по незавершенным платежам"""
+        reconciler = PaymentReconciler({}, self.engine, self.payments)
+        plan = self._executed_plan(lambda: reconciler._fetch_batch(list(OPEN_STATUSES), 0, 1000))
+        self._assert_plan(plan, 'ix_payments_open', ordered=True)
+
+    def test_top_partners_range(self):
+        """Тест топа партнеров за период"""
+        end = datetime(2024, 6, 1)
+        query = top_partners_query(self.payments, end - timedelta(days=7), end, 10)
+        self._assert_uses(query, 'ix_payments_paid_at_partner')
+
+    def test_active_subscription_of_partner(self):
+        """Тест активной подписки партнера"""
+        columns = self.subscriptions.c
+        query = select(self.subscriptions).where(columns.partner_id == 'P1', columns.status == 'active')
+        self._assert_uses(query, 'ix_subscriptions_partner_status')
+
+    def test_expiring_subscriptions(self):
+        """Тест истекающих подписок"""
+        columns = self.subscriptions.c
+        now = datetime(2024, 6, 1)
+        query = select(self.subscriptions).where(
+            columns.status == 'active', columns.expires_at >= now, columns.expires_at < now + timedelta(days=7)
+        ).order_by(columns.expires_at)
+        self._assert_uses(query, 'ix_subscriptions_status_expires', ordered=True)
+
+    def test_detects_full_scan(self):
+        """Тест срабатывания проверки на запросе без индекса"""
+        query = select(self.payments).where(self.payments.c.description == 'x')
+        assert any(FULL_SCAN.match(line) for line in self._plan(query))
@@ -0,0 +1,125 @@
+"""
+Тесты кэша подборок партнеров (Блок C)
+"""
+
+from unittest.mock import Mock
+
+from BLOCK_C_INTEGRATIONS.recommendation_cache import RecommendationCache
+from BLOCK_C_INTEGRATIONS.protalk_connector import ProtalkConnector
+
+
+class FakeRedis:
+    """Минимальный Redis в памяти: hash-команды и pipeline"""
+
+    def __init__(self):
+        self.data = {}
+        self.ttl = {}
+        self.hmget_calls = 0
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+    def hset(self, key, mapping):
+        self.data.setdefault(key, {}).update({k: str(v).encode() for k, v in mapping.items()})
+
+    def expire(self, key, ttl):
+        self.ttl[key] = ttl
+
+    def hmget(self, key, fields):
+        self.hmget_calls += 1
+        stored = self.data.get(key, {})
+        return [stored.get(field) for field in fields]
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.commands.append((name, args, kwargs))
+
+    def execute(self):
+        return [getattr(self.redis, name)(*args, **kwargs) for name, args, kwargs in self.commands]
+
+
+PARTNERS = [
+    {'partner_code': f'P{i:03d}', 'company_name': f'Компания {i}',
+     'specializations': ['каркасные дома'], 'regions': ['Московская область'], 'rating': 4.5}
+    for i in range(7)
+]
+
+
+class TestRecommendationCache:
+    """Тесты RecommendationCache"""
+
+    def setup_method(self):
+        """Настройка перед каждым тестом"""
+        self.redis = FakeRedis()
+        self.cache = RecommendationCache(self.redis, ttl=600)
+
+    def test_request_hash_is_stable(self):
+        """Тест независимости хэша от порядка ключей"""
+        first = RecommendationCache.make_request_hash({'region': 'МО', 'budget': 5000000})
+        second = RecommendationCache.make_request_hash({'budget': 5000000, 'region': 'МО'})
+
+        assert first == second
+        assert len(first) == 16
+
+    def test_get_page_single_lookup(self):
+        """Тест чтения страницы одним запросом"""
+        cards = [f'card {i}' for i in range(len(PARTNERS))]
+        self.cache.save('chat1', 'abc', PARTNERS, cards=cards)
+
+        page = self.cache.get_page('chat1', 'abc', page=1, page_size=3)
+
+        assert self.redis.hmget_calls == 1
+        assert page['partner_ids'] == ['P003', 'P004', 'P005']
+        assert page['cards'] == ['card 3', 'card 4', 'card 5']
+        assert page['total'] == 7
+        assert page['has_next'] is True
+        assert self.redis.ttl['recs:chat1:abc'] == 600
+
+    def test_last_page(self):
+        """Тест последней неполной страницы"""
+        self.cache.save('chat1', 'abc', PARTNERS)
+
+        page = self.cache.get_page('chat1', 'abc', page=2, page_size=3)
+
+        assert page['partner_ids'] == ['P006']
+        assert page['has_next'] is False
+
+    def test_cache_miss(self):
+        """Тест отсутствующей подборки"""
+        assert self.cache.get_page('chat1', 'missing', page=0) is None
+
+
+class TestProtalkNextPartner:
+    """Тесты листания подборки в ProtalkConnector"""
+
+    def setup_method(self):
+        """Настройка перед каждым тестом"""
+        self.connector = ProtalkConnector('token', recommendation_cache=RecommendationCache(FakeRedis()))
+        self.connector.session.post = Mock(return_value=Mock(status_code=200, json=lambda: {}))
+
+    def test_next_partner_served_from_cache(self):
+        """Тест показа следующего партнера без повторного подбора"""
+        self.connector.send_partner_recommendations('chat1', PARTNERS, request_hash='abc')
+        first_keyboard = self.connector.session.post.call_args.kwargs['json']['reply_markup']['inline_keyboard']
+        assert first_keyboard[-1][0]['callback_data'] == 'next_partner:abc:1'
+
+        result = self.connector.send_next_partner('chat1', 'abc', 1)
+
+        assert result['success'] is True
+        assert result['partner_id'] == 'P001'
+        assert result['total_partners'] == 7
+
+    def test_next_partner_cache_miss(self):
+        """Тест истекшей подборки"""
+        result = self.connector.send_next_partner('chat1', 'expired', 1)
+
+        assert result['success'] is False
+        assert result['cache_miss'] is True
@@ -0,0 +1,152 @@
+"""
+Тесты материализованных агрегатов доходов
+"""
+
+from datetime import date, datetime
+
+from sqlalchemy import (
+    create_engine, MetaData, Table, Column, Integer, String, Float, Date, DateTime
+)
+from sqlalchemy.pool import StaticPool
+
+from backend.services.revenue_aggregates import RevenueAggregates, monthly_amount
+from backend.services.revenue_analytics import RevenueAnalytics
+
+
+class EmptyCohorts:
+    """Когортный снимок еще не построен"""
+
+    def partner_ltv(self, partner_id):
+        return None
+
+
+class TestRevenueAggregates:
+    """Тесты RevenueAggregates и RevenueAnalytics поверх агрегатов"""
+
+    def setup_method(self):
+        """Настройка перед каждым тестом"""
+        self.engine = create_engine('sqlite://', connect_args={'check_same_thread': False},
+                                    poolclass=StaticPool)
+        metadata = MetaData()
+        partner_daily = Table(
+            'revenue_daily_partner', metadata,
+            Column('day', Date, primary_key=True),
+            Column('partner_id', String(50), primary_key=True),
+            Column('revenue', Float, nullable=False, default=0),
+            Column('payment_count', Integer, nullable=False, default=0)
+        )
+        tariff_daily = Table(
+            'revenue_daily_tariff', metadata,
+            Column('day', Date, primary_key=True),
+            Column('tariff_plan', String(30), primary_key=True),
+            Column('revenue', Float, nullable=False, default=0),
+            Column('payment_count', Integer, nullable=False, default=0)
+        )
+        transitions = Table(
+            'subscription_transitions_daily', metadata,
+            Column('day', Date, primary_key=True),
+            Column('tariff_plan', String(30), primary_key=True),
+            Column('from_status', String(20), primary_key=True),
+            Column('to_status', String(20), primary_key=True),
+            Column('transition_count', Integer, nullable=False, default=0),
+            Column('mrr_delta', Float, nullable=False, default=0)
+        )
+        self.payments = Table(
+            'payments', metadata,
+            Column('id', Integer, primary_key=True),
+            Column('partner_id', String(50)),
+            Column('amount', Float),
+            Column('status', String(20)),
+            Column('tariff_plan', String(30)),
+            Column('paid_at', DateTime)
+        )
+        self.subscriptions = Table(
+            'subscriptions', metadata,
+            Column('id', Integer, primary_key=True),
+            Column('tariff_plan', String(30)),
+            Column('status', String(20)),
+            Column('price', Float),
+            Column('period', String(20)),
+            Column('starts_at', DateTime),
+            Column('updated_at', DateTime)
+        )
+        metadata.create_all(self.engine)
+
+        self.aggregates = RevenueAggregates(self.engine, (partner_daily, tariff_daily, transitions))
+        self.analytics = RevenueAnalytics(self.aggregates, EmptyCohorts())
+
+    def test_payments_accumulate_per_day(self):
+        """Тест приращения дневных агрегатов при завершении платежей"""
+        self.aggregates.record_payment('P1', 'professional', 5000, datetime(2024, 1, 15, 10))
+        self.aggregates.record_payment('P1', 'professional', 5000, datetime(2024, 1, 15, 18))
+        self.aggregates.record_payments([
+            {'partner_id': 'P2', 'tariff_plan': 'business', 'amount': 15000, 'paid_at': datetime(2024, 1, 20)},
+            {'partner_id': 'P3', 'tariff_plan': 'business', 'amount': 1000, 'paid_at': datetime(2024, 2, 1)}
+        ])
+
+        result = self.analytics.get_monthly_revenue(2024, 1)
+
+        assert result['total_revenue'] == 25000
+        assert result['payment_count'] == 3
+        assert result['average_payment'] == 25000 / 3
+        assert result['revenue_by_tariff']['professional'] == {'revenue': 10000, 'payment_count': 2}
+        assert result['daily_revenue'][0] == {'date': '2024-01-15', 'revenue': 10000, 'payment_count': 2}
+        assert self.analytics.get_yearly_revenue(2024)['monthly_revenue'][1]['revenue'] == 1000
+
+    def test_partner_ltv_and_top_partners(self):
+        """Тест LTV партнера и топа партнеров по агрегатам"""
+        for month, amount in ((1, 5000), (2, 15000), (3, 5000)):
+            self.aggregates.record_payment('P1', 'professional', amount, datetime(2024, month, 1))
+        self.aggregates.record_payment('P2', 'start', 1000, datetime(2024, 3, 1))
+
+        ltv = self.analytics.get_partner_lifetime_value('P1')
+        top = self.aggregates.top_partners(date(2024, 1, 1), date(2024, 4, 1), limit=1)
+
+        assert ltv['total_spent'] == 25000
+        assert ltv['payment_count'] == 3
+        assert ltv['active_months'] == 3
+        assert top == [{'partner_id': 'P1', 'total_spent': 25000, 'payment_count': 3}]
+
+    def test_mrr_and_churn_from_transitions(self):
+        """Тест MRR и оттока по переходам статусов подписок"""
+        for _ in range(4):
+            self.aggregates.record_subscription_transition(
+                'professional', 'new', 'active', monthly_amount(5000, 'monthly'), at=date(2024, 1, 1)
+            )
+        self.aggregates.record_subscription_transition(
+            'business', 'new', 'active', monthly_amount(120000, 'yearly'), at=date(2024, 1, 2)
+        )
+        self.aggregates.record_subscription_transition(
+            'professional', 'active', 'cancelled', 5000, at=date(2024, 2, 10)
+        )
+
+        assert self.aggregates.mrr(date(2024, 1, 31)) == 30000
+        assert self.aggregates.mrr(date(2024, 2, 28)) == 25000
+        assert self.aggregates.churn(date(2024, 2, 1), date(2024, 3, 1)) == {
+            'active_at_start': 5, 'churned': 1, 'churn_rate': 20.0
+        }
+
+    def test_rebuild_matches_events(self):
+        """Тест перестроения агрегатов из таблиц платежей и подписок"""
+        with self.engine.begin() as conn:
+            conn.execute(self.payments.insert(), [
+                {'partner_id': 'P1', 'amount': 5000, 'status': 'completed', 'tariff_plan': 'professional',
+                 'paid_at': datetime(2024, 1, 15, 10)},
+                {'partner_id': 'P1', 'amount': 5000, 'status': 'completed', 'tariff_plan': 'professional',
+                 'paid_at': datetime(2024, 1, 15, 12)},
+                {'partner_id': 'P2', 'amount': 9000, 'status': 'pending', 'tariff_plan': 'business',
+                 'paid_at': None}
+            ])
+            conn.execute(self.subscriptions.insert(), [
+                {'tariff_plan': 'professional', 'status': 'active', 'price': 5000, 'period': 'monthly',
+                 'starts_at': datetime(2024, 1, 1), 'updated_at': datetime(2024, 1, 1)},
+                {'tariff_plan': 'professional', 'status': 'expired', 'price': 15000, 'period': 'quarterly',
+                 'starts_at': datetime(2024, 1, 1), 'updated_at': datetime(2024, 4, 1)}
+            ])
+
+        self.aggregates.rebuild(self.payments, self.subscriptions)
+
+        assert self.aggregates.partner_totals('P1')['total_spent'] == 10000
+        assert self.aggregates.partner_totals('P2')['payment_count'] == 0
+        assert self.aggregates.mrr(date(2024, 2, 1)) == 10000
+        assert self.aggregates.mrr(date(2024, 4, 1)) == 5000
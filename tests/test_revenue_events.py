@@ -0,0 +1,114 @@
+"""
+Тесты записи агрегатов доходов по изменениям платежей и подписок
+"""
+
+from datetime import datetime
+
+from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime
+from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from backend.services.revenue_events import RevenueEventRecorder
+
+Base = declarative_base()
+
+
+class Payment(Base):
+    __tablename__ = 'payments'
+
+    id = Column(Integer, primary_key=True)
+    partner_id = Column(String(50))
+    amount = Column(Float)
+    status = Column(String(20), default='pending')
+    tariff_plan = Column(String(30))
+    paid_at = Column(DateTime)
+
+
+class Subscription(Base):
+    __tablename__ = 'subscriptions'
+
+    id = Column(Integer, primary_key=True)
+    tariff_plan = Column(String(30))
+    status = Column(String(20), default='active')
+    price = Column(Float)
+    period = Column(String(20))
+
+
+class RecordingAggregates:
+    """Агрегаты доходов: запоминают события"""
+
+    def __init__(self):
+        self.payments = []
+        self.transitions = []
+
+    def record_payments(self, payments):
+        self.payments.extend(payments)
+
+    def record_subscription_transition(self, **transition):
+        self.transitions.append(transition)
+
+
+class TestRevenueEventRecorder:
+    """Тесты RevenueEventRecorder"""
+
+    def setup_method(self):
+        """Настройка перед каждым тестом"""
+        engine = create_engine('sqlite://', connect_args={'check_same_thread': False},
+                               poolclass=StaticPool)
+        Base.metadata.create_all(engine)
+        self.Session = sessionmaker(engine)
+        self.aggregates = RecordingAggregates()
+        RevenueEventRecorder(lambda: self.aggregates, Payment, Subscription).install(self.Session)
+
+    def test_payment_completion_recorded_once(self):
+        """Тест: завершение платежа записывается после commit и один раз"""
+        session = self.Session()
+        payment = Payment(partner_id='P1', amount=5000, tariff_plan='professional')
+        session.add(payment)
+        session.commit()
+
+        payment.status = 'completed'
+        payment.paid_at = datetime(2024, 5, 1, 10)
+        session.flush()
+        assert self.aggregates.payments == []
+        session.commit()
+
+        payment.amount = 5000.0
+        payment.status = 'completed'
+        session.commit()
+
+        assert self.aggregates.payments == [{
+            'partner_id': 'P1', 'tariff_plan': 'professional', 'amount': 5000,
+            'paid_at': datetime(2024, 5, 1, 10)
+        }]
+
+    def test_rollback_discards_events(self):
+        """Тест: события отмененной транзакции не записываются"""
+        session = self.Session()
+        session.add(Payment(partner_id='P1', amount=100, status='completed', paid_at=datetime(2024, 5, 1)))
+        session.flush()
+        session.rollback()
+        session.commit()
+
+        assert self.aggregates.payments == []
+
+    def test_subscription_transitions(self):
+        """Тест создания, смены цены и оттока подписки"""
+        session = self.Session()
+        subscription = Subscription(tariff_plan='professional', price=5000, period='monthly')
+        session.add(subscription)
+        session.commit()
+
+        subscription.price = 6000
+        session.commit()
+        subscription.status = 'cancelled'
+        session.commit()
+
+        assert self.aggregates.transitions == [
+            {'tariff_plan': 'professional', 'from_status': 'new', 'to_status': 'active',
+             'mrr_amount': 5000, 'previous_mrr_amount': None},
+            {'tariff_plan': 'professional', 'from_status': 'active', 'to_status': 'active',
+             'mrr_amount': 6000, 'previous_mrr_amount': 5000},
+            {'tariff_plan': 'professional', 'from_status': 'active', 'to_status': 'cancelled',
+             'mrr_amount': 6000, 'previous_mrr_amount': None},
+        ]
@@ -0,0 +1,96 @@
+"""
+Тесты прогноза доходов
+"""
+
+import time
+from datetime import date
+
+import numpy as np
+
+from backend.services.revenue_forecast import RevenueForecaster, fit_forecast
+
+
+class MockAggregates:
+    """Помесячная выручка по тарифам без базы данных"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.loads = 0
+
+    def monthly_revenue_by_tariff(self, end=None):
+        self.loads += 1
+        return [row for row in self.rows if end is None or (row[0], row[1]) < (end.year, end.month)]
+
+    def version(self):
+        return str(len(self.rows))
+
+
+def _history(years, first_year=2019):
+    """Тренд + сезонный пик в декабре для двух тарифов"""
+    rows = []
+    for index in range(years * 12):
+        year, month = first_year + index // 12, index % 12 + 1
+        peak = 2 if month == 12 else 1
+        rows.append((year, month, 'professional', (100000 + 1000 * index) * peak))
+        rows.append((year, month, 'business', 50000 + 500 * index))
+    return rows
+
+
+class TestRevenueForecast:
+    """Тесты RevenueForecaster"""
+
+    def setup_method(self):
+        """Настройка перед каждым тестом"""
+        self.aggregates = MockAggregates(_history(5))
+        self.forecaster = RevenueForecaster(self.aggregates, today=lambda: date(2024, 1, 15))
+
+    def test_linear_trend_is_extrapolated(self):
+        """Тест продолжения линейного тренда с узким интервалом на точных данных"""
+        series = np.arange(12, dtype=float)[:, None] * 10 + 100
+        mean, lower, upper, model = fit_forecast(series, 3, first_month=1)
+
+        assert model == 'trend'
+        assert np.allclose(mean[:, 0], [220, 230, 240])
+        assert np.allclose(lower, mean) and np.allclose(upper, mean)
+
+    def test_forecast_with_seasonality_per_tariff_and_total(self):
+        """Тест прогноза по тарифам и итога с сезонностью"""
+        result = self.forecaster.forecast(12)
+
+        assert result['model'] == 'trend+seasonality'
+        assert result['history_months'] == 60
+        assert [item['period'] for item in result['forecast']][:2] == ['2024-01', '2024-02']
+
+        december = result['by_tariff']['professional'][11]
+        november = result['by_tariff']['professional'][10]
+        assert december['period'] == '2024-12'
+        assert december['revenue'] > 1.5 * november['revenue']
+
+        total = result['forecast'][0]
+        parts = sum(result['by_tariff'][tariff][0]['revenue'] for tariff in ('professional', 'business'))
+        assert abs(total['revenue'] - parts) < 1
+        assert total['lower'] <= total['revenue'] <= total['upper']
+
+    def test_cached_per_version(self):
+        """Тест кэширования по горизонту и версии данных"""
+        first = self.forecaster.forecast(6)
+        assert self.forecaster.forecast(6) is first
+        assert self.aggregates.loads == 1
+
+        self.aggregates.rows.append((2023, 12, 'start', 1000))
+        assert self.forecaster.forecast(6) is not first
+        assert self.aggregates.loads == 2
+
+    def test_short_history_returns_empty_forecast(self):
+        """Тест недостаточной истории"""
+        forecaster = RevenueForecaster(MockAggregates(_history(1)[:4]), today=lambda: date(2019, 3, 1))
+        result = forecaster.forecast(6)
+
+        assert result['model'] is None
+        assert result['forecast'] == []
+
+    def test_five_years_under_50ms(self):
+        """Тест времени построения прогноза на 5 годах истории"""
+        started = time.perf_counter()
+        self.forecaster.forecast(12)
+        assert time.perf_counter() - started < 0.05
@@ -0,0 +1,163 @@
+"""
+Тесты хранилищ подписок блока D
+"""
+
+import os
+import sys
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+
+# Модули сервисов блока D импортируются как services.* из каталога block_d
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                'BLOCK_D_MONETIZATION', 'block_d', 'services'))
+
+from subscription_store import InMemorySubscriptionStore, SQLSubscriptionStore  # noqa: E402
+
+NOW = datetime(2024, 6, 1, 12, 0)
+
+
+def subscription(subscription_id, partner_id='P1', days=30, status='active'):
+    return {
+        'subscription_id': subscription_id,
+        'partner_id': partner_id,
+        'tariff_code': 'basic',
+        'billing_period': 'monthly',
+        'status': status,
+        'price': 5000,
+        'leads_included': 50,
+        'start_date': NOW.isoformat(),
+        'expires_at': (NOW + timedelta(days=days)).isoformat(),
+        'auto_renewal': True
+    }
+
+
+class TestInMemorySubscriptionStore:
+    """Тесты подписок в памяти"""
+
+    def setup_method(self):
+        """Настройка перед каждым тестом"""
+        self.store = InMemorySubscriptionStore()
+
+    def test_update_keeps_indexes(self):
+        """Тест индексов после смены срока и статуса"""
+        self.store.add(subscription('sub_1', days=10))
+        self.store.add(subscription('sub_2', days=20))
+
+        self.store.update('sub_1', expires_at=(NOW + timedelta(days=40)).isoformat())
+        assert [s['subscription_id'] for s in self.store.expiring_between(NOW, NOW + timedelta(days=60))] == [
+            'sub_2', 'sub_1'
+        ]
+        assert self.store.next_expiry() == NOW + timedelta(days=20)
+
+        self.store.update('sub_2', status='cancelled')
+        assert self.store.get_active('P1')['subscription_id'] == 'sub_1'
+        assert self.store.next_expiry() == NOW + timedelta(days=40)
+
+        self.store.update('sub_1', status='expired')
+        assert self.store.get_active('P1') is None
+        assert self.store.next_expiry() is None
+
+        self.store.update('sub_2', status='active')
+        assert self.store.get_active('P1')['subscription_id'] == 'sub_2'
+        assert self.store.expiring_within(30, now=NOW) == [self.store.get('sub_2')]
+
+    def test_expiring_between_bounds(self):
+        """Тест границ выборки: start включается, end - нет"""
+        for day in (5, 10, 15):
+            self.store.add(subscription(f'sub_{day}', partner_id=f'P{day}', days=day))
+
+        found = self.store.expiring_between(NOW + timedelta(days=5), NOW + timedelta(days=15))
+        assert [s['subscription_id'] for s in found] == ['sub_5', 'sub_10']
+        assert self.store.expiring_between(NOW, NOW + timedelta(days=5)) == []
+        # Границы строками ISO, как в данных блока D
+        assert len(self.store.expiring_between(NOW.isoformat(), (NOW + timedelta(days=16)).isoformat())) == 3
+
+    def test_get_active_latest_expiry(self):
+        """Тест выбора активной подписки с самым поздним сроком"""
+        self.store.add(subscription('sub_1', days=30))
+        self.store.add(subscription('sub_2', days=365))
+        self.store.add(subscription('sub_3', days=90))
+
+        assert self.store.get_active('P1')['subscription_id'] == 'sub_2'
+
+    def test_concurrent_updates(self):
+        """Тест изменения подписок из нескольких потоков"""
+        for number in range(50):
+            self.store.add(subscription(f'sub_{number}', partner_id=f'P{number % 5}', days=number + 1))
+
+        def renew(offset):
+            for number in range(offset, 50, 4):
+                for days in range(1, 21):
+                    self.store.update(f'sub_{number}', expires_at=(NOW + timedelta(days=number + days)).isoformat())
+
+        threads = [threading.Thread(target=renew, args=(offset,)) for offset in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        found = self.store.expiring_between(NOW, NOW + timedelta(days=365))
+        assert len(found) == 50
+        assert [s['expires_at'] for s in found] == sorted(
+            (NOW + timedelta(days=number + 20)).isoformat() for number in range(50)
+        )
+
+
+class TestSQLSubscriptionStore:
+    """Тесты подписок в таблице subscriptions"""
+
+    def setup_method(self):
+        """Настройка перед каждым тестом"""
+        from backend.models import db, Partner, Subscription
+
+        self.engine = create_engine('sqlite://', connect_args={'check_same_thread': False},
+                                    poolclass=StaticPool)
+        db.metadata.create_all(self.engine, tables=[Partner.__table__, Subscription.__table__])
+        self.session = Session(self.engine)
+        self.store = SQLSubscriptionStore(self.session)
+        self.memory = InMemorySubscriptionStore()
+
+    def teardown_method(self):
+        self.session.close()
+
+    def test_keeps_block_d_id(self):
+        """Тест сохранения идентификатора sub_<ULID>"""
+        created = self.store.add(subscription('sub_01HZX3K9Q7'))
+
+        assert created['subscription_id'] == 'sub_01HZX3K9Q7'
+        assert self.store.get('sub_01HZX3K9Q7')['tariff_code'] == 'basic'
+        assert self.store.get('sub_unknown') is None
+
+    def test_update_last_payment(self):
+        """Тест записи платежа продления (RenewalScheduler)"""
+        self.store.add(subscription('sub_1', days=10))
+
+        updated = self.store.update('sub_1', status='active', expires_at=(NOW + timedelta(days=40)).isoformat(),
+                                    last_payment_id='pay_01HZX3K9Q7', renewal_payment_id=None)
+
+        assert updated['last_payment_id'] == 'pay_01HZX3K9Q7'
+        assert updated['renewal_payment_id'] is None
+        assert self.store.get('sub_1')['expires_at'] == (NOW + timedelta(days=40)).isoformat()
+
+    def test_get_active_matches_memory(self):
+        """Тест одинакового выбора активной подписки в обоих хранилищах"""
+        for subscription_id, days in (('sub_1', 30), ('sub_2', 365), ('sub_3', 90), ('sub_4', 365)):
+            self.store.add(subscription(subscription_id, days=days))
+            self.memory.add(subscription(subscription_id, days=days))
+
+        assert self.store.get_active('P1')['subscription_id'] == 'sub_4'
+        assert self.memory.get_active('P1')['subscription_id'] == 'sub_4'
+
+    def test_expiring_between_matches_memory(self):
+        """Тест одинаковых границ выборки в обоих хранилищах"""
+        for day in (5, 10, 15):
+            self.store.add(subscription(f'sub_{day}', partner_id=f'P{day}', days=day))
+            self.memory.add(subscription(f'sub_{day}', partner_id=f'P{day}', days=day))
+
+        start, end = NOW + timedelta(days=5), NOW + timedelta(days=15)
+        assert [s['subscription_id'] for s in self.store.expiring_between(start, end)] == \
+            [s['subscription_id'] for s in self.memory.expiring_between(start, end)] == ['sub_5', 'sub_10']
@@ -0,0 +1,130 @@
+"""
+Тесты таблицы цен тарифов (Блок C)
+"""
+
+import copy
+import sys
+
+from BLOCK_C_INTEGRATIONS import tariff_pricing
+from BLOCK_C_INTEGRATIONS.config import BlockCConfig
+from BLOCK_C_INTEGRATIONS.idempotency import IdempotencyStore
+from BLOCK_C_INTEGRATIONS.payment_gateway import PaymentGateway
+from BLOCK_C_INTEGRATIONS.tariff_pricing import TariffPricing, TariffPrice, split_vat, to_kopecks
+
+PLANS = {
+    'start': {'name': 'Стартовый', 'price_monthly': 0, 'is_active': True},
+    'professional': {
+        'name': 'Профессиональный', 'price_monthly': 5000,
+        'price_quarterly': 13500, 'price_yearly': 48000, 'is_active': True
+    },
+    'legacy': {'name': 'Архивный', 'price_monthly': 999.99, 'is_active': False}
+}
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTariffPricing:
+    """Тесты таблицы цен"""
+
+    def setup_method(self):
+        """Настройка перед каждым тестом"""
+        self.plans = copy.deepcopy(PLANS)
+        self.clock = FakeClock()
+        self.pricing = TariffPricing(plans_source=lambda: self.plans, refresh_interval=5,
+                                     clock=self.clock)
+
+    def test_kopecks_without_float_drift(self):
+        """Тест расчета в целых копейках"""
+        assert to_kopecks(999.99) == 99999
+        assert to_kopecks('0.1') + to_kopecks('0.2') == to_kopecks('0.3')
+        assert split_vat(99999, 0.20) == TariffPrice(83332, 16667, 99999)
+        assert split_vat(10000, 0.20, includes_vat=False) == TariffPrice(10000, 2000, 12000)
+
+    def test_matrix_lookup(self):
+        """Тест цены тариф × период"""
+        price = self.pricing.get('professional', 'quarterly')
+
+        assert price == TariffPrice(net=1125000, vat=225000, gross=1350000)
+        assert price.net + price.vat == price.gross
+        assert self.pricing.get('professional', 'weekly') is None
+        assert self.pricing.get('legacy') is None
+        assert self.pricing.tariffs() == ['start', 'professional']
+
+    def test_hot_reload(self):
+        """Тест пересчета при изменении тарифов после интервала проверки"""
+        assert self.pricing.get('professional').gross == 500000
+
+        self.plans['professional']['price_monthly'] = 6000
+        assert self.pricing.get('professional').gross == 500000
+
+        self.clock.now = 5
+        assert self.pricing.get('professional').gross == 600000
+
+    def test_reload_on_tax_rate_change(self, monkeypatch):
+        """Тест пересчета при изменении ставки НДС"""
+        version = self.pricing.matrix.version
+        monkeypatch.setitem(BlockCConfig.PAYMENT_CONFIG, 'tax_rate', 0.10)
+
+        matrix = self.pricing.reload()
+
+        assert matrix.version != version
+        assert matrix.get('professional').vat == 45455
+
+    def test_unchanged_config_keeps_matrix(self):
+        """Тест: без изменений таблица не перестраивается"""
+        matrix = self.pricing.matrix
+        self.clock.now = 10
+
+        assert self.pricing.matrix is matrix
+
+    def test_calculate_tariff_amount(self, monkeypatch):
+        """Тест расчета суммы платежа по общей таблице"""
+        monkeypatch.setattr(tariff_pricing, '_pricing', self.pricing)
+        gateway = PaymentGateway('yookassa', shop_id='shop', secret_key='key',
+                                 idempotency_store=IdempotencyStore(':memory:'))
+
+        result = gateway.calculate_tariff_amount('professional')
+
+        assert result['success'] is True
+        assert result['amounts'] == {'monthly': 5000.0, 'quarterly': 13500.0, 'yearly': 48000.0}
+        assert result['prices']['monthly']['vat'] == 83333
+        assert gateway.calculate_tariff_amount('premium')['success'] is False
+
+
+class TestDefaultPlansSource:
+    """Тесты источника тарифов по умолчанию"""
+
+    def setup_method(self):
+        """Настройка перед каждым тестом"""
+        tariff_pricing._monetization_unavailable = False
+
+    def teardown_method(self):
+        tariff_pricing._monetization_unavailable = False
+
+    def test_gateway_with_default_source(self, monkeypatch):
+        """Тест расчета суммы по реальному источнику тарифов (без подмены таблицы)"""
+        monkeypatch.setattr(tariff_pricing, '_pricing', None)
+        gateway = PaymentGateway('yookassa', shop_id='s', secret_key='k',
+                                 idempotency_store=IdempotencyStore(':memory:'))
+
+        result = gateway.calculate_tariff_amount('business')
+
+        plans = tariff_pricing._load_monetization_plans()
+        assert result['success'] is True
+        assert result['amounts']['monthly'] == plans['business']['price_monthly']
+
+    def test_fallback_when_block_d_missing(self, monkeypatch):
+        """Тест прежней таблицы Блока C, если конфигурация Блока D не импортируется"""
+        monkeypatch.setitem(sys.modules, 'BLOCK_D_MONETIZATION.block_d.config', None)
+
+        pricing = TariffPricing()
+
+        assert pricing.get('business').gross == 3000000
+        assert pricing.get('premium', 'yearly').gross == 15000000
+        assert tariff_pricing._load_monetization_plans() is tariff_pricing.FALLBACK_TARIFF_PLANS
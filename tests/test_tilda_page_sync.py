@@ -0,0 +1,110 @@
+"""
+Тесты публикации страниц партнеров в Tilda (Блок C)
+"""
+
+from BLOCK_C_INTEGRATIONS.tilda_page_sync import PageRenderCache, TildaPageSync, partner_page_alias
+
+
+class FakeTildaPages:
+    """Страницы проекта Tilda; failing - партнеры, публикация которых падает"""
+
+    def __init__(self, pages=None):
+        self.pages = dict(pages or {})
+        self.failing = set()
+        self.created = []
+        self.updated = []
+        self.list_calls = 0
+
+    def list_partner_pages(self):
+        self.list_calls += 1
+        return {'success': True, 'pages': [{'id': page_id, 'alias': alias, 'title': ''}
+                                           for alias, page_id in self.pages.items()]}
+
+    def create_partner_page(self, partner_data):
+        code = partner_data['partner_code']
+        if code in self.failing:
+            return {'success': False, 'error': 'Ошибка создания страницы: 502'}
+        page_id = f'page-{code}'
+        self.pages[partner_page_alias(code)] = page_id
+        self.created.append(code)
+        return {'success': True, 'page_id': page_id}
+
+    def update_partner_page(self, page_id, partner_data, force=False):
+        if partner_data['partner_code'] in self.failing:
+            return {'success': False, 'error': 'Ошибка обновления страницы: 502'}
+        self.updated.append(page_id)
+        return {'success': True, 'page_id': page_id}
+
+
+def make_partners(codes, rating=4.5):
+    return [{'partner_code': code, 'company_name': f'Компания {code}', 'rating': rating} for code in codes]
+
+
+class TestTildaPageSync:
+    """Тесты TildaPageSync"""
+
+    def setup_method(self):
+        """Настройка перед каждым тестом"""
+        self.cache = PageRenderCache(':memory:')
+        self.tilda = FakeTildaPages()
+        self.sync = TildaPageSync(self.tilda, self.cache, rate=1000, max_workers=2)
+        self.partners = make_partners([f'P{i:02d}' for i in range(10)])
+
+    def _fetch(self, after, limit):
+        return [p for p in self.partners if after is None or p['partner_code'] > after][:limit]
+
+    def test_unchanged_pages_skipped(self):
+        """Тест пропуска страниц без изменений"""
+        self.sync.push_changed(self.partners[:3])
+        result = self.sync.push_changed(self.partners[:3])
+
+        assert result['skipped'] == 3
+        assert len(self.tilda.created) == 3
+
+    def test_existing_page_updated_with_empty_cache(self):
+        """Тест: при пустом кэше существующая страница обновляется, а не создается заново"""
+        self.tilda.pages = {partner_page_alias('P01'): 'old-page'}
+
+        self.sync.push_changed(self.partners[:3])
+
+        assert self.tilda.updated == ['old-page']
+        assert sorted(self.tilda.created) == ['P00', 'P02']
+        assert self.cache.get_page('P01')['page_id'] == 'old-page'
+        assert self.tilda.list_calls == 1
+
+    def test_failed_partners_retried_after_pass(self):
+        """Тест повтора партнеров с ошибкой в конце прохода"""
+        self.tilda.failing = {'P03'}
+
+        first = self.sync.rebuild_all(self._fetch, batch_size=4)
+
+        assert first['success'] is False
+        assert first['status'] == 'incomplete'
+        assert self.cache.get_failures('rebuild_all')[0]['partner_code'] == 'P03'
+
+        self.tilda.failing = set()
+        second = self.sync.rebuild_all(self._fetch, batch_size=4)
+
+        assert second['success'] is True
+        assert second['status'] == 'completed'
+        assert self.cache.get_page('P03') is not None
+        assert self.cache.get_failures('rebuild_all') == []
+
+    def test_transient_failure_recovered_in_same_run(self):
+        """Тест: ошибка, исчезнувшая к концу прохода, не оставляет задачу незавершенной"""
+        original = self.tilda.create_partner_page
+        attempts = {}
+
+        def flaky(partner_data):
+            code = partner_data['partner_code']
+            attempts[code] = attempts.get(code, 0) + 1
+            if code == 'P05' and attempts[code] == 1:
+                return {'success': False, 'error': 'timeout'}
+            return original(partner_data)
+
+        self.tilda.create_partner_page = flaky
+        result = self.sync.rebuild_all(self._fetch, batch_size=4)
+
+        assert result['status'] == 'completed'
+        assert result['pushed'] == 10
+        assert attempts['P05'] == 2
@@ -0,0 +1,85 @@
+"""
+Тесты хранилища статистики страниц Tilda (Блок C)
+"""
+
+from datetime import date, timedelta
+
+from BLOCK_C_INTEGRATIONS.tilda_stats import TildaStatsWarehouse, TildaStatsSync
+
+
+class FakeTildaConnector:
+    """Коннектор, отдающий по 10 просмотров в день"""
+
+    def __init__(self):
+        self.calls = []
+
+    def get_page_stats(self, page_id, start_date, end_date):
+        self.calls.append((page_id, start_date, end_date))
+        day = date.fromisoformat(start_date)
+        days = []
+        while day <= date.fromisoformat(end_date):
+            days.append({'date': day.isoformat(), 'views': 10, 'visitors': 4, 'leads': 1})
+            day += timedelta(days=1)
+        return {'success': True, 'stats': {'days': days}, 'page_id': page_id}
+
+
+class TestTildaStats:
+    """Тесты TildaStatsWarehouse и TildaStatsSync"""
+
+    def setup_method(self):
+        """Настройка перед каждым тестом"""
+        self.connector = FakeTildaConnector()
+        self.warehouse = TildaStatsWarehouse(':memory:')
+        self.sync = TildaStatsSync(self.connector, self.warehouse, max_workers=2, initial_days=30)
+
+    def test_incremental_sync(self):
+        """Тест догрузки только с последнего синхронизированного дня"""
+        self.sync.sync_page('page_1', 'P001', today=date(2026, 3, 10))
+        result = self.sync.sync_page('page_1', 'P001', today=date(2026, 3, 12))
+
+        assert result['days'] == 3
+        assert self.connector.calls[-1] == ('page_1', '2026-03-10', '2026-03-12')
+
+    def test_range_served_from_warehouse(self):
+        """Тест суммирования дневных агрегатов за произвольный период"""
+        self.sync.sync_page('page_1', 'P001', today=date(2026, 3, 31))
+        calls = len(self.connector.calls)
+
+        result = self.warehouse.get_page_stats('page_1', '2026-03-05', '2026-03-14')
+
+        assert result['stats']['views'] == 100
+        assert result['stats']['days_with_data'] == 10
+        assert len(self.connector.calls) == calls
+
+    def test_monthly_report_rollup(self):
+        """Тест месячной сводки по партнерам"""
+        self.sync.sync_all([('page_1', 'P001'), ('page_2', 'P001'), ('page_3', 'P002')],
+                           today=date(2026, 2, 28))
+
+        report = self.warehouse.get_monthly_report_stats(2026, 2)
+
+        assert report['P001']['page_views'] == 560
+        assert report['P001']['page_views_rank'] == 1
+        assert report['P002']['page_views'] == 280
+
+    def test_watermark_not_moved_by_unparsed_response(self):
+        """Тест: ответ без дней не сдвигает отметку синхронизации"""
+        self.sync.sync_page('page_1', 'P001', today=date(2026, 3, 10))
+        self.connector.get_page_stats = lambda page_id, start, end: {
+            'success': True, 'stats': {'data': [{'day': '2026-03-11', 'views': 5}]}
+        }
+
+        result = self.sync.sync_page('page_1', 'P001', today=date(2026, 3, 12))
+
+        assert result['days'] == 0
+        assert self.warehouse.get_last_synced_day('page_1') == '2026-03-10'
+
+    def test_watermark_is_last_parsed_day(self):
+        """Тест: отметка - последний полученный день, даже если он раньше сегодняшнего"""
+        self.connector.get_page_stats = lambda page_id, start, end: {
+            'success': True, 'stats': {'items': [{'date': '2026-03-08', 'pageviews': 7}]}
+        }
+
+        self.sync.sync_page('page_1', 'P001', today=date(2026, 3, 12))
+
+        assert self.warehouse.get_last_synced_day('page_1') == '2026-03-08'
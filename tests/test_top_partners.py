@@ -0,0 +1,200 @@
+"""
+Тесты топа партнеров по выручке
+"""
+
+import logging
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import (
+    create_engine, MetaData, Table, Column, Index, Integer, String, Float, DateTime, text
+)
+from sqlalchemy.pool import StaticPool
+
+from backend.services.top_partners import RollingTopPartners, query_top_partners
+
+
+class TestRollingTopPartners:
+    """Тесты RollingTopPartners"""
+
+    def setup_method(self):
+        """Настройка перед каждым тестом"""
+        self.now = datetime(2024, 5, 31, 12, 0)
+        self.top = RollingTopPartners(clock=lambda: self.now)
+
+    def test_windows_rank_partners(self):
+        """Тест топа по каждому окну"""
+        self.top.record_payment('P1', 1000, self.now - timedelta(days=1))
+        self.top.record_payment('P2', 5000, self.now - timedelta(days=20))
+        self.top.record_payment('P3', 9000, self.now - timedelta(days=60))
+        self.top.record_payment('P1', 500, self.now - timedelta(days=2))
+
+        assert [item['partner_id'] for item in self.top.top(7)] == ['P1']
+        assert [item['partner_id'] for item in self.top.top(30)] == ['P2', 'P1']
+        assert [item['partner_id'] for item in self.top.top(90)] == ['P3', 'P2', 'P1']
+        assert self.top.top(90, limit=1) == [{'partner_id': 'P3', 'total_spent': 9000, 'payment_count': 1}]
+        assert self.top.top(7)[0] == {'partner_id': 'P1', 'total_spent': 1500, 'payment_count': 2}
+
+    def test_payments_leave_window(self):
+        """Тест выхода платежей из окна со временем"""
+        self.top.record_payment('P1', 1000, self.now - timedelta(days=6))
+        self.top.record_payment('P2', 800, self.now - timedelta(days=1))
+        assert self.top.top(7)[0]['partner_id'] == 'P1'
+
+        self.now += timedelta(days=2)
+        assert self.top.top(7) == [{'partner_id': 'P2', 'total_spent': 800, 'payment_count': 1}]
+
+    def test_cached_until_next_payment(self):
+        """Тест повторного чтения без пересчета"""
+        self.top.record_payment('P1', 1000, self.now)
+        first = self.top.top(30)
+        assert self.top.top(30)[0] is first[0]
+
+        self.top.record_payment('P2', 2000, self.now)
+        assert self.top.top(30)[0]['partner_id'] == 'P2'
+
+    def test_matches_full_sort(self):
+        """Тест совпадения с полной сортировкой при случайном потоке платежей"""
+        payments = [
+            (f'P{random.randrange(200)}', random.randrange(1, 10000), self.now - timedelta(hours=random.randrange(24 * 120)))
+            for _ in range(3000)
+        ]
+        for index, (partner_id, amount, paid_at) in enumerate(payments):
+            self.top.record_payment(partner_id, amount, paid_at)
+            if index % 500 == 0:
+                self.top.top(30, limit=5)
+
+        for days in self.top.windows:
+            totals = {}
+            for partner_id, amount, paid_at in payments:
+                if paid_at > self.now - timedelta(days=days):
+                    totals[partner_id] = totals.get(partner_id, 0) + amount
+            expected = sorted(totals.items(), key=lambda item: -item[1])[:10]
+            assert [item['total_spent'] for item in self.top.top(days)] == [amount for _, amount in expected]
+
+
+class TestTopPartnersQuery:
+    """Тесты SQL-запроса топа партнеров"""
+
+    def setup_method(self):
+        """Настройка перед каждым тестом"""
+        self.engine = create_engine('sqlite://', connect_args={'check_same_thread': False},
+                                    poolclass=StaticPool)
+        metadata = MetaData()
+        self.payments = Table(
+            'payments', metadata,
+            Column('id', Integer, primary_key=True),
+            Column('partner_id', String(50)),
+            Column('amount', Float),
+            Column('status', String(20)),
+            Column('created_at', DateTime),
+            Column('paid_at', DateTime),
+            Index('ix_payments_paid_at_partner', 'paid_at', 'partner_id')
+        )
+        metadata.create_all(self.engine)
+
+    def test_grouped_limit_over_paid_at_index(self):
+        """Тест сгруппированного запроса с LIMIT по индексу (paid_at, partner_id)"""
+        start = datetime(2024, 5, 1)
+        with self.engine.begin() as conn:
+            conn.execute(self.payments.insert(), [
+                {'partner_id': 'P1', 'amount': 100, 'status': 'completed', 'created_at': start - timedelta(days=20),
+                 'paid_at': start + timedelta(days=1)},
+                {'partner_id': 'P1', 'amount': 100, 'status': 'completed', 'created_at': start,
+                 'paid_at': start + timedelta(days=2)},
+                {'partner_id': 'P2', 'amount': 150, 'status': 'completed', 'created_at': start,
+                 'paid_at': start + timedelta(days=3)},
+                {'partner_id': 'P3', 'amount': 900, 'status': 'pending', 'created_at': start, 'paid_at': None},
+                {'partner_id': 'P4', 'amount': 900, 'status': 'completed', 'created_at': start - timedelta(days=2),
+                 'paid_at': start - timedelta(days=1)},
+            ])
+
+        top = query_top_partners(self.engine, self.payments, start, start + timedelta(days=30), limit=2)
+
+        assert top == [
+            {'partner_id': 'P1', 'total_spent': 200, 'payment_count': 2},
+            {'partner_id': 'P2', 'total_spent': 150, 'payment_count': 1}
+        ]
+
+        with self.engine.connect() as conn:
+            plan = ' '.join(str(row[-1]) for row in conn.execute(text(
+                "EXPLAIN QUERY PLAN SELECT partner_id, SUM(amount) FROM payments "
+                "WHERE paid_at >= '2024-05-01' AND paid_at < '2024-05-31' AND status = 'completed' "
+                "GROUP BY partner_id ORDER BY 2 DESC LIMIT 10"
+            )))
+        assert 'ix_payments_paid_at_partner' in plan
+
+    def test_unpartitioned_keeps_late_payments(self):
+        """Тест: платеж, оплаченный намного позже создания, попадает в топ"""
+        start = datetime(2024, 5, 1)
+        with self.engine.begin() as conn:
+            conn.execute(self.payments.insert(), [
+                {'partner_id': 'P1', 'amount': 100, 'status': 'completed', 'created_at': start - timedelta(days=400),
+                 'paid_at': start + timedelta(days=1)},
+            ])
+
+        top = query_top_partners(self.engine, self.payments, start, start + timedelta(days=30))
+
+        assert top == [{'partner_id': 'P1', 'total_spent': 100, 'payment_count': 1}]
+
+    def test_load_replaces_windows(self):
+        """Тест прогрева окон из таблицы: перечитывание не удваивает суммы"""
+        now = datetime(2024, 5, 31, 12, 0)
+        with self.engine.begin() as conn:
+            conn.execute(self.payments.insert(), [
+                {'partner_id': 'P1', 'amount': 100, 'status': 'completed', 'created_at': now - timedelta(days=3),
+                 'paid_at': now - timedelta(days=3)},
+                {'partner_id': 'P2', 'amount': 300, 'status': 'completed', 'created_at': now - timedelta(days=40),
+                 'paid_at': now - timedelta(days=40)},
+            ])
+        rolling = RollingTopPartners(clock=lambda: now)
+
+        assert rolling.load(self.engine, self.payments) == 2
+        assert rolling.load(self.engine, self.payments) == 2
+        assert rolling.loaded_at == now
+        assert rolling.top(7) == [{'partner_id': 'P1', 'total_spent': 100, 'payment_count': 1}]
+
+        # Платеж, завершенный другим процессом, попадает в окна при перечитывании
+        with self.engine.begin() as conn:
+            conn.execute(self.payments.insert(), [
+                {'partner_id': 'P3', 'amount': 50, 'status': 'completed', 'created_at': now, 'paid_at': now},
+            ])
+        rolling.load(self.engine, self.payments)
+        assert rolling.top(90) == [
+            {'partner_id': 'P2', 'total_spent': 300, 'payment_count': 1},
+            {'partner_id': 'P1', 'total_spent': 100, 'payment_count': 1},
+            {'partner_id': 'P3', 'total_spent': 50, 'payment_count': 1}
+        ]
+
+    def test_reloader_backs_off_after_errors(self, caplog):
+        """Тест фонового перечитывания: ошибка логируется, пауза растет"""
+        with self.engine.begin() as conn:
+            conn.execute(self.payments.insert(), [
+                {'partner_id': 'P1', 'amount': 100, 'status': 'completed', 'created_at': datetime.utcnow(),
+                 'paid_at': datetime.utcnow()},
+            ])
+        rolling = RollingTopPartners()
+        calls = []
+        loaded = threading.Event()
+
+        def engine():
+            calls.append(time.monotonic())
+            if len(calls) < 3:
+                raise RuntimeError('database is down')
+            loaded.set()
+            return self.engine
+
+        with caplog.at_level(logging.ERROR, logger='backend.services.top_partners'):
+            rolling.start_reloader(engine, interval=0.05, payments=self.payments)
+            try:
+                assert loaded.wait(5)
+            finally:
+                rolling.stop_reloader(5)
+
+        # Паузы после ошибок: 0.1 и 0.2 секунды
+        assert calls[1] - calls[0] >= 0.09
+        assert calls[2] - calls[1] >= 0.19
+        assert len([r for r in caplog.records if 'reload failed' in r.getMessage()]) == 2
+        assert rolling.top(7) == [{'partner_id': 'P1', 'total_spent': 100, 'payment_count': 1}]
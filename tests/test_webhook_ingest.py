@@ -0,0 +1,210 @@
+"""
+Тесты приема вебхуков: дедупликация и входящая очередь (Блок C)
+"""
+
+import hashlib
+import hmac
+import json
+
+import pytest
+
+from BLOCK_C_INTEGRATIONS.config import BlockCConfig
+from BLOCK_C_INTEGRATIONS.tilda_connector import TildaConnector
+from BLOCK_C_INTEGRATIONS.webhook_handlers import WebhookHandler
+from BLOCK_C_INTEGRATIONS.webhook_inbox import WebhookInbox, InboxDispatcher
+from BLOCK_C_INTEGRATIONS.webhook_ingest import WebhookIngestor, LocalDedupStore
+from BLOCK_C_INTEGRATIONS.webhook_signature import HmacVerifier
+
+
+class TestWebhookIngestor:
+    """Тесты WebhookIngestor"""
+
+    def setup_method(self):
+        """Настройка перед каждым тестом"""
+        self.secret = 'test_secret'
+        self.now = 1_700_000_000
+        self.handler = WebhookHandler(self.secret)
+        self.ingestor = WebhookIngestor(
+            self.handler, LocalDedupStore(ttl=600), clock=lambda: self.now
+        )
+
+    def _headers(self, body, timestamp=None):
+        timestamp = str(timestamp or self.now)
+        signed = f'{timestamp}.'.encode('utf-8') + body
+        signature = hmac.new(self.secret.encode('utf-8'), signed, hashlib.sha256).hexdigest()
+        return {'X-Signature': signature, 'X-Timestamp': timestamp}
+
+    def test_duplicate_payment_acknowledged(self):
+        """Тест однократной обработки повторной доставки платежа"""
+        body = json.dumps({'payment_id': 'pay_1', 'status': 'succeeded',
+                           'metadata': {'partner_code': 'P001'}}).encode('utf-8')
+
+        first = self.ingestor.ingest('payment', body, self._headers(body))
+        second = self.ingestor.ingest('payment', body, self._headers(body))
+
+        assert first['action'] == 'activate_subscription'
+        assert second == {'status': 'duplicate', 'event_id': 'pay_1:succeeded'}
+        assert self.ingestor.get_stats()['processed'] == 1
+
+    def test_bad_signature_rejected(self):
+        """Тест отклонения неверной подписи"""
+        body = b'{"payment_id": "pay_1", "status": "succeeded"}'
+
+        result = self.ingestor.ingest('payment', body, {'X-Signature': 'bad', 'X-Timestamp': str(self.now)})
+
+        assert result['status'] == 'rejected'
+
+    def test_stale_timestamp_rejected(self):
+        """Тест отклонения вебхука вне окна timestamp_tolerance"""
+        body = b'{"payment_id": "pay_2", "status": "succeeded"}'
+
+        result = self.ingestor.ingest('payment', body, self._headers(body, timestamp=self.now - 3600))
+
+        assert result['status'] == 'rejected'
+
+    def test_replayed_body_with_fresh_timestamp_rejected(self):
+        """Тест: время отправки входит в подпись, подменить его нельзя"""
+        body = b'{"payment_id": "pay_3", "status": "succeeded"}'
+        headers = self._headers(body, timestamp=self.now - 3600)
+        headers['X-Timestamp'] = str(self.now)
+
+        result = self.ingestor.ingest('payment', body, headers)
+
+        assert result == {'status': 'rejected', 'error': 'Неверная подпись вебхука'}
+
+    def test_missing_timestamp_rejected_for_opted_in_source(self):
+        """Тест: источник из timestamp_sources обязан присылать заголовок времени"""
+        ingestor = WebhookIngestor(self.handler, LocalDedupStore(ttl=600), timestamp_sources=['payment'],
+                                   clock=lambda: self.now)
+        body = b'{"payment_id": "pay_4", "status": "succeeded"}'
+        signature = hmac.new(self.secret.encode('utf-8'), body, hashlib.sha256).hexdigest()
+
+        result = ingestor.ingest('payment', body, {'X-Signature': signature})
+
+        assert result == {'status': 'rejected', 'error': 'Отсутствует время отправки вебхука'}
+
+    def test_missing_timestamp_verified_by_body(self):
+        """Тест: без заголовка времени подпись проверяется только по телу"""
+        body = b'{"payment_id": "pay_5", "status": "succeeded"}'
+        signature = hmac.new(self.secret.encode('utf-8'), body, hashlib.sha256).hexdigest()
+
+        accepted = self.ingestor.ingest('payment', body, {'X-Signature': signature})
+        replayed = self.ingestor.ingest('payment', body, {'X-Signature': signature})
+        # Подпись "время.тело" без заголовка времени не проходит
+        headers = self._headers(b'{"payment_id": "pay_6", "status": "succeeded"}')
+        del headers['X-Timestamp']
+        stripped = self.ingestor.ingest('payment', b'{"payment_id": "pay_6", "status": "succeeded"}', headers)
+
+        assert accepted['event_id'] == 'pay_5:succeeded'
+        assert replayed['status'] == 'duplicate'
+        assert stripped == {'status': 'rejected', 'error': 'Неверная подпись вебхука'}
+
+    def test_local_store_bounded(self):
+        """Тест ограничения размера локального множества"""
+        store = LocalDedupStore(ttl=600, max_entries=3)
+        for i in range(10):
+            assert store.claim(f'event_{i}')
+
+        assert len(store) == 3
+        assert not store.claim('event_9')
+
+
+class TestWebhookInbox:
+    """Тесты WebhookInbox и InboxDispatcher"""
+
+    def setup_method(self):
+        """Настройка перед каждым тестом"""
+        self.now = 1_700_000_000.0
+        self.inbox = WebhookInbox(':memory:', clock=lambda: self.now)
+        self.results = []
+
+    def _dispatcher(self, handler, **kwargs):
+        return InboxDispatcher(
+            handler, self.inbox, on_result=lambda source, event, result: self.results.append(result),
+            concurrency={'payment': 2, 'umnico': 2}, **kwargs
+        )
+
+    def test_ingest_acknowledges_and_dispatches(self):
+        """Тест подтверждения приема до запуска обработчика"""
+        handler = WebhookHandler('')
+        ingestor = WebhookIngestor(handler, LocalDedupStore(ttl=600), inbox=self.inbox,
+                                   clock=lambda: self.now)
+        body = b'{"payment_id": "pay_1", "status": "succeeded", "metadata": {}}'
+
+        result = ingestor.ingest('payment', body, {})
+        assert result['status'] == 'accepted'
+        assert self.results == []
+
+        dispatcher = self._dispatcher(handler)
+        assert dispatcher.drain(timeout=5)
+        dispatcher.stop()
+
+        assert self.results[0]['action'] == 'activate_subscription'
+        assert self.inbox.get_stats() == {'payment': {'done': 1}}
+
+    def test_retry_then_dead_letter(self):
+        """Тест повторов с задержкой и перевода в DLQ"""
+        class FailingHandler:
+            def handle_payment_webhook(self, data):
+                return {'status': 'error', 'error': 'db unavailable'}
+
+        self.inbox.append('payment', 'pay_2:succeeded', b'{"payment_id": "pay_2"}')
+        dispatcher = self._dispatcher(FailingHandler(), max_attempts=3, retry_backoff=10)
+
+        for _ in range(3):
+            dispatcher.drain(timeout=5)
+            self.now += 60
+        dispatcher.stop()
+
+        dead = self.inbox.get_dead_letters()
+        assert len(dead) == 1
+        assert dead[0]['attempts'] == 3
+        assert dead[0]['last_error'] == 'db unavailable'
+
+    def test_replay_window(self):
+        """Тест повтора событий за период"""
+        self.inbox.append('umnico', 'm1', b'{"message": "hi"}')
+        self.now += 3600
+        self.inbox.append('umnico', 'm2', b'{"message": "hi"}')
+
+        dispatcher = self._dispatcher(WebhookHandler(''))
+        dispatcher.drain(timeout=5)
+
+        assert self.inbox.replay(self.now - 10, self.now + 10) == 1
+        assert self.inbox.replay(self.now - 10, self.now + 10, copies=3) == 3
+        dispatcher.drain(timeout=5)
+        dispatcher.stop()
+
+        assert len(self.results) == 6
+
+
+class TestHmacVerifier:
+    """Тесты HmacVerifier"""
+
+    def test_key_rotation(self):
+        """Тест приема подписи текущим и предыдущим секретом"""
+        body = b'{"payment_id": "pay_1"}'
+        old = HmacVerifier(['old_secret'])
+        verifier = HmacVerifier(['new_secret', 'old_secret'])
+
+        assert verifier.verify(body, verifier.sign(body))
+        assert verifier.verify(memoryview(body), old.sign(body))
+        assert not verifier.verify(body, HmacVerifier(['other']).sign(body))
+        assert not verifier.verify(body, '')
+
+    def test_sign_without_secret(self):
+        """Тест понятной ошибки подписи без настроенного секрета"""
+        with pytest.raises(ValueError):
+            HmacVerifier(['']).sign(b'{}')
+
+    def test_tilda_rotation_from_config(self, monkeypatch):
+        """Тест: коннектор Tilda принимает предыдущие секреты из WEBHOOK_PREVIOUS_SECRETS"""
+        monkeypatch.setitem(BlockCConfig.WEBHOOK_CONFIG, 'previous_secrets', ['old_secret'])
+        body = '{"tranid": "1"}'
+
+        connector = TildaConnector('public', 'new_secret')
+
+        assert connector.verify_webhook_signature(body, HmacVerifier(['old_secret']).sign(body))
+        assert not TildaConnector('public', 'new_secret', previous_secrets=[]).verify_webhook_signature(
+            body, HmacVerifier(['old_secret']).sign(body)
+        )